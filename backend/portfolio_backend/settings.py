@@ -117,6 +117,9 @@ CSRF_COOKIE_HTTPONLY = False  # Doit être False pour que React puisse lire le t
 CSRF_COOKIE_SECURE = False  # True en production avec HTTPS
 CSRF_TRUSTED_ORIGINS = os.environ.get('CORS_ALLOWED_ORIGINS', 'http://localhost:3001').split(',')
 
+# Stockage des données de portefeuille : 'json' (fichiers dans /app/data) ou 'sqlite'
+PORTFOLIO_STORAGE_ENGINE = os.environ.get('PORTFOLIO_STORAGE_ENGINE', 'json')
+
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
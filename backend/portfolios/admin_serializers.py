@@ -61,7 +61,7 @@ class InstrumentTypeSerializer(serializers.ModelSerializer):
 
     def get_signaletiques_count(self, obj):
         """Nombre de signalétiques avec ce type d'instrument (statut)"""
-        from . import file_storage
+        from .storage import engine as file_storage
         all_sigs = file_storage.get_all_signaletiques()
         count = sum(
             1 for s in all_sigs
@@ -2,7 +2,9 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from django.contrib.auth.models import User
+from django.db import DatabaseError
 from .models import AssetCategory, InstrumentType
+from . import outbox, rapprochement
 from .admin_serializers import AssetCategorySerializer, InstrumentTypeSerializer, UserSerializer
 
 
@@ -49,3 +51,40 @@ def check_superuser(request):
         'is_superuser': request.user.is_superuser,
         'username': request.user.username
     })
+
+
+@api_view(['GET'])
+@permission_classes([IsSuperUser])
+def synchro_outbox(request):
+    """État de la file de synchronisation JSON → PostgreSQL (retard, rejets)"""
+    return Response(outbox.etat())
+
+
+@api_view(['POST'])
+@permission_classes([IsSuperUser])
+def synchro_outbox_drain(request):
+    """Applique immédiatement la file de synchronisation à PostgreSQL"""
+    try:
+        resultat = outbox.drainer()
+    except DatabaseError as e:
+        return Response({'error': f'Base indisponible : {e}', 'etat': outbox.etat()},
+                        status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    if resultat['occupe']:
+        return Response({'error': 'Synchronisation déjà en cours dans un autre processus', 'etat': outbox.etat()},
+                        status=status.HTTP_409_CONFLICT)
+    return Response({**resultat, 'etat': outbox.etat()})
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsSuperUser])
+def synchro_rapprochement(request):
+    """Rapprochement de la signalétique JSON / PostgreSQL ; POST répare la base"""
+    try:
+        exemples = int(request.query_params.get('exemples', rapprochement.RAPPROCHEMENT_EXEMPLES))
+    except ValueError:
+        return Response({'error': 'exemples doit être un entier'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        rapport = rapprochement.rapprocher(reparer=request.method == 'POST', exemples=exemples)
+    except DatabaseError as e:
+        return Response({'error': f'Base indisponible : {e}'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return Response(rapport)
@@ -0,0 +1,75 @@
+# Lecture en continu des classeurs Excel importés.
+# openpyxl est ouvert en mode read_only / data_only : les lignes sont décodées au fil
+# de l'eau depuis le XML de la feuille, sans construire les objets cellule de tout le
+# classeur ; la mémoire reste constante quelle que soit la taille du fichier.
+# Dans ce mode ws.max_row n'est pas fiable (dimension absente ou fausse dans le
+# fichier) : le nombre de lignes est compté pendant la lecture.
+
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+import openpyxl
+
+
+def lignes_brutes(fichier) -> Iterator[tuple]:
+    """Valeurs de chaque ligne de la feuille active (tuples, en-tête compris), lues en
+    continu ; le classeur est fermé à la fin de la lecture"""
+    classeur = openpyxl.load_workbook(fichier, read_only=True, data_only=True)
+    try:
+        yield from classeur.active.iter_rows(values_only=True)
+    finally:
+        classeur.close()
+
+
+def ligne_vide(valeurs) -> bool:
+    return not any(v is not None and str(v).strip() != '' for v in valeurs)
+
+
+class Feuille:
+    """Feuille active d'un classeur importé : en-têtes (première ligne), puis chaque
+    ligne non vide sous forme de dictionnaire {en-tête: valeur}.
+
+    entetes_texte : en-têtes convertis en chaînes sans espaces superflus (sinon valeurs
+    brutes des cellules). convertir : fonction appliquée à chaque valeur.
+    lignes_totales : nombre de lignes non vides lues jusqu'ici ; lignes_estimees : nombre
+    de lignes d'après la dimension déclarée par le fichier (indicatif, None si absente).
+    """
+
+    def __init__(self, fichier, entetes_texte: bool = True, convertir: Optional[Callable] = None):
+        self._classeur = openpyxl.load_workbook(fichier, read_only=True, data_only=True)
+        try:
+            feuille = self._classeur.active
+            self.lignes_estimees = max(feuille.max_row - 1, 0) if feuille.max_row else None
+            self._lignes = feuille.iter_rows(values_only=True)
+            premiere = next(self._lignes, ())
+        except BaseException:
+            self._classeur.close()  # sinon le fichier reste ouvert
+            raise
+        if entetes_texte:
+            self.entetes = [str(v).strip() if v is not None else '' for v in premiere]
+        else:
+            self.entetes = list(premiere)
+        self._convertir = convertir
+        self.lignes_totales = 0
+
+    def __iter__(self) -> Iterator[Tuple[int, Dict]]:
+        """(numéro de la ligne dans la feuille, dictionnaire) de chaque ligne non vide ;
+        le classeur est fermé à la fin de la lecture"""
+        try:
+            for numero, valeurs in enumerate(self._lignes, start=2):
+                if ligne_vide(valeurs):
+                    continue
+                self.lignes_totales += 1
+                if self._convertir is not None:
+                    valeurs = [self._convertir(v) for v in valeurs]
+                yield numero, dict(zip(self.entetes, valeurs))
+        finally:
+            self.close()
+
+    def close(self):
+        self._classeur.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,174 @@
+# Expositions par transparence (géographie, secteur) à partir des colonnes de
+# pourcentages de donnees_supplementaires de la signalétique ('USA': 0.16,
+# 'Technologie': 0.2, …).
+# La signalétique est ramenée une fois par version à une matrice dense
+# instruments × facteurs (float64, fraction de l'instrument exposée à chaque facteur) ;
+# l'exposition d'un portefeuille est alors un seul produit matrice-vecteur
+# poids @ matrice, poids en % du portefeuille par instrument.
+# Les libellés de colonnes sont comparés sans accents ni casse (comme l'interface).
+
+import re
+import threading
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .storage import resolve_engine
+
+FACTEURS = {
+    'geographie': [
+        'USA', 'Japon', 'Grande Bretagne', 'Canada', 'Pays Emergeants Hors Chine et Japon',
+        'Australie', 'Suède', 'Suisse', 'Chine', 'Israel', 'Allemagne', 'Nouvelle Zelande',
+        'Pays-Bas', 'Irlande', 'Espagne', 'Italie', 'France', 'Autre Pays',
+    ],
+    'secteur': [
+        'Etats', 'Industrie', 'Finance', 'Consommation Cyclique', 'Technologie',
+        'Santé', 'Consommation Defensive', 'Communication', 'Immobilier',
+        'Matières Premières', 'Energie', 'Service Publiques', 'Services de consommation', 'Autre Secteur',
+    ],
+}
+LIBELLES = [libelle for libelles in FACTEURS.values() for libelle in libelles]
+
+# moteur → matrice de la dernière version de la signalétique
+_cache: Dict[str, Dict] = {}
+_cache_lock = threading.Lock()
+
+
+def normaliser(texte) -> str:
+    """Clé de comparaison : sans accents, minuscules, séparateurs réduits à une espace"""
+    texte = unicodedata.normalize('NFD', str(texte))
+    texte = ''.join(c for c in texte if not unicodedata.combining(c)).lower()
+    return re.sub(r'[^a-z0-9]+', ' ', texte).strip()
+
+
+_COLONNES = {normaliser(libelle): j for j, libelle in enumerate(LIBELLES)}
+
+
+def _nombre(valeur) -> float:
+    if isinstance(valeur, (int, float)) and not isinstance(valeur, bool):
+        return float(valeur)
+    try:
+        return float(str(valeur).replace('%', '').replace(',', '.').strip())
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _construire(signaletiques: List[Dict]) -> Dict:
+    matrice = np.zeros((len(signaletiques), len(LIBELLES)))
+    par_id, par_isin, noms = {}, {}, []
+    colonnes = {}  # clé brute → colonne (ou 'nom'), les mêmes clés se répètent d'un titre à l'autre
+    for i, sig in enumerate(signaletiques):
+        ds = sig.get('donnees_supplementaires') or {}
+        nom = sig.get('titre')
+        for cle, valeur in ds.items():
+            j = colonnes.get(cle, -1)
+            if j == -1:
+                cle_normalisee = normaliser(cle)
+                j = colonnes[cle] = 'nom' if cle_normalisee == 'nom' else _COLONNES.get(cle_normalisee)
+            if j is None or valeur in (None, ''):
+                continue
+            if j == 'nom':
+                nom = valeur
+            else:
+                matrice[i, j] = _nombre(valeur)
+        par_id.setdefault(sig.get('id'), i)
+        if sig.get('isin'):
+            par_isin.setdefault(sig['isin'], i)
+        noms.append(nom)
+    return {'matrice': matrice, 'par_id': par_id, 'par_isin': par_isin, 'noms': noms,
+            'ids': [sig.get('id') for sig in signaletiques], 'isins': [sig.get('isin') for sig in signaletiques]}
+
+
+def get_matrice(engine=None) -> Dict:
+    """Matrice instruments × facteurs de la signalétique courante (reconstruite si elle a changé).
+
+    Clés : matrice, par_id / par_isin (→ ligne), ids, isins, noms (par ligne), version.
+    """
+    engine = resolve_engine(engine)
+    version = engine.get_data_version('signaletique')
+    cached = _cache.get(engine.__name__)
+    if cached is not None and cached['version'] == version:
+        return cached
+    with _cache_lock:
+        cached = _cache.get(engine.__name__)
+        if cached is None or cached['version'] != version:
+            cached = {**_construire(engine.get_all_signaletiques()), 'version': version}
+            _cache[engine.__name__] = cached
+    return cached
+
+
+def _facteurs(valeurs: np.ndarray) -> Dict[str, Dict[str, float]]:
+    resultat, debut = {}, 0
+    for groupe, libelles in FACTEURS.items():
+        resultat[groupe] = {libelle: float(valeurs[debut + k]) for k, libelle in enumerate(libelles)}
+        debut += len(libelles)
+    return resultat
+
+
+def exposer(lignes: Iterable[Tuple[Optional[int], float]], donnees: Dict) -> Dict:
+    """Expositions d'un portefeuille décrit par (ligne de la matrice donnees, poids en %).
+
+    Les lignes None (instrument absent de la signalétique) comptent dans le poids
+    total mais n'exposent à aucun facteur. Retourne les expositions totales (en %)
+    par groupe de facteurs et la contribution de chaque instrument.
+    """
+    matrice = donnees['matrice']
+    lignes = list(lignes)
+    poids = np.zeros(len(matrice))
+    connues = [(i, p) for i, p in lignes if i is not None]
+    if connues:
+        np.add.at(poids, np.array([i for i, _ in connues]), np.array([p for _, p in connues], dtype=float))
+    totaux = poids @ matrice
+
+    instruments = []
+    for i in np.flatnonzero(poids):
+        instruments.append({
+            'signaletique_id': donnees['ids'][i],
+            'isin': donnees['isins'][i],
+            'nom': donnees['noms'][i],
+            'poids': float(poids[i]),
+            **_facteurs(poids[i] * matrice[i]),
+        })
+    return {
+        'poids_total': float(sum(p for _, p in lignes)),
+        'poids_sans_signaletique': float(sum(p for i, p in lignes if i is None)),
+        'expositions': {
+            groupe: sorted(({'facteur': libelle, 'exposition': valeur} for libelle, valeur in valeurs.items()),
+                           key=lambda e: -e['exposition'])
+            for groupe, valeurs in _facteurs(totaux).items()
+        },
+        'totaux': {groupe: float(sum(valeurs.values())) for groupe, valeurs in _facteurs(totaux).items()},
+        'instruments': instruments,
+    }
+
+
+def exposer_portefeuille_cible(portefeuille: Dict, engine=None) -> Dict:
+    """Expositions d'un portefeuille cible (poids = ratio de chaque ligne, en %)"""
+    donnees = get_matrice(engine)
+    return exposer(((donnees['par_id'].get(item.get('signaletique')), _nombre(item.get('ratio')))
+                    for item in portefeuille.get('items', [])), donnees)
+
+
+def exposer_positions(positions: List[Dict], valeurs: Optional[Dict[str, float]] = None,
+                      categorie: Optional[str] = None, engine=None) -> Dict:
+    """Expositions des positions d'une analyse FIFO, pondérées par leur valeur.
+
+    valeurs : valeur de chaque ISIN à utiliser à la place de position['valeur']
+    (ex. convertie dans la devise du portefeuille). categorie : mots qui doivent tous
+    figurer dans la catégorie de la position (sans accents ni casse), ex. 'long short'.
+    """
+    if categorie:
+        mots = normaliser(categorie).split()
+        positions = [p for p in positions if all(mot in normaliser(p.get('categorie') or '') for mot in mots)]
+    valeurs = valeurs or {}
+    montants = [(p, valeurs.get(p['isin'], p.get('valeur') or 0.0)) for p in positions]
+    total = sum(montant for _, montant in montants)
+    donnees = get_matrice(engine)
+    lignes = []
+    for position, montant in montants:
+        ligne = donnees['par_id'].get(position.get('signaletique_id'))
+        if ligne is None:
+            ligne = donnees['par_isin'].get(position['isin'])
+        lignes.append((ligne, montant / total * 100 if total else 0.0))
+    return {'valeur_totale': total, **exposer(lignes, donnees)}
@@ -0,0 +1,534 @@
+# Moteur FIFO incrémental : lots d'achat ouverts et P&L réalisé par
+# (portefeuille, ISIN), persistés comme états dérivés du moteur de stockage
+# (get_etat / save_etat) :
+#   fifo_<portefeuille>         index : transactions appliquées (id → empreinte,
+#                               ISIN, clé (date, id)) et jeton de chaque titre
+#   fifo_<portefeuille>_<isin>  lots, en-têtes et opérations (annulables) du titre
+# À chaque analyse, les transactions du portefeuille sont comparées à celles déjà
+# appliquées (id + empreinte) :
+#   - rien n'a changé        → résultat mémorisé en mémoire, sinon reformaté à
+#                              partir des états des titres, sans rejouer ;
+#   - nouvelles transactions → appliquées à la suite des lots du titre ;
+#   - insertion / suppression antidatée → pour le titre concerné seulement, les
+#     opérations postérieures à la date la plus ancienne touchée sont annulées
+#     (en ordre inverse, chaque vente gardant les lots qu'elle a consommés) puis
+#     rejouées.
+# La consommation des lots (deque, virgule fixe) est dans fifo_engine.
+# Seuls les états des titres touchés sont réécrits. Un changement de la
+# signalétique (ISIN, catégorie, type d'instrument) ou un état incohérent
+# (écritures concurrentes) reconstruit l'état du portefeuille.
+
+import importlib
+import json
+import multiprocessing
+import os
+import uuid
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from . import fifo_engine
+from .fifo_engine import (LOT_DATE, LOT_DEVISE, LOT_PRIX, LOT_QUANTITE, PRIX_DECIMALES, QUANTITE_DECIMALES,
+                          vers_decimal, vers_float)
+from .storage import resolve_engine
+
+FORMAT_ETAT = 5
+
+# Processus utilisés par défaut par analyse_fifo_portefeuilles (0 ou 1 : dans le processus courant)
+FIFO_BATCH_WORKERS = int(os.environ.get('FIFO_BATCH_WORKERS', '0'))
+
+# (moteur, portefeuille) → (révision de l'index, résultat formaté)
+_resultats: Dict = {}
+
+
+def _nom_etat(portfolio_id, isin: Optional[str] = None) -> str:
+    return f'fifo_{portfolio_id}' if isin is None else f'fifo_{portfolio_id}_{isin}'
+
+
+def _empreinte(transaction: Dict) -> str:
+    """Champs d'une transaction qui influent sur le FIFO"""
+    return '|'.join(str(transaction.get(champ)) for champ in (
+        'date', 'type_operation', 'quantite', 'prix_unitaire', 'devise', 'signaletique_id', 'isin'))
+
+
+def _infos_titre(sig: Dict) -> Dict:
+    """ISIN, libellés et type d'instrument issus de la signalétique"""
+    ds = sig.get('donnees_supplementaires') or {}
+    return {
+        'isin': sig.get('isin') or sig.get('code'),
+        'titre': sig.get('titre', ''),
+        'categorie': sig.get('categorie_text') or 'Non classé',
+        'type_instrument': ds.get("Type d'instr") or '',
+        'signaletique_id': sig['id'],
+        'donnees_supplementaires': ds,
+    }
+
+
+def _etat_titre_vide(infos: Dict) -> Dict:
+    return {
+        'position': None,       # en-tête fixé au premier achat
+        'position_cle': None,
+        'realise': None,        # en-tête fixé à la première vente
+        'realise_cle': None,
+        **fifo_engine.titre_vide(infos['categorie'], infos['type_instrument']),
+        'operations': [],       # une par transaction appliquée, triées par (date, id)
+    }
+
+
+def _appliquer(etat_titre: Dict, transaction: Dict, infos: Dict):
+    """Applique une transaction aux lots du titre et enregistre l'opération (annulable)"""
+    decimales_montant = QUANTITE_DECIMALES + etat_titre['decimales_prix']
+    quantite = fifo_engine.vers_entier(transaction['quantite'], QUANTITE_DECIMALES)
+    prix = fifo_engine.vers_entier(transaction['prix_unitaire'], PRIX_DECIMALES)
+    quantite_float = vers_float(quantite, QUANTITE_DECIMALES)
+    prix_float = vers_float(prix, PRIX_DECIMALES)
+    # Pour obligations: prix en %, l'entier quantite * prix porte deux décimales de plus
+    montant = vers_float(quantite * prix, decimales_montant)
+    titre = infos['titre']
+    categorie = infos['categorie']
+    type_instrument = infos['type_instrument']
+    operation = {'cle': [transaction['date'], transaction['id']],
+                 'type': transaction['type_operation'], 'detail': None}
+
+    if transaction['type_operation'] == 'ACHAT':
+        if etat_titre['position'] is None:
+            etat_titre['position'] = {k: infos[k] for k in (
+                'titre', 'categorie', 'type_instrument', 'signaletique_id', 'donnees_supplementaires')}
+            etat_titre['position_cle'] = operation['cle']
+            operation['cree_position'] = True
+        fifo_engine.acheter(etat_titre, transaction['id'], transaction['date'], quantite, prix,
+                            transaction['devise'])
+        operation['detail'] = {
+            'id': transaction['id'],
+            'date': transaction['date'],
+            'type': 'ACHAT',
+            'titre': titre,
+            'categorie': categorie,
+            'type_instrument': type_instrument,
+            'quantite': quantite_float,
+            'prix_unitaire': prix_float,
+            'montant': montant,
+            'devise': transaction['devise']
+        }
+
+    elif transaction['type_operation'] == 'VENTE':
+        vente = fifo_engine.vendre(etat_titre, quantite, prix) if etat_titre['position'] is not None else None
+        if vente is None:
+            # Vente à découvert ou erreur
+            operation['detail'] = {
+                'id': transaction['id'],
+                'date': transaction['date'],
+                'type': 'VENTE',
+                'titre': titre,
+                'categorie': categorie,
+                'quantite': quantite_float,
+                'prix_unitaire': prix_float,
+                'montant': montant,
+                'devise': transaction['devise'],
+                'erreur': 'Vente sans achat correspondant'
+            }
+        else:
+            consommes, pnl_transaction = vente
+            lots_consommes = [
+                {
+                    'date_achat': lot[LOT_DATE],
+                    'quantite': vers_float(lot[LOT_QUANTITE], QUANTITE_DECIMALES),
+                    'prix_achat': vers_float(lot[LOT_PRIX], PRIX_DECIMALES),
+                    'devise': lot[LOT_DEVISE],
+                    'prix_vente': prix_float,
+                    'pnl': vers_float(pnl_lot, decimales_montant)
+                }
+                for lot, pnl_lot in consommes
+            ]
+            if etat_titre['realise'] is None:
+                etat_titre['realise'] = {'titre': titre, 'categorie': categorie, 'type_instrument': type_instrument}
+                etat_titre['realise_cle'] = operation['cle']
+                operation['cree_realise'] = True
+            operation['consommes'] = [lot for lot, _ in consommes]
+            operation['pnl'] = pnl_transaction
+            operation['vente'] = {
+                'date': transaction['date'],
+                'quantite': quantite_float,
+                'prix_vente': prix_float,
+                'devise': transaction['devise'],
+                'pnl': vers_float(pnl_transaction, decimales_montant),
+                'lots_consommes': lots_consommes
+            }
+            operation['detail'] = {
+                'id': transaction['id'],
+                'date': transaction['date'],
+                'type': 'VENTE',
+                'titre': titre,
+                'categorie': categorie,
+                'type_instrument': type_instrument,
+                'quantite': quantite_float,
+                'prix_unitaire': prix_float,
+                'montant': montant,
+                'devise': transaction['devise'],
+                'pnl': vers_float(pnl_transaction, decimales_montant),
+                'lots_consommes': lots_consommes
+            }
+
+    etat_titre['operations'].append(operation)
+
+
+def _annuler(etat_titre: Dict, operation: Dict):
+    """Annule la dernière opération appliquée au titre"""
+    if operation['type'] == 'ACHAT':
+        fifo_engine.annuler_achat(etat_titre)
+        if operation.get('cree_position'):
+            etat_titre['position'] = None
+            etat_titre['position_cle'] = None
+    elif 'consommes' in operation:
+        fifo_engine.rendre(etat_titre, operation['consommes'], operation['pnl'])
+        if operation.get('cree_realise'):
+            etat_titre['realise'] = None
+            etat_titre['realise_cle'] = None
+
+
+def _synchroniser(appliquees: Dict, titres: Dict, transactions: List[Dict], resoudre) -> set:
+    """Met à jour les transactions appliquées et les états des titres (copiés avant
+    modification) ; retourne les ISIN touchés. resoudre : transaction → signalétique"""
+    courantes = {str(t['id']): t for t in transactions}
+    seuils: Dict = {}  # ISIN → plus petite clé (date, id) touchée
+
+    def _toucher(isin, cle):
+        if isin is not None and (isin not in seuils or cle < seuils[isin]):
+            seuils[isin] = cle
+
+    for tid, applique in list(appliquees.items()):
+        transaction = courantes.get(tid)
+        if transaction is None or _empreinte(transaction) != applique['empreinte']:
+            del appliquees[tid]
+            _toucher(applique['isin'], applique['cle'])
+
+    infos_par_id: Dict = {}
+    for tid, transaction in courantes.items():
+        if tid in appliquees:
+            continue
+        sig = resoudre(transaction)
+        infos = _infos_titre(sig) if sig else None
+        infos_par_id[tid] = infos
+        appliquees[tid] = {
+            'empreinte': _empreinte(transaction),
+            'cle': [transaction['date'], transaction['id']],
+            'isin': infos['isin'] if infos else None,
+        }
+        _toucher(appliquees[tid]['isin'], appliquees[tid]['cle'])
+
+    a_rejouer = defaultdict(list)
+    for tid, applique in appliquees.items():
+        isin = applique['isin']
+        if isin in seuils and applique['cle'] >= seuils[isin]:
+            a_rejouer[isin].append(tid)
+
+    for isin, seuil in seuils.items():
+        etat_titre = None
+        if isin in titres:
+            # L'état lu peut venir du cache du moteur : seul le titre touché est copié
+            # (aller-retour JSON, nettement plus rapide que deepcopy sur ces structures)
+            etat_titre = json.loads(json.dumps(titres[isin]))
+            etat_titre['lots'] = deque(etat_titre['lots'])
+            operations = etat_titre['operations']
+            while operations and operations[-1]['cle'] >= seuil:
+                _annuler(etat_titre, operations.pop())
+        for tid in sorted(a_rejouer[isin], key=lambda tid: appliquees[tid]['cle']):
+            infos = infos_par_id.get(tid)
+            if infos is None:
+                sig = resoudre(courantes[tid])
+                infos = _infos_titre(sig)
+            if etat_titre is None:
+                etat_titre = _etat_titre_vide(infos)
+            _appliquer(etat_titre, courantes[tid], infos)
+        if etat_titre is None or not etat_titre['operations']:
+            titres.pop(isin, None)
+        else:
+            etat_titre['lots'] = list(etat_titre['lots'])
+            titres[isin] = etat_titre
+    return set(seuils)
+
+
+def _resultat(titres: Dict) -> Dict:
+    """Résultat de l'analyse (positions actuelles, P&L réalisé, transactions) à partir
+    des états des titres"""
+    operations = sorted(
+        (op for etat_titre in titres.values() for op in etat_titre['operations'] if op['detail'] is not None),
+        key=lambda op: op['cle'],
+    )
+    transaction_details = [op['detail'] for op in operations]
+
+    positions_actuelles = []
+    for isin, etat_titre in sorted(
+            ((isin, e) for isin, e in titres.items() if e['position'] is not None),
+            key=lambda item: item[1]['position_cle']):
+        if etat_titre['quantite'] <= 0:
+            continue
+        position = etat_titre['position']
+        # Prix moyen pondéré des lots restants (prix réels : prix/100 pour les obligations)
+        decimales_valeur = QUANTITE_DECIMALES + etat_titre['decimales_prix']
+        valeur_totale = sum(lot[LOT_QUANTITE] * lot[LOT_PRIX] for lot in etat_titre['lots'])
+        prix_moyen = (vers_decimal(valeur_totale, decimales_valeur)
+                      / vers_decimal(etat_titre['quantite'], QUANTITE_DECIMALES))
+        positions_actuelles.append({
+            'isin': isin,
+            'titre': position['titre'],
+            'categorie': position.get('categorie', 'Non classé'),
+            'type_instrument': position.get('type_instrument', ''),
+            'signaletique_id': position.get('signaletique_id'),
+            'donnees_supplementaires': position.get('donnees_supplementaires', {}),
+            'quantite': vers_float(etat_titre['quantite'], QUANTITE_DECIMALES),
+            'prix_moyen': float(prix_moyen),
+            'valeur': vers_float(valeur_totale, decimales_valeur),
+            'devise': etat_titre['lots'][0][LOT_DEVISE] if etat_titre['lots'] else 'EUR',
+            'lots': [
+                {
+                    'date': lot[LOT_DATE],
+                    'quantite': vers_float(lot[LOT_QUANTITE], QUANTITE_DECIMALES),
+                    'prix_unitaire': vers_float(lot[LOT_PRIX], PRIX_DECIMALES),
+                    'devise': lot[LOT_DEVISE]
+                }
+                for lot in etat_titre['lots']
+            ]
+        })
+
+    realises = sorted(((isin, e) for isin, e in titres.items() if e['realise'] is not None),
+                      key=lambda item: item[1]['realise_cle'])
+    pnl_realise_details = [
+        {
+            'isin': isin,
+            'titre': etat_titre['realise']['titre'],
+            'categorie': etat_titre['realise'].get('categorie', 'Non classé'),
+            'type_instrument': etat_titre['realise'].get('type_instrument', ''),
+            'pnl_total': vers_float(etat_titre['pnl'], QUANTITE_DECIMALES + etat_titre['decimales_prix']),
+            'ventes': [op['vente'] for op in etat_titre['operations'] if 'vente' in op],
+        }
+        for isin, etat_titre in realises
+    ]
+    pnl_total_realise = sum((vers_decimal(etat_titre['pnl'], QUANTITE_DECIMALES + etat_titre['decimales_prix'])
+                             for _, etat_titre in realises), Decimal('0'))
+
+    return {
+        'positions_actuelles': positions_actuelles,
+        'pnl_realise': {
+            'total': float(pnl_total_realise),
+            'par_titre': pnl_realise_details
+        },
+        'transactions': transaction_details,
+        'statistiques': {
+            'nombre_transactions': len(transaction_details),
+            'nombre_titres_en_portefeuille': len(positions_actuelles),
+            'nombre_titres_vendus': len(pnl_realise_details)
+        }
+    }
+
+
+def _inchangees(appliquees: Dict, transactions: List[Dict]) -> bool:
+    """Vrai si les transactions sont exactement celles déjà appliquées"""
+    if len(appliquees) != len(transactions):
+        return False
+    for transaction in transactions:
+        applique = appliquees.get(str(transaction['id']))
+        if applique is None or applique['empreinte'] != _empreinte(transaction):
+            return False
+    return True
+
+
+def _charger_titres(portfolio_id, index: Dict, engine) -> Optional[Dict]:
+    """États des titres de l'index ; None si l'un d'eux ne correspond pas à son jeton"""
+    titres = {}
+    for isin, jeton in index['titres'].items():
+        etat_titre = engine.get_etat(_nom_etat(portfolio_id, isin))
+        if etat_titre.get('jeton') != jeton:
+            return None
+        titres[isin] = etat_titre
+    return titres
+
+
+def _analyser(portfolio_id: int, transactions: List[Dict], resoudre, version_signaletique: int,
+              engine) -> tuple:
+    """Met à jour l'état FIFO du portefeuille ; retourne (révision, résultat)"""
+    cle_memo = (engine.__name__, portfolio_id)
+    index = engine.get_etat(_nom_etat(portfolio_id))
+    titres = None
+    if index.get('format') == FORMAT_ETAT and index.get('signaletique_version') == version_signaletique:
+        if _inchangees(index['appliquees'], transactions):
+            memo = _resultats.get(cle_memo)
+            if memo is not None and memo[0] == index['revision']:
+                return memo
+        titres = _charger_titres(portfolio_id, index, engine)
+
+    if titres is None:
+        for isin in index.get('titres') or {}:
+            engine.delete_etat(_nom_etat(portfolio_id, isin))
+        index = {'format': FORMAT_ETAT, 'signaletique_version': version_signaletique,
+                 'revision': None, 'appliquees': {}, 'titres': {}}
+        titres = {}
+    else:
+        index = {**index, 'appliquees': dict(index['appliquees']), 'titres': dict(index['titres'])}
+
+    touches = _synchroniser(index['appliquees'], titres, transactions, resoudre)
+    if touches or index['revision'] is None:
+        # Jeton aléatoire : deux processus qui écrivent le même état n'ont pas la même révision
+        index['revision'] = uuid.uuid4().hex
+        for isin in touches:
+            if isin in titres:
+                titres[isin]['jeton'] = index['titres'][isin] = index['revision']
+                engine.save_etat(_nom_etat(portfolio_id, isin), titres[isin])
+            else:
+                index['titres'].pop(isin, None)
+                engine.delete_etat(_nom_etat(portfolio_id, isin))
+        engine.save_etat(_nom_etat(portfolio_id), index)
+
+    _resultats[cle_memo] = (index['revision'], _resultat(titres))
+    return _resultats[cle_memo]
+
+
+def analyse_fifo(portfolio_id: int, engine=None) -> Dict:
+    """Analyse FIFO d'un portefeuille (positions actuelles, P&L réalisé, transactions),
+    mise à jour incrémentalement à partir de l'état persisté."""
+    engine = resolve_engine(engine)
+    version_signaletique = engine.get_data_version('signaletique')
+    return _analyser(portfolio_id, engine.get_transactions_by_portfolio(portfolio_id),
+                     engine.get_signaletique_for_transaction, version_signaletique, engine)[1]
+
+
+# ---------------------------------------------------------------------------
+# Analyse de plusieurs portefeuilles (vue foyer)
+# ---------------------------------------------------------------------------
+
+def resolveur_signaletique(engine):
+    """Index signalétique (id, ISIN) construit une fois, partagé par tous les portefeuilles.
+    Même résolution que get_signaletique_for_transaction : id puis ISIN, premier gagnant."""
+    par_id, par_isin = {}, {}
+    for sig in engine.get_all_signaletiques():
+        par_id.setdefault(sig.get('id'), sig)
+        isin = (sig.get('isin') or '').upper()
+        if isin:
+            par_isin.setdefault(isin, sig)
+
+    def resoudre(transaction: Dict) -> Optional[Dict]:
+        sig = par_id.get(transaction.get('signaletique_id'))
+        if sig:
+            return sig
+        isin = transaction.get('isin')
+        return par_isin.get(isin.strip().upper()) if isin else None
+    return resoudre
+
+
+# Contexte d'un processus du pool (voir _initialiser_worker)
+_worker: Dict = {}
+
+
+def _initialiser_worker(nom_moteur: str, data_dir: str, sqlite_path: Optional[str], version_signaletique: int):
+    """Processus du pool (démarré par spawn) : même stockage que le parent, index signalétique
+    construit une fois par processus"""
+    from . import file_storage
+    engine = importlib.import_module(nom_moteur)
+    file_storage.set_data_dir(data_dir)
+    if sqlite_path is not None:
+        engine.set_database_path(sqlite_path)
+    _worker.update(engine=engine, resoudre=resolveur_signaletique(engine),
+                   version_signaletique=version_signaletique)
+
+
+def _analyser_worker(portfolio_id: int, transactions: List[Dict]) -> tuple:
+    return _analyser(portfolio_id, transactions, _worker['resoudre'], _worker['version_signaletique'],
+                     _worker['engine'])
+
+
+def analyse_fifo_portefeuilles(portfolio_ids: Optional[List[int]] = None, engine=None,
+                               workers: Optional[int] = None) -> Dict[int, Dict]:
+    """Analyse FIFO de plusieurs portefeuilles (tous par défaut) : {portfolio_id: résultat}.
+
+    Les transactions sont lues en une passe et regroupées par portefeuille ; l'index
+    signalétique est partagé. Avec workers > 1, les portefeuilles sont répartis sur un
+    pool de processus (chaque processus met à jour l'état persisté de ses portefeuilles).
+    """
+    engine = resolve_engine(engine)
+    if portfolio_ids is None:
+        portfolio_ids = [p['id'] for p in engine.get_all_portfolios()]
+    workers = FIFO_BATCH_WORKERS if workers is None else workers
+    version_signaletique = engine.get_data_version('signaletique')
+    par_portefeuille = defaultdict(list)
+    demandes = set(portfolio_ids)
+    for transaction in engine.get_all_transactions():
+        if transaction.get('portfolio_id') in demandes:
+            par_portefeuille[transaction['portfolio_id']].append(transaction)
+
+    if workers > 1 and len(portfolio_ids) > 1:
+        from . import file_storage
+        contexte = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(workers, len(portfolio_ids)), mp_context=contexte,
+                                 initializer=_initialiser_worker,
+                                 initargs=(engine.__name__, file_storage.DATA_DIR,
+                                           getattr(engine, 'SQLITE_PATH', None), version_signaletique)) as executor:
+            futures = {pid: executor.submit(_analyser_worker, pid, par_portefeuille[pid]) for pid in portfolio_ids}
+            resultats = {}
+            for pid, future in futures.items():
+                # Le résultat calculé par le processus est mémorisé ici aussi
+                _resultats[(engine.__name__, pid)] = future.result()
+                resultats[pid] = _resultats[(engine.__name__, pid)][1]
+            return resultats
+
+    resoudre = resolveur_signaletique(engine)
+    return {pid: _analyser(pid, par_portefeuille[pid], resoudre, version_signaletique, engine)[1]
+            for pid in portfolio_ids}
+
+
+def vue_foyer(analyses: Dict[int, Dict]) -> Dict:
+    """Consolidation des analyses de plusieurs portefeuilles : positions par (ISIN, devise),
+    P&L réalisé par ISIN, avec la contribution de chaque portefeuille"""
+    positions: Dict = {}
+    realises: Dict = {}
+    nombre_transactions = 0
+    for pid, analyse in analyses.items():
+        nombre_transactions += analyse['statistiques']['nombre_transactions']
+        for position in analyse['positions_actuelles']:
+            cle = (position['isin'], position['devise'])
+            consolidee = positions.get(cle)
+            if consolidee is None:
+                consolidee = positions[cle] = {
+                    'isin': position['isin'],
+                    'titre': position['titre'],
+                    'categorie': position['categorie'],
+                    'type_instrument': position['type_instrument'],
+                    'signaletique_id': position['signaletique_id'],
+                    'devise': position['devise'],
+                    'quantite': 0.0,
+                    'valeur': 0.0,
+                    'portefeuilles': [],
+                }
+            consolidee['quantite'] += position['quantite']
+            consolidee['valeur'] += position['valeur']
+            consolidee['portefeuilles'].append(
+                {'portfolio_id': pid, 'quantite': position['quantite'], 'valeur': position['valeur']})
+        for titre in analyse['pnl_realise']['par_titre']:
+            consolide = realises.get(titre['isin'])
+            if consolide is None:
+                consolide = realises[titre['isin']] = {
+                    'isin': titre['isin'],
+                    'titre': titre['titre'],
+                    'categorie': titre['categorie'],
+                    'type_instrument': titre['type_instrument'],
+                    'pnl_total': 0.0,
+                    'portefeuilles': [],
+                }
+            consolide['pnl_total'] += titre['pnl_total']
+            consolide['portefeuilles'].append({'portfolio_id': pid, 'pnl_total': titre['pnl_total']})
+
+    for consolidee in positions.values():
+        consolidee['prix_moyen'] = consolidee['valeur'] / consolidee['quantite'] if consolidee['quantite'] else 0.0
+    return {
+        'positions_actuelles': list(positions.values()),
+        'pnl_realise': {
+            'total': sum(analyse['pnl_realise']['total'] for analyse in analyses.values()),
+            'par_titre': list(realises.values()),
+        },
+        'statistiques': {
+            'nombre_portefeuilles': len(analyses),
+            'nombre_transactions': nombre_transactions,
+            'nombre_titres_en_portefeuille': len(positions),
+            'nombre_titres_vendus': len(realises),
+        }
+    }
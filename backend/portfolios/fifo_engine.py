@@ -0,0 +1,131 @@
+# Cœur FIFO : consommation des lots d'achat d'un titre, indépendant du stockage.
+#   - lots en deque : la consommation en tête est en O(1) ;
+#   - quantités et prix en entiers à virgule fixe (QUANTITE_DECIMALES,
+#     PRIX_DECIMALES) : aucun Decimal dans la boucle de consommation, P&L exact ;
+#   - échelle de prix résolue une fois par titre : une obligation est cotée en %
+#     (100 = 1), son prix réel est le même entier lu avec deux décimales de plus.
+# Les conversions vers float / Decimal n'ont lieu qu'à la sortie (vers_float,
+# vers_decimal). Un lot est une liste [id, date, quantite, prix, devise].
+
+from collections import deque
+from decimal import Decimal, ROUND_HALF_EVEN
+from typing import Dict, List, Optional, Tuple
+
+QUANTITE_DECIMALES = 8
+PRIX_DECIMALES = 8
+
+# Positions dans un lot
+LOT_ID, LOT_DATE, LOT_QUANTITE, LOT_PRIX, LOT_DEVISE = range(5)
+
+
+def is_obligation(categorie, type_instrument=''):
+    """
+    Détermine si un actif est une obligation.
+    Pour les obligations, le prix est en pourcentage (100 = 1).
+    """
+    categorie_lower = (categorie or '').lower()
+    type_lower = (type_instrument or '').lower()
+    return 'obligation' in categorie_lower or 'obligation' in type_lower
+
+
+def get_prix_reel(prix_unitaire, categorie, type_instrument=''):
+    """
+    Retourne le prix réel en tenant compte du fait que les obligations sont en pourcentage.
+    """
+    if is_obligation(categorie, type_instrument):
+        return prix_unitaire / Decimal('100')
+    return prix_unitaire
+
+
+def decimales_prix(categorie, type_instrument='') -> int:
+    """Nombre de décimales du prix réel entier d'un titre (deux de plus pour une obligation)"""
+    return PRIX_DECIMALES + (2 if is_obligation(categorie, type_instrument) else 0)
+
+
+def vers_entier(valeur, decimales: int) -> int:
+    """Convertit une valeur (Decimal, chaîne, nombre) en entier à virgule fixe,
+    arrondie au plus proche au-delà de la précision retenue"""
+    texte = valeur if isinstance(valeur, str) else str(valeur)
+    partie_entiere, _, fraction = texte.partition('.')
+    if len(fraction) <= decimales:
+        # Cas courant ('12', '-3.25') : lecture directe, sans passer par Decimal
+        try:
+            return int(partie_entiere + fraction.ljust(decimales, '0'))
+        except ValueError:
+            pass
+    valeur = valeur if isinstance(valeur, Decimal) else Decimal(texte)
+    return int(valeur.scaleb(decimales).to_integral_value(ROUND_HALF_EVEN))
+
+
+def vers_decimal(entier: int, decimales: int) -> Decimal:
+    return Decimal(entier).scaleb(-decimales)
+
+
+def vers_float(entier: int, decimales: int) -> float:
+    # La division entière vraie est correctement arrondie : même float que float(Decimal)
+    return entier / 10 ** decimales
+
+
+def titre_vide(categorie, type_instrument='') -> Dict:
+    """État FIFO d'un titre : lots ouverts, quantité détenue, P&L réalisé cumulé"""
+    return {
+        'decimales_prix': decimales_prix(categorie, type_instrument),
+        'lots': deque(),
+        'quantite': 0,
+        'pnl': 0,  # en unités de 10^-(QUANTITE_DECIMALES + decimales_prix)
+    }
+
+
+def acheter(titre: Dict, lot_id, date, quantite: int, prix: int, devise):
+    """Ajoute un lot d'achat en fin de file"""
+    titre['lots'].append([lot_id, date, quantite, prix, devise])
+    titre['quantite'] += quantite
+
+
+def annuler_achat(titre: Dict) -> List:
+    """Retire le dernier lot ajouté (annulation d'un achat) et le retourne"""
+    lot = titre['lots'].pop()
+    titre['quantite'] -= lot[LOT_QUANTITE]
+    return lot
+
+
+def vendre(titre: Dict, quantite: int, prix: int) -> Optional[Tuple[List[Tuple[List, int]], int]]:
+    """Consomme les lots en FIFO pour une vente au prix donné.
+
+    Retourne (consommés, pnl) : pour chaque lot touché, une copie du lot portant la
+    quantité prise et le P&L du lot ; None si la quantité détenue est insuffisante
+    (rien n'est alors consommé).
+    """
+    if titre['quantite'] < quantite:
+        return None
+    lots = titre['lots']
+    consommes = []
+    pnl = 0
+    reste = quantite
+    while reste > 0 and lots:
+        lot = lots[0]
+        prise = lot[LOT_QUANTITE] if lot[LOT_QUANTITE] < reste else reste
+        pnl_lot = prise * (prix - lot[LOT_PRIX])
+        pnl += pnl_lot
+        consommes.append(([lot[LOT_ID], lot[LOT_DATE], prise, lot[LOT_PRIX], lot[LOT_DEVISE]], pnl_lot))
+        reste -= prise
+        if prise == lot[LOT_QUANTITE]:
+            lots.popleft()
+        else:
+            lot[LOT_QUANTITE] -= prise
+    titre['quantite'] -= quantite - reste
+    titre['pnl'] += pnl
+    return consommes, pnl
+
+
+def rendre(titre: Dict, consommes: List[List], pnl: int):
+    """Annule une vente : remet en tête les quantités prises aux lots (en ordre inverse)"""
+    lots = titre['lots']
+    for lot in reversed(consommes):
+        if lots and lots[0][LOT_ID] == lot[LOT_ID]:
+            # Lot consommé partiellement : il est encore en tête
+            lots[0][LOT_QUANTITE] += lot[LOT_QUANTITE]
+        else:
+            lots.appendleft(list(lot))
+        titre['quantite'] += lot[LOT_QUANTITE]
+    titre['pnl'] -= pnl
@@ -8,6 +8,19 @@ from datetime import datetime, date
 from decimal import Decimal
 from typing import List, Dict, Any, Optional
 import shutil
+from contextlib import contextmanager, nullcontext
+import functools
+import itertools
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus
+    fcntl = None
 
 # Répertoire de stockage des données (chemin dans le conteneur Docker)
 DATA_DIR = "/app/data"
@@ -15,59 +28,315 @@ DATA_DIR = "/app/data"
 # Chemins des fichiers JSON
 PORTFOLIOS_FILE = os.path.join(DATA_DIR, "portfolios.json")
 TRANSACTIONS_FILE = os.path.join(DATA_DIR, "transactions.json")
+TRANSACTIONS_JOURNAL_FILE = os.path.join(DATA_DIR, "transactions.journal.jsonl")
 CASH_FILE = os.path.join(DATA_DIR, "cash.json")
 TARGET_PORTFOLIOS_FILE = os.path.join(DATA_DIR, "target_portfolios.json")
 SIGNALETIQUE_FILE = os.path.join(DATA_DIR, "signaletique.json")
 PRIX_HISTORIQUE_KOALA_FILE = os.path.join(DATA_DIR, "prix_historique_koala.json")
 PRIX_HISTORIQUE_BONOBO_FILE = os.path.join(DATA_DIR, "prix_historique_bonobo.json")
+PRIX_CONSOLIDATION_FILE = os.path.join(DATA_DIR, "prix_consolidation.json")
+TAUX_CHANGE_FILE = os.path.join(DATA_DIR, "taux_change.json")
+ETATS_DIR = os.path.join(DATA_DIR, "etats")
+
+# Journal des transactions : les créations/suppressions sont ajoutées en fin de
+# journal puis fusionnées dans transactions.json au-delà du seuil de compaction.
+TRANSACTIONS_JOURNAL_ENABLED = os.environ.get('TRANSACTIONS_JOURNAL', 'True') == 'True'
+TRANSACTIONS_JOURNAL_COMPACT_THRESHOLD = int(os.environ.get('TRANSACTIONS_JOURNAL_COMPACT_THRESHOLD', '2000'))
+TRANSACTIONS_JOURNAL_FSYNC_EVERY = int(os.environ.get('TRANSACTIONS_JOURNAL_FSYNC_EVERY', '100'))
+TRANSACTIONS_JOURNAL_FSYNC_SECONDS = float(os.environ.get('TRANSACTIONS_JOURNAL_FSYNC_SECONDS', '1.0'))
+
+
+# ---------------------------------------------------------------------------
+# Verrous inter-processus, écritures atomiques et versions de fichiers
+# ---------------------------------------------------------------------------
+# Chaque fichier de données a un fichier compagnon <fichier>.lock sur lequel
+# on pose un verrou fcntl : partagé pour relire le fichier depuis le disque,
+# exclusif pour tout cycle lecture-modification-écriture. Plusieurs workers
+# gunicorn peuvent ainsi écrire sans perdre de mises à jour.
+# Le fichier .lock contient aussi un compteur de version monotone, incrémenté
+# à chaque écriture du fichier (jamais remis à zéro, même par clear_all_data),
+# qui permet aux écrivains optimistes (lots) de détecter les conflits.
+# Les écritures passent par un fichier temporaire + fsync + rename : un
+# lecteur ou un arrêt brutal ne voit jamais de fichier tronqué.
+
+VERSION_WIDTH = 20  # chiffres du compteur stocké dans le fichier .lock
+
+_lock_local = threading.local()
+
+
+class VersionConflictError(ValueError):
+    """Le fichier a été modifié par un autre écrivain depuis sa lecture"""
+
+
+def _lock_path(filepath: str) -> str:
+    return filepath + '.lock'
+
+
+def _held_locks() -> Dict[str, list]:
+    held = getattr(_lock_local, 'held', None)
+    if held is None:
+        held = _lock_local.held = {}
+    return held  # filepath → [fd, exclusif, profondeur]
+
+
+def _acquire_lock(filepath: str, exclusive: bool):
+    held = _held_locks()
+    entry = held.get(filepath)
+    if entry is not None:
+        # Réentrant dans le thread ; un verrou partagé est promu si nécessaire
+        if exclusive and not entry[1] and fcntl is not None:
+            fcntl.flock(entry[0], fcntl.LOCK_EX)
+            entry[1] = True
+        entry[2] += 1
+        return
+    os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+    # Un descripteur par acquisition : flock exclut aussi les autres threads
+    fd = os.open(_lock_path(filepath), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+    except BaseException:
+        os.close(fd)
+        raise
+    held[filepath] = [fd, exclusive, 1]
+
+
+def _release_lock(filepath: str):
+    held = _held_locks()
+    entry = held[filepath]
+    entry[2] -= 1
+    if entry[2] == 0:
+        del held[filepath]
+        os.close(entry[0])  # libère le verrou fcntl
+
+
+@contextmanager
+def _locked(*filepaths: str, exclusive: bool = True):
+    """Verrouille les fichiers (ordre trié pour éviter les interblocages)"""
+    acquired = []
+    try:
+        for filepath in sorted(set(filepaths)):
+            _acquire_lock(filepath, exclusive)
+            acquired.append(filepath)
+        yield
+    finally:
+        for filepath in reversed(acquired):
+            _release_lock(filepath)
+
+
+def _write_locked(*filepaths: str):
+    """Décorateur : exécute la fonction sous verrou exclusif des fichiers donnés
+    (noms des constantes de module, ex. 'CASH_FILE').
+
+    Dans un lot, les verrous sont pris au commit et la fonction s'exécute directement.
+    Avec TRANSACTIONS_FILE, _journal_lock est pris avant les verrous fcntl, dans le
+    même ordre que _commit_batch et les lectures du journal (sinon interblocage
+    entre threads d'un même processus).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current_batch() is not None:
+                return func(*args, **kwargs)
+            journal = _journal_lock if 'TRANSACTIONS_FILE' in filepaths else nullcontext()
+            with journal, _locked(*[globals()[name] for name in filepaths]):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _read_file_version(filepath: str) -> int:
+    """Version courante du fichier (0 s'il n'a jamais été écrit)"""
+    held = _held_locks().get(filepath)
+    if held is not None:
+        raw = os.pread(held[0], VERSION_WIDTH, 0)
+    else:
+        try:
+            with open(_lock_path(filepath), 'rb') as f:
+                raw = f.read(VERSION_WIDTH)
+        except FileNotFoundError:
+            return 0
+    try:
+        return int(raw or b'0')
+    except ValueError:
+        return 0
+
+
+def _bump_file_version(filepath: str) -> int:
+    """Incrémente la version du fichier"""
+    with _locked(filepath):
+        version = _read_file_version(filepath) + 1
+        os.pwrite(_held_locks()[filepath][0], str(version).zfill(VERSION_WIDTH).encode('ascii'), 0)
+    return version
+
+
+def _reserve_id(filepath: str, candidate: int) -> int:
+    """Réserve un ID ≥ candidate pour filepath, jamais donné deux fois : le plus grand ID
+    réservé suit la version dans le fichier .lock. Un lot et un autre écrivain ne
+    créent donc pas d'éléments de même ID."""
+    with _locked(filepath):
+        fd = _held_locks()[filepath][0]
+        try:
+            reserved = int(os.pread(fd, VERSION_WIDTH, VERSION_WIDTH) or b'0')
+        except ValueError:
+            reserved = 0
+        new_id = max(candidate, reserved + 1)
+        os.pwrite(fd, str(new_id).zfill(VERSION_WIDTH).encode('ascii'), VERSION_WIDTH)
+    return new_id
+
+
+def _reset_reserved_id(filepath: str):
+    with _locked(filepath):
+        os.pwrite(_held_locks()[filepath][0], b'0'.zfill(VERSION_WIDTH), VERSION_WIDTH)
+
+
+def get_file_version(filepath: str) -> int:
+    """Retourne le compteur de version monotone d'un fichier de données"""
+    return _read_file_version(filepath)
+
+
+def get_data_version(nom: str) -> int:
+    """Compteur de version d'un jeu de données ('transactions', 'signaletique', …) ;
+    change à chaque écriture, ne revient jamais en arrière."""
+    fichiers = {
+        'portfolios': [PORTFOLIOS_FILE],
+        'transactions': [TRANSACTIONS_FILE],
+        'cash': [CASH_FILE],
+        'signaletique': [SIGNALETIQUE_FILE],
+        'target_portfolios': [TARGET_PORTFOLIOS_FILE],
+        'prix_sources': [PRIX_HISTORIQUE_KOALA_FILE, PRIX_HISTORIQUE_BONOBO_FILE],
+        'prix_titres': [PRIX_TITRES_MANIFEST_FILE],
+        'taux_change': [TAUX_CHANGE_FILE],
+    }.get(nom)
+    if fichiers is None:
+        raise ValueError(f"Jeu de données inconnu : '{nom}'")
+    return sum(_read_file_version(filepath) for filepath in fichiers)
+
+
+def _fsync_dir(directory: str):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _atomic_write(filepath: str, content: bytes):
+    """Écrit content dans filepath via fichier temporaire + fsync + rename"""
+    directory = os.path.dirname(filepath) or '.'
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(filepath) + '.', suffix='.tmp',
+                                    dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_dir(directory)
 
 
 # ---------------------------------------------------------------------------
 # Historique de prix – Import source Koala
 # ---------------------------------------------------------------------------
+# Les règles de fusion sont dans des fonctions pures (_append_prix_rows,
+# _upsert_titre_entry, …) qui opèrent sur les dicts de données : elles sont
+# partagées avec le moteur SQLite (sqlite_storage).
+# Les historiques bruts sont stockés par identifiant sous forme de dict
+# date_import → {cours, devise} (ordre d'insertion conservé) : remplacer le prix
+# d'une date est en O(1). La forme liste [{cours, date_import, devise}] n'est
+# produite que pour l'API (get_prix_historique_koala / _bonobo) ; l'ancien format
+# liste est converti à la lecture et réécrit au prochain import.
+
+def _points_prix(entries) -> Dict:
+    """Points d'un identifiant sous forme date_import → {cours, devise} (accepte l'ancien format liste)"""
+    if not isinstance(entries, list):
+        return entries
+    points = {}
+    for e in entries:
+        date_cle = str(e.get('date_import') or '')
+        points.pop(date_cle, None)
+        points[date_cle] = {'cours': e.get('cours'), 'devise': e.get('devise')}
+    return points
+
+
+def _liste_prix(points: Dict) -> List[Dict]:
+    """Forme liste (API) des points d'un identifiant"""
+    return [{'cours': p.get('cours'), 'date_import': date_import, 'devise': p.get('devise')}
+            for date_import, p in points.items()]
+
+
+def _read_prix_source(filepath: str) -> Dict:
+    """Historique brut d'une source (identifiant → points), converti sur place si ancien format"""
+    historique = _read_json_file(filepath, {})
+    for identifiant, entries in historique.items():
+        if isinstance(entries, list):
+            historique[identifiant] = _points_prix(entries)
+    return historique
+
 
 def get_prix_historique_koala() -> Dict:
     """Retourne tout l'historique de prix Koala (dict identifiant → [entrées])"""
-    return _read_json_file(PRIX_HISTORIQUE_KOALA_FILE, {})
+    return {identifiant: _liste_prix(points)
+            for identifiant, points in _read_prix_source(PRIX_HISTORIQUE_KOALA_FILE).items()}
 
 
 def get_prix_historique_bonobo() -> Dict:
     """Retourne tout l'historique de prix Bonobo (dict identifiant → [entrées])"""
-    return _read_json_file(PRIX_HISTORIQUE_BONOBO_FILE, {})
+    return {identifiant: _liste_prix(points)
+            for identifiant, points in _read_prix_source(PRIX_HISTORIQUE_BONOBO_FILE).items()}
 
 
-def append_prix_bonobo(rows: List[Dict]) -> Dict:
-    """
-    Ajoute des entrées dans l'historique Bonobo.
-    rows: liste de {isin, cours, devise, date_import}
-    Retourne des stats {ajoutés, ignorés}.
-    Un seul prix par (isin, date_import) — le dernier reçu écrase le précédent.
+def _append_prix_rows(historique: Dict, rows: List[Dict], key_field: str,
+                      touches: Optional[Dict] = None) -> Dict:
+    """Ajoute rows dans historique (identifiant → points) ; retourne {ajoutes, ignores}.
+    Un seul prix par (identifiant, date_import) — le dernier reçu écrase le précédent.
+    touches (optionnel) reçoit identifiant → plus petite date_import modifiée.
     """
-    historique = _read_json_file(PRIX_HISTORIQUE_BONOBO_FILE, {})
     ajoutes = 0
     ignores = 0
     for row in rows:
-        isin = str(row.get('isin', '')).strip()
+        identifiant = str(row.get(key_field, '')).strip()
         cours = row.get('cours')
-        if not isin or cours is None:
+        if not identifiant or cours is None:
             ignores += 1
             continue
-        entree = {
-            'cours': float(cours),
-            'date_import': row.get('date_import', datetime.now().date().isoformat()),
-            'devise': row.get('devise', 'EUR'),
-        }
-        if isin not in historique:
-            historique[isin] = []
-        # Dédoublonnage : remplace l'entrée de même date si elle existe déjà
-        date_cle = entree['date_import']
-        historique[isin] = [e for e in historique[isin] if e.get('date_import') != date_cle]
-        historique[isin].append(entree)
+        date_cle = str(row.get('date_import') or datetime.now().date().isoformat())
+        points = historique.setdefault(identifiant, {})
+        # Dédoublonnage : le prix de même date est retiré puis réinséré en fin
+        points.pop(date_cle, None)
+        points[date_cle] = {'cours': float(cours), 'devise': row.get('devise', 'EUR')}
         ajoutes += 1
-    _write_json_file(PRIX_HISTORIQUE_BONOBO_FILE, historique)
+        if touches is not None:
+            touches[identifiant] = min(touches.get(identifiant, date_cle), date_cle)
     return {'ajoutes': ajoutes, 'ignores': ignores}
 
 
+@_write_locked('PRIX_HISTORIQUE_BONOBO_FILE', 'PRIX_CONSOLIDATION_FILE')
+def append_prix_bonobo(rows: List[Dict]) -> Dict:
+    """
+    Ajoute des entrées dans l'historique Bonobo.
+    rows: liste de {isin, cours, devise, date_import}
+    Retourne des stats {ajoutés, ignorés}.
+    Un seul prix par (isin, date_import) — le dernier reçu écrase le précédent.
+    """
+    historique = _read_prix_source(PRIX_HISTORIQUE_BONOBO_FILE)
+    touches = {}
+    stats = _append_prix_rows(historique, rows, 'isin', touches)
+    _write_json_file(PRIX_HISTORIQUE_BONOBO_FILE, historique)
+    _marquer_a_consolider('bonobo', touches)
+    return stats
+
+
+@_write_locked('PRIX_HISTORIQUE_KOALA_FILE', 'PRIX_CONSOLIDATION_FILE')
 def append_prix_koala(rows: List[Dict]) -> Dict:
     """
     Ajoute des entrées dans l'historique Koala.
@@ -75,75 +344,232 @@ def append_prix_koala(rows: List[Dict]) -> Dict:
     Retourne des stats {ajoutés, ignorés}.
     Un seul prix par (symbole, date_import) — le dernier reçu écrase le précédent.
     """
-    historique = _read_json_file(PRIX_HISTORIQUE_KOALA_FILE, {})
+    historique = _read_prix_source(PRIX_HISTORIQUE_KOALA_FILE)
+    touches = {}
+    stats = _append_prix_rows(historique, rows, 'symbole', touches)
+    _write_json_file(PRIX_HISTORIQUE_KOALA_FILE, historique)
+    _marquer_a_consolider('koala', touches)
+    return stats
+
+
+def _marquer_a_consolider(source: str, touches: Dict):
+    """Note les dates modifiées par un import pour la prochaine consolidation incrémentale"""
+    if not touches:
+        return
+    etat = _read_json_file(PRIX_CONSOLIDATION_FILE, {})
+    _fusionner_touches(etat, source, touches)
+    _write_json_file(PRIX_CONSOLIDATION_FILE, etat)
+
+
+# ---------------------------------------------------------------------------
+# Taux de change – historique importé (pas de service externe)
+# ---------------------------------------------------------------------------
+# Stocké par paire 'BASE/COTATION' sous forme date → taux (1 BASE = taux COTATION),
+# comme les points des sources de prix : un seul taux par (paire, date), le dernier
+# reçu écrase le précédent. La règle de fusion est partagée avec sqlite_storage.
+
+def _paire_change(devise_base, devise_cotation) -> Optional[str]:
+    """Clé 'BASE/COTATION' normalisée, None si une devise est vide ou identique à l'autre"""
+    base = str(devise_base or '').strip().upper()
+    cotation = str(devise_cotation or '').strip().upper()
+    if not base or not cotation or base == cotation:
+        return None
+    return f'{base}/{cotation}'
+
+
+def _append_taux_rows(historique: Dict, rows: List[Dict]) -> Dict:
+    """Ajoute rows ({devise_base, devise_cotation, date, taux}) dans historique
+    (paire → {date: taux}) ; retourne {ajoutes, ignores}"""
     ajoutes = 0
     ignores = 0
     for row in rows:
-        symbole = str(row.get('symbole', '')).strip()
-        cours = row.get('cours')
-        if not symbole or cours is None:
+        paire = _paire_change(row.get('devise_base'), row.get('devise_cotation'))
+        date_cle = str(row.get('date') or '')[:10]
+        try:
+            date.fromisoformat(date_cle)
+            taux = float(row.get('taux'))
+        except (TypeError, ValueError):
+            paire = None
+        if paire is None or not taux > 0:
             ignores += 1
             continue
-        entree = {
-            'cours': float(cours),
-            'date_import': row.get('date_import', datetime.now().date().isoformat()),
-            'devise': row.get('devise', 'EUR'),
-        }
-        if symbole not in historique:
-            historique[symbole] = []
-        # Dédoublonnage : remplace l'entrée de même date si elle existe déjà
-        date_cle = entree['date_import']
-        historique[symbole] = [e for e in historique[symbole] if e.get('date_import') != date_cle]
-        historique[symbole].append(entree)
+        historique.setdefault(paire, {})[date_cle] = taux
         ajoutes += 1
-    _write_json_file(PRIX_HISTORIQUE_KOALA_FILE, historique)
     return {'ajoutes': ajoutes, 'ignores': ignores}
 
 
+def get_taux_change() -> Dict:
+    """Retourne l'historique des taux de change (paire 'BASE/COTATION' → {date: taux})"""
+    return _read_json_file(TAUX_CHANGE_FILE, {})
+
+
+@_write_locked('TAUX_CHANGE_FILE')
+def append_taux_change(rows: List[Dict]) -> Dict:
+    """
+    Ajoute des taux de change à l'historique.
+    rows: liste de {devise_base, devise_cotation, date, taux} (1 devise_base = taux devise_cotation)
+    Retourne des stats {ajoutes, ignores}.
+    """
+    historique = _read_json_file(TAUX_CHANGE_FILE, {})
+    stats = _append_taux_rows(historique, rows)
+    if stats['ajoutes']:
+        _write_json_file(TAUX_CHANGE_FILE, historique)
+    return stats
+
+
 # ---------------------------------------------------------------------------
 # Historique de prix – consolidé par titre (Koala + Bonobo → prix_historique_titres)
 # ---------------------------------------------------------------------------
 
-PRIX_HISTORIQUE_TITRES_FILE = os.path.join(DATA_DIR, "prix_historique_titres.json")
+# Stockage par titre : un fichier par ISIN dans prix_titres/ et un manifeste
+# (ISIN → en-tête + statistiques) ; lire ou modifier un titre ne touche que
+# son fichier et le manifeste. L'ancien fichier unique prix_historique_titres.json
+# est découpé automatiquement au premier accès.
+PRIX_HISTORIQUE_TITRES_FILE = os.path.join(DATA_DIR, "prix_historique_titres.json")  # ancien format
+PRIX_TITRES_DIR = os.path.join(DATA_DIR, "prix_titres")
+PRIX_TITRES_MANIFEST_FILE = os.path.join(PRIX_TITRES_DIR, "manifest.json")
+PRIX_TITRES_WRITE_WORKERS = int(os.environ.get('PRIX_TITRES_WRITE_WORKERS', '8'))
+
+
+def _prix_titre_path(isin: str) -> str:
+    """Fichier de l'historique d'un titre (clé encodée pour rester un nom de fichier valide)"""
+    return os.path.join(PRIX_TITRES_DIR, quote(isin, safe='') + '.json')
+
+
+def _titre_stats(isin: str, titre: Dict) -> Dict:
+    """Entrée de manifeste d'un titre : en-tête et statistiques de son historique"""
+    historique = titre.get('historique') or []
+    derniere_date = max((e.get('date') or '' for e in historique), default=None)
+    return {
+        'nom': titre.get('nom', isin),
+        'signaletique_id': titre.get('signaletique_id'),
+        'devise_ref': titre.get('devise_ref', 'EUR'),
+        'nb_entrees': len(historique),
+        'sources': sorted({e.get('source') or '' for e in historique}),
+        'premiere_date': min((e.get('date') or '' for e in historique), default=None),
+        'derniere_date': derniere_date,
+        'dernier_cours': next(
+            (e.get('cours') for e in historique if (e.get('date') or '') == derniere_date), None
+        ),
+    }
+
+
+def _migrate_prix_titres_legacy():
+    """Découpe l'ancien prix_historique_titres.json en fichiers par titre (une seule fois)"""
+    if os.path.exists(PRIX_TITRES_MANIFEST_FILE) or not os.path.exists(PRIX_HISTORIQUE_TITRES_FILE):
+        return
+    with _locked(PRIX_TITRES_MANIFEST_FILE):
+        if os.path.exists(PRIX_TITRES_MANIFEST_FILE) or not os.path.exists(PRIX_HISTORIQUE_TITRES_FILE):
+            return
+        titres, _ = _load_committed_json(PRIX_HISTORIQUE_TITRES_FILE)
+        # Écriture immédiate même si un lot est en cours : l'ancien fichier est renommé juste après
+        state = _current_batch()
+        _batch_local.state = None
+        try:
+            _replace_prix_titres(titres or {})
+        finally:
+            _batch_local.state = state
+        os.replace(PRIX_HISTORIQUE_TITRES_FILE, PRIX_HISTORIQUE_TITRES_FILE + '.migre')
+
+
+def _save_prix_titre(isin: str, titre: Dict):
+    """Écrit le fichier d'un titre puis met à jour son entrée du manifeste"""
+    os.makedirs(PRIX_TITRES_DIR, exist_ok=True)
+    _write_json_file(_prix_titre_path(isin), titre)
+    manifest = _read_json_file(PRIX_TITRES_MANIFEST_FILE, {})
+    manifest[isin] = _titre_stats(isin, titre)
+    _write_json_file(PRIX_TITRES_MANIFEST_FILE, manifest)
+
+
+def _write_prix_titre_files(titres: Dict, supprimes=()):
+    """Écrit les fichiers des titres donnés (en parallèle) et supprime ceux des ISIN supprimés"""
+    os.makedirs(PRIX_TITRES_DIR, exist_ok=True)
+    writes = [(_prix_titre_path(isin), titre) for isin, titre in titres.items()]
+    if _current_batch() is not None or PRIX_TITRES_WRITE_WORKERS <= 1:
+        # Dans un lot, les écritures sont mises en attente dans le thread courant
+        for filepath, titre in writes:
+            _write_json_file(filepath, titre)
+    else:
+        with ThreadPoolExecutor(max_workers=PRIX_TITRES_WRITE_WORKERS) as executor:
+            list(executor.map(lambda write: _write_json_file(*write), writes))
+    for isin in supprimes:
+        filepath = _prix_titre_path(isin)
+        if os.path.exists(filepath):
+            os.remove(filepath)
+
+
+def _replace_prix_titres(titres: Dict):
+    """Remplace tout l'historique consolidé : fichiers par titre écrits en parallèle, puis manifeste"""
+    previous = set(_read_json_file(PRIX_TITRES_MANIFEST_FILE, {}))
+    _write_prix_titre_files(titres, previous - set(titres))
+    _write_json_file(PRIX_TITRES_MANIFEST_FILE,
+                     {isin: _titre_stats(isin, titre) for isin, titre in titres.items()})
+
+
+def _update_prix_titres(titres: Dict, supprimes=()):
+    """Réécrit seulement les titres modifiés / supprimés, puis leurs entrées du manifeste"""
+    if not titres and not supprimes:
+        return
+    _write_prix_titre_files(titres, supprimes)
+    manifest = _read_json_file(PRIX_TITRES_MANIFEST_FILE, {})
+    for isin in supprimes:
+        manifest.pop(isin, None)
+    for isin, titre in titres.items():
+        manifest[isin] = _titre_stats(isin, titre)
+    _write_json_file(PRIX_TITRES_MANIFEST_FILE, manifest)
+
+
+def get_prix_titres_manifest() -> Dict:
+    """Retourne le manifeste de l'historique consolidé (ISIN → en-tête et statistiques)"""
+    _migrate_prix_titres_legacy()
+    return _read_json_file(PRIX_TITRES_MANIFEST_FILE, {})
+
+
+def get_prix_titres_version() -> int:
+    """Version de l'historique consolidé (change à chaque écriture d'un titre)"""
+    _migrate_prix_titres_legacy()
+    return get_file_version(PRIX_TITRES_MANIFEST_FILE)
 
 
 def get_prix_historique_titres() -> Dict:
     """Retourne l'historique consolidé de prix par ISIN"""
-    return _read_json_file(PRIX_HISTORIQUE_TITRES_FILE, {})
+    titres = {}
+    for isin in get_prix_titres_manifest():
+        titre, _ = _load_json_file(_prix_titre_path(isin))
+        if titre is not None:
+            titres[isin] = titre
+    return titres
 
 
 def get_prix_titre_by_isin(isin: str) -> Optional[Dict]:
     """Retourne l'historique de prix pour un titre donné par ISIN"""
-    return _read_json_file(PRIX_HISTORIQUE_TITRES_FILE, {}).get(isin)
+    _migrate_prix_titres_legacy()
+    return _load_json_file(_prix_titre_path(isin))[0]
 
 
-def upsert_prix_titre_entry(isin: str, entry: Dict, sig: Optional[Dict] = None) -> Dict:
-    """
-    Ajoute ou met à jour une entrée de prix dans l'historique d'un titre.
-    Si entry contient un 'id' existant, elle est mise à jour ; sinon elle est créée.
-    Retourne l'entrée finale.
-    """
-    titres = _read_json_file(PRIX_HISTORIQUE_TITRES_FILE, {})
-    if isin not in titres:
-        nom = sig.get('titre', isin) if sig else isin
-        ds = (sig.get('donnees_supplementaires') or {}) if sig else {}
-        devise_ref = str(ds.get('Devise') or 'EUR').strip()
-        titres[isin] = {
-            'isin': isin,
-            'nom': nom,
-            'signaletique_id': sig.get('id') if sig else None,
-            'devise_ref': devise_ref,
-            'historique': [],
-        }
+def _nouveau_titre(isin: str, sig: Optional[Dict], nom: Optional[str] = None) -> Dict:
+    """En-tête d'historique consolidé d'un titre (sans entrées)"""
+    ds = (sig.get('donnees_supplementaires') or {}) if sig else {}
+    if nom is None:
+        nom = isin
+    return {
+        'isin': isin,
+        'nom': sig.get('titre', nom) if sig else nom,
+        'signaletique_id': sig.get('id') if sig else None,
+        'devise_ref': str(ds.get('Devise') or 'EUR').strip(),
+        'historique': [],
+    }
+
 
-    historique = titres[isin]['historique']
+def _upsert_titre_entry(titre: Dict, isin: str, entry: Dict) -> Dict:
+    """Met à jour l'entrée d'id entry['id'] ou en ajoute une nouvelle ; retourne l'entrée finale"""
+    historique = titre['historique']
     entry_id = entry.get('id')
 
     if entry_id:
         for i, e in enumerate(historique):
             if e.get('id') == entry_id:
                 historique[i] = {**e, **entry}
-                _write_json_file(PRIX_HISTORIQUE_TITRES_FILE, titres)
                 return historique[i]
 
     # Nouvelle entrée
@@ -158,43 +584,18 @@ def upsert_prix_titre_entry(isin: str, entry: Dict, sig: Optional[Dict] = None)
     }
     historique.append(new_entry)
     historique.sort(key=lambda x: x.get('date') or '')
-    _write_json_file(PRIX_HISTORIQUE_TITRES_FILE, titres)
     return new_entry
 
 
-def delete_prix_titre_entry(isin: str, entry_id: str) -> bool:
-    """Supprime une entrée par son id. Retourne True si supprimée, False si introuvable."""
-    titres = _read_json_file(PRIX_HISTORIQUE_TITRES_FILE, {})
-    if isin not in titres:
-        return False
-    before = len(titres[isin]['historique'])
-    titres[isin]['historique'] = [e for e in titres[isin]['historique'] if e.get('id') != entry_id]
-    if len(titres[isin]['historique']) == before:
-        return False
-    _write_json_file(PRIX_HISTORIQUE_TITRES_FILE, titres)
-    return True
+def _delete_titre_entry(titre: Dict, entry_id: str) -> bool:
+    before = len(titre['historique'])
+    titre['historique'] = [e for e in titre['historique'] if e.get('id') != entry_id]
+    return len(titre['historique']) != before
 
 
-def import_prix_titre_from_rows(isin: str, rows: List[Dict], sig: Optional[Dict] = None) -> Dict:
-    """
-    Importe une liste de lignes (dict avec date/cours/devise/source/symbole)
-    dans l'historique d'un titre, sans écraser les entrées existantes
-    (dédoublonnage par date+source). Retourne des stats.
-    """
-    titres = _read_json_file(PRIX_HISTORIQUE_TITRES_FILE, {})
-    if isin not in titres:
-        nom = sig.get('titre', isin) if sig else isin
-        ds = (sig.get('donnees_supplementaires') or {}) if sig else {}
-        devise_ref = str(ds.get('Devise') or 'EUR').strip()
-        titres[isin] = {
-            'isin': isin,
-            'nom': nom,
-            'signaletique_id': sig.get('id') if sig else None,
-            'devise_ref': devise_ref,
-            'historique': [],
-        }
-
-    historique = titres[isin]['historique']
+def _import_titre_rows(titre: Dict, isin: str, rows: List[Dict]) -> Dict:
+    """Ajoute rows à l'historique du titre sans écraser (dédoublonnage par date+source)"""
+    historique = titre['historique']
     existing_keys = {(e.get('date'), e.get('source')) for e in historique}
     ajoutes = 0
     ignores = 0
@@ -230,22 +631,62 @@ def import_prix_titre_from_rows(isin: str, rows: List[Dict], sig: Optional[Dict]
         ajoutes += 1
 
     historique.sort(key=lambda x: x.get('date') or '')
-    _write_json_file(PRIX_HISTORIQUE_TITRES_FILE, titres)
     return {'ajoutes': ajoutes, 'ignores': ignores}
 
 
-def rebuild_prix_historique_titres() -> Dict:
+@_write_locked('PRIX_TITRES_MANIFEST_FILE')
+def upsert_prix_titre_entry(isin: str, entry: Dict, sig: Optional[Dict] = None) -> Dict:
     """
-    Consolide les historiques Koala (par Symbole) et Bonobo (par ISIN)
-    vers prix_historique_titres.json, clé = ISIN.
-    - Koala  : match par donnees_supplementaires['Symbole']
-    - Bonobo : match par signaletique.isin
-    - Devise '%' (Bonobo) : remplacée par la devise de référence du titre
+    Ajoute ou met à jour une entrée de prix dans l'historique d'un titre.
+    Si entry contient un 'id' existant, elle est mise à jour ; sinon elle est créée.
+    Retourne l'entrée finale.
     """
-    sigs = get_all_signaletiques()
-    koala = _read_json_file(PRIX_HISTORIQUE_KOALA_FILE, {})
-    bonobo = _read_json_file(PRIX_HISTORIQUE_BONOBO_FILE, {})
+    titre = get_prix_titre_by_isin(isin) or _nouveau_titre(isin, sig)
+    saved = _upsert_titre_entry(titre, isin, entry)
+    _save_prix_titre(isin, titre)
+    return saved
+
+
+@_write_locked('PRIX_TITRES_MANIFEST_FILE')
+def delete_prix_titre_entry(isin: str, entry_id: str) -> bool:
+    """Supprime une entrée par son id. Retourne True si supprimée, False si introuvable."""
+    titre = get_prix_titre_by_isin(isin)
+    if titre is None or not _delete_titre_entry(titre, entry_id):
+        return False
+    _save_prix_titre(isin, titre)
+    return True
 
+
+@_write_locked('PRIX_TITRES_MANIFEST_FILE')
+def import_prix_titre_from_rows(isin: str, rows: List[Dict], sig: Optional[Dict] = None) -> Dict:
+    """
+    Importe une liste de lignes (dict avec date/cours/devise/source/symbole)
+    dans l'historique d'un titre, sans écraser les entrées existantes
+    (dédoublonnage par date+source). Retourne des stats.
+    """
+    titre = get_prix_titre_by_isin(isin) or _nouveau_titre(isin, sig)
+    stats = _import_titre_rows(titre, isin, rows)
+    _save_prix_titre(isin, titre)
+    return stats
+
+
+# ---------------------------------------------------------------------------
+# Consolidation Koala + Bonobo → historique par titre
+# ---------------------------------------------------------------------------
+# Les entrées d'autres sources (saisies manuelles, imports de sauvegarde) sont
+# conservées par la consolidation et prioritaires à date égale ; entre sources
+# consolidées, Bonobo l'emporte sur Koala.
+# Consolidation incrémentale : l'état (PRIX_CONSOLIDATION_FILE) garde, par source
+# et identifiant, l'en-tête du titre cible et la plus grande date_import déjà
+# consolidée (high-water mark), ainsi que les dates modifiées depuis par les
+# imports (a_consolider). Seuls les points nouveaux sont fusionnés dans les titres
+# concernés ; un identifiant dont la correspondance Symbole/CodeBank/ISIN a changé
+# fait reconstruire entièrement ses titres d'origine et de destination.
+SOURCES_CONSOLIDEES = {'koala': 0, 'bonobo': 1}  # source → priorité à date égale
+
+
+def _index_signaletiques(sigs: List[Dict]) -> tuple:
+    """Retourne (ISIN → signalétique, Symbole/CodeBank → signalétique)"""
     # Index signaletiques par ISIN
     isin_to_sig = {sig['isin']: sig for sig in sigs if sig.get('isin')}
 
@@ -256,67 +697,68 @@ def rebuild_prix_historique_titres() -> Dict:
         symbole = ds.get('Symbole') or ds.get('CodeBank')
         if symbole and str(symbole).strip():
             symbole_to_sig[str(symbole).strip()] = sig
+    return isin_to_sig, symbole_to_sig
+
+
+def _entree_consolidee(source: str, isin: str, idx: int, date_import: str, point: Dict, devise_ref: str,
+                       symbole: Optional[str] = None) -> Dict:
+    """Entrée de l'historique consolidé pour le point idx (date_import → point) d'une source brute"""
+    if source == 'koala':
+        return {
+            'id': f"{isin}_{date_import}_{idx}_koala",
+            'date': date_import,
+            'cours': point.get('cours'),
+            'devise': point.get('devise') or devise_ref,
+            'source': 'koala',
+            'symbole': symbole,
+        }
+    devise = str(point.get('devise') or 'EUR').strip()
+    if devise == '%':
+        devise = devise_ref
+    return {
+        'id': f"{isin}_{date_import}_{idx}_bonobo",
+        'date': date_import,
+        'cours': point.get('cours'),
+        'devise': devise,
+        'source': 'bonobo',
+    }
+
+
+def _consolider_titres(sigs: List[Dict], koala: Dict, bonobo: Dict) -> tuple:
+    """Consolide Koala (par Symbole) et Bonobo (par ISIN) (identifiant → points) ; retourne (titres, stats)"""
+    isin_to_sig, symbole_to_sig = _index_signaletiques(sigs)
 
     titres: Dict = {}
 
     def _get_or_create(isin, sig):
         if isin not in titres:
-            ds = sig.get('donnees_supplementaires') or {}
-            devise_ref = str(ds.get('Devise') or 'EUR').strip()
-            titres[isin] = {
-                'isin': isin,
-                'nom': sig.get('titre', ''),
-                'signaletique_id': sig.get('id'),
-                'devise_ref': devise_ref,
-                'historique': [],
-            }
+            titres[isin] = _nouveau_titre(isin, sig, nom=sig.get('titre', ''))
         return titres[isin]
 
     # ── Koala ──
-    for symbole, entries in koala.items():
+    for symbole, points in koala.items():
         sig = symbole_to_sig.get(symbole)
         if not sig:
             continue
         isin = sig.get('isin') or f"SYM_{symbole}"
         titre = _get_or_create(isin, sig)
         devise_ref = titre['devise_ref']
-        for idx, entry in enumerate(entries):
-            titre['historique'].append({
-                'id': f"{isin}_{entry.get('date_import', '')}_{idx}_koala",
-                'date': entry.get('date_import', ''),
-                'cours': entry.get('cours'),
-                'devise': entry.get('devise') or devise_ref,
-                'source': 'koala',
-                'symbole': symbole,
-            })
+        for idx, (date_import, point) in enumerate(points.items()):
+            titre['historique'].append(
+                _entree_consolidee('koala', isin, idx, date_import, point, devise_ref, symbole))
 
     # ── Bonobo ──
-    for isin, entries in bonobo.items():
+    for isin, points in bonobo.items():
         sig = isin_to_sig.get(isin)
         if sig:
             titre = _get_or_create(isin, sig)
         else:
             if isin not in titres:
-                titres[isin] = {
-                    'isin': isin,
-                    'nom': isin,
-                    'signaletique_id': None,
-                    'devise_ref': 'EUR',
-                    'historique': [],
-                }
+                titres[isin] = _nouveau_titre(isin, None)
             titre = titres[isin]
         devise_ref = titre['devise_ref']
-        for idx, entry in enumerate(entries):
-            devise = str(entry.get('devise') or 'EUR').strip()
-            if devise == '%':
-                devise = devise_ref
-            titre['historique'].append({
-                'id': f"{isin}_{entry.get('date_import', '')}_{idx}_bonobo",
-                'date': entry.get('date_import', ''),
-                'cours': entry.get('cours'),
-                'devise': devise,
-                'source': 'bonobo',
-            })
+        for idx, (date_import, point) in enumerate(points.items()):
+            titre['historique'].append(_entree_consolidee('bonobo', isin, idx, date_import, point, devise_ref))
 
     # Tri par date puis dédoublonnage : un seul prix par date (le dernier source gagne — Bonobo > Koala)
     for isin in titres:
@@ -326,8 +768,7 @@ def rebuild_prix_historique_titres() -> Dict:
             par_date[entry.get('date') or ''] = entry  # écrase si même date → dernier gagne
         titres[isin]['historique'] = list(par_date.values())
 
-    _write_json_file(PRIX_HISTORIQUE_TITRES_FILE, titres)
-    return {
+    return titres, {
         'titres_consolides': len(titres),
         'total_entrees': sum(len(t['historique']) for t in titres.values()),
         'koala_matches': sum(
@@ -341,14 +782,219 @@ def rebuild_prix_historique_titres() -> Dict:
     }
 
 
-def restore_prix_historique_from_rows(rows: List[Dict]) -> Dict:
+def _cibles_consolidation(sigs: List[Dict], koala: Dict, bonobo: Dict) -> Dict:
+    """Source → identifiant → en-tête du titre cible (None si l'identifiant n'est pas rattaché)"""
+    isin_to_sig, symbole_to_sig = _index_signaletiques(sigs)
+    cibles = {'koala': {}, 'bonobo': {}}
+    for symbole in koala:
+        sig = symbole_to_sig.get(symbole)
+        if sig:
+            entete = _nouveau_titre(sig.get('isin') or f"SYM_{symbole}", sig, nom=sig.get('titre', ''))
+            del entete['historique']
+            cibles['koala'][symbole] = entete
+    for isin in bonobo:
+        sig = isin_to_sig.get(isin)
+        entete = _nouveau_titre(isin, sig, nom=sig.get('titre', '')) if sig else _nouveau_titre(isin, None)
+        del entete['historique']
+        cibles['bonobo'][isin] = entete
+    return cibles
+
+
+def _a_entrees_manuelles(stats: Dict) -> bool:
+    """Vrai si l'entrée de manifeste signale des entrées hors sources consolidées"""
+    return 'sources' not in stats or any(s not in SOURCES_CONSOLIDEES for s in stats['sources'])
+
+
+def _conserver_manuelles(titre: Optional[Dict], actuel: Optional[Dict]) -> Optional[Dict]:
+    """Reporte dans titre (reconstruit) les entrées hors sources consolidées de actuel"""
+    manuelles = [e for e in (actuel or {}).get('historique', []) if e.get('source') not in SOURCES_CONSOLIDEES]
+    if not manuelles:
+        return titre
+    if titre is None:
+        titre = {**actuel, 'historique': []}
+    dates = {e.get('date') for e in manuelles}
+    titre['historique'] = sorted(
+        [e for e in titre['historique'] if e.get('date') not in dates] + manuelles,
+        key=lambda x: x.get('date') or '',
+    )
+    return titre
+
+
+def _fusionner_entrees(titre: Dict, nouvelles: List[Dict]) -> int:
+    """Fusionne des entrées consolidées dans un titre (priorités par date) ; retourne le nombre retenu"""
+    historique = titre['historique']
+    manuelles = set()
+    par_date = {}
+    for i, e in enumerate(historique):
+        if e.get('source') in SOURCES_CONSOLIDEES:
+            par_date[e.get('date') or ''] = i
+        else:
+            manuelles.add(e.get('date') or '')
+    retenues = 0
+    for entree in nouvelles:
+        date_cle = entree.get('date') or ''
+        if date_cle in manuelles:
+            continue
+        i = par_date.get(date_cle)
+        if i is None:
+            par_date[date_cle] = len(historique)
+            historique.append(entree)
+        elif SOURCES_CONSOLIDEES[entree['source']] >= SOURCES_CONSOLIDEES[historique[i]['source']]:
+            historique[i] = entree
+        else:
+            continue
+        retenues += 1
+    if retenues:
+        historique.sort(key=lambda x: x.get('date') or '')
+    return retenues
+
+
+def _fusionner_touches(etat: Dict, source: str, touches: Dict):
+    """Ajoute à l'état les plus petites dates modifiées par identifiant"""
+    a_consolider = etat.setdefault('a_consolider', {}).setdefault(source, {})
+    for identifiant, date_min in touches.items():
+        a_consolider[identifiant] = min(a_consolider.get(identifiant, date_min), date_min)
+
+
+def _etat_consolidation(cibles: Dict, koala: Dict, bonobo: Dict) -> Dict:
+    """État de consolidation correspondant à une reconstruction complète"""
+    etat = {'sources': {}, 'a_consolider': {}}
+    for source, historique in (('koala', koala), ('bonobo', bonobo)):
+        etat['sources'][source] = {
+            identifiant: {
+                'cible': cible,
+                'hwm': max(historique[identifiant], default=''),
+            }
+            for identifiant, cible in cibles[source].items()
+        }
+    return etat
+
+
+def _consolider_complet(sigs: List[Dict], koala: Dict, bonobo: Dict, actuels: Dict) -> tuple:
+    """Reconstruction complète ; actuels = titres existants ayant des entrées manuelles.
+    Retourne (titres, état)."""
+    titres, _ = _consolider_titres(sigs, koala, bonobo)
+    for isin, actuel in actuels.items():
+        titre = _conserver_manuelles(titres.get(isin), actuel)
+        if titre is not None:
+            titres[isin] = titre
+    return titres, _etat_consolidation(_cibles_consolidation(sigs, koala, bonobo), koala, bonobo)
+
+
+def _consolider_incremental(sigs: List[Dict], koala: Dict, bonobo: Dict, etat: Dict, get_titre) -> tuple:
+    """Consolidation incrémentale à partir de l'état précédent ; get_titre(isin) lit un titre existant.
+    Retourne (titres modifiés, ISIN supprimés, nouvel état, stats)."""
+    cibles = _cibles_consolidation(sigs, koala, bonobo)
+    precedent = etat.get('sources') or {}
+    a_consolider = etat.get('a_consolider') or {}
+
+    # Identifiants dont la correspondance a changé : titres d'origine et de destination à reconstruire
+    a_reconstruire = set()
+    for source in SOURCES_CONSOLIDEES:
+        avant = precedent.get(source) or {}
+        for identifiant in set(avant) | set(cibles[source]):
+            ancienne = (avant.get(identifiant) or {}).get('cible')
+            nouvelle = cibles[source].get(identifiant)
+            if ancienne != nouvelle:
+                a_reconstruire.update(c['isin'] for c in (ancienne, nouvelle) if c)
+
+    modifies: Dict = {}
+    supprimes = set()
+    if a_reconstruire:
+        reconstruits, _ = _consolider_titres(
+            sigs,
+            {s: e for s, e in koala.items() if s in cibles['koala'] and cibles['koala'][s]['isin'] in a_reconstruire},
+            {i: e for i, e in bonobo.items() if cibles['bonobo'][i]['isin'] in a_reconstruire},
+        )
+        for isin in a_reconstruire:
+            actuel = get_titre(isin)
+            titre = _conserver_manuelles(reconstruits.get(isin), actuel)
+            if titre is not None:
+                modifies[isin] = titre
+            elif actuel is not None:
+                supprimes.add(isin)
+
+    # Points nouveaux (au-delà du high-water mark) ou modifiés depuis la dernière consolidation
+    nouvel_etat = {'sources': {}, 'a_consolider': {}}
+    fusionnees = 0
+    for source, historique in (('koala', koala), ('bonobo', bonobo)):
+        avant = precedent.get(source) or {}
+        touches = a_consolider.get(source) or {}
+        suivis = nouvel_etat['sources'][source] = {}
+        for identifiant, cible in cibles[source].items():
+            points = historique[identifiant]
+            hwm = (avant.get(identifiant) or {}).get('hwm') or ''
+            if cible['isin'] in a_reconstruire:
+                hwm = max(points, default='')
+            else:
+                seuil = touches.get(identifiant)
+                nouveaux = [
+                    (idx, date_import) for idx, date_import in enumerate(points)
+                    if date_import > hwm or (seuil is not None and date_import >= seuil)
+                ]
+                if nouveaux:
+                    isin = cible['isin']
+                    titre = modifies.get(isin) or get_titre(isin) or {**cible, 'historique': []}
+                    symbole = identifiant if source == 'koala' else None
+                    fusionnees += _fusionner_entrees(titre, [
+                        _entree_consolidee(source, isin, idx, date_import, points[date_import],
+                                           titre['devise_ref'], symbole)
+                        for idx, date_import in nouveaux
+                    ])
+                    modifies[isin] = titre
+                    hwm = max([hwm] + [date_import for _, date_import in nouveaux])
+            suivis[identifiant] = {'cible': cible, 'hwm': hwm}
+
+    return modifies, supprimes, nouvel_etat, {
+        'titres_reconstruits': len(a_reconstruire),
+        'titres_modifies': len(modifies) + len(supprimes),
+        'entrees_fusionnees': fusionnees,
+    }
+
+
+def _stats_consolidation(manifest: Dict) -> Dict:
+    """Statistiques globales de l'historique consolidé à partir du manifeste"""
+    return {
+        'titres_consolides': len(manifest),
+        'total_entrees': sum(stats.get('nb_entrees', 0) for stats in manifest.values()),
+        'koala_matches': sum(1 for stats in manifest.values() if 'koala' in stats.get('sources', [])),
+        'bonobo_matches': sum(1 for stats in manifest.values() if 'bonobo' in stats.get('sources', [])),
+    }
+
+
+@_write_locked('PRIX_TITRES_MANIFEST_FILE', 'PRIX_CONSOLIDATION_FILE',
+               'PRIX_HISTORIQUE_KOALA_FILE', 'PRIX_HISTORIQUE_BONOBO_FILE')
+def rebuild_prix_historique_titres(incremental: bool = False) -> Dict:
     """
-    Reconstruit prix_historique_titres.json à partir des lignes lues depuis le fichier Excel
-    de sauvegarde (colonnes : ISIN, Nom, Date, Cours, Devise, Source, Symbole).
-    Retourne des stats {ajoutes, ignores, titres}.
+    Consolide les historiques Koala (par Symbole) et Bonobo (par ISIN)
+    vers l'historique consolidé (un fichier par ISIN, voir PRIX_TITRES_DIR).
+    - Koala  : match par donnees_supplementaires['Symbole']
+    - Bonobo : match par signaletique.isin
+    - Devise '%' (Bonobo) : remplacée par la devise de référence du titre
+    - Entrées manuelles : conservées
+    incremental=True ne fusionne que les points nouveaux depuis la dernière consolidation.
     """
-    titres: Dict = {}
     sigs = get_all_signaletiques()
+    koala = _read_prix_source(PRIX_HISTORIQUE_KOALA_FILE)
+    bonobo = _read_prix_source(PRIX_HISTORIQUE_BONOBO_FILE)
+    if incremental:
+        titres, supprimes, etat, stats = _consolider_incremental(
+            sigs, koala, bonobo, _read_json_file(PRIX_CONSOLIDATION_FILE, {}), get_prix_titre_by_isin)
+        _update_prix_titres(titres, supprimes)
+    else:
+        actuels = {isin: get_prix_titre_by_isin(isin) for isin, titre_stats in get_prix_titres_manifest().items()
+                   if _a_entrees_manuelles(titre_stats)}
+        titres, etat = _consolider_complet(sigs, koala, bonobo, actuels)
+        _replace_prix_titres(titres)
+        stats = {'titres_reconstruits': len(titres)}
+    _write_json_file(PRIX_CONSOLIDATION_FILE, etat)
+    return {'mode': 'incremental' if incremental else 'complet', **stats,
+            **_stats_consolidation(_read_json_file(PRIX_TITRES_MANIFEST_FILE, {}))}
+
+
+def _titres_from_backup_rows(rows: List[Dict], sigs: List[Dict]) -> tuple:
+    """Historique consolidé à partir des lignes de sauvegarde ; retourne (titres, stats)"""
+    titres: Dict = {}
     isin_to_sig = {sig['isin']: sig for sig in sigs if sig.get('isin')}
 
     ajoutes = 0
@@ -375,17 +1021,7 @@ def restore_prix_historique_from_rows(rows: List[Dict]) -> Dict:
         symbole = str(row.get('Symbole') or '')
 
         if isin not in titres:
-            sig = isin_to_sig.get(isin)
-            sig_id = sig['id'] if sig else None
-            ds = (sig.get('donnees_supplementaires') or {}) if sig else {}
-            devise_ref = str(ds.get('Devise') or 'EUR').strip()
-            titres[isin] = {
-                'isin': isin,
-                'nom': sig.get('titre', nom) if sig else nom,
-                'signaletique_id': sig_id,
-                'devise_ref': devise_ref,
-                'historique': [],
-            }
+            titres[isin] = _nouveau_titre(isin, isin_to_sig.get(isin), nom=nom)
 
         entry_id = f"{isin}_{date_val}_{idx}_{source}"
         titres[isin]['historique'].append({
@@ -398,17 +1034,34 @@ def restore_prix_historique_from_rows(rows: List[Dict]) -> Dict:
         })
         ajoutes += 1
 
-    _write_json_file(PRIX_HISTORIQUE_TITRES_FILE, titres)
-    return {'ajoutes': ajoutes, 'ignores': ignores, 'titres': len(titres)}
+    return titres, {'ajoutes': ajoutes, 'ignores': ignores, 'titres': len(titres)}
+
+
+@_write_locked('PRIX_TITRES_MANIFEST_FILE')
+def restore_prix_historique_from_rows(rows: List[Dict]) -> Dict:
+    """
+    Reconstruit l'historique consolidé à partir des lignes lues depuis le fichier Excel
+    de sauvegarde (colonnes : ISIN, Nom, Date, Cours, Devise, Source, Symbole).
+    Retourne des stats {ajoutes, ignores, titres}.
+    """
+    titres, stats = _titres_from_backup_rows(rows, get_all_signaletiques())
+    _replace_prix_titres(titres)
+    return stats
 
 
 class DateTimeEncoder(json.JSONEncoder):
     """Encoder JSON personnalisé pour gérer les types date, datetime et Decimal"""
-    
+
+    # Passe à True dès qu'un objet a dû être converti (date, Decimal…) :
+    # la représentation relue depuis le disque diffère alors de l'objet Python.
+    converted = False
+
     def default(self, obj):
         if isinstance(obj, (datetime, date)):
+            self.converted = True
             return obj.isoformat()
         if isinstance(obj, Decimal):
+            self.converted = True
             return str(obj)
         return super().default(obj)
 
@@ -430,30 +1083,507 @@ def list_json_snapshots(directory: str) -> List[str]:
     return entries
 
 
-def _read_json_file(filepath: str, default: Any = None) -> Any:
-    """Lit un fichier JSON et retourne son contenu"""
-    if not os.path.exists(filepath):
-        return default if default is not None else []
-    
+# ---------------------------------------------------------------------------
+# Cache en mémoire des fichiers JSON
+# ---------------------------------------------------------------------------
+# Chaque fichier lu est conservé parsé en mémoire avec sa signature disque
+# (inode, mtime_ns, taille) et n'est relu que si cette signature change
+# (écriture par un autre processus, édition manuelle du fichier).
+# Les écritures via _write_json_file mettent le cache à jour directement.
+# Les objets retournés sont partagés entre les appels : un appelant qui les
+# modifie doit les réécrire via _write_json_file.
+
+_cache_lock = threading.RLock()
+_json_cache: Dict[str, tuple] = {}  # filepath → (signature, données parsées, version)
+_cache_stats = {'hits': 0, 'misses': 0, 'writes': 0}
+_versions = itertools.count(1)  # version locale, change à chaque (re)chargement ou écriture
+
+
+def _file_signature(filepath: str) -> Optional[tuple]:
+    """Signature disque d'un fichier (inode, mtime_ns, taille), None s'il n'existe pas"""
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def get_cache_stats() -> Dict:
+    """Retourne les compteurs du cache JSON (hits, misses, écritures, fichiers en cache)"""
+    with _cache_lock:
+        return {**_cache_stats, 'fichiers': len(_json_cache), 'index': len(_indexes)}
+
+
+def _etat_path(nom: str) -> str:
+    return os.path.join(ETATS_DIR, quote(nom, safe='') + '.json')
+
+
+def get_etat(nom: str) -> Dict:
+    """Retourne un état dérivé persisté (cache de calcul), {} s'il n'existe pas.
+    L'objet vient du cache : le copier avant de le modifier."""
+    return _read_json_file(_etat_path(nom), {})
+
+
+def save_etat(nom: str, data: Dict):
+    """Enregistre un état dérivé persisté (etats/<nom>.json)"""
+    os.makedirs(ETATS_DIR, exist_ok=True)
+    _write_json_file(_etat_path(nom), data)
+
+
+def delete_etat(nom: str):
+    """Supprime un état dérivé persisté (sans effet s'il n'existe pas)"""
+    filepath = _etat_path(nom)
+    if os.path.exists(filepath):
+        os.remove(filepath)
+
+
+def clear_cache():
+    """Vide le cache JSON en mémoire (les fichiers seront relus au prochain accès)"""
+    with _cache_lock:
+        _json_cache.clear()
+        _indexes.clear()
+    with _journal_lock:
+        _journal_state['merged'] = None
+
+
+def _load_committed_json(filepath: str) -> tuple:
+    """Retourne (données, version) depuis le cache ou le disque ; (None, None) si illisible"""
+    signature = _file_signature(filepath)
+    if signature is None:
+        return None, None
+
+    with _cache_lock:
+        cached = _json_cache.get(filepath)
+        if cached is not None and cached[0] == signature:
+            _cache_stats['hits'] += 1
+            return cached[1], cached[2]
+        _cache_stats['misses'] += 1
+
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with _locked(filepath, exclusive=False):
+            signature = _file_signature(filepath)
+            with open(filepath, 'r', encoding='utf-8') as f:
+                data = json.load(f)
     except (json.JSONDecodeError, IOError):
+        return None, None
+
+    with _cache_lock:
+        version = next(_versions)
+        _json_cache[filepath] = (signature, data, version)
+    return data, version
+
+
+def _load_json_file(filepath: str) -> tuple:
+    """Comme _load_committed_json, mais voit les modifications du lot (batch) en cours"""
+    batch = _current_batch()
+    if batch is None:
+        return _load_committed_json(filepath)
+    staged = batch['files'].get(filepath)
+    if staged is None:
+        batch['disk_versions'].setdefault(filepath, _read_file_version(filepath))
+        data, _ = _load_committed_json(filepath)
+        if data is None:
+            return None, None
+        # Copie privée : les objets du cache partagé ne sont pas modifiés avant le commit
+        staged = (_stage_base(batch, filepath, data), next(_versions))
+        batch['files'][filepath] = staged
+    return staged
+
+
+def _copy_json(data: Any) -> Any:
+    return json.loads(json.dumps(data, cls=DateTimeEncoder, ensure_ascii=False))
+
+
+def _stage_base(batch: Dict, filepath: str, data: Any) -> Any:
+    """Copie privée des données lues dans le lot ; leur texte est gardé comme base
+    pour rejouer les changements du lot en cas d'écriture concurrente"""
+    text = json.dumps(data, cls=DateTimeEncoder, ensure_ascii=False)
+    batch['bases'][filepath] = text
+    return json.loads(text)
+
+
+def _read_json_file(filepath: str, default: Any = None) -> Any:
+    """Lit un fichier JSON et retourne son contenu (depuis le cache si le fichier n'a pas changé)"""
+    data, _ = _load_json_file(filepath)
+    if data is None:
         return default if default is not None else []
+    return data
+
 
+def _write_json_file(filepath: str, data: Any, index_updates: Optional[List[tuple]] = None):
+    """Écrit des données dans un fichier JSON et met à jour le cache.
+
+    index_updates : liste de (élément, anciennes clés) ajoutés ou modifiés par
+    l'appelant. Si elle est fournie, les index secondaires sont mis à jour sur
+    place au lieu d'être reconstruits à la prochaine recherche.
+    Dans un lot (batch), l'écriture est seulement mise en attente jusqu'au commit.
+    """
+    batch = _current_batch()
+    if batch is not None:
+        previous = batch['files'].get(filepath)
+        batch['disk_versions'].setdefault(filepath, _read_file_version(filepath))
+        version = next(_versions)
+        batch['files'][filepath] = (data, version)
+        batch['dirty'].add(filepath)
+        with _cache_lock:
+            _carry_indexes(batch['indexes'], filepath, previous, data, version, index_updates)
+        return
 
-def _write_json_file(filepath: str, data: Any):
-    """Écrit des données dans un fichier JSON"""
     ensure_data_dir()
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, cls=DateTimeEncoder, ensure_ascii=False)
+    # Les états dérivés (etats/) ne sont pas destinés à être lus : JSON compact,
+    # sérialisé par l'encodeur C (l'indentation force l'encodeur Python)
+    compact = os.path.dirname(filepath) == ETATS_DIR
+    encoder = DateTimeEncoder(indent=None if compact else 2, ensure_ascii=False,
+                              separators=(',', ':') if compact else None)
+    try:
+        text = encoder.encode(data)
+        with _locked(filepath):
+            _atomic_write(filepath, text.encode('utf-8'))
+            _bump_file_version(filepath)
+    except Exception:
+        with _cache_lock:
+            _json_cache.pop(filepath, None)
+            _indexes.pop(filepath, None)
+        raise
+
+    # Si des dates/Decimal ont été converties, on met en cache la forme relue
+    # afin que les lecteurs voient exactement le contenu du fichier.
+    written = json.loads(text) if encoder.converted else data
+    with _cache_lock:
+        previous = _json_cache.get(filepath)
+        version = next(_versions)
+        _json_cache[filepath] = (_file_signature(filepath), written, version)
+        _cache_stats['writes'] += 1
+        if written is not data:
+            _indexes.pop(filepath, None)
+        else:
+            _carry_indexes(_indexes, filepath, previous[1:] if previous else None,
+                           data, version, index_updates)
 
 
-def _get_next_id(items: List[Dict]) -> int:
-    """Retourne le prochain ID disponible"""
-    if not items:
-        return 1
-    return max(item.get('id', 0) for item in items) + 1
+# ---------------------------------------------------------------------------
+# Index secondaires (id, ISIN, code, nom, portefeuille → éléments)
+# ---------------------------------------------------------------------------
+# Construits à la demande à partir des données en cache, pour la version
+# courante du fichier. Une écriture qui décrit ses changements (index_updates)
+# met les index à jour sur place ; toute autre écriture les invalide et ils
+# sont reconstruits à la prochaine recherche.
+
+# filepath → (version, {nom: (key_func, multi, index)}, {'max_id': …})
+_indexes: Dict[str, tuple] = {}
+
+
+def _key_id(item: Dict):
+    return item.get('id')
+
+
+def _key_name(item: Dict):
+    return item.get('name')
+
+
+def _key_portfolio_id(item: Dict):
+    return item.get('portfolio_id')
+
+
+def _key_isin(item: Dict):
+    return (item.get('isin') or '').upper() or None
+
+
+def _key_code(item: Dict):
+    return (item.get('code') or '').upper() or None
+
+
+def _key_transaction_doublon(item: Dict):
+    """Clé de détection de doublons (voir transaction_exists)"""
+    return (item.get('portfolio_id'), item.get('date'), item.get('type_operation'),
+            str(item.get('quantite')), str(item.get('prix_unitaire')))
+
+
+def _index_add(index: Dict, key_func, multi: bool, item: Dict):
+    key = key_func(item)
+    if key is None:
+        return
+    if multi:
+        index.setdefault(key, []).append(item)
+    else:
+        # Premier élément gagnant, comme le parcours linéaire d'origine
+        index.setdefault(key, item)
+
+
+def _index_remove(index: Dict, multi: bool, key, item: Dict):
+    if key is None:
+        return
+    if multi:
+        bucket = index.get(key)
+        if bucket:
+            index[key] = [i for i in bucket if i is not item]
+    elif index.get(key) is item:
+        del index[key]
+
+
+def _index_store() -> Dict[str, tuple]:
+    batch = _current_batch()
+    return batch['indexes'] if batch is not None else _indexes
+
+
+def _carry_indexes(store: Dict[str, tuple], filepath: str, previous: Optional[tuple], data: Any,
+                   version: int, index_updates: Optional[List[tuple]]):
+    """Reporte les index de filepath sur la nouvelle version (appelé sous _cache_lock).
+
+    previous : (données, version) remplacées. Les index ne sont reportés que si
+    l'appelant a modifié ces mêmes données et décrit ses changements.
+    """
+    entry = store.pop(filepath, None)
+    if (entry is None or index_updates is None or previous is None
+            or previous[1] != entry[0] or previous[0] is not data):
+        return
+    definitions, meta = entry[1], entry[2]
+    for item, old_keys in index_updates:
+        if 'max_id' in meta and isinstance(item.get('id'), int):
+            meta['max_id'] = max(meta['max_id'], item['id'])
+        for name, (key_func, multi, index) in definitions.items():
+            if old_keys:
+                old_key = old_keys.get(name)
+                if old_key == key_func(item):
+                    continue
+                _index_remove(index, multi, old_key, item)
+            _index_add(index, key_func, multi, item)
+    store[filepath] = (version, definitions, meta)
+
+
+def _index_keys(filepath: str, item: Dict) -> Dict:
+    """Clés actuelles d'un élément dans les index construits pour filepath"""
+    with _cache_lock:
+        entry = _index_store().get(filepath)
+        if not entry:
+            return {}
+        return {name: key_func(item) for name, (key_func, _, _) in entry[1].items()}
+
+
+def _index_entry(filepath: str) -> tuple:
+    """Retourne (données, entrée d'index) pour la version courante de filepath"""
+    if filepath == TRANSACTIONS_FILE:
+        data, version = _load_transactions()
+    else:
+        data, version = _load_json_file(filepath)
+    if data is None:
+        return None, None
+    store = _index_store()
+    entry = store.get(filepath)
+    if entry is None or entry[0] != version:
+        entry = (version, {}, {})
+        store[filepath] = entry
+    return data, entry
+
+
+def _get_index(filepath: str, name: str, key_func, multi: bool = False) -> Dict:
+    """Retourne l'index `name` de filepath, (re)construit si le fichier a changé"""
+    with _cache_lock:
+        data, entry = _index_entry(filepath)
+        if entry is None:
+            return {}
+        definition = entry[1].get(name)
+        if definition is None:
+            index: Dict = {}
+            for item in data:
+                _index_add(index, key_func, multi, item)
+            definition = (key_func, multi, index)
+            entry[1][name] = definition
+        return definition[2]
+
+
+def _next_id(filepath: str) -> int:
+    """Prochain ID disponible pour filepath (maximum maintenu avec les index), réservé"""
+    with _cache_lock:
+        data, entry = _index_entry(filepath)
+        if entry is None:
+            candidate = 1
+        else:
+            meta = entry[2]
+            if 'max_id' not in meta:
+                meta['max_id'] = max((item.get('id', 0) for item in data), default=0)
+            candidate = meta['max_id'] + 1
+    return _reserve_id(filepath, candidate)
+
+
+# ---------------------------------------------------------------------------
+# Lots d'écritures (unit of work)
+# ---------------------------------------------------------------------------
+# Dans un bloc `with batch():`, chaque fichier touché est chargé une seule fois
+# (copie privée au thread), les helpers habituels y appliquent leurs
+# modifications avec les mêmes règles de validation et de dédoublonnage, et
+# chaque fichier n'est écrit qu'une fois à la sortie du bloc. Une exception
+# dans le bloc ou pendant le commit annule l'ensemble des fichiers.
+# Les fichiers ne sont pas verrouillés pendant le bloc : si un autre écrivain en
+# modifie un entre-temps, les changements du lot (ajouts, modifications,
+# suppressions d'éléments) sont rejoués au commit sur le contenu à jour, et
+# l'élément du lot l'emporte s'il a été modifié des deux côtés.
+
+_batch_local = threading.local()
+
+
+def _current_batch() -> Optional[Dict]:
+    return getattr(_batch_local, 'state', None)
+
+
+@contextmanager
+def batch():
+    """Regroupe les écritures du bloc et les valide ensemble (ou aucune) à la sortie.
+
+    Les blocs imbriqués rejoignent le lot englobant.
+    """
+    if _current_batch() is not None:
+        yield
+        return
+
+    state = {
+        'files': {},          # filepath → (données, version)
+        'dirty': set(),       # fichiers à écrire au commit
+        'indexes': {},        # index secondaires sur les données du lot
+        'journal': [],        # opérations de transactions à journaliser
+        'disk_versions': {},  # filepath → version disque à la première lecture
+        'bases': {},          # filepath → texte JSON des données à la première lecture
+        'transactions_rewrite': False,
+        'max_id': 0,          # plus grand ID de transaction du lot
+        'base_max_id': 0,     # plus grand ID sur disque à la lecture des transactions
+        'ids': set(),         # IDs des transactions du lot (rejeu idempotent)
+    }
+    _batch_local.state = state
+    try:
+        yield
+    except BaseException:
+        _batch_local.state = None
+        raise
+    _batch_local.state = None
+    _commit_batch(state)
+
+
+def _read_bytes(filepath: str) -> Optional[bytes]:
+    try:
+        with open(filepath, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _restore_bytes(filepath: str, content: Optional[bytes]):
+    if content is None:
+        if os.path.exists(filepath):
+            os.remove(filepath)
+    else:
+        _atomic_write(filepath, content)
+
+
+def _commit_batch(state: Dict):
+    """Écrit chaque fichier modifié une fois ; restaure tous les fichiers en cas d'échec.
+
+    Si un fichier réécrit a été modifié par un autre écrivain depuis sa lecture dans
+    le lot, les changements du lot sont rejoués sur son contenu actuel (_merge_batch).
+    Lève VersionConflictError si c'est impossible. Les créations de transactions
+    journalisées ne sont pas en conflit : leurs IDs sont décalés si besoin.
+    """
+    files = sorted(state['dirty'] - {TRANSACTIONS_FILE})
+    rewritten = files + ([TRANSACTIONS_FILE] if state['transactions_rewrite'] else [])
+    targets = list(files)
+    if state['transactions_rewrite'] or state['journal']:
+        targets += [TRANSACTIONS_FILE, TRANSACTIONS_JOURNAL_FILE]
+    if not targets:
+        return
+
+    with _journal_lock, _locked(*[f for f in targets if f != TRANSACTIONS_JOURNAL_FILE]):
+        for filepath in rewritten:
+            expected = state['disk_versions'].get(filepath)
+            if expected is not None and _read_file_version(filepath) != expected:
+                merged = _merge_batch(state, filepath)
+                if merged is None:
+                    raise VersionConflictError(
+                        f"{os.path.basename(filepath)} a été modifié par un autre processus pendant le lot"
+                    )
+                state['files'][filepath] = (merged, next(_versions))
+        if state['journal'] and not state['transactions_rewrite']:
+            _renumber_journal_records(state)
+
+        originals = {filepath: _read_bytes(filepath) for filepath in targets}
+        try:
+            for filepath in files:
+                _write_json_file(filepath, state['files'][filepath][0])
+            if state['transactions_rewrite']:
+                _write_transactions(state['files'][TRANSACTIONS_FILE][0])
+            elif state['journal']:
+                _append_journal(state['journal'])
+        except BaseException:
+            for filepath, content in originals.items():
+                try:
+                    _restore_bytes(filepath, content)
+                except OSError:
+                    pass
+            clear_cache()
+            raise
+
+
+def _by_key(data: Any) -> Optional[Dict]:
+    """Éléments indexés par clé (dictionnaire) ou par ID (liste d'éléments avec 'id')"""
+    if isinstance(data, dict):
+        return data
+    if isinstance(data, list) and all(isinstance(item, dict) and 'id' in item for item in data):
+        by_id = {item['id']: item for item in data}
+        return by_id if len(by_id) == len(data) else None
+    return None
+
+
+def _merge_batch(state: Dict, filepath: str) -> Optional[Any]:
+    """Rejoue les changements du lot sur le contenu actuel de filepath (sous verrou).
+
+    Changements = différences entre la base lue par le lot et ses données finales, par
+    ID pour les listes d'éléments, par clé pour les dictionnaires : ajouts, éléments
+    modifiés (ceux du lot remplacent ceux du disque), suppressions. Les autres
+    éléments écrits entre-temps sont conservés. None si impossible (ID créé des deux
+    côtés avec des contenus différents, données d'une autre forme).
+    """
+    base_text = state['bases'].get(filepath)
+    # Valeurs JSON (dates, Decimal convertis) comparables à la base
+    mine = _copy_json(state['files'][filepath][0])
+    if filepath == TRANSACTIONS_FILE:
+        theirs, _ = _load_committed_transactions()
+    else:
+        theirs, _ = _load_committed_json(filepath)
+    if base_text is None or theirs is None:
+        return mine  # écrit sans lecture dans le lot : remplace le fichier
+    base = _by_key(json.loads(base_text))
+    mine_items = _by_key(mine)
+    theirs_items = _by_key(theirs)
+    if base is None or mine_items is None or theirs_items is None or type(mine) is not type(theirs):
+        return None
+
+    merged = dict(theirs_items)
+    for key in base:
+        if key not in mine_items:
+            merged.pop(key, None)
+    for key, item in mine_items.items():
+        if key not in base:
+            if key in theirs_items and _copy_json(theirs_items[key]) != item:
+                return None
+            merged[key] = item
+        elif item != base[key]:
+            merged[key] = item
+    return merged if isinstance(mine, dict) else list(merged.values())
+
+
+def _renumber_journal_records(state: Dict):
+    """Décale les IDs créés dans le lot si d'autres transactions ont été créées entre-temps"""
+    _load_committed_transactions()
+    shift = _journal_state['max_id'] - state['base_max_id']
+    if shift <= 0:
+        return
+    mapping = {}
+    for record in state['journal']:
+        if record.get('op') == 'add':
+            tx = record['tx']
+            if (tx.get('id') or 0) > state['base_max_id']:
+                mapping[tx['id']] = tx['id'] + shift
+                tx['id'] = mapping[tx['id']]
+        elif record.get('id') in mapping:
+            record['id'] = mapping[record['id']]
 
 
 # ============================================================================
@@ -467,22 +1597,15 @@ def get_all_portfolios() -> List[Dict]:
 
 def get_portfolio_by_id(portfolio_id: int) -> Optional[Dict]:
     """Récupère un portefeuille par son ID"""
-    portfolios = get_all_portfolios()
-    for portfolio in portfolios:
-        if portfolio.get('id') == portfolio_id:
-            return portfolio
-    return None
+    return _get_index(PORTFOLIOS_FILE, 'id', _key_id).get(portfolio_id)
 
 
 def get_portfolio_by_name(name: str) -> Optional[Dict]:
     """Récupère un portefeuille par son nom"""
-    portfolios = get_all_portfolios()
-    for portfolio in portfolios:
-        if portfolio.get('name') == name:
-            return portfolio
-    return None
+    return _get_index(PORTFOLIOS_FILE, 'name', _key_name).get(name)
 
 
+@_write_locked('PORTFOLIOS_FILE')
 def create_portfolio(name: str, description: str = None,
                      type_compte: str = None, courtier: str = None,
                      devise: str = 'EUR', date_ouverture: str = None,
@@ -500,11 +1623,11 @@ def create_portfolio(name: str, description: str = None,
     """
     portfolios = get_all_portfolios()
 
-    if any(p.get('name') == name for p in portfolios):
+    if get_portfolio_by_name(name):
         raise ValueError(f"Un portefeuille avec le nom '{name}' existe déjà")
 
     new_portfolio = {
-        'id': _get_next_id(portfolios),
+        'id': _next_id(PORTFOLIOS_FILE),
         'name': name,
         'description': description,
         'type_compte': type_compte,
@@ -517,10 +1640,11 @@ def create_portfolio(name: str, description: str = None,
     }
 
     portfolios.append(new_portfolio)
-    _write_json_file(PORTFOLIOS_FILE, portfolios)
+    _write_json_file(PORTFOLIOS_FILE, portfolios, index_updates=[(new_portfolio, None)])
     return new_portfolio
 
 
+@_write_locked('PORTFOLIOS_FILE')
 def update_portfolio(portfolio_id: int, data: Dict) -> Optional[Dict]:
     """Met à jour un portefeuille"""
     portfolios = get_all_portfolios()
@@ -542,6 +1666,7 @@ def update_portfolio(portfolio_id: int, data: Dict) -> Optional[Dict]:
     return None
 
 
+@_write_locked('PORTFOLIOS_FILE', 'TRANSACTIONS_FILE', 'CASH_FILE')
 def delete_portfolio(portfolio_id: int) -> bool:
     """Supprime un portefeuille et toutes ses transactions et cash associés"""
     portfolios = get_all_portfolios()
@@ -557,7 +1682,7 @@ def delete_portfolio(portfolio_id: int) -> bool:
     # Supprimer les transactions associées
     transactions = get_all_transactions()
     new_transactions = [t for t in transactions if t.get('portfolio_id') != portfolio_id]
-    _write_json_file(TRANSACTIONS_FILE, new_transactions)
+    _write_transactions(new_transactions)
     
     # Supprimer les cash associés
     cash_entries = get_all_cash()
@@ -567,6 +1692,7 @@ def delete_portfolio(portfolio_id: int) -> bool:
     return True
 
 
+@_write_locked('PORTFOLIOS_FILE')
 def get_or_create_portfolio(name: str, defaults: Dict = None) -> tuple[Dict, bool]:
     """Récupère ou crée un portefeuille.
 
@@ -592,28 +1718,277 @@ def get_or_create_portfolio(name: str, defaults: Dict = None) -> tuple[Dict, boo
     return new_portfolio, True
 
 
+@_write_locked('PORTFOLIOS_FILE')
+def replace_all_portfolios(portfolios: List[Dict]):
+    """Remplace la liste complète des portefeuilles (restauration d'un snapshot, IDs conservés)"""
+    _write_json_file(PORTFOLIOS_FILE, portfolios)
+
+
 # ============================================================================
 # TRANSACTIONS
 # ============================================================================
 
+# ---------------------------------------------------------------------------
+# Journal des transactions
+# ---------------------------------------------------------------------------
+# transactions.json est l'instantané de base ; transactions.journal.jsonl
+# contient une ligne JSON par opération postérieure :
+#   {"op": "add", "tx": {...}}   création
+#   {"op": "del", "id": 12}      suppression (tombstone)
+# La lecture fusionne base + journal (en ne lisant que la fin du journal
+# quand il a seulement grossi). Le rejeu est idempotent (clé = id), ce qui
+# rend la compaction sûre même si elle est interrompue.
+
+_journal_lock = threading.RLock()
+_journal_state: Dict[str, Any] = {
+    'base_version': None,   # version en cache de transactions.json utilisée
+    'inode': None,          # inode du journal lu
+    'offset': 0,            # octets du journal déjà appliqués
+    'lignes': 0,            # nombre d'opérations dans le journal
+    'merged': None,         # liste fusionnée base + journal
+    'version': None,        # version de la liste fusionnée (pour les index)
+    'max_id': 0,
+    'ids': set(),           # IDs présents dans la liste fusionnée
+    'non_synchronisees': 0,  # lignes écrites depuis le dernier fsync
+    'dernier_fsync': 0.0,
+    'compactions': 0,
+}
+
+
+def _apply_journal_record(merged: List[Dict], record: Dict, state: Dict) -> Optional[List[Dict]]:
+    """Applique une opération du journal ; retourne la nouvelle liste si elle a été remplacée"""
+    if record.get('op') == 'add':
+        tx = record['tx']
+        if tx.get('id') in state['ids']:
+            return None  # déjà présent (compaction interrompue avant la suppression du journal)
+        merged.append(tx)
+        state['ids'].add(tx.get('id'))
+        state['max_id'] = max(state['max_id'], tx.get('id') or 0)
+    elif record.get('op') == 'del':
+        state['ids'].discard(record.get('id'))
+        merged = [t for t in merged if t.get('id') != record.get('id')]
+        return merged
+    return None
+
+
+def _read_journal(merged: List[Dict], offset: int) -> tuple:
+    """Lit le journal à partir de offset ; retourne (liste, nouvel offset, lignes lues)"""
+    lignes = 0
+    with open(TRANSACTIONS_JOURNAL_FILE, 'rb') as f:
+        f.seek(offset)
+        for raw in f:
+            if not raw.endswith(b'\n'):
+                break  # ligne incomplète : sera relue une fois terminée
+            offset += len(raw)
+            line = raw.decode('utf-8').strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # ligne corrompue (arrêt brutal pendant l'écriture) : ignorée
+            replaced = _apply_journal_record(merged, record, _journal_state)
+            if replaced is not None:
+                merged = replaced
+            lignes += 1
+    return merged, offset, lignes
+
+
+def _load_transactions() -> tuple:
+    """Retourne (transactions fusionnées base + journal, version) ; voit le lot en cours"""
+    batch = _current_batch()
+    if batch is None:
+        return _load_committed_transactions()
+    staged = batch['files'].get(TRANSACTIONS_FILE)
+    if staged is None:
+        with _journal_lock:
+            batch['disk_versions'].setdefault(TRANSACTIONS_FILE, _read_file_version(TRANSACTIONS_FILE))
+            merged, _ = _load_committed_transactions()
+            batch['max_id'] = batch['base_max_id'] = _journal_state['max_id']
+            batch['ids'] = set(_journal_state['ids'])
+            staged = (_stage_base(batch, TRANSACTIONS_FILE, merged), next(_versions))
+        batch['files'][TRANSACTIONS_FILE] = staged
+    return staged
+
+
+def _load_committed_transactions() -> tuple:
+    """Retourne (transactions fusionnées base + journal, version) telles que sur disque"""
+    with _journal_lock:
+        merged = _merged_if_current()
+        if merged is not None:
+            return merged
+        # Relecture sous verrou partagé : pas de lecture pendant une compaction
+        with _locked(TRANSACTIONS_FILE, exclusive=False):
+            merged = _merged_if_current()
+            if merged is not None:
+                return merged
+
+            st = _journal_state
+            base, base_version = _load_committed_json(TRANSACTIONS_FILE)
+            journal_sig = _file_signature(TRANSACTIONS_JOURNAL_FILE)
+            journal_inode = journal_sig[0] if journal_sig else None
+            journal_size = journal_sig[2] if journal_sig else 0
+
+            if (st['merged'] is not None and st['base_version'] == base_version
+                    and st['inode'] == journal_inode and journal_size >= st['offset']):
+                # Le journal a seulement grossi : n'appliquer que la fin
+                merged = st['merged']
+                offset = st['offset']
+                lignes = st['lignes']
+            else:
+                merged = list(base or [])
+                st['ids'] = {t.get('id') for t in merged}
+                st['max_id'] = max((t.get('id') or 0 for t in merged), default=0)
+                offset = 0
+                lignes = 0
+            if journal_sig is not None:
+                merged, offset, lues = _read_journal(merged, offset)
+                lignes += lues
+
+            st.update(base_version=base_version, inode=journal_inode, offset=offset,
+                      lignes=lignes, merged=merged, version=next(_versions))
+            return merged, st['version']
+
+
+def _merged_if_current() -> Optional[tuple]:
+    """(liste fusionnée, version) si ni la base ni le journal n'ont changé sur disque"""
+    st = _journal_state
+    if st['merged'] is None:
+        return None
+    _, base_version = _load_committed_json(TRANSACTIONS_FILE)
+    journal_sig = _file_signature(TRANSACTIONS_JOURNAL_FILE)
+    journal_inode = journal_sig[0] if journal_sig else None
+    journal_size = journal_sig[2] if journal_sig else 0
+    if (st['base_version'] == base_version and st['inode'] == journal_inode
+            and st['offset'] == journal_size):
+        return st['merged'], st['version']
+    return None
+
+
+def _next_transaction_id() -> int:
+    """Prochain ID de transaction (maximum suivi avec le journal ou le lot)"""
+    with _journal_lock:
+        _load_transactions()
+        batch = _current_batch()
+        return (batch if batch is not None else _journal_state)['max_id'] + 1
+
+
+def _sync_journal(f, lignes: int = 1, force: bool = False):
+    """fsync groupé : toutes les N lignes ou après un délai, ou si force"""
+    st = _journal_state
+    st['non_synchronisees'] += lignes
+    now = time.monotonic()
+    if (force or st['non_synchronisees'] >= TRANSACTIONS_JOURNAL_FSYNC_EVERY
+            or now - st['dernier_fsync'] >= TRANSACTIONS_JOURNAL_FSYNC_SECONDS):
+        os.fsync(f.fileno())
+        st['non_synchronisees'] = 0
+        st['dernier_fsync'] = now
+
+
+def _append_journal(records: List[Dict]):
+    """Ajoute des opérations au journal (une seule écriture) et met à jour la vue fusionnée et ses index.
+
+    Dans un lot, les opérations sont seulement appliquées à la copie du lot et
+    écrites d'un bloc au commit.
+    """
+    batch = _current_batch()
+    with _journal_lock, (_locked(TRANSACTIONS_FILE) if batch is None else nullcontext()):
+        merged, version = _load_transactions()
+        st = _journal_state
+        if batch is None:
+            ensure_data_dir()
+            text = ''.join(json.dumps(record, cls=DateTimeEncoder, ensure_ascii=False) + '\n'
+                           for record in records)
+            with open(TRANSACTIONS_JOURNAL_FILE, 'a', encoding='utf-8') as f:
+                f.write(text)
+                f.flush()
+                _sync_journal(f, len(records), force=len(records) > 1)
+            journal_sig = _file_signature(TRANSACTIONS_JOURNAL_FILE)
+            _bump_file_version(TRANSACTIONS_FILE)
+        else:
+            batch['journal'].extend(records)
+
+        added: Optional[List[tuple]] = []
+        for record in records:
+            replaced = _apply_journal_record(merged, record, batch if batch is not None else st)
+            if replaced is not None:
+                merged = replaced
+                added = None  # suppression : les index seront reconstruits
+            elif added is not None:
+                added.append((record['tx'], None))
+        new_version = next(_versions)
+        if batch is not None:
+            batch['files'][TRANSACTIONS_FILE] = (merged, new_version)
+        else:
+            st.update(inode=journal_sig[0], offset=journal_sig[2], lignes=st['lignes'] + len(records),
+                      merged=merged, version=new_version)
+        with _cache_lock:
+            _carry_indexes(_index_store(), TRANSACTIONS_FILE, (merged, version), merged,
+                           new_version, added)
+
+        if batch is None and st['lignes'] >= TRANSACTIONS_JOURNAL_COMPACT_THRESHOLD:
+            compact_transactions_journal()
+
+
+def _write_transactions(transactions: List[Dict]):
+    """Réécrit l'instantané complet des transactions et vide le journal"""
+    batch = _current_batch()
+    if batch is not None:
+        batch['files'][TRANSACTIONS_FILE] = (transactions, next(_versions))
+        batch['indexes'].pop(TRANSACTIONS_FILE, None)
+        batch['transactions_rewrite'] = True
+        batch['ids'] = {t.get('id') for t in transactions}
+        batch['max_id'] = max((t.get('id') or 0 for t in transactions), default=0)
+        return
+    with _journal_lock, _locked(TRANSACTIONS_FILE):
+        # Instantané écrit avant la suppression du journal : en cas d'arrêt
+        # entre les deux, le rejeu ignore les créations déjà présentes.
+        _write_json_file(TRANSACTIONS_FILE, transactions)
+        if os.path.exists(TRANSACTIONS_JOURNAL_FILE):
+            os.remove(TRANSACTIONS_JOURNAL_FILE)
+        st = _journal_state
+        st.update(merged=None, inode=None, offset=0, lignes=0, non_synchronisees=0)
+
+
+def compact_transactions_journal() -> Dict:
+    """Fusionne le journal dans transactions.json. Retourne des stats."""
+    with _journal_lock, _locked(TRANSACTIONS_FILE):
+        merged, _ = _load_transactions()
+        lignes = _journal_state['lignes']
+        if lignes:
+            _write_transactions(merged)
+            _journal_state['compactions'] += 1
+        return {'lignes_fusionnees': lignes, 'transactions': len(merged)}
+
+
+def get_journal_stats() -> Dict:
+    """Retourne l'état du journal des transactions"""
+    with _journal_lock:
+        _load_transactions()
+        st = _journal_state
+        return {
+            'actif': TRANSACTIONS_JOURNAL_ENABLED,
+            'lignes': st['lignes'],
+            'octets': st['offset'],
+            'seuil_compaction': TRANSACTIONS_JOURNAL_COMPACT_THRESHOLD,
+            'compactions': st['compactions'],
+        }
+
+
 def get_all_transactions() -> List[Dict]:
-    """Récupère toutes les transactions"""
-    return _read_json_file(TRANSACTIONS_FILE, [])
+    """Récupère toutes les transactions (instantané + journal)"""
+    return _load_transactions()[0]
 
 
 def get_transaction_by_id(transaction_id: int) -> Optional[Dict]:
     """Récupère une transaction par son ID"""
-    transactions = get_all_transactions()
-    for transaction in transactions:
-        if transaction.get('id') == transaction_id:
-            return transaction
-    return None
+    return _get_index(TRANSACTIONS_FILE, 'id', _key_id).get(transaction_id)
 
 
 def get_transactions_by_portfolio(portfolio_id: int) -> List[Dict]:
     """Récupère toutes les transactions d'un portefeuille"""
-    transactions = get_all_transactions()
-    return [t for t in transactions if t.get('portfolio_id') == portfolio_id]
+    index = _get_index(TRANSACTIONS_FILE, 'portfolio_id', _key_portfolio_id, multi=True)
+    return list(index.get(portfolio_id, []))
 
 
 def transaction_exists(portfolio_id: int, signaletique_id: int, date_str: str,
@@ -623,15 +1998,10 @@ def transaction_exists(portfolio_id: int, signaletique_id: int, date_str: str,
     Utilise l'ISIN en priorité (stable après recréation du volume PostgreSQL),
     avec fallback sur signaletique_id pour les anciens enregistrements.
     """
-    transactions = get_all_transactions()
+    index = _get_index(TRANSACTIONS_FILE, 'doublon', _key_transaction_doublon, multi=True)
+    candidates = index.get((portfolio_id, date_str, type_operation, str(quantite), str(prix_unitaire)), [])
 
-    for transaction in transactions:
-        if not (transaction.get('portfolio_id') == portfolio_id and
-                transaction.get('date') == date_str and
-                transaction.get('type_operation') == type_operation and
-                str(transaction.get('quantite')) == str(quantite) and
-                str(transaction.get('prix_unitaire')) == str(prix_unitaire)):
-            continue
+    for transaction in candidates:
         # Vérifier l'identité du titre : ISIN en priorité, sinon signaletique_id
         stored_isin = transaction.get('isin')
         if isin and stored_isin:
@@ -643,16 +2013,31 @@ def transaction_exists(portfolio_id: int, signaletique_id: int, date_str: str,
     return False
 
 
+@_write_locked('TRANSACTIONS_FILE')
 def create_transaction(portfolio_id: int, signaletique_id: int, date_obj: date,
                        type_operation: str, quantite: Decimal, prix_unitaire: Decimal,
                        devise: str = 'EUR', isin: Optional[str] = None) -> Dict:
     """Crée une nouvelle transaction.
     isin est stocké en clair pour garantir la cohérence après recréation du volume PostgreSQL.
     """
-    transactions = get_all_transactions()
+    with _journal_lock:
+        new_transaction = _build_transaction(_next_transaction_id(), portfolio_id, signaletique_id, date_obj,
+                                             type_operation, quantite, prix_unitaire, devise, isin)
+        if TRANSACTIONS_JOURNAL_ENABLED:
+            _append_journal([{'op': 'add', 'tx': new_transaction}])
+        else:
+            transactions = get_all_transactions()
+            transactions.append(new_transaction)
+            _write_transactions(transactions)
+
+    return new_transaction
+
 
-    new_transaction = {
-        'id': _get_next_id(transactions),
+def _build_transaction(new_id: int, portfolio_id: int, signaletique_id: int, date_obj: date,
+                       type_operation: str, quantite: Decimal, prix_unitaire: Decimal,
+                       devise: str, isin: Optional[str]) -> Dict:
+    return {
+        'id': new_id,
         'portfolio_id': portfolio_id,
         'signaletique_id': signaletique_id,
         'isin': isin.strip().upper() if isin else None,
@@ -664,11 +2049,6 @@ def create_transaction(portfolio_id: int, signaletique_id: int, date_obj: date,
         'date_creation': datetime.now().isoformat()
     }
 
-    transactions.append(new_transaction)
-    _write_json_file(TRANSACTIONS_FILE, transactions)
-
-    return new_transaction
-
 
 def get_signaletique_for_transaction(transaction: Dict) -> Optional[Dict]:
     """Résout la signalétique d'une transaction.
@@ -684,16 +2064,18 @@ def get_signaletique_for_transaction(transaction: Dict) -> Optional[Dict]:
     return None
 
 
+@_write_locked('TRANSACTIONS_FILE')
 def delete_transaction(transaction_id: int) -> bool:
     """Supprime une transaction"""
-    transactions = get_all_transactions()
-    
-    new_transactions = [t for t in transactions if t.get('id') != transaction_id]
-    
-    if len(new_transactions) == len(transactions):
-        return False  # Transaction non trouvée
-    
-    _write_json_file(TRANSACTIONS_FILE, new_transactions)
+    with _journal_lock:
+        if get_transaction_by_id(transaction_id) is None:
+            return False  # Transaction non trouvée
+
+        if TRANSACTIONS_JOURNAL_ENABLED:
+            _append_journal([{'op': 'del', 'id': transaction_id}])
+        else:
+            transactions = get_all_transactions()
+            _write_transactions([t for t in transactions if t.get('id') != transaction_id])
     return True
 
 
@@ -708,26 +2090,23 @@ def get_all_cash() -> List[Dict]:
 
 def get_cash_by_id(cash_id: int) -> Optional[Dict]:
     """Récupère une entrée de cash par son ID"""
-    cash_entries = get_all_cash()
-    for cash in cash_entries:
-        if cash.get('id') == cash_id:
-            return cash
-    return None
+    return _get_index(CASH_FILE, 'id', _key_id).get(cash_id)
 
 
 def get_cash_by_portfolio(portfolio_id: int) -> List[Dict]:
     """Récupère toutes les entrées de cash d'un portefeuille"""
-    cash_entries = get_all_cash()
-    return [c for c in cash_entries if c.get('portfolio_id') == portfolio_id]
+    index = _get_index(CASH_FILE, 'portfolio_id', _key_portfolio_id, multi=True)
+    return list(index.get(portfolio_id, []))
 
 
+@_write_locked('CASH_FILE')
 def create_cash(portfolio_id: int, banque: str, montant: Decimal, 
                 devise: str, date_obj: date, commentaire: str = None) -> Dict:
     """Crée une nouvelle entrée de cash"""
     cash_entries = get_all_cash()
     
     new_cash = {
-        'id': _get_next_id(cash_entries),
+        'id': _next_id(CASH_FILE),
         'portfolio_id': portfolio_id,
         'banque': banque,
         'montant': str(montant),
@@ -739,11 +2118,12 @@ def create_cash(portfolio_id: int, banque: str, montant: Decimal,
     }
     
     cash_entries.append(new_cash)
-    _write_json_file(CASH_FILE, cash_entries)
+    _write_json_file(CASH_FILE, cash_entries, index_updates=[(new_cash, None)])
     
     return new_cash
 
 
+@_write_locked('CASH_FILE')
 def update_cash(cash_id: int, data: Dict) -> Optional[Dict]:
     """Met à jour une entrée de cash"""
     cash_entries = get_all_cash()
@@ -759,6 +2139,7 @@ def update_cash(cash_id: int, data: Dict) -> Optional[Dict]:
     return None
 
 
+@_write_locked('CASH_FILE')
 def delete_cash(cash_id: int) -> bool:
     """Supprime une entrée de cash"""
     cash_entries = get_all_cash()
@@ -781,26 +2162,15 @@ def get_all_signaletiques() -> List[Dict]:
 
 
 def get_signaletique_by_id(sig_id: int) -> Optional[Dict]:
-    for sig in get_all_signaletiques():
-        if sig.get('id') == sig_id:
-            return sig
-    return None
+    return _get_index(SIGNALETIQUE_FILE, 'id', _key_id).get(sig_id)
 
 
 def get_signaletique_by_isin(isin: str) -> Optional[Dict]:
-    isin_upper = isin.strip().upper()
-    for sig in get_all_signaletiques():
-        if (sig.get('isin') or '').upper() == isin_upper:
-            return sig
-    return None
+    return _get_index(SIGNALETIQUE_FILE, 'isin', _key_isin).get(isin.strip().upper())
 
 
 def get_signaletique_by_code(code: str) -> Optional[Dict]:
-    code_upper = code.strip().upper()
-    for sig in get_all_signaletiques():
-        if (sig.get('code') or '').upper() == code_upper:
-            return sig
-    return None
+    return _get_index(SIGNALETIQUE_FILE, 'code', _key_code).get(code.strip().upper())
 
 
 def search_signaletique_by_titre(titre: str) -> Optional[Dict]:
@@ -811,6 +2181,7 @@ def search_signaletique_by_titre(titre: str) -> Optional[Dict]:
     return None
 
 
+@_write_locked('SIGNALETIQUE_FILE')
 def upsert_signaletique(code: str, isin: Optional[str], titre: str,
                         description: Optional[str] = None,
                         categorie_text: Optional[str] = None,
@@ -827,24 +2198,15 @@ def upsert_signaletique(code: str, isin: Optional[str], titre: str,
     sigs = get_all_signaletiques()
 
     # Trouver un existant
-    existing_idx = None
-    if isin:
-        isin_up = isin.strip().upper()
-        for i, s in enumerate(sigs):
-            if (s.get('isin') or '').upper() == isin_up:
-                existing_idx = i
-                break
-    if existing_idx is None:
-        code_up = code.strip().upper()
-        for i, s in enumerate(sigs):
-            if (s.get('code') or '').upper() == code_up:
-                existing_idx = i
-                break
+    existing = get_signaletique_by_isin(isin) if isin else None
+    if existing is None:
+        existing = get_signaletique_by_code(code)
 
     now = datetime.now().isoformat()
 
-    if existing_idx is not None:
-        sig = sigs[existing_idx]
+    if existing is not None:
+        sig = existing
+        old_keys = _index_keys(SIGNALETIQUE_FILE, sig)
         sig['code'] = code
         sig['isin'] = isin
         sig['titre'] = titre
@@ -860,10 +2222,10 @@ def upsert_signaletique(code: str, isin: Optional[str], titre: str,
             sig['date_cours'] = date_cours
         if frequence_coupon is not None:
             sig['frequence_coupon'] = frequence_coupon
-        sigs[existing_idx] = sig
     else:
+        old_keys = None
         sig = {
-            'id': _get_next_id(sigs),
+            'id': _next_id(SIGNALETIQUE_FILE),
             'code': code,
             'isin': isin,
             'titre': titre,
@@ -881,27 +2243,28 @@ def upsert_signaletique(code: str, isin: Optional[str], titre: str,
         }
         sigs.append(sig)
 
-    _write_json_file(SIGNALETIQUE_FILE, sigs)
+    _write_json_file(SIGNALETIQUE_FILE, sigs, index_updates=[(sig, old_keys)])
     return sig
 
 
+@_write_locked('SIGNALETIQUE_FILE')
 def update_signaletique(sig_id: int, data: Dict) -> Optional[Dict]:
     """Met à jour une signalétique existante."""
     sigs = get_all_signaletiques()
-    for i, sig in enumerate(sigs):
-        if sig.get('id') == sig_id:
-            for k, v in data.items():
-                # Pour donnees_supplementaires : fusionner (merge) au lieu de remplacer
-                # afin de préserver les champs non gérés par le formulaire (CodeBank, etc.)
-                if k == 'donnees_supplementaires' and v is not None and sig.get('donnees_supplementaires'):
-                    sig['donnees_supplementaires'] = {**sig['donnees_supplementaires'], **v}
-                else:
-                    sig[k] = v
-            sig['date_modification'] = datetime.now().isoformat()
-            sigs[i] = sig
-            _write_json_file(SIGNALETIQUE_FILE, sigs)
-            return sig
-    return None
+    sig = get_signaletique_by_id(sig_id)
+    if sig is None:
+        return None
+    old_keys = _index_keys(SIGNALETIQUE_FILE, sig)
+    for k, v in data.items():
+        # Pour donnees_supplementaires : fusionner (merge) au lieu de remplacer
+        # afin de préserver les champs non gérés par le formulaire (CodeBank, etc.)
+        if k == 'donnees_supplementaires' and v is not None and sig.get('donnees_supplementaires'):
+            sig['donnees_supplementaires'] = {**sig['donnees_supplementaires'], **v}
+        else:
+            sig[k] = v
+    sig['date_modification'] = datetime.now().isoformat()
+    _write_json_file(SIGNALETIQUE_FILE, sigs, index_updates=[(sig, old_keys)])
+    return sig
 
 
 # ============================================================================
@@ -915,18 +2278,12 @@ def get_all_target_portfolios() -> List[Dict]:
 
 def get_target_portfolio_by_id(portfolio_id: int) -> Optional[Dict]:
     """Récupère un portefeuille cible par son ID"""
-    for portfolio in get_all_target_portfolios():
-        if portfolio.get('id') == portfolio_id:
-            return portfolio
-    return None
+    return _get_index(TARGET_PORTFOLIOS_FILE, 'id', _key_id).get(portfolio_id)
 
 
 def get_target_portfolio_by_name(name: str) -> Optional[Dict]:
     """Récupère un portefeuille cible par son nom"""
-    for portfolio in get_all_target_portfolios():
-        if portfolio.get('name') == name:
-            return portfolio
-    return None
+    return _get_index(TARGET_PORTFOLIOS_FILE, 'name', _key_name).get(name)
 
 
 def _validate_target_items(items: List[Dict]):
@@ -944,15 +2301,16 @@ def _validate_target_items(items: List[Dict]):
             raise ValueError("Chaque ratio doit être positif")
 
 
+@_write_locked('TARGET_PORTFOLIOS_FILE')
 def create_target_portfolio(name: str, items: List[Dict]) -> Dict:
     """Crée un nouveau portefeuille cible.
     items: liste de dict {signaletique: int, ratio: float}
     """
     portfolios = get_all_target_portfolios()
-    if any(p.get('name') == name for p in portfolios):
+    if get_target_portfolio_by_name(name) is not None:
         raise ValueError(f"Un portefeuille cible nommé '{name}' existe déjà")
     _validate_target_items(items)
-    portfolio_id = _get_next_id(portfolios)
+    portfolio_id = _next_id(TARGET_PORTFOLIOS_FILE)
     # Attribuer des IDs aux items
     normalized_items = [
         {'id': idx + 1, 'signaletique': int(item['signaletique']), 'ratio': str(round(float(item['ratio']), 4))}
@@ -966,21 +2324,25 @@ def create_target_portfolio(name: str, items: List[Dict]) -> Dict:
         'items': normalized_items
     }
     portfolios.append(new_portfolio)
-    _write_json_file(TARGET_PORTFOLIOS_FILE, portfolios)
+    _write_json_file(TARGET_PORTFOLIOS_FILE, portfolios, index_updates=[(new_portfolio, None)])
     return new_portfolio
 
 
+@_write_locked('TARGET_PORTFOLIOS_FILE')
 def update_target_portfolio(portfolio_id: int, name: str = None, items: List[Dict] = None) -> Optional[Dict]:
     """Met à jour un portefeuille cible."""
     portfolios = get_all_target_portfolios()
     for i, portfolio in enumerate(portfolios):
         if portfolio.get('id') == portfolio_id:
+            # Valider avant toute modification : l'objet provient du cache partagé
             if name is not None:
                 if name != portfolio.get('name') and any(p.get('name') == name for p in portfolios if p.get('id') != portfolio_id):
                     raise ValueError(f"Un portefeuille cible nommé '{name}' existe déjà")
-                portfolio['name'] = name
             if items is not None:
                 _validate_target_items(items)
+            if name is not None:
+                portfolio['name'] = name
+            if items is not None:
                 portfolio['items'] = [
                     {'id': idx + 1, 'signaletique': int(item['signaletique']), 'ratio': str(round(float(item['ratio']), 4))}
                     for idx, item in enumerate(items)
@@ -992,6 +2354,7 @@ def update_target_portfolio(portfolio_id: int, name: str = None, items: List[Dic
     return None
 
 
+@_write_locked('TARGET_PORTFOLIOS_FILE')
 def delete_target_portfolio(portfolio_id: int) -> bool:
     """Supprime un portefeuille cible."""
     portfolios = get_all_target_portfolios()
@@ -1006,12 +2369,60 @@ def delete_target_portfolio(portfolio_id: int) -> bool:
 # UTILITAIRES
 # ============================================================================
 
-def clear_all_data():
-    """Supprime toutes les données (tous les fichiers JSON)"""
+@_write_locked('PORTFOLIOS_FILE', 'TRANSACTIONS_FILE', 'CASH_FILE', 'TARGET_PORTFOLIOS_FILE', 'SIGNALETIQUE_FILE',
+               'PRIX_HISTORIQUE_KOALA_FILE', 'PRIX_HISTORIQUE_BONOBO_FILE', 'PRIX_TITRES_MANIFEST_FILE',
+               'PRIX_CONSOLIDATION_FILE')
+def clear_all_data(include_prix: bool = False):
+    """Supprime toutes les données (tous les fichiers JSON, historiques de prix si include_prix)"""
     if os.path.exists(DATA_DIR):
-        for filename in [PORTFOLIOS_FILE, TRANSACTIONS_FILE, CASH_FILE, TARGET_PORTFOLIOS_FILE, SIGNALETIQUE_FILE]:
+        filenames = [PORTFOLIOS_FILE, TRANSACTIONS_FILE, TRANSACTIONS_JOURNAL_FILE, CASH_FILE,
+                     TARGET_PORTFOLIOS_FILE, SIGNALETIQUE_FILE]
+        if include_prix:
+            filenames += [PRIX_HISTORIQUE_KOALA_FILE, PRIX_HISTORIQUE_BONOBO_FILE, PRIX_HISTORIQUE_TITRES_FILE,
+                          PRIX_CONSOLIDATION_FILE, TAUX_CHANGE_FILE]
+        for filename in filenames:
             if os.path.exists(filename):
                 os.remove(filename)
+            # Version incrémentée même si le fichier manquait déjà : les caches indexés
+            # sur les versions ne doivent plus servir les données effacées
+            if filename != TRANSACTIONS_JOURNAL_FILE:
+                _bump_file_version(filename)
+                _reset_reserved_id(filename)
+        if include_prix:
+            if os.path.exists(PRIX_TITRES_DIR):
+                for filename in os.listdir(PRIX_TITRES_DIR):
+                    if filename.endswith('.json'):
+                        os.remove(os.path.join(PRIX_TITRES_DIR, filename))
+            _bump_file_version(PRIX_TITRES_MANIFEST_FILE)
+        if os.path.exists(ETATS_DIR):
+            for filename in os.listdir(ETATS_DIR):
+                if filename.endswith('.json'):
+                    os.remove(os.path.join(ETATS_DIR, filename))
+    clear_cache()
+
+
+def set_data_dir(path: str):
+    """Change le répertoire de données (migration, tests de parité) et vide les caches"""
+    global DATA_DIR, PORTFOLIOS_FILE, TRANSACTIONS_FILE, TRANSACTIONS_JOURNAL_FILE, CASH_FILE
+    global TARGET_PORTFOLIOS_FILE, SIGNALETIQUE_FILE, PRIX_HISTORIQUE_KOALA_FILE
+    global PRIX_HISTORIQUE_BONOBO_FILE, PRIX_HISTORIQUE_TITRES_FILE, PRIX_TITRES_DIR, PRIX_TITRES_MANIFEST_FILE
+    global PRIX_CONSOLIDATION_FILE, TAUX_CHANGE_FILE, ETATS_DIR
+    DATA_DIR = path
+    PORTFOLIOS_FILE = os.path.join(DATA_DIR, "portfolios.json")
+    TRANSACTIONS_FILE = os.path.join(DATA_DIR, "transactions.json")
+    TRANSACTIONS_JOURNAL_FILE = os.path.join(DATA_DIR, "transactions.journal.jsonl")
+    CASH_FILE = os.path.join(DATA_DIR, "cash.json")
+    TARGET_PORTFOLIOS_FILE = os.path.join(DATA_DIR, "target_portfolios.json")
+    SIGNALETIQUE_FILE = os.path.join(DATA_DIR, "signaletique.json")
+    PRIX_HISTORIQUE_KOALA_FILE = os.path.join(DATA_DIR, "prix_historique_koala.json")
+    PRIX_HISTORIQUE_BONOBO_FILE = os.path.join(DATA_DIR, "prix_historique_bonobo.json")
+    PRIX_CONSOLIDATION_FILE = os.path.join(DATA_DIR, "prix_consolidation.json")
+    TAUX_CHANGE_FILE = os.path.join(DATA_DIR, "taux_change.json")
+    ETATS_DIR = os.path.join(DATA_DIR, "etats")
+    PRIX_HISTORIQUE_TITRES_FILE = os.path.join(DATA_DIR, "prix_historique_titres.json")
+    PRIX_TITRES_DIR = os.path.join(DATA_DIR, "prix_titres")
+    PRIX_TITRES_MANIFEST_FILE = os.path.join(PRIX_TITRES_DIR, "manifest.json")
+    clear_cache()
 
 
 def data_exists() -> bool:
@@ -1035,5 +2446,12 @@ def get_data_stats() -> Dict:
         'transactions_count': len(get_all_transactions()),
         'cash_count': len(get_all_cash()),
         'target_portfolios_count': len(get_all_target_portfolios()),
-        'signaletique_count': len(get_all_signaletiques())
+        'signaletique_count': len(get_all_signaletiques()),
+        'cache': get_cache_stats(),
+        'journal_transactions': get_journal_stats(),
+        'versions': {
+            os.path.basename(filepath): get_file_version(filepath)
+            for filepath in [PORTFOLIOS_FILE, TRANSACTIONS_FILE, CASH_FILE,
+                             TARGET_PORTFOLIOS_FILE, SIGNALETIQUE_FILE]
+        },
     }
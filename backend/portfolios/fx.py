@@ -0,0 +1,239 @@
+# Taux de change : historique importé (engine.get_taux_change, paire 'BASE/COTATION'
+# → {date: taux}, 1 BASE = taux COTATION), sans service externe.
+#   - chaque paire est ramenée à deux colonnes NumPy triées (jours int32, taux
+#     float64), construites une fois par version des taux (get_data_version
+#     ('taux_change')) : aucune lecture de fichier par conversion ;
+#   - recherche du dernier taux connu à une date (as-of) par dichotomie ; à défaut de
+#     paire directe, inverse de la paire opposée, puis passage par FX_DEVISE_PIVOT ;
+#   - cache LRU des conversions récentes ((paire, jour) → taux).
+# Étage de conversion : convertir_analyse_fifo, convertir_valorisation et
+# convertir_cash expriment les montants d'un résultat dans une devise cible (celle
+# du portefeuille). Les coûts d'achat sont convertis au taux de la date d'achat, les
+# produits de vente au taux de la date de vente, les valeurs de marché et le cash au
+# taux de la date de valorisation : le P&L converti inclut l'effet de change.
+
+import os
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from . import price_store
+from .fifo_engine import is_obligation
+from .storage import resolve_engine
+
+FX_DEVISE_PIVOT = os.environ.get('FX_DEVISE_PIVOT', 'EUR')
+FX_CACHE_TAILLE = int(os.environ.get('FX_CACHE_TAILLE', '4096'))
+
+# moteur → (version, {(base, cotation): (jours, taux)})
+_series: Dict[str, tuple] = {}
+_series_lock = threading.Lock()
+# (moteur, version, source, cible, jour) → taux (None si introuvable)
+_conversions: 'OrderedDict[tuple, Optional[float]]' = OrderedDict()
+_conversions_lock = threading.Lock()
+
+
+def _construire_series(historique: Dict) -> Dict[tuple, tuple]:
+    series = {}
+    for paire, points in historique.items():
+        base, _, cotation = paire.partition('/')
+        lignes = sorted((jour, float(taux)) for jour, taux in (
+            (price_store.date_vers_jour(d), t) for d, t in points.items()) if jour is not None)
+        if not base or not cotation or not lignes:
+            continue
+        series[(base, cotation)] = (np.array([l[0] for l in lignes], dtype=np.int32),
+                                    np.array([l[1] for l in lignes], dtype=np.float64))
+    return series
+
+
+def get_series(engine=None) -> tuple:
+    """(version, séries par paire) à jour ; séries reconstruites si les taux ont changé"""
+    engine = resolve_engine(engine)
+    version = engine.get_data_version('taux_change')
+    cached = _series.get(engine.__name__)
+    if cached is not None and cached[0] == version:
+        return cached
+    with _series_lock:
+        cached = _series.get(engine.__name__)
+        if cached is None or cached[0] != version:
+            cached = _series[engine.__name__] = (version, _construire_series(engine.get_taux_change()))
+    return cached
+
+
+def _a_date(serie: tuple, jour: int) -> Optional[float]:
+    jours, taux = serie
+    position = int(np.searchsorted(jours, jour, side='right')) - 1
+    return float(taux[position]) if position >= 0 else None
+
+
+def _taux_direct(series: Dict, source: str, cible: str, jour: int) -> Optional[float]:
+    serie = series.get((source, cible))
+    if serie is not None:
+        return _a_date(serie, jour)
+    serie = series.get((cible, source))
+    if serie is not None:
+        taux = _a_date(serie, jour)
+        return 1 / taux if taux else None
+    return None
+
+
+def taux_change(source: str, cible: str, jour, engine=None) -> Optional[float]:
+    """Taux pour convertir un montant de source en cible à la date donnée (date, chaîne
+    ISO ou ordinal) : dernier taux connu à cette date. None si aucun taux n'est disponible."""
+    source = (source or 'EUR').upper()
+    cible = (cible or 'EUR').upper()
+    if source == cible:
+        return 1.0
+    jour = jour if isinstance(jour, int) else price_store.date_vers_jour(jour)
+    if jour is None:
+        return None
+    engine = resolve_engine(engine)
+    version, series = get_series(engine)
+    cle = (engine.__name__, version, source, cible, jour)
+    with _conversions_lock:
+        if cle in _conversions:
+            _conversions.move_to_end(cle)
+            return _conversions[cle]
+
+    taux = _taux_direct(series, source, cible, jour)
+    if taux is None and FX_DEVISE_PIVOT not in (source, cible):
+        vers_pivot = _taux_direct(series, source, FX_DEVISE_PIVOT, jour)
+        depuis_pivot = _taux_direct(series, FX_DEVISE_PIVOT, cible, jour)
+        if vers_pivot is not None and depuis_pivot is not None:
+            taux = vers_pivot * depuis_pivot
+    with _conversions_lock:
+        _conversions[cle] = taux
+        while len(_conversions) > FX_CACHE_TAILLE:
+            _conversions.popitem(last=False)
+    return taux
+
+
+def _convertisseur(devise_cible: str, engine):
+    """Fonction convertir(montant, devise, jour) → montant en devise_cible (None si le
+    taux manque) et ensemble des paires manquantes qu'elle alimente"""
+    manquants = set()
+
+    def convertir(montant, devise, jour) -> Optional[float]:
+        if montant is None:
+            return None
+        taux = taux_change(devise, devise_cible, jour, engine)
+        if taux is None:
+            manquants.add(f"{(devise or 'EUR').upper()}/{devise_cible}")
+            return None
+        return montant * taux
+
+    return convertir, manquants
+
+
+def _somme(valeurs) -> Optional[float]:
+    """Somme, None si un terme est inconnu"""
+    total = 0.0
+    for valeur in valeurs:
+        if valeur is None:
+            return None
+        total += valeur
+    return total
+
+
+def _diviseur(element: Dict) -> int:
+    return 100 if is_obligation(element.get('categorie'), element.get('type_instrument')) else 1
+
+
+def convertir_analyse_fifo(analyse: Dict, devise_cible: str, engine=None) -> Dict:
+    """Positions (coût d'achat) et P&L réalisé d'une analyse FIFO exprimés en devise_cible"""
+    devise_cible = (devise_cible or 'EUR').upper()
+    convertir, manquants = _convertisseur(devise_cible, engine)
+
+    positions = []
+    for position in analyse['positions_actuelles']:
+        diviseur = _diviseur(position)
+        valeur = _somme(convertir(lot['quantite'] * lot['prix_unitaire'] / diviseur,
+                                  lot.get('devise') or position['devise'], lot['date'])
+                        for lot in position['lots'])
+        positions.append({'isin': position['isin'], 'devise': position['devise'], 'valeur': valeur})
+
+    par_titre = []
+    for titre in analyse['pnl_realise']['par_titre']:
+        diviseur = _diviseur(titre)
+        montants = []
+        for vente in titre['ventes']:
+            devise = vente.get('devise')
+            for lot in vente['lots_consommes']:
+                produit = convertir(lot['quantite'] * lot['prix_vente'] / diviseur, devise, vente['date'])
+                # Coût dans la devise du lot acheté, au taux de sa date d'achat
+                cout = convertir(lot['quantite'] * lot['prix_achat'] / diviseur, lot.get('devise') or devise,
+                                 lot.get('date_achat') or vente['date'])
+                montants.append(None if produit is None or cout is None else produit - cout)
+        par_titre.append({'isin': titre['isin'], 'pnl_total': _somme(montants)})
+
+    return {
+        'devise': devise_cible,
+        'positions': positions,
+        'valeur_totale': _somme(p['valeur'] for p in positions),
+        'pnl_realise': {'total': _somme(t['pnl_total'] for t in par_titre), 'par_titre': par_titre},
+        'taux_manquants': sorted(manquants),
+    }
+
+
+def convertir_valorisation(valorisation: Dict, devise_cible: str, engine=None) -> Dict:
+    """Valeur d'achat (taux des dates d'achat), valeur de marché et P&L latent (taux de la
+    date de valorisation) des positions valorisées, exprimés en devise_cible"""
+    devise_cible = (devise_cible or 'EUR').upper()
+    convertir, manquants = _convertisseur(devise_cible, engine)
+    jour = valorisation['date_valorisation']
+
+    positions = []
+    for position in valorisation['positions']:
+        if position['valeur_marche'] is None:
+            continue
+        diviseur = _diviseur(position)
+        valeur_achat = _somme(convertir(lot['quantite'] * lot['prix_unitaire'] / diviseur,
+                                        lot.get('devise') or position['devise'], lot['date'])
+                              for lot in position['lots'])
+        valeur_marche = convertir(position['valeur_marche'], position['devise_cours'] or position['devise'], jour)
+        positions.append({
+            'isin': position['isin'],
+            'valeur_achat': valeur_achat,
+            'valeur_marche': valeur_marche,
+            'pnl_latent': None if valeur_achat is None or valeur_marche is None else valeur_marche - valeur_achat,
+        })
+
+    return {
+        'devise': devise_cible,
+        'positions': positions,
+        'totaux': {
+            champ: _somme(p[champ] for p in positions) for champ in ('valeur_achat', 'valeur_marche', 'pnl_latent')
+        },
+        'taux_manquants': sorted(manquants),
+    }
+
+
+def convertir_cash(entrees: List[Dict], devise_cible: str, date_conversion=None, engine=None) -> Dict:
+    """Entrées de cash converties en devise_cible au taux de date_conversion (aujourd'hui
+    par défaut) ; total du dernier solde de chaque compte (banque, devise) à cette date"""
+    devise_cible = (devise_cible or 'EUR').upper()
+    jour = price_store.date_vers_jour(date_conversion or date.today())
+    if jour is None:
+        raise ValueError(f"Date de conversion invalide : {date_conversion!r}")
+    convertir, manquants = _convertisseur(devise_cible, engine)
+
+    converties = []
+    soldes = {}
+    for entree in entrees:
+        montant = convertir(float(entree['montant']), entree.get('devise'), jour)
+        converties.append({'id': entree['id'], 'montant': montant})
+        jour_entree = price_store.date_vers_jour(entree.get('date'))
+        if jour_entree is not None and jour_entree <= jour:
+            compte = (entree.get('banque'), entree.get('devise') or 'EUR')
+            if compte not in soldes or (jour_entree, entree['id']) > soldes[compte][0]:
+                soldes[compte] = ((jour_entree, entree['id']), montant)
+
+    return {
+        'devise': devise_cible,
+        'date_conversion': price_store.jour_vers_date(jour).isoformat(),
+        'entrees': converties,
+        'total': _somme(solde for _, solde in soldes.values()),
+        'taux_manquants': sorted(manquants),
+    }
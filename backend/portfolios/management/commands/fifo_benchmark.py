@@ -0,0 +1,144 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from portfolios import fifo_engine
+from portfolios.fifo_engine import PRIX_DECIMALES, QUANTITE_DECIMALES, get_prix_reel
+
+
+PROFILS = {
+    # (probabilité de vente, quantité achetée max, quantité vendue max)
+    'mixte': (0.3, 2000, 40),
+    # Investissement programmé : petits achats, ventes rares et importantes → longues files de lots
+    'programme': (0.02, 200, 2000),
+}
+
+
+def generer_transactions(nombre: int, nombre_titres: int, profil: str, seed: int) -> list:
+    """Transactions synthétiques (quantités en centièmes), un titre sur cinq coté en %"""
+    probabilite_vente, achat_max, vente_max = PROFILS[profil]
+    rng = random.Random(seed)
+    titres = [(f'XX{i:010d}', 'Obligations' if i % 5 == 0 else 'Actions') for i in range(nombre_titres)]
+    detenu = {isin: Decimal('0') for isin, _ in titres}
+    debut = date(2000, 1, 1)
+    transactions = []
+    for i in range(nombre):
+        isin, categorie = titres[rng.randrange(nombre_titres)]
+        prix = Decimal(rng.randint(5000, 15000)).scaleb(-2)
+        if detenu[isin] > 0 and rng.random() < probabilite_vente:
+            quantite = min(detenu[isin], Decimal(rng.randint(1, vente_max)))
+            type_operation = 'VENTE'
+            detenu[isin] -= quantite
+        else:
+            quantite = Decimal(rng.randint(1, achat_max)).scaleb(-2)
+            type_operation = 'ACHAT'
+            detenu[isin] += quantite
+        transactions.append({'id': i + 1, 'date': (debut + timedelta(days=i // 10)).isoformat(),
+                             'isin': isin, 'categorie': categorie, 'type_operation': type_operation,
+                             'quantite': str(quantite), 'prix_unitaire': str(prix)})
+    return transactions
+
+
+def preparer_reference(transactions: list) -> list:
+    return [(t['isin'], t['categorie'], t['type_operation'], Decimal(t['quantite']), Decimal(t['prix_unitaire']))
+            for t in transactions]
+
+
+def fifo_reference(operations: list) -> dict:
+    """Algorithme d'origine : lots en liste (pop(0)), Decimal et get_prix_reel à chaque lot"""
+    positions = {}
+    pnl = {}
+    for isin, categorie, type_operation, quantite, prix_unitaire in operations:
+        position = positions.setdefault(isin, {'lots': [], 'quantite_totale': Decimal('0')})
+        if type_operation == 'ACHAT':
+            position['lots'].append({'quantite': quantite, 'prix_unitaire': prix_unitaire})
+            position['quantite_totale'] += quantite
+            continue
+        if position['quantite_totale'] < quantite:
+            continue
+        prix_vente_reel = get_prix_reel(prix_unitaire, categorie)
+        quantite_a_vendre = quantite
+        while quantite_a_vendre > 0 and position['lots']:
+            lot = position['lots'][0]
+            quantite_vendue = min(lot['quantite'], quantite_a_vendre)
+            prix_achat_reel = get_prix_reel(lot['prix_unitaire'], categorie)
+            pnl[isin] = pnl.get(isin, Decimal('0')) + quantite_vendue * (prix_vente_reel - prix_achat_reel)
+            quantite_a_vendre -= quantite_vendue
+            position['quantite_totale'] -= quantite_vendue
+            if lot['quantite'] <= quantite_vendue:
+                position['lots'].pop(0)
+            else:
+                lot['quantite'] -= quantite_vendue
+    return {isin: float(valeur) for isin, valeur in pnl.items() if valeur != 0}
+
+
+def preparer_moteur(transactions: list) -> list:
+    return [(t['id'], t['date'], t['isin'], t['categorie'], t['type_operation'],
+             fifo_engine.vers_entier(t['quantite'], QUANTITE_DECIMALES),
+             fifo_engine.vers_entier(t['prix_unitaire'], PRIX_DECIMALES))
+            for t in transactions]
+
+
+def fifo_moteur(operations: list) -> dict:
+    """Même calcul avec fifo_engine : deque, entiers à virgule fixe, échelle résolue par titre"""
+    titres = {}
+    for lot_id, jour, isin, categorie, type_operation, quantite, prix in operations:
+        titre = titres.get(isin)
+        if titre is None:
+            titre = titres[isin] = fifo_engine.titre_vide(categorie)
+        if type_operation == 'ACHAT':
+            fifo_engine.acheter(titre, lot_id, jour, quantite, prix, 'EUR')
+        else:
+            fifo_engine.vendre(titre, quantite, prix)
+    return {
+        isin: fifo_engine.vers_float(titre['pnl'], QUANTITE_DECIMALES + titre['decimales_prix'])
+        for isin, titre in titres.items() if titre['pnl'] != 0
+    }
+
+
+def _meilleur_temps(func, argument, repetitions: int) -> tuple:
+    meilleur, resultat = None, None
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        resultat = func(argument)
+        duree = time.perf_counter() - debut
+        meilleur = duree if meilleur is None else min(meilleur, duree)
+    return meilleur, resultat
+
+
+class Command(BaseCommand):
+    help = "Compare le cœur FIFO (fifo_engine) à l'algorithme d'origine sur des transactions synthétiques"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=50000, help='Nombre de transactions')
+        parser.add_argument('--titres', type=int, default=20, help='Nombre de titres')
+        parser.add_argument('--profil', choices=sorted(PROFILS), default='mixte')
+        parser.add_argument('--repetitions', type=int, default=3, help='Meilleur temps sur N exécutions')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        if options['transactions'] < 1 or options['titres'] < 1 or options['repetitions'] < 1:
+            raise CommandError('--transactions, --titres et --repetitions doivent être positifs')
+        transactions = generer_transactions(options['transactions'], options['titres'],
+                                            options['profil'], options['seed'])
+        ventes = sum(1 for t in transactions if t['type_operation'] == 'VENTE')
+        self.stdout.write(f'{len(transactions)} transactions ({ventes} ventes) sur {options["titres"]} titres, '
+                          f'profil {options["profil"]}')
+
+        temps = {}
+        resultats = {}
+        for nom, preparer, calculer in (('reference', preparer_reference, fifo_reference),
+                                        ('fifo_engine', preparer_moteur, fifo_moteur)):
+            temps_conversion, operations = _meilleur_temps(preparer, transactions, options['repetitions'])
+            temps_fifo, resultats[nom] = _meilleur_temps(calculer, operations, options['repetitions'])
+            temps[nom] = temps_fifo
+            self.stdout.write(f'  {nom:<12} conversion {temps_conversion * 1000:8.1f} ms   '
+                              f'FIFO {temps_fifo * 1000:8.1f} ms')
+
+        if resultats['reference'] != resultats['fifo_engine']:
+            raise CommandError('Les P&L réalisés diffèrent entre les deux implémentations')
+        self.stdout.write(self.style.SUCCESS(
+            f'P&L identiques ; FIFO x{temps["reference"] / temps["fifo_engine"]:.1f}'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from portfolios import file_storage, sqlite_storage
+
+
+class Command(BaseCommand):
+    help = 'Copie les données des fichiers JSON (/app/data) dans la base SQLite du moteur sqlite'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data-dir', help='Répertoire des fichiers JSON source (défaut : DATA_DIR)')
+        parser.add_argument('--database', help='Chemin de la base SQLite cible (défaut : PORTFOLIO_SQLITE_PATH)')
+        parser.add_argument('--replace', action='store_true',
+                            help='Écrase le contenu d\'une base SQLite non vide')
+
+    def handle(self, *args, **options):
+        if options['data_dir']:
+            file_storage.set_data_dir(options['data_dir'])
+        if options['database']:
+            sqlite_storage.set_database_path(options['database'])
+
+        self.stdout.write(f'Source : {file_storage.DATA_DIR}')
+        self.stdout.write(f'Cible  : {sqlite_storage.SQLITE_PATH}')
+        try:
+            copies = sqlite_storage.import_from_json(replace=options['replace'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for table, count in copies.items():
+            self.stdout.write(f'  {table}: {count}')
+        self.stdout.write(self.style.SUCCESS('Migration terminée'))
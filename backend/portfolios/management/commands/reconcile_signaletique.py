@@ -0,0 +1,59 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from portfolios import rapprochement
+
+
+class Command(BaseCommand):
+    help = ('Rapproche la signalétique du stockage JSON et de PostgreSQL (manquantes, en trop, '
+            'différentes) ; --reparer réécrit la base depuis le JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reparer', action='store_true',
+                            help='Écrire en base les signalétiques et catégories manquantes ou différentes')
+        parser.add_argument('--exemples', type=int, default=rapprochement.RAPPROCHEMENT_EXEMPLES,
+                            help="Nombre d'écarts détaillés par type")
+        parser.add_argument('--json', action='store_true', help='Rapport complet au format JSON')
+        parser.add_argument('--strict', action='store_true',
+                            help='Code de sortie en erreur si des écarts subsistent (tâche planifiée)')
+
+    def handle(self, *args, **options):
+        rapport = rapprochement.rapprocher(reparer=options['reparer'], exemples=options['exemples'])
+        if options['json']:
+            self.stdout.write(json.dumps(rapport, ensure_ascii=False, indent=2))
+        else:
+            self._afficher(rapport)
+
+        ecarts = rapport['manquantes'] + rapport['en_trop'] + rapport['differentes'] + len(rapport['categories_manquantes'])
+        if 'reparation' in rapport:
+            reparation = rapport['reparation']
+            ecarts = rapport['en_trop'] + len(reparation['erreurs'])
+        if options['strict'] and ecarts:
+            raise CommandError(f'{ecarts} écart(s) entre le stockage JSON et la base')
+
+    def _afficher(self, rapport):
+        self.stdout.write(f"JSON : {rapport['signaletiques_json']} signalétiques — "
+                          f"base : {rapport['signaletiques_base']} ({rapport['duree_secondes']} s)")
+        self.stdout.write(f"  identiques   : {rapport['identiques']}")
+        for nom in ('manquantes', 'en_trop', 'differentes'):
+            style = self.style.ERROR if rapport[nom] else self.style.SUCCESS
+            self.stdout.write(style(f"  {nom:<13}: {rapport[nom]}"))
+            for exemple in rapport['exemples'][nom]:
+                if isinstance(exemple, dict):
+                    self.stdout.write(f"      {exemple['cle']} ({', '.join(exemple['champs'])})")
+                else:
+                    self.stdout.write(f"      {exemple}")
+        if rapport['categories_manquantes']:
+            self.stdout.write(self.style.ERROR(
+                f"  catégories manquantes : {', '.join(rapport['categories_manquantes'])}"))
+        if rapport['evenements_en_attente']:
+            self.stdout.write(self.style.WARNING(
+                f"  {rapport['evenements_en_attente']} événement(s) de synchronisation encore en attente"))
+        if 'reparation' in rapport:
+            reparation = rapport['reparation']
+            self.stdout.write(self.style.SUCCESS(
+                f"Réparation : {reparation['crees']} créée(s), {reparation['mis_a_jour']} mise(s) à jour, "
+                f"{reparation['categories_creees']} catégorie(s) créée(s)"))
+            for erreur in reparation['erreurs']:
+                self.stdout.write(self.style.ERROR(f"  {erreur['cle']} : {erreur['erreur']}"))
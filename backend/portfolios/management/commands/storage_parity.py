@@ -0,0 +1,172 @@
+import os
+import shutil
+import tempfile
+from datetime import date
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from portfolios import file_storage, sqlite_storage
+
+# Champs horodatés à l'exécution : exclus de la comparaison
+HORODATAGES = {'date_creation', 'date_modification'}
+
+
+def _normaliser(value):
+    if isinstance(value, dict):
+        return {k: _normaliser(v) for k, v in value.items() if k not in HORODATAGES}
+    if isinstance(value, (list, tuple)):
+        return [_normaliser(v) for v in value]
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _appel(resultats, nom, func, *args, **kwargs):
+    """Exécute func et enregistre son résultat (ou l'erreur levée) sous nom"""
+    try:
+        resultats.append((nom, _normaliser(func(*args, **kwargs))))
+    except ValueError as e:
+        resultats.append((nom, f'ValueError: {e}'))
+
+
+def scenario(s) -> list:
+    """Suite d'opérations exécutée à l'identique sur chaque moteur ; retourne les résultats"""
+    r = []
+    _appel(r, 'create_portfolio', s.create_portfolio, 'PEA', description='Actions', type_compte='PEA')
+    _appel(r, 'create_portfolio doublon', s.create_portfolio, 'PEA')
+    _appel(r, 'get_or_create_portfolio', s.get_or_create_portfolio, 'CTO', {'courtier': 'Degiro'})
+    _appel(r, 'get_or_create_portfolio existant', s.get_or_create_portfolio, 'CTO')
+    _appel(r, 'update_portfolio', s.update_portfolio, 1, {'couleur': '#112233'})
+    _appel(r, 'update_portfolio nom pris', s.update_portfolio, 1, {'name': 'CTO'})
+    _appel(r, 'get_portfolio_by_name', s.get_portfolio_by_name, 'CTO')
+
+    _appel(r, 'upsert_signaletique', s.upsert_signaletique, 'SIG_FR0000120271', 'FR0000120271', 'TotalEnergies',
+           categorie_text='Actions', donnees_supplementaires={'Symbole': 'TTE', 'Devise': 'EUR'})
+    _appel(r, 'upsert_signaletique oblig', s.upsert_signaletique, 'SIG_XS1234567890', 'XS1234567890', 'Oblig 2030',
+           categorie_text='Obligations', donnees_supplementaires={'Devise': 'USD'})
+    _appel(r, 'upsert_signaletique par code', s.upsert_signaletique, 'AUTO_7', None, 'Fonds sans ISIN')
+    _appel(r, 'upsert_signaletique maj', s.upsert_signaletique, 'SIG_FR0000120271', 'fr0000120271', 'Total SE',
+           donnees_supplementaires={'Symbole': 'TTE', 'Devise': 'EUR'}, prix=61.2, devise_prix='EUR')
+    _appel(r, 'update_signaletique fusion', s.update_signaletique, 1, {'donnees_supplementaires': {'Pays': 'France'}})
+    _appel(r, 'get_signaletique_by_isin', s.get_signaletique_by_isin, ' fr0000120271 ')
+    _appel(r, 'get_signaletique_by_code', s.get_signaletique_by_code, 'auto_7')
+    _appel(r, 'search_signaletique_by_titre', s.search_signaletique_by_titre, 'oblig')
+
+    for i, (jour, type_op, quantite, prix) in enumerate([
+        (date(2024, 1, 2), 'ACHAT', Decimal('10'), Decimal('55.5')),
+        (date(2024, 3, 4), 'ACHAT', Decimal('5'), Decimal('58')),
+        (date(2024, 6, 1), 'VENTE', Decimal('8'), Decimal('63.25')),
+    ]):
+        _appel(r, f'create_transaction {i}', s.create_transaction, 1, 1, jour, type_op, quantite, prix,
+               isin='FR0000120271')
+    _appel(r, 'create_transaction CTO', s.create_transaction, 2, 2, date(2024, 2, 1), 'ACHAT',
+           Decimal('1000'), Decimal('98.7'), 'USD', isin='XS1234567890')
+    _appel(r, 'transaction_exists', s.transaction_exists, 1, 1, '2024-03-04', 'ACHAT', '5', '58', isin='FR0000120271')
+    _appel(r, 'transaction_exists autre isin', s.transaction_exists, 1, 1, '2024-03-04', 'ACHAT', '5', '58',
+           isin='XS1234567890')
+    _appel(r, 'delete_transaction', s.delete_transaction, 2)
+    _appel(r, 'delete_transaction absente', s.delete_transaction, 99)
+    _appel(r, 'get_transactions_by_portfolio', s.get_transactions_by_portfolio, 1)
+    _appel(r, 'get_signaletique_for_transaction', s.get_signaletique_for_transaction,
+           {'signaletique_id': 999, 'isin': 'XS1234567890'})
+
+    _appel(r, 'create_cash', s.create_cash, 1, 'Boursorama', Decimal('1500.50'), 'EUR', date(2024, 1, 1))
+    _appel(r, 'create_cash CTO', s.create_cash, 2, 'Degiro', Decimal('200'), 'USD', date(2024, 1, 1), 'frais')
+    _appel(r, 'update_cash', s.update_cash, 1, {'montant': '1600'})
+    _appel(r, 'delete_cash', s.delete_cash, 2)
+    _appel(r, 'get_cash_by_portfolio', s.get_cash_by_portfolio, 1)
+
+    _appel(r, 'create_target_portfolio', s.create_target_portfolio, 'Cible',
+           [{'signaletique': 1, 'ratio': 60}, {'signaletique': 2, 'ratio': 40}])
+    _appel(r, 'create_target_portfolio total faux', s.create_target_portfolio, 'Cible 2',
+           [{'signaletique': 1, 'ratio': 50}])
+    _appel(r, 'create_target_portfolio doublon', s.create_target_portfolio, 'Cible',
+           [{'signaletique': 1, 'ratio': 100}])
+    _appel(r, 'update_target_portfolio', s.update_target_portfolio, 1, name='Cible prudente',
+           items=[{'signaletique': 2, 'ratio': 100}])
+    _appel(r, 'get_target_portfolio_by_name', s.get_target_portfolio_by_name, 'Cible prudente')
+
+    _appel(r, 'append_prix_koala', s.append_prix_koala, [
+        {'symbole': 'TTE', 'cours': 60.1, 'date_import': '2024-06-01', 'devise': 'EUR'},
+        {'symbole': 'TTE', 'cours': 60.4, 'date_import': '2024-06-02', 'devise': 'EUR'},
+        {'symbole': 'TTE', 'cours': 60.9, 'date_import': '2024-06-01', 'devise': 'EUR'},
+        {'symbole': '', 'cours': 1},
+    ])
+    _appel(r, 'append_prix_bonobo', s.append_prix_bonobo, [
+        {'isin': 'XS1234567890', 'cours': 98.1, 'date_import': '2024-06-01', 'devise': '%'},
+        {'isin': 'FR0000120271', 'cours': 61.0, 'date_import': '2024-06-02', 'devise': 'EUR'},
+        {'isin': 'XS1234567890', 'cours': None},
+    ])
+    _appel(r, 'rebuild_prix_historique_titres', s.rebuild_prix_historique_titres)
+    _appel(r, 'upsert_prix_titre_entry', s.upsert_prix_titre_entry, 'FR0000120271',
+           {'date': '2024-06-03', 'cours': 62.0})
+    _appel(r, 'upsert_prix_titre_entry maj', s.upsert_prix_titre_entry, 'FR0000120271',
+           {'id': 'FR0000120271_2024-06-01_0_koala', 'cours': 59.0})
+    _appel(r, 'import_prix_titre_from_rows', s.import_prix_titre_from_rows, 'XS1234567890', [
+        {'date': '2024-05-01', 'cours': '97.5', 'source': 'import'},
+        {'date': '2024-05-01', 'cours': '97.6', 'source': 'import'},
+        {'Date': '2024-05-02', 'Cours': 'abc'},
+    ])
+    _appel(r, 'delete_prix_titre_entry', s.delete_prix_titre_entry, 'FR0000120271', 'FR0000120271_2024-06-02_1_bonobo')
+    _appel(r, 'append_prix_koala suite', s.append_prix_koala, [
+        {'symbole': 'TTE', 'cours': 61.2, 'date_import': '2024-06-04', 'devise': 'EUR'},
+        {'symbole': 'TTE', 'cours': 60.0, 'date_import': '2024-06-01', 'devise': 'EUR'},
+    ])
+    _appel(r, 'rebuild_prix_historique_titres incremental', s.rebuild_prix_historique_titres, incremental=True)
+    _appel(r, 'rebuild_prix_historique_titres incremental vide', s.rebuild_prix_historique_titres, incremental=True)
+    _appel(r, 'get_prix_historique_titres', s.get_prix_historique_titres)
+    _appel(r, 'restore_prix_historique_from_rows', s.restore_prix_historique_from_rows, [
+        {'ISIN': 'fr0000120271', 'Nom': 'Total', 'Date': '2024-01-01', 'Cours': 50, 'Source': 'koala'},
+        {'ISIN': 'LU0000000001', 'Date': '2024-01-01', 'Cours': 10},
+        {'ISIN': '', 'Cours': 1},
+    ])
+
+    # Lot annulé par une exception : aucune écriture ne doit subsister
+    try:
+        with s.batch():
+            s.create_cash(1, 'Annulé', Decimal('1'), 'EUR', date(2024, 1, 1))
+            s.create_transaction(1, 1, date(2024, 7, 1), 'ACHAT', Decimal('1'), Decimal('1'))
+            raise RuntimeError('annulation')
+    except RuntimeError:
+        pass
+    with s.batch():
+        for i in range(20):
+            sig = s.upsert_signaletique(f'AUTO_{100 + i}', None, f'Lot {i}')
+            s.create_transaction(2, sig['id'], date(2024, 8, 1), 'ACHAT', Decimal(i + 1), Decimal('10'))
+
+    _appel(r, 'delete_portfolio', s.delete_portfolio, 2)
+    for getter in ['get_all_portfolios', 'get_all_transactions', 'get_all_cash', 'get_all_signaletiques',
+                   'get_all_target_portfolios', 'get_prix_historique_koala', 'get_prix_historique_bonobo',
+                   'get_prix_historique_titres', 'get_prix_titres_manifest']:
+        _appel(r, getter, getattr(s, getter))
+    return r
+
+
+class Command(BaseCommand):
+    help = 'Exécute le même scénario sur les moteurs JSON et SQLite et compare les résultats'
+
+    def handle(self, *args, **options):
+        tmp = tempfile.mkdtemp(prefix='storage_parity_')
+        ancien_dir = file_storage.DATA_DIR
+        ancienne_base = sqlite_storage.SQLITE_PATH
+        try:
+            file_storage.set_data_dir(os.path.join(tmp, 'json'))
+            sqlite_storage.set_database_path(os.path.join(tmp, 'sqlite', 'portfolio.sqlite3'))
+            attendu = scenario(file_storage)
+            obtenu = scenario(sqlite_storage)
+        finally:
+            file_storage.set_data_dir(ancien_dir)
+            sqlite_storage.set_database_path(ancienne_base)
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        ecarts = 0
+        for (nom, valeur_json), (_, valeur_sqlite) in zip(attendu, obtenu):
+            if valeur_json != valeur_sqlite:
+                ecarts += 1
+                self.stdout.write(self.style.ERROR(f'✗ {nom}'))
+                self.stdout.write(f'    json   : {valeur_json!r}')
+                self.stdout.write(f'    sqlite : {valeur_sqlite!r}')
+        if ecarts:
+            raise CommandError(f'{ecarts} écart(s) sur {len(attendu)} opérations')
+        self.stdout.write(self.style.SUCCESS(f'Parité OK : {len(attendu)} opérations identiques'))
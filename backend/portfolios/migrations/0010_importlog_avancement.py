@@ -0,0 +1,43 @@
+# Generated by Django 4.2.29 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolios', '0009_instrument_type'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='importlog',
+            name='type_import',
+            field=models.CharField(choices=[('signaletique', 'Signalétique'), ('pricing', 'Pricing'), ('transactions', 'Transactions'), ('cash', 'Cash'), ('target_portfolio', 'Portefeuilles cibles'), ('restauration', 'Restauration')], max_length=50),
+        ),
+        migrations.AddField(
+            model_name='importlog',
+            name='lignes_traitees',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='importlog',
+            name='date_debut',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='importlog',
+            name='date_maj',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='importlog',
+            name='date_fin',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='importlog',
+            name='resultat',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -101,6 +101,9 @@ class ImportLog(models.Model):
         ('signaletique', 'Signalétique'),
         ('pricing', 'Pricing'),
         ('transactions', 'Transactions'),
+        ('cash', 'Cash'),
+        ('target_portfolio', 'Portefeuilles cibles'),
+        ('restauration', 'Restauration'),
     ]
     
     type_import = models.CharField(max_length=50, choices=TYPE_CHOICES)
@@ -111,6 +114,12 @@ class ImportLog(models.Model):
     statut = models.CharField(max_length=50, default='en_cours')
     erreurs = models.JSONField(blank=True, null=True)
     date_import = models.DateTimeField(auto_now_add=True)
+    # Avancement des imports en tâche de fond (voir taches.py)
+    lignes_traitees = models.IntegerField(default=0)
+    date_debut = models.DateTimeField(blank=True, null=True)
+    date_maj = models.DateTimeField(blank=True, null=True)
+    date_fin = models.DateTimeField(blank=True, null=True)
+    resultat = models.JSONField(blank=True, null=True)
     
     class Meta:
         verbose_name = "Log d'import"
@@ -0,0 +1,210 @@
+# Valeur quotidienne (NAV) d'un portefeuille réel sur une plage de dates, calculée
+# par matrices NumPy plutôt que jour par jour :
+#   quantites  jours × ISIN : somme cumulée des mouvements (achats +, ventes −) ;
+#   prix       jours × ISIN : dernier cours connu à chaque date (report en avant par
+#              recherche dichotomique dans la série du titre, price_store), à défaut
+#              dernier prix de transaction ; obligations divisées par 100 ;
+#   valeurs  = quantites × prix, sommées par devise de position ;
+#   flux       jours × ISIN : montant des mouvements (achats +, ventes −) ;
+#   cash       solde de chaque compte (banque, devise) : dernière entrée à la date.
+# Les ventes ignorées par l'analyse FIFO (vente sans achat correspondant) le sont ici aussi.
+# Les séries sont exprimées dans la devise de chaque position (pas de conversion).
+# Le résultat est mis en cache par (portefeuille, plage) et invalidé par les versions
+# des transactions, de l'historique consolidé, du cash et de la signalétique.
+
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import date
+from typing import Dict, Optional
+
+import numpy as np
+
+from . import fifo, price_store
+from .fifo_engine import is_obligation
+from .storage import resolve_engine
+
+NAV_CACHE_TAILLE = 16
+DONNEES_SOURCES = ('transactions', 'prix_titres', 'cash', 'signaletique')
+
+_cache: 'OrderedDict[tuple, tuple]' = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _jour(valeur, defaut: int) -> int:
+    if valeur is None or valeur == '':
+        return defaut
+    jour = valeur if isinstance(valeur, int) else price_store.date_vers_jour(valeur)
+    if jour is None:
+        raise ValueError(f"Date invalide : {valeur!r}")
+    return jour
+
+
+def _mouvements(portfolio_id: int, engine) -> list:
+    """Mouvements retenus : (jour, isin, quantité signée, prix, devise, catégorie, type d'instrument)"""
+    ignorees = {d['id'] for d in fifo.analyse_fifo(portfolio_id, engine)['transactions'] if 'erreur' in d}
+    resoudre = fifo.resolveur_signaletique(engine)
+    mouvements = []
+    for transaction in engine.get_transactions_by_portfolio(portfolio_id):
+        if transaction['id'] in ignorees:
+            continue
+        sig = resoudre(transaction)
+        jour = price_store.date_vers_jour(transaction.get('date'))
+        if not sig or jour is None:
+            continue
+        ds = sig.get('donnees_supplementaires') or {}
+        quantite = float(transaction['quantite'])
+        mouvements.append((
+            jour,
+            sig.get('isin') or sig.get('code'),
+            quantite if transaction['type_operation'] == 'ACHAT' else -quantite,
+            float(transaction['prix_unitaire']),
+            transaction.get('devise') or 'EUR',
+            sig.get('categorie_text') or 'Non classé',
+            ds.get("Type d'instr") or '',
+        ))
+    mouvements.sort(key=lambda m: m[0])
+    return mouvements
+
+
+def _serie_reportee(jours_serie: np.ndarray, valeurs_serie: np.ndarray, jours: np.ndarray) -> np.ndarray:
+    """Valeur de la série à chaque jour (dernière valeur connue, NaN avant la première)"""
+    positions = np.searchsorted(jours_serie, jours, side='right') - 1
+    resultat = np.full(len(jours), np.nan)
+    connues = positions >= 0
+    resultat[connues] = valeurs_serie[positions[connues]]
+    return resultat
+
+
+def _calculer(portfolio_id: int, mouvements: list, jour_debut: int, jour_fin: int, engine) -> Dict:
+    jours = np.arange(jour_debut, jour_fin + 1, dtype=np.int64)
+    isins = sorted({m[1] for m in mouvements})
+    colonne = {isin: j for j, isin in enumerate(isins)}
+    infos = {}
+    for _, isin, _, _, devise, categorie, type_instrument in mouvements:
+        infos.setdefault(isin, (devise, categorie, type_instrument))
+
+    # Quantités : mouvements posés sur leur jour (ceux d'avant la plage sur le premier), puis cumulés
+    mouvements_plage = [m for m in mouvements if m[0] <= jour_fin]
+    deltas = np.zeros((len(jours), len(isins)))
+    if mouvements_plage:
+        lignes = np.maximum(np.array([m[0] for m in mouvements_plage]) - jour_debut, 0)
+        colonnes_mvt = np.array([colonne[m[1]] for m in mouvements_plage])
+        np.add.at(deltas, (lignes, colonnes_mvt), np.array([m[2] for m in mouvements_plage]))
+    quantites = np.cumsum(deltas, axis=0)
+    # Flux : montant signé des mouvements (achats +), au même emplacement que les quantités
+    flux = np.zeros((len(jours), len(isins)))
+
+    # Prix : cours consolidés reportés, à défaut dernier prix de transaction
+    colonnes_prix = price_store.get_prix_colonnes(engine)
+    prix = np.full((len(jours), len(isins)), np.nan)
+    sans_cours = []
+    prix_transactions = defaultdict(lambda: ([], []))
+    for jour, isin, _, prix_unitaire, _, _, _ in mouvements:
+        prix_transactions[isin][0].append(jour)
+        prix_transactions[isin][1].append(prix_unitaire)
+    for isin, j in colonne.items():
+        bornes = colonnes_prix['index'].get(isin)
+        if bornes is not None:
+            debut, fin = bornes
+            prix[:, j] = _serie_reportee(colonnes_prix['jours'][debut:fin], colonnes_prix['cours'][debut:fin], jours)
+        else:
+            sans_cours.append(isin)
+        manquants = np.isnan(prix[:, j])
+        if manquants.any():
+            jours_tx, prix_tx = prix_transactions[isin]
+            prix[manquants, j] = _serie_reportee(np.array(jours_tx), np.array(prix_tx), jours[manquants])
+        devise, categorie, type_instrument = infos[isin]
+        if is_obligation(categorie, type_instrument):
+            prix[:, j] /= 100
+    if mouvements_plage:
+        diviseurs = np.array([100.0 if is_obligation(m[5], m[6]) else 1.0 for m in mouvements_plage])
+        montants = np.array([m[2] * m[3] for m in mouvements_plage]) / diviseurs
+        np.add.at(flux, (lignes, colonnes_mvt), montants)
+
+    valeurs = np.where(quantites != 0, quantites * np.nan_to_num(prix), 0.0)
+
+    # Cash : solde de chaque compte (banque, devise) à chaque jour
+    comptes = defaultdict(list)
+    for entree in engine.get_cash_by_portfolio(portfolio_id):
+        jour = price_store.date_vers_jour(entree.get('date'))
+        if jour is not None:
+            comptes[(entree.get('banque'), entree.get('devise') or 'EUR')].append((jour, entree['id'], float(entree['montant'])))
+    cash: Dict[str, np.ndarray] = {}
+    for (_, devise), entrees in comptes.items():
+        entrees.sort()
+        solde = _serie_reportee(np.array([e[0] for e in entrees]), np.array([e[2] for e in entrees]), jours)
+        cash[devise] = cash.get(devise, np.zeros(len(jours))) + np.nan_to_num(solde)
+
+    devises_isins = np.array([infos[isin][0] for isin in isins])
+    titres = {devise: valeurs[:, devises_isins == devise].sum(axis=1) for devise in set(devises_isins.tolist())}
+    return {
+        'jours': jours,
+        'isins': isins,
+        'infos': {isin: {'devise': d, 'categorie': c, 'type_instrument': t} for isin, (d, c, t) in infos.items()},
+        'quantites': quantites,
+        'prix': prix,
+        'valeurs': valeurs,
+        'flux': flux,
+        'titres': titres,
+        'cash': cash,
+        'sans_cours': sans_cours,
+    }
+
+
+def calculer_nav(portfolio_id: int, debut=None, fin=None, engine=None) -> Optional[Dict]:
+    """Matrices de NAV d'un portefeuille (voir en-tête) entre debut et fin (incluses).
+
+    Par défaut, de la première transaction ou entrée de cash à aujourd'hui.
+    Retourne None si le portefeuille n'a ni transaction ni cash. Le résultat vient du
+    cache : ne pas modifier les tableaux.
+    """
+    engine = resolve_engine(engine)
+    versions = tuple(engine.get_data_version(nom) for nom in DONNEES_SOURCES)
+    premiers = [price_store.date_vers_jour(t.get('date')) for t in engine.get_transactions_by_portfolio(portfolio_id)]
+    premiers += [price_store.date_vers_jour(c.get('date')) for c in engine.get_cash_by_portfolio(portfolio_id)]
+    premiers = [jour for jour in premiers if jour is not None]
+    if not premiers:
+        return None
+    jour_debut = _jour(debut, min(premiers))
+    jour_fin = _jour(fin, date.today().toordinal())
+    if jour_fin < jour_debut:
+        raise ValueError('La date de fin précède la date de début')
+
+    cle = (engine.__name__, portfolio_id, jour_debut, jour_fin)
+    with _cache_lock:
+        cached = _cache.get(cle)
+        if cached is not None and cached[0] == versions:
+            _cache.move_to_end(cle)
+            return cached[1]
+    resultat = _calculer(portfolio_id, _mouvements(portfolio_id, engine), jour_debut, jour_fin, engine)
+    with _cache_lock:
+        _cache[cle] = (versions, resultat)
+        _cache.move_to_end(cle)
+        while len(_cache) > NAV_CACHE_TAILLE:
+            _cache.popitem(last=False)
+    return resultat
+
+
+def serie_nav(portfolio_id: int, debut=None, fin=None, engine=None) -> Dict:
+    """Série quotidienne de NAV par devise (titres, cash, total), au format JSON"""
+    nav = calculer_nav(portfolio_id, debut, fin, engine)
+    if nav is None:
+        return {'dates': [], 'series': {}, 'isins_sans_cours': []}
+    devises = sorted(set(nav['titres']) | set(nav['cash']))
+    zeros = np.zeros(len(nav['jours']))
+    series = {}
+    for devise in devises:
+        titres = nav['titres'].get(devise, zeros)
+        cash = nav['cash'].get(devise, zeros)
+        series[devise] = {
+            'titres': np.round(titres, 2).tolist(),
+            'cash': np.round(cash, 2).tolist(),
+            'total': np.round(titres + cash, 2).tolist(),
+        }
+    return {
+        'debut': price_store.jour_vers_date(nav['jours'][0]).isoformat(),
+        'fin': price_store.jour_vers_date(nav['jours'][-1]).isoformat(),
+        'dates': [price_store.jour_vers_date(jour).isoformat() for jour in nav['jours']],
+        'series': series,
+        'isins_sans_cours': nav['sans_cours'],
+    }
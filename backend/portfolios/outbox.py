@@ -0,0 +1,386 @@
+# File d'attente (outbox) de la double écriture JSON → PostgreSQL.
+# Les vues qui modifient la signalétique (et, par elle, les catégories et types
+# d'instruments) n'écrivent plus en base : à la fin de la modification du stockage JSON,
+# les changements sont ajoutés comme événements à un fichier JSONL local (une ligne
+# par événement, une seule écriture + fsync par requête ou par import). Un thread de
+# fond les applique à PostgreSQL par lots de SYNCHRO_OUTBOX_LOT (synchro.LotSignaletiques,
+# une transaction par lot) ; la latence des requêtes ne dépend plus de la base et une
+# base indisponible ne fait que retarder la synchronisation.
+#
+# Événements :
+#   {"id": "…", "date": "…", "op": "signaletique", "origine": …, "valeurs": {…},
+#    "type_instrument": …, "creer": true, "mettre_a_jour": true}
+#   {"id": "…", "date": "…", "op": "reference", "origine": …, "categorie": …, "type_instrument": …}
+# L'id (clé d'idempotence) du dernier événement appliqué est enregistré avec la position
+# atteinte dans le fichier (curseur, écrit après la validation de la transaction). Un
+# arrêt entre les deux fait rejouer le dernier lot, sans effet : chaque événement est
+# une écriture complète de la signalétique, identifiée par ISIN / code, et les
+# événements sont appliqués dans l'ordre.
+# Échec de la base (connexion…) : le lot est retenté, avec une attente doublée à chaque
+# échec (plafonnée à SYNCHRO_OUTBOX_DELAI_MAX). Événement refusé par la base (contrainte,
+# valeur invalide) : écarté dans le fichier des rejets, la file continue.
+# Une fois la file entièrement appliquée, le fichier est vidé.
+# Plusieurs processus peuvent publier (verrou fcntl sur le fichier) ; un seul applique
+# à la fois (verrou de drainage non bloquant).
+#
+# SYNCHRO_OUTBOX=False revient à l'écriture directe en base dans la requête.
+
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import groupby
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus
+    fcntl = None
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, close_old_connections, connection, transaction
+
+from . import file_storage, synchro
+from .models import AssetCategory
+
+OUTBOX_ACTIF = os.environ.get('SYNCHRO_OUTBOX', 'True') == 'True'
+# Fichier de la file (défaut : synchro_outbox.jsonl dans le répertoire de données)
+OUTBOX_FICHIER = os.environ.get('SYNCHRO_OUTBOX_FICHIER')
+# Événements appliqués par transaction
+OUTBOX_LOT = int(os.environ.get('SYNCHRO_OUTBOX_LOT', '1000'))
+# Attente (secondes) du thread quand la file est vide, et première attente après un échec
+OUTBOX_INTERVALLE = float(os.environ.get('SYNCHRO_OUTBOX_INTERVALLE', '1'))
+OUTBOX_DELAI_MAX = float(os.environ.get('SYNCHRO_OUTBOX_DELAI_MAX', '60'))
+
+_etat = {
+    'appliques': 0,            # événements appliqués par ce processus
+    'rejetes': 0,              # événements écartés par ce processus
+    'dernier_drainage': None,  # fin du dernier passage réussi
+    'derniere_erreur': None,
+    'echecs_consecutifs': 0,
+}
+_drainage_lock = threading.Lock()
+_thread: Optional[threading.Thread] = None
+_thread_lock = threading.Lock()
+_reveil = threading.Event()
+
+
+def _chemin() -> str:
+    return OUTBOX_FICHIER or os.path.join(file_storage.DATA_DIR, 'synchro_outbox.jsonl')
+
+
+def _chemin_curseur() -> str:
+    return _chemin() + '.curseur'
+
+
+def _chemin_rejets() -> str:
+    return os.path.splitext(_chemin())[0] + '.rejets.jsonl'
+
+
+@contextmanager
+def _verrou(suffixe: str, bloquant: bool = True):
+    """Verrou fcntl exclusif sur <fichier><suffixe> ; rend False si non bloquant et déjà pris"""
+    chemin = _chemin() + suffixe
+    os.makedirs(os.path.dirname(chemin) or '.', exist_ok=True)
+    fd = os.open(chemin, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | (0 if bloquant else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+        yield True
+    finally:
+        os.close(fd)  # libère le verrou fcntl
+
+
+def _encoder(valeur):
+    if isinstance(valeur, AssetCategory):
+        return valeur.name
+    return file_storage.DateTimeEncoder().default(valeur)
+
+
+def publier(evenements: List[Dict]):
+    """Ajoute des événements à la file (une écriture, fsync) et réveille le drainage"""
+    if not evenements:
+        return
+    maintenant = datetime.now().isoformat()
+    texte = ''.join(
+        json.dumps({'id': uuid.uuid4().hex, 'date': maintenant, **evenement},
+                   default=_encoder, ensure_ascii=False) + '\n'
+        for evenement in evenements
+    )
+    with _verrou('.lock'):
+        with open(_chemin(), 'a', encoding='utf-8') as f:
+            f.write(texte)
+            f.flush()
+            os.fsync(f.fileno())
+    demarrer()
+    _reveil.set()
+
+
+class Publication:
+    """Même interface que synchro.LotSignaletiques, mais les signalétiques sont publiées
+    dans la file à la sortie du bloc (rien en cas d'exception) au lieu d'être écrites
+    en base. Les erreurs de base n'étant connues qu'à l'application, erreurs reste vide."""
+
+    def __init__(self, origine: Optional[str] = None):
+        self.origine = origine
+        self.erreurs: List[Dict] = []
+        self._evenements: List[Dict] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            publier(self._evenements)
+        self._evenements = []
+        return False
+
+    def ajouter(self, valeurs: Dict, ligne: Optional[int] = None, type_instrument: Optional[str] = None,
+                creer: bool = True, mettre_a_jour: bool = True):
+        synchro.cle(valeurs)  # champs et clé vérifiés dès la requête
+        self._evenements.append({
+            'op': 'signaletique', 'origine': self.origine, 'valeurs': valeurs,
+            'type_instrument': type_instrument, 'creer': creer, 'mettre_a_jour': mettre_a_jour,
+        })
+
+    def referencer(self, categorie: Optional[str] = None, type_instrument: Optional[str] = None,
+                   ligne: Optional[int] = None):
+        if categorie or type_instrument:
+            self._evenements.append({
+                'op': 'reference', 'origine': self.origine,
+                'categorie': categorie, 'type_instrument': type_instrument,
+            })
+
+
+def lot_signaletiques(origine: Optional[str] = None):
+    """Double écriture de signalétiques : via la file si SYNCHRO_OUTBOX (défaut),
+    sinon directement en base dans la requête"""
+    if OUTBOX_ACTIF:
+        return Publication(origine)
+    return synchro.LotSignaletiques(origine)
+
+
+# ── Curseur ──────────────────────────────────────────────────────────────────
+
+def _inode() -> Optional[int]:
+    try:
+        return os.stat(_chemin()).st_ino
+    except FileNotFoundError:
+        return None
+
+
+def _lire_curseur() -> Dict:
+    """Position atteinte dans la file ; repart du début si le fichier a été remplacé"""
+    try:
+        with open(_chemin_curseur(), encoding='utf-8') as f:
+            curseur = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        curseur = {}
+    inode = _inode()
+    taille = os.path.getsize(_chemin()) if inode is not None else 0
+    if 'offset' not in curseur or curseur.get('inode') != inode or curseur['offset'] > taille:
+        curseur = {'offset': 0, 'dernier_id': None, 'inode': inode}
+    return curseur
+
+
+def _ecrire_curseur(curseur: Dict):
+    temporaire = _chemin_curseur() + '.tmp'
+    with open(temporaire, 'w', encoding='utf-8') as f:
+        json.dump(curseur, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporaire, _chemin_curseur())
+
+
+def _lire_evenements(offset: int, limite: Optional[int]) -> tuple:
+    """(événements complets à partir de offset, nouvel offset)"""
+    evenements = []
+    try:
+        f = open(_chemin(), 'rb')
+    except FileNotFoundError:
+        return evenements, offset
+    with f:
+        f.seek(offset)
+        for brut in f:
+            if not brut.endswith(b'\n'):
+                break  # ligne en cours d'écriture : sera relue une fois terminée
+            offset += len(brut)
+            ligne = brut.decode('utf-8').strip()
+            if not ligne:
+                continue
+            try:
+                evenements.append(json.loads(ligne))
+            except json.JSONDecodeError:
+                _rejeter({'brut': ligne}, 'Ligne illisible')
+            if limite is not None and len(evenements) >= limite:
+                break
+    return evenements, offset
+
+
+def _compter(offset: int) -> tuple:
+    """(événements en attente à partir de offset, date du plus ancien), sans les décoder"""
+    nombre = 0
+    plus_ancien = None
+    try:
+        f = open(_chemin(), 'rb')
+    except FileNotFoundError:
+        return nombre, plus_ancien
+    with f:
+        f.seek(offset)
+        for brut in f:
+            if not brut.endswith(b'\n') or not brut.strip():
+                continue
+            if plus_ancien is None:
+                try:
+                    plus_ancien = json.loads(brut).get('date')
+                except (json.JSONDecodeError, AttributeError):
+                    pass
+            nombre += 1
+    return nombre, plus_ancien
+
+
+def _rejeter(evenement: Dict, erreur: str):
+    with open(_chemin_rejets(), 'a', encoding='utf-8') as f:
+        f.write(json.dumps({**evenement, 'erreur': erreur, 'date_rejet': datetime.now().isoformat()},
+                           ensure_ascii=False) + '\n')
+    _etat['rejetes'] += 1
+
+
+# ── Application ──────────────────────────────────────────────────────────────
+
+def _appliquer(evenements: List[Dict]):
+    """Applique un lot d'événements dans une transaction ; les événements refusés
+    (valeur invalide, contrainte) sont écartés dans les rejets"""
+    rejets = []
+    with transaction.atomic():
+        for origine, groupe in groupby(enumerate(evenements), key=lambda e: e[1].get('origine')):
+            with synchro.LotSignaletiques(origine) as lot:
+                for position, evenement in groupe:
+                    try:
+                        if evenement.get('op') == 'reference':
+                            lot.referencer(evenement.get('categorie'), evenement.get('type_instrument'),
+                                           ligne=position)
+                        elif evenement.get('op') == 'signaletique':
+                            lot.ajouter(evenement['valeurs'], ligne=position,
+                                        type_instrument=evenement.get('type_instrument'),
+                                        creer=evenement.get('creer', True),
+                                        mettre_a_jour=evenement.get('mettre_a_jour', True))
+                        else:
+                            rejets.append((evenement, f"Opération inconnue : {evenement.get('op')}"))
+                    except (ValueError, ValidationError) as e:
+                        rejets.append((evenement, str(e)))
+            rejets.extend((evenements[e['ligne']], e['erreur']) for e in lot.erreurs)
+    for evenement, erreur in rejets:
+        _rejeter(evenement, erreur)
+
+
+def drainer(limite: Optional[int] = None) -> Dict:
+    """Applique la file à PostgreSQL (au plus limite événements, tous par défaut).
+    Lève DatabaseError si la base est indisponible (la file est conservée)."""
+    appliques = 0
+    with _drainage_lock, _verrou('.drainage.lock', bloquant=False) as libre:
+        if not libre:
+            return {'occupe': True, 'appliques': 0}
+        close_old_connections()
+        while limite is None or appliques < limite:
+            curseur = _lire_curseur()
+            taille = OUTBOX_LOT if limite is None else min(OUTBOX_LOT, limite - appliques)
+            evenements, offset = _lire_evenements(curseur['offset'], taille)
+            if not evenements:
+                if offset != curseur['offset']:
+                    _ecrire_curseur({**curseur, 'offset': offset})
+                _vider_si_applique()
+                break
+            _appliquer(evenements)
+            _ecrire_curseur({'offset': offset, 'dernier_id': evenements[-1].get('id'), 'inode': curseur['inode']})
+            appliques += len(evenements)
+            _etat['appliques'] += len(evenements)
+        _etat['dernier_drainage'] = datetime.now().isoformat()
+    return {'occupe': False, 'appliques': appliques}
+
+
+def _vider_si_applique():
+    """Vide le fichier de la file si tout a été appliqué (sous le verrou des publications)"""
+    with _verrou('.lock'):
+        curseur = _lire_curseur()
+        try:
+            taille = os.path.getsize(_chemin())
+        except FileNotFoundError:
+            return
+        if taille and curseur['offset'] == taille:
+            os.truncate(_chemin(), 0)
+            _ecrire_curseur({'offset': 0, 'dernier_id': curseur.get('dernier_id'), 'inode': curseur['inode']})
+
+
+# ── Thread de fond ───────────────────────────────────────────────────────────
+
+def _boucle():
+    attente = OUTBOX_INTERVALLE
+    while True:
+        _reveil.wait(attente)
+        _reveil.clear()
+        try:
+            drainer()
+        except DatabaseError as e:
+            _etat['echecs_consecutifs'] += 1
+            _etat['derniere_erreur'] = {'date': datetime.now().isoformat(), 'erreur': str(e)}
+            connection.close()
+            attente = min(OUTBOX_INTERVALLE * 2 ** _etat['echecs_consecutifs'], OUTBOX_DELAI_MAX)
+            continue
+        except Exception as e:  # ne jamais arrêter le thread (fichier illisible…)
+            _etat['echecs_consecutifs'] += 1
+            _etat['derniere_erreur'] = {'date': datetime.now().isoformat(), 'erreur': str(e)}
+            attente = OUTBOX_DELAI_MAX
+            continue
+        _etat['echecs_consecutifs'] = 0
+        attente = OUTBOX_INTERVALLE
+
+
+def demarrer():
+    """Démarre le thread de drainage s'il ne tourne pas (appelé à la première publication)"""
+    global _thread
+    with _thread_lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_boucle, name='synchro-outbox', daemon=True)
+            _thread.start()
+
+
+def etat() -> Dict:
+    """Retard de la synchronisation : événements en attente, âge du plus ancien, compteurs"""
+    demarrer()  # reprend une file laissée par un processus précédent
+    curseur = _lire_curseur()
+    try:
+        taille = os.path.getsize(_chemin())
+    except FileNotFoundError:
+        taille = 0
+    en_attente, plus_ancien = _compter(curseur['offset'])
+    retard = None
+    if plus_ancien:
+        try:
+            retard = (datetime.now() - datetime.fromisoformat(plus_ancien)).total_seconds()
+        except ValueError:
+            pass
+    try:
+        with open(_chemin_rejets(), 'rb') as f:
+            rejets_total = sum(1 for _ in f)
+    except FileNotFoundError:
+        rejets_total = 0
+    return {
+        'actif': OUTBOX_ACTIF,
+        'fichier': _chemin(),
+        'evenements_en_attente': en_attente,
+        'octets_en_attente': max(taille - curseur['offset'], 0),
+        'plus_ancien': plus_ancien,
+        'retard_secondes': round(retard, 1) if retard is not None else None,
+        'dernier_id_applique': curseur.get('dernier_id'),
+        'rejets': rejets_total,
+        'thread_actif': _thread is not None and _thread.is_alive(),
+        **_etat,
+    }
@@ -0,0 +1,240 @@
+# Stockage colonnaire de l'historique consolidé des prix, pour les calculs
+# (valorisation, rendements, risque).
+# L'historique consolidé (prix_titres, JSON ou SQLite) reste la source de vérité ;
+# on en dérive une génération de colonnes NumPy, relue par mmap sans désérialisation :
+#   prix_colonnes/<moteur>/v<version>/
+#     jours.npy    int32   date en ordinal (date.toordinal())
+#     cours.npy    float64 cours
+#     devises.npy  uint8   code de devise (voir index.json → devises)
+#     sources.npy  uint8   code de source (voir index.json → sources)
+#     index.json   {isin: [debut, fin]}, tables des codes (devises, sources), version
+# Les lignes sont triées par ISIN puis par date : la série d'un titre est la
+# tranche [debut:fin] de chaque colonne (une vue, sans copie).
+# La version est celle de l'historique consolidé (get_prix_titres_version) : toute
+# écriture d'un titre rend la génération obsolète, reconstruite à la lecture suivante.
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import date
+from typing import Dict, Optional
+
+import numpy as np
+
+from . import file_storage
+from .storage import resolve_engine
+
+PRIX_COLONNES_DIRNAME = 'prix_colonnes'
+COLONNES = {
+    'jours': np.int32,
+    'cours': np.float64,
+    'devises': np.uint8,
+    'sources': np.uint8,
+}
+
+_cache: Dict[str, Dict] = {}
+_cache_lock = threading.Lock()
+
+
+def _store_dir(engine) -> str:
+    """Répertoire des générations du moteur (à côté de ses données)"""
+    base = os.path.dirname(engine.SQLITE_PATH) if hasattr(engine, 'SQLITE_PATH') else engine.DATA_DIR
+    return os.path.join(base, PRIX_COLONNES_DIRNAME, engine.__name__.rsplit('.', 1)[-1])
+
+
+def date_vers_jour(value) -> Optional[int]:
+    """Convertit une date (date ou chaîne ISO, éventuellement horodatée) en ordinal"""
+    if isinstance(value, date):
+        return value.toordinal()
+    try:
+        return date.fromisoformat(str(value)[:10]).toordinal()
+    except (TypeError, ValueError):
+        return None
+
+
+def jour_vers_date(jour: int) -> date:
+    """Convertit un ordinal en date"""
+    return date.fromordinal(int(jour))
+
+
+def arrondi(valeur, decimales: int = 6) -> Optional[float]:
+    """Arrondi d'un résultat de calcul : None si la valeur est absente ou non finie"""
+    # + 0.0 : évite les « -0.0 »
+    return None if valeur is None or not np.isfinite(valeur) else round(float(valeur), decimales) + 0.0
+
+
+def _build_columns(titres: Dict) -> tuple:
+    """Construit (colonnes, index, devises, sources) à partir de l'historique consolidé"""
+    devises: Dict[str, int] = {}
+    sources: Dict[str, int] = {}
+    jours, cours, codes_devise, codes_source = [], [], [], []
+    index = {}
+    for isin in sorted(titres):
+        titre = titres[isin] or {}
+        lignes = []
+        for entry in titre.get('historique', []):
+            jour = date_vers_jour(entry.get('date'))
+            try:
+                valeur = float(entry.get('cours'))
+            except (TypeError, ValueError):
+                continue
+            if jour is None:
+                continue
+            devise = entry.get('devise') or titre.get('devise_ref') or 'EUR'
+            source = entry.get('source') or ''
+            lignes.append((jour, valeur,
+                           devises.setdefault(devise, len(devises)),
+                           sources.setdefault(source, len(sources))))
+        if not lignes:
+            continue
+        # Tri stable : à date égale, l'ordre de l'historique est conservé
+        lignes.sort(key=lambda ligne: ligne[0])
+        debut = len(jours)
+        for jour, valeur, devise, source in lignes:
+            jours.append(jour)
+            cours.append(valeur)
+            codes_devise.append(devise)
+            codes_source.append(source)
+        index[isin] = [debut, len(jours)]
+    if len(devises) > 255 or len(sources) > 255:
+        raise ValueError("Trop de devises ou de sources distinctes pour un codage sur 8 bits")
+    colonnes = {
+        'jours': np.array(jours, dtype=COLONNES['jours']),
+        'cours': np.array(cours, dtype=COLONNES['cours']),
+        'devises': np.array(codes_devise, dtype=COLONNES['devises']),
+        'sources': np.array(codes_source, dtype=COLONNES['sources']),
+    }
+    return colonnes, index, list(devises), list(sources)
+
+
+def _write_generation(store_dir: str, version: int, titres: Dict) -> str:
+    """Écrit une génération dans un répertoire temporaire puis la publie par rename"""
+    os.makedirs(store_dir, exist_ok=True)
+    target = os.path.join(store_dir, f'v{version}')
+    if os.path.exists(os.path.join(target, 'index.json')):
+        return target
+    colonnes, index, devises, sources = _build_columns(titres)
+    tmp_dir = tempfile.mkdtemp(prefix='.v', dir=store_dir)
+    try:
+        for nom, valeurs in colonnes.items():
+            with open(os.path.join(tmp_dir, f'{nom}.npy'), 'wb') as f:
+                np.save(f, valeurs)
+                f.flush()
+                os.fsync(f.fileno())
+        file_storage._atomic_write(os.path.join(tmp_dir, 'index.json'), json.dumps({
+            'version': version,
+            'index': index,
+            'devises': devises,
+            'sources': sources,
+        }, ensure_ascii=False).encode('utf-8'))
+        try:
+            os.rename(tmp_dir, target)
+        except OSError:
+            # Un autre processus a publié la même version entre-temps
+            if not os.path.exists(os.path.join(target, 'index.json')):
+                raise
+        file_storage._fsync_dir(store_dir)
+    finally:
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    _remove_old_generations(store_dir, keep=f'v{version}')
+    return target
+
+
+def _remove_old_generations(store_dir: str, keep: str):
+    """Supprime les générations précédentes (les mmap déjà ouverts restent valides sous POSIX)"""
+    for name in os.listdir(store_dir):
+        if name != keep and name.startswith('v') and name[1:].isdigit():
+            shutil.rmtree(os.path.join(store_dir, name), ignore_errors=True)
+
+
+def _open_generation(generation_dir: str) -> Dict:
+    with open(os.path.join(generation_dir, 'index.json'), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    colonnes = {
+        nom: np.load(os.path.join(generation_dir, f'{nom}.npy'), mmap_mode='r')
+        for nom in COLONNES
+    }
+    return {
+        'version': meta['version'],
+        'index': {isin: tuple(bornes) for isin, bornes in meta['index'].items()},
+        'codes_devises': meta['devises'],
+        'codes_sources': meta['sources'],
+        **colonnes,
+    }
+
+
+def get_prix_colonnes(engine=None) -> Dict:
+    """Retourne les colonnes de prix à jour (mmap en lecture seule), reconstruites si besoin.
+
+    Clés : jours, cours, devises, sources (tableaux NumPy), index ({isin: (debut, fin)}),
+    codes_devises / codes_sources (code → libellé), version.
+    """
+    engine = resolve_engine(engine)
+    store_dir = _store_dir(engine)
+    # La version est lue avant les données : une écriture concurrente rend la
+    # génération construite obsolète, jamais incohérente avec son numéro.
+    version = engine.get_prix_titres_version()
+    cached = _cache.get(store_dir)
+    if cached is not None and cached['version'] == version:
+        return cached
+    with _cache_lock:
+        cached = _cache.get(store_dir)
+        if cached is not None and cached['version'] == version:
+            return cached
+        generation_dir = os.path.join(store_dir, f'v{version}')
+        if not os.path.exists(os.path.join(generation_dir, 'index.json')):
+            generation_dir = _write_generation(store_dir, version, engine.get_prix_historique_titres())
+        colonnes = _open_generation(generation_dir)
+        _cache[store_dir] = colonnes
+        return colonnes
+
+
+def get_serie_prix(isin: str, engine=None) -> Optional[Dict]:
+    """Retourne la série d'un titre : vues (sans copie) sur jours, cours, devises, sources"""
+    colonnes = get_prix_colonnes(engine)
+    bornes = colonnes['index'].get(isin)
+    if bornes is None:
+        return None
+    debut, fin = bornes
+    return {
+        'isin': isin,
+        'jours': colonnes['jours'][debut:fin],
+        'cours': colonnes['cours'][debut:fin],
+        'devises': colonnes['devises'][debut:fin],
+        'sources': colonnes['sources'][debut:fin],
+        'codes_devises': colonnes['codes_devises'],
+        'codes_sources': colonnes['codes_sources'],
+    }
+
+
+def get_cours_a_date(isins, jour_valorisation, engine=None) -> Dict[str, Dict]:
+    """Dernier cours connu à la date donnée (incluse) pour chaque ISIN : recherche
+    dichotomique dans la série triée du titre. Les ISIN sans cours antérieur sont omis.
+
+    jour_valorisation : date, chaîne ISO ou ordinal.
+    """
+    jour = jour_valorisation if isinstance(jour_valorisation, int) else date_vers_jour(jour_valorisation)
+    if jour is None:
+        raise ValueError(f"Date invalide : {jour_valorisation!r}")
+    colonnes = get_prix_colonnes(engine)
+    jours = colonnes['jours']
+    resultat = {}
+    for isin in isins:
+        bornes = colonnes['index'].get(isin)
+        if bornes is None:
+            continue
+        debut, fin = bornes
+        # Dernière ligne de date <= jour (à date égale, la dernière de l'historique)
+        position = debut + int(np.searchsorted(jours[debut:fin], jour, side='right')) - 1
+        if position < debut:
+            continue
+        resultat[isin] = {
+            'jour': int(jours[position]),
+            'date': jour_vers_date(jours[position]).isoformat(),
+            'cours': float(colonnes['cours'][position]),
+            'devise': colonnes['codes_devises'][colonnes['devises'][position]],
+        }
+    return resultat
@@ -0,0 +1,175 @@
+# Rapprochement du stockage JSON (qui fait foi) et des tables PostgreSQL Signaletique /
+# AssetCategory alimentées par la double écriture.
+# Chaque signalétique est réduite à une empreinte de contenu (blake2b des champs
+# synchronisés mis sous forme canonique : '' et None confondus, prix à 4 décimales comme
+# en base, dates ISO, JSON à clés triées). Les empreintes JSON sont indexées par clé
+# (ISIN, sinon code, comme pour l'écriture) ; la base est parcourue en flux
+# (values_list().iterator(), sans instancier de modèles) et comparée par jointure sur
+# la clé : manquantes (JSON seul), en trop (base seule), différentes (empreintes
+# distinctes). Les catégories utilisées par le JSON mais absentes d'AssetCategory sont
+# aussi relevées.
+# La réparation écrit en base les signalétiques manquantes ou différentes et les
+# catégories manquantes (synchro.LotSignaletiques, bulk_create / bulk_update) après
+# avoir appliqué la file de synchronisation. Les signalétiques en trop ne sont que
+# signalées (la suppression des signalétiques est désactivée).
+
+import hashlib
+import json
+import os
+import time
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List
+
+from django.core.exceptions import ValidationError
+
+from . import outbox, synchro
+from .models import AssetCategory, Signaletique
+from .storage import resolve_engine
+
+# Écarts détaillés dans le rapport (par type d'écart)
+RAPPROCHEMENT_EXEMPLES = int(os.environ.get('RAPPROCHEMENT_EXEMPLES', '20'))
+# Lignes lues par aller-retour lors du parcours de la base
+RAPPROCHEMENT_CHUNK = 5000
+
+# Champs comparés (ordre fixe) ; la catégorie (FK) est comparée par son nom
+CHAMPS = ['code', 'isin', 'titre', 'description', 'categorie_text', 'statut', 'donnees_supplementaires',
+          'prix', 'devise_prix', 'source_prix', 'date_cours', 'frequence_coupon']
+_PRIX = Decimal(1).scaleb(-Signaletique._meta.get_field('prix').decimal_places)
+
+
+def _canonique(valeur):
+    if valeur is None or valeur == '' or valeur == {}:
+        return None
+    if isinstance(valeur, Decimal):
+        try:
+            return format(valeur.quantize(_PRIX), 'f')
+        except InvalidOperation:
+            return str(valeur)
+    if isinstance(valeur, (date, datetime)):
+        return valeur.isoformat()
+    if isinstance(valeur, (dict, list)):
+        return json.dumps(valeur, sort_keys=True, ensure_ascii=False, default=str, separators=(',', ':'))
+    return valeur
+
+
+def _canonique_json(sig: Dict) -> tuple:
+    """Valeurs canoniques d'une signalétique du JSON, converties comme à l'écriture en base"""
+    valeurs = []
+    for champ in CHAMPS:
+        valeur = sig.get(champ)
+        if valeur is not None and valeur != '':
+            try:
+                valeur = synchro.CHAMPS[champ].to_python(valeur)
+            except ValidationError:
+                valeur = str(valeur)  # invalide : ne peut pas correspondre à la base
+        valeurs.append(_canonique(valeur))
+    valeurs.append(synchro.normaliser_nom(sig.get('categorie_text')))
+    return tuple(valeurs)
+
+
+def _empreinte(valeurs: tuple) -> bytes:
+    return hashlib.blake2b(json.dumps(valeurs, ensure_ascii=False, default=str).encode('utf-8'),
+                           digest_size=16).digest()
+
+
+def _cle(valeurs: tuple) -> str:
+    """Clé de jointure : ISIN, sinon code (valeurs canoniques)"""
+    return valeurs[1] or valeurs[0]
+
+
+def _ecarts(attendu: tuple, obtenu: tuple) -> List[str]:
+    return [champ for champ, a, b in zip(CHAMPS + ['categorie'], attendu, obtenu) if a != b]
+
+
+def rapprocher(reparer: bool = False, exemples: int = RAPPROCHEMENT_EXEMPLES, engine=None) -> Dict:
+    """Compare la signalétique du stockage JSON et de la base ; répare la base si demandé.
+    Lève DatabaseError si la base est indisponible."""
+    debut = time.perf_counter()
+    engine = resolve_engine(engine)
+    if reparer:
+        outbox.drainer()  # sinon des événements en attente écraseraient la réparation
+
+    sigs = engine.get_all_signaletiques()
+    attendues = {}  # clé → (empreinte, position dans sigs)
+    categories = set()
+    for position, sig in enumerate(sigs):
+        valeurs = _canonique_json(sig)
+        cle = _cle(valeurs)
+        if cle is not None:
+            attendues[cle] = (_empreinte(valeurs), position)
+        if valeurs[-1]:
+            categories.add(valeurs[-1])
+    lignes_json = len(attendues)
+
+    categories_manquantes = sorted(categories - set(AssetCategory.objects.values_list('name', flat=True)))
+
+    identiques = 0
+    lignes_base = 0
+    en_trop: List[str] = []
+    differentes: List[tuple] = []  # (clé, position dans sigs, valeurs en base)
+    colonnes = CHAMPS + ['categorie__name']
+    for ligne in Signaletique.objects.order_by().values_list(*colonnes).iterator(chunk_size=RAPPROCHEMENT_CHUNK):
+        lignes_base += 1
+        valeurs = tuple(_canonique(v) for v in ligne)
+        cle = _cle(valeurs)
+        attendue = attendues.pop(cle, None)
+        if attendue is None:
+            en_trop.append(cle)
+        elif attendue[0] == _empreinte(valeurs):
+            identiques += 1
+        else:
+            differentes.append((cle, attendue[1], valeurs))
+    manquantes = list(attendues.items())
+
+    rapport = {
+        'signaletiques_json': lignes_json,
+        'signaletiques_base': lignes_base,
+        'identiques': identiques,
+        'manquantes': len(manquantes),
+        'en_trop': len(en_trop),
+        'differentes': len(differentes),
+        'categories_manquantes': categories_manquantes,
+        'exemples': {
+            'manquantes': [cle for cle, _ in manquantes[:exemples]],
+            'en_trop': en_trop[:exemples],
+            'differentes': [
+                {'cle': cle, 'champs': _ecarts(_canonique_json(sigs[position]), valeurs)}
+                for cle, position, valeurs in differentes[:exemples]
+            ],
+        },
+        'evenements_en_attente': outbox.etat()['evenements_en_attente'],
+        'duree_secondes': round(time.perf_counter() - debut, 3),
+    }
+
+    if reparer:
+        rapport['reparation'] = _reparer(
+            sigs, [position for _, (_, position) in manquantes] + [position for _, position, _ in differentes],
+            categories_manquantes,
+        )
+        rapport['duree_secondes'] = round(time.perf_counter() - debut, 3)
+    return rapport
+
+
+def _reparer(sigs: List[Dict], positions: List[int], categories: List[str]) -> Dict:
+    """Écrit en base les signalétiques données (valeurs du JSON) et les catégories manquantes"""
+    erreurs = []
+    with synchro.LotSignaletiques(origine='le rapprochement') as lot:
+        for nom in categories:
+            lot.referencer(categorie=nom)
+        for position in positions:
+            sig = sigs[position]
+            valeurs = {champ: sig.get(champ) for champ in CHAMPS}
+            valeurs['categorie'] = sig.get('categorie_text')
+            try:
+                lot.ajouter(valeurs, ligne=position)
+            except (ValueError, ValidationError) as e:
+                erreurs.append({'cle': sig.get('isin') or sig.get('code'), 'erreur': str(e)})
+    erreurs.extend({'cle': sigs[e['ligne']].get('isin') or sigs[e['ligne']].get('code'), 'erreur': e['erreur']}
+                   for e in lot.erreurs)
+    return {
+        'crees': lot.crees,
+        'mis_a_jour': lot.mis_a_jour,
+        'categories_creees': len([nom for nom in categories if ('categorie', nom) not in lot.refus]),
+        'erreurs': erreurs,
+    }
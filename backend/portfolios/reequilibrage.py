@@ -0,0 +1,263 @@
+# Rééquilibrage d'un portefeuille réel vers un portefeuille cible.
+# Lignes = union des positions ouvertes (analyse FIFO valorisée au dernier cours,
+# valorisation.valoriser_positions) et des titres du portefeuille cible ; montants
+# exprimés dans la devise du portefeuille (fx). Le cash disponible est le dernier
+# solde de chaque compte.
+# Calcul vectorisé (tableaux NumPy alignés sur les lignes) :
+#   poids actuels, poids cibles, écart par ligne et par catégorie ;
+#   ordres = écart de valeur / prix, tronqué vers zéro en nombre entier de titres
+#   (une ligne absente de la cible est vendue en totalité), ordres sous le montant
+#   minimum annulés, achats réduits au cash disponible (cash + ventes) ;
+#   puis une passe gloutonne achète un titre de plus aux lignes les plus sous-pondérées
+#   tant que le cash restant le permet.
+# reequilibrer_lot évalue plusieurs couples (portefeuille, cible) en une requête :
+# analyses FIFO, portefeuilles cibles et signalétique chargés une seule fois.
+
+import os
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from . import fifo, fx, price_store, valorisation
+from .fifo_engine import is_obligation
+from .storage import resolve_engine
+
+# Montant minimum d'un ordre (devise du portefeuille) par défaut
+REEQUILIBRAGE_MONTANT_MIN = float(os.environ.get('REEQUILIBRAGE_MONTANT_MIN', '100'))
+
+
+def _nombre(valeur) -> float:
+    try:
+        return float(str(valeur).replace(',', '.'))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def allouer(valeurs: np.ndarray, prix: np.ndarray, quantites: np.ndarray, cibles: np.ndarray,
+            cash: float, montant_min: float = 0.0) -> np.ndarray:
+    """Nombre entier de titres à acheter (+) ou vendre (−) par ligne.
+
+    valeurs, prix, quantites : valeur, prix unitaire et quantité détenue de chaque
+    ligne ; cibles : poids cibles (fractions, somme ≤ 1) ; cash : liquidités
+    disponibles. Les lignes sans prix (NaN ou ≤ 0) ne reçoivent pas d'ordre.
+    """
+    cotees = np.isfinite(prix) & (prix > 0)
+    prix_surs = np.where(cotees, prix, 1.0)
+    total = valeurs.sum() + cash
+    ecarts = cibles * total - valeurs
+
+    ordres = np.where(cotees, np.fix(ecarts / prix_surs), 0.0)
+    # Une ligne sortie de la cible est vendue en totalité (quantités fractionnaires comprises)
+    ordres = np.where(cotees & (cibles == 0) & (quantites > 0), -quantites, ordres)
+    ordres = np.maximum(ordres, -quantites)
+    ordres[np.abs(ordres * prix_surs) < montant_min] = 0.0
+
+    # Achats limités au cash disponible après ventes
+    achats = ordres > 0
+    disponible = cash - (ordres[~achats] * prix_surs[~achats]).sum()
+    cout_achats = (ordres[achats] * prix_surs[achats]).sum()
+    if cout_achats > disponible:
+        facteur = max(disponible, 0.0) / cout_achats
+        ordres[achats] = np.floor(ordres[achats] * facteur)
+        ordres[achats & (ordres * prix_surs < montant_min)] = 0.0
+
+    # Passe gloutonne : un titre de plus aux lignes les plus sous-pondérées
+    reste = disponible - (ordres[ordres > 0] * prix_surs[ordres > 0]).sum()
+    deficits = np.where(cotees & (cibles > 0), ecarts - ordres * prix_surs, 0.0)
+    for i in np.argsort(-deficits / np.where(cibles > 0, cibles, 1.0)):
+        if deficits[i] <= 0:
+            break
+        if prix_surs[i] <= reste and (ordres[i] + 1) * prix_surs[i] >= montant_min:
+            ordres[i] += 1
+            reste -= prix_surs[i]
+    return ordres
+
+
+def _prix_reel(cours: float, categorie, type_instrument) -> float:
+    return cours / 100 if is_obligation(categorie, type_instrument) else cours
+
+
+def _lignes(positions: List[Dict], items: List[Dict], devise: str, jour: int, engine) -> Tuple[List[Dict], set]:
+    """Lignes du rééquilibrage (union positions / cible) avec valeur et prix unitaire en devise"""
+    valorisees = valorisation.valoriser_positions(positions, price_store.jour_vers_date(jour), engine)['positions']
+    manquants = set()
+
+    def convertir(montant, devise_montant):
+        taux = fx.taux_change(devise_montant, devise, jour, engine)
+        if taux is None:
+            manquants.add(f"{(devise_montant or 'EUR').upper()}/{devise}")
+            return np.nan
+        return montant * taux
+
+    lignes = {}
+    for position in valorisees:
+        if position['valeur_marche'] is not None:
+            devise_cours = position['devise_cours'] or position['devise']
+            prix = convertir(_prix_reel(position['cours'], position['categorie'], position['type_instrument']),
+                             devise_cours)
+        else:
+            # Sans cours : valorisée à son prix de revient
+            prix = convertir(_prix_reel(position['prix_moyen'], position['categorie'], position['type_instrument']),
+                             position['devise'])
+        lignes[position['isin']] = {
+            'isin': position['isin'],
+            'titre': position['titre'],
+            'categorie': position['categorie'],
+            'quantite': position['quantite'],
+            'prix': prix,
+            'poids_cible': 0.0,
+        }
+
+    a_coter = []
+    for item in items:
+        sig = item['signaletique']
+        isin = sig.get('isin') or sig.get('code')
+        ligne = lignes.get(isin)
+        if ligne is None:
+            ds = sig.get('donnees_supplementaires') or {}
+            ligne = lignes[isin] = {
+                'isin': isin,
+                'titre': sig.get('titre'),
+                'categorie': sig.get('categorie_text') or 'Non classé',
+                'quantite': 0.0,
+                'prix': np.nan,
+                'poids_cible': 0.0,
+                '_sig': sig,
+                '_type_instrument': ds.get("Type d'instr") or '',
+            }
+            a_coter.append(ligne)
+        ligne['poids_cible'] += item['ratio'] / 100
+
+    # Titres de la cible non détenus : dernier cours consolidé, à défaut prix de la signalétique
+    cours = price_store.get_cours_a_date([ligne['isin'] for ligne in a_coter], jour, engine)
+    for ligne in a_coter:
+        sig = ligne.pop('_sig')
+        type_instrument = ligne.pop('_type_instrument')
+        if ligne['isin'] in cours:
+            c = cours[ligne['isin']]
+            ligne['prix'] = convertir(_prix_reel(c['cours'], ligne['categorie'], type_instrument), c['devise'])
+        elif sig.get('prix') not in (None, ''):
+            ligne['prix'] = convertir(_prix_reel(_nombre(sig['prix']), ligne['categorie'], type_instrument),
+                                      sig.get('devise_prix') or 'EUR')
+    return list(lignes.values()), manquants
+
+
+def _calculer(portfolio: Dict, cible: Dict, positions: List[Dict], cash_entrees: List[Dict],
+              jour: int, montant_min: float, engine) -> Dict:
+    devise = (portfolio.get('devise') or 'EUR').upper()
+    lignes, manquants = _lignes(positions, cible['items'], devise, jour, engine)
+    conversion_cash = fx.convertir_cash(cash_entrees, devise, price_store.jour_vers_date(jour), engine)
+    manquants.update(conversion_cash['taux_manquants'])
+    cash = conversion_cash['total'] or 0.0
+
+    quantites = np.array([l['quantite'] for l in lignes], dtype=float)
+    prix = np.array([l['prix'] for l in lignes], dtype=float)
+    cibles = np.array([l['poids_cible'] for l in lignes], dtype=float)
+    valeurs = np.nan_to_num(quantites * prix)
+    ordres = allouer(valeurs, prix, quantites, cibles, cash, montant_min)
+    montants = ordres * np.nan_to_num(prix)
+
+    total = valeurs.sum() + cash
+    poids = valeurs / total if total else np.zeros(len(lignes))
+    poids_apres = (valeurs + montants) / total if total else np.zeros(len(lignes))
+
+    # Écarts par catégorie
+    noms_categories = sorted({l['categorie'] for l in lignes})
+    indices = np.array([noms_categories.index(l['categorie']) for l in lignes], dtype=int)
+    par_categorie = {
+        nom: np.bincount(indices, weights=tableau, minlength=len(noms_categories))
+        for nom, tableau in (('poids', poids), ('poids_cible', cibles), ('poids_apres', poids_apres))
+    } if lignes else {}
+
+    resultats = []
+    for i, ligne in enumerate(lignes):
+        resultats.append({
+            **ligne,
+            'prix': price_store.arrondi(prix[i]),
+            'valeur': price_store.arrondi(valeurs[i], 2),
+            'poids': price_store.arrondi(poids[i]),
+            'poids_cible': price_store.arrondi(cibles[i]),
+            'ecart': price_store.arrondi(poids[i] - cibles[i]),
+            'quantite_ordre': price_store.arrondi(ordres[i]),
+            'montant_ordre': price_store.arrondi(montants[i], 2),
+            'poids_apres': price_store.arrondi(poids_apres[i]),
+        })
+    ordres_liste = [
+        {'isin': r['isin'], 'titre': r['titre'], 'sens': 'ACHAT' if r['quantite_ordre'] > 0 else 'VENTE',
+         'quantite': abs(r['quantite_ordre']), 'montant': abs(r['montant_ordre'])}
+        for r in resultats if r['quantite_ordre']
+    ]
+    return {
+        'portfolio_id': portfolio['id'],
+        'target_id': cible['id'],
+        'devise': devise,
+        'date_valorisation': price_store.jour_vers_date(jour).isoformat(),
+        'valeur_titres': price_store.arrondi(valeurs.sum(), 2),
+        'cash': price_store.arrondi(cash, 2),
+        'valeur_totale': price_store.arrondi(total, 2),
+        'cash_apres': price_store.arrondi(cash - montants.sum(), 2),
+        'lignes': resultats,
+        'categories': [
+            {
+                'categorie': nom,
+                'poids': price_store.arrondi(par_categorie['poids'][k]),
+                'poids_cible': price_store.arrondi(par_categorie['poids_cible'][k]),
+                'ecart': price_store.arrondi(par_categorie['poids'][k] - par_categorie['poids_cible'][k]),
+                'poids_apres': price_store.arrondi(par_categorie['poids_apres'][k]),
+            }
+            for k, nom in enumerate(noms_categories)
+        ],
+        'ordres': ordres_liste,
+        'sans_prix': [r['isin'] for r in resultats if r['prix'] is None],
+        'taux_manquants': sorted(manquants),
+    }
+
+
+def _cible_resolue(cible: Dict, engine) -> Dict:
+    """Portefeuille cible dont chaque ligne porte sa signalétique et son ratio numérique"""
+    items = []
+    for item in cible.get('items', []):
+        sig = engine.get_signaletique_by_id(int(item['signaletique']))
+        if sig is None:
+            raise ValueError(f"Signalétique {item['signaletique']} introuvable (portefeuille cible {cible['id']})")
+        items.append({'signaletique': sig, 'ratio': _nombre(item.get('ratio'))})
+    return {'id': cible['id'], 'name': cible.get('name'), 'items': items}
+
+
+def reequilibrer_lot(paires: List[Tuple[int, int]], date_valorisation=None,
+                     montant_min: Optional[float] = None, engine=None) -> List[Dict]:
+    """Rééquilibrage de chaque couple (portefeuille réel, portefeuille cible).
+
+    Lève ValueError si un portefeuille ou une cible est introuvable ou si la date
+    est invalide.
+    """
+    engine = resolve_engine(engine)
+    jour = price_store.date_vers_jour(date_valorisation or date.today())
+    if jour is None:
+        raise ValueError(f"Date de valorisation invalide : {date_valorisation!r}")
+    montant_min = REEQUILIBRAGE_MONTANT_MIN if montant_min is None else montant_min
+
+    portfolios = {p['id']: p for p in engine.get_all_portfolios()}
+    cibles = {c['id']: c for c in engine.get_all_target_portfolios()}
+    for pid, cid in paires:
+        if pid not in portfolios:
+            raise ValueError(f"Portefeuille {pid} introuvable")
+        if cid not in cibles:
+            raise ValueError(f"Portefeuille cible {cid} introuvable")
+
+    ids = list(dict.fromkeys(pid for pid, _ in paires))
+    analyses = fifo.analyse_fifo_portefeuilles(ids, engine)
+    resolues = {cid: _cible_resolue(cibles[cid], engine) for cid in dict.fromkeys(cid for _, cid in paires)}
+    cash = {pid: engine.get_cash_by_portfolio(pid) for pid in ids}
+    return [
+        _calculer(portfolios[pid], resolues[cid], analyses[pid]['positions_actuelles'], cash[pid],
+                  jour, montant_min, engine)
+        for pid, cid in paires
+    ]
+
+
+def reequilibrer(portfolio_id: int, target_id: int, date_valorisation=None,
+                 montant_min: Optional[float] = None, engine=None) -> Dict:
+    """Écarts et ordres pour rapprocher le portefeuille portfolio_id de la cible target_id"""
+    return reequilibrer_lot([(portfolio_id, target_id)], date_valorisation, montant_min, engine)[0]
@@ -0,0 +1,206 @@
+# Rendements d'un portefeuille réel, à partir des matrices de NAV (nav.calculer_nav) :
+#   - TWR (rendement pondéré par le temps) : rendement quotidien
+#       r_t = (V_t − F⁻_t) / (V_{t-1} + F⁺_t) − 1
+#     (achats F⁺ en début de journée, ventes F⁻ en fin de journée : une sortie
+#     complète garde le rendement du jour au lieu d'annuler la valeur)
+#     chaîné par produit cumulé ; le TWR d'une fenêtre est le rapport des facteurs
+#     de croissance à ses bornes ;
+#   - XIRR (rendement pondéré par les capitaux) : taux annuel qui annule la valeur
+#     actuelle des flux (valeur initiale, flux, valeur finale), résolu par Newton
+#     sécurisé par dichotomie, vectorisé sur tous les groupes à la fois ; 'mwr' en
+#     donne l'équivalent sur la période (à lire plutôt que le taux annuel sur moins d'un an).
+# Flux externes : montants des transactions (achats +, ventes −) pour les titres ;
+# au niveau du portefeuille s'y ajoutent les variations des soldes de cash (le cash
+# n'a pas de rendement propre). Groupes : portefeuille, catégorie (categorie_text), ISIN.
+# Fenêtres : YTD, 1 an, 3 ans, depuis l'origine, arrêtées à la date de fin.
+# Les résultats sont mémorisés par (portefeuille, date de fin) et invalidés par les
+# mêmes versions que la NAV.
+
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from . import nav, price_store
+from .storage import resolve_engine
+
+RENDEMENTS_CACHE_TAILLE = 32
+XIRR_ITERATIONS = 100
+XIRR_TOLERANCE = 1e-10
+# Bornes de recherche sur x = ln(1 + taux) : taux entre −99,995 % et ×22 026 par an
+XIRR_BORNE = 10.0
+
+_cache: 'OrderedDict[tuple, tuple]' = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _jour_moins_annees(jour: int, annees: int) -> int:
+    d = date.fromordinal(jour)
+    try:
+        return d.replace(year=d.year - annees).toordinal()
+    except ValueError:  # 29 février
+        return d.replace(year=d.year - annees, day=28).toordinal()
+
+
+def fenetres(jour_debut: int, jour_fin: int) -> Dict[str, Optional[int]]:
+    """Jour de base de chaque fenêtre (valeur de départ = fin de ce jour) ; None si la
+    série ne couvre pas la fenêtre. 'origine' part avant le premier jour (valeur nulle)."""
+    bases = {
+        'ytd': date(date.fromordinal(jour_fin).year - 1, 12, 31).toordinal(),
+        '1a': _jour_moins_annees(jour_fin, 1),
+        '3a': _jour_moins_annees(jour_fin, 3),
+    }
+    resultat = {nom: (base if base >= jour_debut else None) for nom, base in bases.items()}
+    resultat['origine'] = jour_debut - 1
+    return resultat
+
+
+def facteurs_twr(valeurs: np.ndarray, flux: np.ndarray) -> np.ndarray:
+    """Facteurs de croissance cumulés (un par jour, par colonne) à partir des valeurs
+    et flux quotidiens (tableaux jours × groupes)"""
+    precedentes = np.vstack([np.zeros((1,) + valeurs.shape[1:]), valeurs[:-1]])
+    capital = precedentes + np.maximum(flux, 0.0)
+    finales = valeurs - np.minimum(flux, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Sans capital investi (avant le premier achat, après une sortie) : pas de rendement
+        croissance = np.where(capital > 0, finales / capital, 1.0)
+    return np.cumprod(croissance, axis=0)
+
+
+def xirr(flux: np.ndarray, annees: np.ndarray) -> np.ndarray:
+    """Taux annuels annulant la valeur actuelle de chaque ligne de flux (groupes × dates,
+    du point de vue de l'investisseur : versements −, retraits et valeur finale +).
+
+    annees : délai de chaque date depuis la première, en années. NaN si la ligne n'a
+    pas de flux de signes opposés ou si aucune racine n'est encadrée.
+    """
+    flux = np.atleast_2d(np.asarray(flux, dtype=float))
+    annees = np.asarray(annees, dtype=float)
+    nombre = flux.shape[0]
+
+    def _vna(x):
+        actualisation = np.exp(-np.outer(x, annees))
+        return (flux * actualisation).sum(axis=1), -(flux * annees * actualisation).sum(axis=1)
+
+    bas = np.full(nombre, -XIRR_BORNE)
+    haut = np.full(nombre, XIRR_BORNE)
+    vna_bas, _ = _vna(bas)
+    vna_haut, _ = _vna(haut)
+    valides = (np.sign(vna_bas) * np.sign(vna_haut) < 0) & (flux > 0).any(axis=1) & (flux < 0).any(axis=1)
+    echelle = np.maximum(np.abs(flux).sum(axis=1), 1e-12)
+
+    x = np.zeros(nombre)
+    for _ in range(XIRR_ITERATIONS):
+        vna, derivee = _vna(x)
+        if np.all(~valides | (np.abs(vna) <= XIRR_TOLERANCE * echelle)):
+            break
+        # Resserre l'encadrement autour de la racine
+        meme_signe = np.sign(vna) == np.sign(vna_bas)
+        bas = np.where(meme_signe, x, bas)
+        vna_bas = np.where(meme_signe, vna, vna_bas)
+        haut = np.where(meme_signe, haut, x)
+        # Pas de Newton s'il reste dans l'encadrement, sinon dichotomie
+        with np.errstate(divide='ignore', invalid='ignore'):
+            newton = x - vna / derivee
+        dans_encadrement = np.isfinite(newton) & (newton > bas) & (newton < haut)
+        x = np.where(dans_encadrement, newton, (bas + haut) / 2)
+    return np.where(valides, np.expm1(x), np.nan)
+
+
+def _groupes(donnees: Dict) -> Dict[str, Dict[str, List[int]]]:
+    """Colonnes (ISIN) de chaque catégorie et de chaque titre"""
+    categories: Dict[str, List[int]] = {}
+    for j, isin in enumerate(donnees['isins']):
+        categories.setdefault(donnees['infos'][isin]['categorie'], []).append(j)
+    return {
+        'categories': categories,
+        'titres': {isin: [j] for j, isin in enumerate(donnees['isins'])},
+    }
+
+
+def _calculer(donnees: Dict) -> Dict:
+    jours = donnees['jours']
+    jour_debut, jour_fin = int(jours[0]), int(jours[-1])
+    zeros = np.zeros(len(jours))
+    cash = sum(donnees['cash'].values(), zeros)
+    flux_cash = np.diff(cash, prepend=0.0)
+
+    # Colonnes : portefeuille, puis catégories, puis titres
+    groupes = _groupes(donnees)
+    noms = [('portefeuille', None)]
+    valeurs = [donnees['valeurs'].sum(axis=1) + cash]
+    flux = [donnees['flux'].sum(axis=1) + flux_cash]
+    for niveau in ('categories', 'titres'):
+        for nom, colonnes in groupes[niveau].items():
+            noms.append((niveau, nom))
+            valeurs.append(donnees['valeurs'][:, colonnes].sum(axis=1))
+            flux.append(donnees['flux'][:, colonnes].sum(axis=1))
+    valeurs = np.column_stack(valeurs)
+    flux = np.column_stack(flux)
+    facteurs = facteurs_twr(valeurs, flux)
+
+    resultats = {'portefeuille': {}, 'categories': {}, 'titres': {}}
+    bornes = fenetres(jour_debut, jour_fin)
+    for fenetre, base in bornes.items():
+        if base is None:
+            for niveau, nom in noms:
+                cible = resultats[niveau] if nom is None else resultats[niveau].setdefault(nom, {})
+                cible[fenetre] = None
+            continue
+        i = base - jour_debut  # -1 pour l'origine
+        facteur_base = facteurs[i] if i >= 0 else np.ones(len(noms))
+        valeur_base = valeurs[i] if i >= 0 else np.zeros(len(noms))
+        twr = facteurs[-1] / facteur_base - 1
+        duree = (jour_fin - base) / 365.25
+
+        # XIRR : valeur de base versée au départ, flux de la fenêtre, valeur finale retirée
+        flux_fenetre = -flux[i + 1:].T.copy()
+        flux_fenetre[:, -1] += valeurs[-1]
+        flux_xirr = np.column_stack([-valeur_base, flux_fenetre])
+        annees = np.concatenate([[0.0], np.arange(1, len(jours) - i) / 365.25])
+        taux = xirr(flux_xirr, annees)
+
+        for k, (niveau, nom) in enumerate(noms):
+            cible = resultats[niveau] if nom is None else resultats[niveau].setdefault(nom, {})
+            actif = valeur_base[k] != 0 or np.any(flux[i + 1:, k] != 0)
+            cible[fenetre] = {
+                'debut': price_store.jour_vers_date(base + 1).isoformat(),
+                'twr': price_store.arrondi(twr[k]) if actif else None,
+                'twr_annualise': (price_store.arrondi((1 + twr[k]) ** (1 / duree) - 1)
+                                  if actif and duree > 1 and twr[k] > -1 else None),
+                'xirr': price_store.arrondi(taux[k]),
+                # Rendement pondéré par les capitaux sur la période (non annualisé)
+                'mwr': price_store.arrondi((1 + taux[k]) ** duree - 1),
+            }
+    return {
+        'date_fin': price_store.jour_vers_date(jour_fin).isoformat(),
+        **resultats,
+    }
+
+
+def calculer_rendements(portfolio_id: int, fin=None, engine=None) -> Optional[Dict]:
+    """TWR et XIRR du portefeuille, de chaque catégorie et de chaque titre sur les fenêtres
+    standard (ytd, 1a, 3a, origine) arrêtées à fin (aujourd'hui par défaut).
+    None si le portefeuille n'a ni transaction ni cash."""
+    engine = resolve_engine(engine)
+    versions = tuple(engine.get_data_version(nom) for nom in nav.DONNEES_SOURCES)
+    jour_fin = price_store.date_vers_jour(fin) if fin else date.today().toordinal()
+    if jour_fin is None:
+        raise ValueError(f"Date invalide : {fin!r}")
+    cle = (engine.__name__, portfolio_id, jour_fin)
+    with _cache_lock:
+        cached = _cache.get(cle)
+        if cached is not None and cached[0] == versions:
+            _cache.move_to_end(cle)
+            return cached[1]
+
+    donnees = nav.calculer_nav(portfolio_id, None, jour_fin, engine)
+    resultat = _calculer(donnees) if donnees is not None else None
+    with _cache_lock:
+        _cache[cle] = (versions, resultat)
+        _cache.move_to_end(cle)
+        while len(_cache) > RENDEMENTS_CACHE_TAILLE:
+            _cache.popitem(last=False)
+    return resultat
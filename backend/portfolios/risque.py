@@ -0,0 +1,287 @@
+# Analyse de risque à partir de l'historique consolidé des prix (price_store) :
+#   rendements  jours × ISIN : rendement de chaque titre entre deux cours consécutifs
+#               de sa propre série, posé sur la date du second (NaN les autres jours,
+#               ou si plus de RISQUE_ECART_MAX jours séparent les deux cours) ; grille
+#               = union des dates de cotation de l'univers, limitée aux RISQUE_FENETRE
+#               dernières dates ;
+#   covariance  par paires complètes (jours où les deux titres ont un rendement),
+#               obtenue en une fois par produits matriciels de statistiques suffisantes :
+#                 n = Mᵀ M, s = Xᵀ M, q = (X²)ᵀ M, p = Xᵀ X
+#               (X rendements, 0 si manquant ; M indicatrice de présence) ;
+#   volatilités annualisées (√RISQUE_JOURS_AN), corrélations, volatilité d'un
+#   portefeuille (√wᵀΣw), VaR / ES historiques et drawdown maximal de la série de
+#   rendements du portefeuille.
+# Les rendements sont ceux de la devise de cotation de chaque titre (pas de conversion,
+# comme la NAV).
+# Les statistiques sont mises en cache par (univers, fenêtre, date de fin) et
+# invalidées par la version de l'historique consolidé. Quand de nouveaux jours de
+# cours arrivent sans modifier les jours déjà couverts, le cache est mis à jour par
+# différence : contribution des jours sortis de la fenêtre retirée, celle des nouveaux
+# jours ajoutée, sans recalculer les produits sur toute la fenêtre.
+
+import os
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from . import fx, price_store, valorisation
+from .storage import resolve_engine
+
+# Nombre de dates de rendement par défaut (environ un an de bourse)
+RISQUE_FENETRE = int(os.environ.get('RISQUE_FENETRE', '252'))
+RISQUE_JOURS_AN = 252
+# Écart maximal (jours calendaires) entre deux cours pour un rendement quotidien
+RISQUE_ECART_MAX = 7
+# Observations communes minimales pour une variance ou une covariance
+RISQUE_OBSERVATIONS_MIN = 20
+RISQUE_NIVEAUX = (0.95, 0.99)
+RISQUE_CACHE_TAILLE = 32
+# Mises à jour par différence avant un recalcul complet (dérive numérique)
+RISQUE_MISES_A_JOUR_MAX = 250
+
+# (moteur, univers, fenêtre, jour de fin) → statistiques
+_cache: 'OrderedDict[tuple, Dict]' = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def matrice_rendements(isins: List[str], fenetre: int, jour_fin: Optional[int], engine=None) -> Dict:
+    """Rendements quotidiens alignés (jours × isins, NaN si manquant) des fenetre dernières
+    dates de l'univers jusqu'à jour_fin inclus (dernière date connue si None)"""
+    colonnes = price_store.get_prix_colonnes(engine)
+    jours_titres, rendements_titres, colonnes_titres = [], [], []
+    for j, isin in enumerate(isins):
+        bornes = colonnes['index'].get(isin)
+        if bornes is None:
+            continue
+        jours = np.asarray(colonnes['jours'][bornes[0]:bornes[1]], dtype=np.int64)
+        cours = np.asarray(colonnes['cours'][bornes[0]:bornes[1]])
+        # Plusieurs cours le même jour : le dernier de l'historique
+        dernier = np.append(jours[1:] != jours[:-1], True)
+        jours, cours = jours[dernier], cours[dernier]
+        if jour_fin is not None:
+            jusqu_a = int(np.searchsorted(jours, jour_fin, side='right'))
+            jours, cours = jours[:jusqu_a], cours[:jusqu_a]
+        valides = (jours[1:] - jours[:-1] <= RISQUE_ECART_MAX) & (cours[:-1] > 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rendements = cours[1:] / cours[:-1] - 1
+        jours_titres.append(jours[1:][valides])
+        rendements_titres.append(rendements[valides])
+        colonnes_titres.append(np.full(int(valides.sum()), j))
+
+    tous_jours = np.concatenate(jours_titres) if jours_titres else np.zeros(0, dtype=np.int64)
+    grille, lignes = np.unique(tous_jours, return_inverse=True)
+    debut = max(len(grille) - fenetre, 0)
+    matrice = np.full((len(grille) - debut, len(isins)), np.nan)
+    if len(tous_jours):
+        dans_fenetre = lignes >= debut
+        matrice[lignes[dans_fenetre] - debut, np.concatenate(colonnes_titres)[dans_fenetre]] = \
+            np.concatenate(rendements_titres)[dans_fenetre]
+    return {'jours': grille[debut:], 'isins': list(isins), 'rendements': matrice}
+
+
+def _contribution(rendements: np.ndarray) -> Dict[str, np.ndarray]:
+    """Statistiques suffisantes (additives) des lignes de rendements"""
+    presence = (~np.isnan(rendements)).astype(np.float64)
+    x = np.nan_to_num(rendements)
+    return {'n': presence.T @ presence, 's': x.T @ presence, 'q': (x * x).T @ presence, 'p': x.T @ x}
+
+
+def _covariance(stats: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Covariances et corrélations par paires complètes (NaN sous RISQUE_OBSERVATIONS_MIN)"""
+    n = stats['n']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        moyenne_i = stats['s'] / n  # [i, j] : moyenne de i sur les jours communs avec j
+        covariance = (stats['p'] - n * moyenne_i * moyenne_i.T) / (n - 1)
+        variance_i = np.maximum((stats['q'] - n * moyenne_i ** 2) / (n - 1), 0.0)
+        correlation = np.clip(covariance / np.sqrt(variance_i * variance_i.T), -1.0, 1.0)
+    insuffisant = n < RISQUE_OBSERVATIONS_MIN
+    covariance[insuffisant] = np.nan
+    correlation[insuffisant] = np.nan
+    return {'covariance': covariance, 'correlation': correlation}
+
+
+def _mise_a_jour(ancien: Dict, nouveau: Dict) -> Optional[Dict[str, np.ndarray]]:
+    """Statistiques du nouveau jeu de rendements déduites de l'ancien par différence,
+    None si des jours déjà couverts ont changé (recalcul complet)"""
+    anciens_jours, jours = ancien['jours'], nouveau['jours']
+    if not len(anciens_jours) or not len(jours) or ancien['mises_a_jour'] >= RISQUE_MISES_A_JOUR_MAX:
+        return None
+    sortis = int(np.searchsorted(anciens_jours, jours[0]))
+    communs = len(anciens_jours) - sortis
+    if communs <= 0 or communs > len(jours) \
+            or not np.array_equal(anciens_jours[sortis:], jours[:communs]) \
+            or not np.array_equal(ancien['rendements'][sortis:], nouveau['rendements'][:communs], equal_nan=True):
+        return None
+    retraits = _contribution(ancien['rendements'][:sortis])
+    ajouts = _contribution(nouveau['rendements'][communs:])
+    return {cle: ancien['stats'][cle] - retraits[cle] + ajouts[cle] for cle in ancien['stats']}
+
+
+def get_statistiques(isins: Iterable[str], fenetre: Optional[int] = None, fin=None, engine=None) -> Dict:
+    """Rendements, covariance et corrélations de l'univers isins (ordre trié).
+
+    fin : date de fin (date, chaîne ISO ; dernière date connue si None).
+    Clés : isins, jours, rendements, stats, covariance, correlation, version.
+    """
+    engine = resolve_engine(engine)
+    isins = tuple(sorted(set(isins)))
+    fenetre = fenetre or RISQUE_FENETRE
+    if fenetre < 2:
+        raise ValueError('La fenêtre doit compter au moins 2 jours')
+    jour_fin = None
+    if fin:
+        jour_fin = price_store.date_vers_jour(fin)
+        if jour_fin is None:
+            raise ValueError(f"Date invalide : {fin!r}")
+    version = engine.get_prix_titres_version()
+    cle = (engine.__name__, isins, fenetre, jour_fin)
+    with _cache_lock:
+        ancien = _cache.get(cle)
+        if ancien is not None:
+            _cache.move_to_end(cle)
+    if ancien is not None and ancien['version'] == version:
+        return ancien
+
+    donnees = matrice_rendements(list(isins), fenetre, jour_fin, engine)
+    stats = _mise_a_jour(ancien, donnees) if ancien is not None else None
+    mises_a_jour = ancien['mises_a_jour'] + 1 if stats is not None else 0
+    if stats is None:
+        stats = _contribution(donnees['rendements'])
+    resultat = {**donnees, 'stats': stats, **_covariance(stats), 'version': version, 'mises_a_jour': mises_a_jour}
+    with _cache_lock:
+        _cache[cle] = resultat
+        _cache.move_to_end(cle)
+        while len(_cache) > RISQUE_CACHE_TAILLE:
+            _cache.popitem(last=False)
+    return resultat
+
+
+def _drawdown(rendements: np.ndarray, jours: np.ndarray) -> Dict:
+    """Drawdown maximal d'une série de rendements (jours sans rendement ignorés)"""
+    valeurs = np.cumprod(1 + np.nan_to_num(rendements))
+    sommets = np.maximum.accumulate(np.concatenate([[1.0], valeurs]))[1:]
+    baisses = valeurs / sommets - 1
+    if not len(baisses) or baisses.min() >= 0:
+        return {'valeur': 0.0, 'sommet': None, 'creux': None}
+    creux = int(np.argmin(baisses))
+    avant = np.concatenate([[1.0], valeurs[:creux + 1]])
+    sommet = int(np.argmax(avant))  # 0 : valeur de départ, avant le premier jour
+    return {
+        'valeur': price_store.arrondi(baisses[creux]),
+        'sommet': price_store.jour_vers_date(jours[sommet - 1]).isoformat() if sommet else None,
+        'creux': price_store.jour_vers_date(jours[creux]).isoformat(),
+    }
+
+
+def _var_es(rendements: np.ndarray) -> Dict[str, Dict[str, Optional[float]]]:
+    """VaR et ES historiques à un jour (pertes positives, en fraction de la valeur)"""
+    var, es = {}, {}
+    for niveau in RISQUE_NIVEAUX:
+        nom = f'{niveau * 100:g}'
+        if len(rendements) < RISQUE_OBSERVATIONS_MIN:
+            var[nom] = es[nom] = None
+            continue
+        seuil = np.quantile(rendements, 1 - niveau)
+        var[nom] = price_store.arrondi(-seuil)
+        es[nom] = price_store.arrondi(-rendements[rendements <= seuil].mean())
+    return {'var': var, 'es': es}
+
+
+def analyser(poids: Dict[str, float], fenetre: Optional[int] = None, fin=None, engine=None) -> Dict:
+    """Risque d'un portefeuille décrit par ses poids par ISIN (valeurs ou %, normalisés).
+
+    Les titres sans historique suffisant sont exclus (sans_historique) et les poids
+    restants renormalisés ; poids_couvert donne la part du portefeuille analysée.
+    Rendement quotidien du portefeuille : moyenne pondérée des titres cotés ce jour-là.
+    """
+    poids = {isin: float(p) for isin, p in poids.items() if isin and p}
+    stats = get_statistiques(poids, fenetre, fin, engine)
+    isins, jours, rendements = stats['isins'], stats['jours'], stats['rendements']
+    variances = np.diag(stats['covariance'])
+    couverts = np.isfinite(variances)
+    brut = np.array([poids[isin] for isin in isins])
+    total = brut.sum()
+    w = np.where(couverts, brut, 0.0)
+    w = w / w.sum() if w.sum() else w
+
+    covariance = np.nan_to_num(stats['covariance'])
+    variance = float(w @ covariance @ w)
+    volatilite = np.sqrt(max(variance, 0.0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        contributions = w * (covariance @ w) / variance if variance > 0 else np.full(len(w), np.nan)
+
+    presence = ~np.isnan(rendements[:, couverts])
+    poids_jour = presence @ w[couverts]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        serie = np.nan_to_num(rendements[:, couverts]) @ w[couverts] / poids_jour
+    cotes = poids_jour > 0
+    serie, jours_serie = serie[cotes], jours[cotes]
+
+    volatilites = np.sqrt(variances * RISQUE_JOURS_AN)
+    titres = [{
+        'isin': isin,
+        'poids': price_store.arrondi(w[j]) if couverts[j] else None,
+        'observations': int(stats['stats']['n'][j, j]),
+        'volatilite': price_store.arrondi(volatilites[j]),
+        'contribution': price_store.arrondi(contributions[j]) if couverts[j] else None,
+        'drawdown_max': _drawdown(rendements[:, j], jours)['valeur'],
+    } for j, isin in enumerate(isins)]
+
+    return {
+        'fenetre': len(jours),
+        'date_debut': price_store.jour_vers_date(jours[0]).isoformat() if len(jours) else None,
+        'date_fin': price_store.jour_vers_date(jours[-1]).isoformat() if len(jours) else None,
+        'poids_couvert': price_store.arrondi(brut[couverts].sum() / total) if total else None,
+        'sans_historique': [isin for j, isin in enumerate(isins) if not couverts[j]],
+        'volatilite': price_store.arrondi(volatilite * np.sqrt(RISQUE_JOURS_AN)) if couverts.any() else None,
+        'volatilite_quotidienne': price_store.arrondi(volatilite) if couverts.any() else None,
+        'observations': int(len(serie)),
+        **_var_es(serie),
+        'drawdown_max': _drawdown(serie, jours_serie),
+        'titres': titres,
+        'correlations': {
+            'isins': isins,
+            'matrice': [[price_store.arrondi(c) for c in ligne] for ligne in stats['correlation']],
+        },
+    }
+
+
+def analyser_portefeuille_cible(portefeuille: Dict, fenetre: Optional[int] = None, fin=None, engine=None) -> Dict:
+    """Risque d'un portefeuille cible (poids = ratio de chaque ligne)"""
+    engine = resolve_engine(engine)
+    signaletiques = {sig['id']: sig for sig in engine.get_all_signaletiques()}
+    poids, sans_isin = {}, []
+    for item in portefeuille.get('items', []):
+        sig = signaletiques.get(int(item['signaletique'])) or {}
+        isin = sig.get('isin')
+        try:
+            ratio = float(str(item.get('ratio')).replace(',', '.'))
+        except ValueError:
+            ratio = 0.0
+        if isin:
+            poids[isin] = poids.get(isin, 0.0) + ratio
+        else:
+            sans_isin.append(item['signaletique'])
+    return {**analyser(poids, fenetre, fin, engine), 'signaletiques_sans_isin': sans_isin}
+
+
+def analyser_positions(positions: List[Dict], devise: str, fenetre: Optional[int] = None, fin=None,
+                       engine=None) -> Dict:
+    """Risque des positions ouvertes d'une analyse FIFO, pondérées par leur valeur de
+    marché à la date de fin convertie en devise (fx)"""
+    engine = resolve_engine(engine)
+    jour = price_store.date_vers_jour(fin or date.today())
+    if jour is None:
+        raise ValueError(f"Date invalide : {fin!r}")
+    jour = price_store.jour_vers_date(jour)
+    conversion = fx.convertir_valorisation(valorisation.valoriser_positions(positions, jour, engine), devise, engine)
+    poids = {p['isin']: p['valeur_marche'] for p in conversion['positions'] if p['valeur_marche']}
+    return {
+        **analyser(poids, fenetre, fin, engine),
+        'devise': conversion['devise'],
+        'valeur_totale': price_store.arrondi(sum(poids.values())),
+        'taux_manquants': conversion['taux_manquants'],
+    }
@@ -0,0 +1,952 @@
+# Moteur de stockage SQLite des données de portefeuille.
+# Expose les mêmes fonctions publiques que file_storage (portefeuilles, transactions,
+# cash, signalétique, portefeuilles cibles, historiques de prix) sur une base SQLite
+# locale en mode WAL : recherches indexées, mises à jour partielles et lecteurs
+# concurrents, sans service supplémentaire.
+# Sélection : PORTFOLIO_STORAGE_ENGINE=sqlite (voir portfolios/storage.py).
+# Migration depuis les fichiers JSON : manage.py migrate_json_to_sqlite.
+
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, date
+from decimal import Decimal
+from typing import List, Dict, Any, Optional
+
+from . import file_storage
+from .file_storage import (
+    DateTimeEncoder,
+    ensure_data_dir,
+    list_json_snapshots,
+    _a_entrees_manuelles,
+    _append_prix_rows,
+    _append_taux_rows,
+    _build_transaction,
+    _consolider_complet,
+    _consolider_incremental,
+    _delete_titre_entry,
+    _fusionner_touches,
+    _liste_prix,
+    _import_titre_rows,
+    _nouveau_titre,
+    _paire_change,
+    _points_prix,
+    _stats_consolidation,
+    _titre_stats,
+    _titres_from_backup_rows,
+    _upsert_titre_entry,
+    _validate_target_items,
+)
+
+SQLITE_PATH = os.environ.get('PORTFOLIO_SQLITE_PATH', os.path.join(file_storage.DATA_DIR, 'portfolio.sqlite3'))
+SQLITE_BUSY_TIMEOUT = float(os.environ.get('PORTFOLIO_SQLITE_BUSY_TIMEOUT', '30'))
+
+# Chaque table garde le document complet (colonne data, JSON) et des colonnes
+# dérivées indexées pour les recherches.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS portfolios (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS portfolios_name ON portfolios (name);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY,
+    portfolio_id INTEGER,
+    date TEXT,
+    type_operation TEXT,
+    quantite TEXT,
+    prix_unitaire TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transactions_portfolio ON transactions (portfolio_id);
+CREATE INDEX IF NOT EXISTS transactions_doublon
+    ON transactions (portfolio_id, date, type_operation, quantite, prix_unitaire);
+
+CREATE TABLE IF NOT EXISTS cash (
+    id INTEGER PRIMARY KEY,
+    portfolio_id INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cash_portfolio ON cash (portfolio_id);
+
+CREATE TABLE IF NOT EXISTS signaletique (
+    id INTEGER PRIMARY KEY,
+    isin_key TEXT,
+    code_key TEXT,
+    titre TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS signaletique_isin ON signaletique (isin_key);
+CREATE INDEX IF NOT EXISTS signaletique_code ON signaletique (code_key);
+
+CREATE TABLE IF NOT EXISTS target_portfolios (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS target_portfolios_name ON target_portfolios (name);
+
+CREATE TABLE IF NOT EXISTS prix_sources (
+    source TEXT NOT NULL,
+    identifiant TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (source, identifiant)
+);
+
+CREATE TABLE IF NOT EXISTS prix_titres (
+    isin TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS taux_change (
+    paire TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS versions (
+    nom TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS etats (
+    nom TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+"""
+
+CORE_TABLES = ['portfolios', 'transactions', 'cash', 'signaletique', 'target_portfolios']
+PRIX_TABLES = ['prix_sources', 'prix_titres', 'taux_change']
+
+# Compteur de version par table (get_data_version), incrémenté par trigger à
+# chaque écriture : les caches dérivés (colonnes de prix, FIFO, …) s'y comparent.
+SCHEMA += ''.join(
+    f"CREATE TRIGGER IF NOT EXISTS {table}_version_{op.lower()} AFTER {op} ON {table} BEGIN "
+    f"INSERT INTO versions (nom, version) VALUES ('{table}', 1) "
+    f"ON CONFLICT (nom) DO UPDATE SET version = version + 1; END;\n"
+    for table in CORE_TABLES + PRIX_TABLES
+    for op in ('INSERT', 'UPDATE', 'DELETE')
+)
+
+_local = threading.local()
+
+
+def set_database_path(path: str):
+    """Change la base utilisée (migration, tests de parité) ; les connexions sont rouvertes"""
+    global SQLITE_PATH
+    SQLITE_PATH = path
+    close_connection()
+
+
+def close_connection():
+    """Ferme la connexion du thread courant"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+    _local.conn = None
+    _local.path = None
+
+
+def _connection() -> sqlite3.Connection:
+    """Connexion du thread courant (créée à la demande, schéma initialisé)"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.path == SQLITE_PATH:
+        return conn
+    if conn is not None:
+        conn.close()
+    directory = os.path.dirname(SQLITE_PATH)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    # isolation_level=None : les transactions sont gérées explicitement (_transaction)
+    conn = sqlite3.connect(SQLITE_PATH, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None,
+                           check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(SCHEMA)
+    _local.conn = conn
+    _local.path = SQLITE_PATH
+    return conn
+
+
+@contextmanager
+def _transaction():
+    """Transaction d'écriture (BEGIN IMMEDIATE) ; les blocs imbriqués rejoignent la transaction englobante"""
+    conn = _connection()
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+@contextmanager
+def batch():
+    """Regroupe les écritures du bloc dans une seule transaction SQLite (tout ou rien)"""
+    with _transaction():
+        yield
+
+
+def _dumps(data: Any) -> str:
+    return json.dumps(data, cls=DateTimeEncoder, ensure_ascii=False)
+
+
+def _fetch_one(sql: str, params: tuple = ()) -> Optional[Dict]:
+    row = _connection().execute(sql, params).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def _fetch_all(sql: str, params: tuple = ()) -> List[Dict]:
+    return [json.loads(row[0]) for row in _connection().execute(sql, params)]
+
+
+def _next_id(conn: sqlite3.Connection, table: str) -> int:
+    return conn.execute(f'SELECT COALESCE(MAX(id), 0) + 1 FROM {table}').fetchone()[0]
+
+
+def _norm(value: Optional[str]) -> Optional[str]:
+    return (value or '').strip().upper() or None
+
+
+# ---------------------------------------------------------------------------
+# Écriture des lignes (colonnes indexées dérivées du document)
+# ---------------------------------------------------------------------------
+
+def _save_portfolio(conn, portfolio: Dict):
+    conn.execute('INSERT OR REPLACE INTO portfolios (id, name, data) VALUES (?, ?, ?)',
+                 (portfolio['id'], portfolio.get('name'), _dumps(portfolio)))
+
+
+def _save_transaction(conn, transaction: Dict):
+    conn.execute(
+        'INSERT OR REPLACE INTO transactions '
+        '(id, portfolio_id, date, type_operation, quantite, prix_unitaire, data) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        (transaction['id'], transaction.get('portfolio_id'), transaction.get('date'),
+         transaction.get('type_operation'), str(transaction.get('quantite')),
+         str(transaction.get('prix_unitaire')), _dumps(transaction)))
+
+
+def _save_cash(conn, cash: Dict):
+    conn.execute('INSERT OR REPLACE INTO cash (id, portfolio_id, data) VALUES (?, ?, ?)',
+                 (cash['id'], cash.get('portfolio_id'), _dumps(cash)))
+
+
+def _save_signaletique(conn, sig: Dict):
+    conn.execute('INSERT OR REPLACE INTO signaletique (id, isin_key, code_key, titre, data) VALUES (?, ?, ?, ?, ?)',
+                 (sig['id'], _norm(sig.get('isin')), _norm(sig.get('code')), sig.get('titre'), _dumps(sig)))
+
+
+def _save_target_portfolio(conn, portfolio: Dict):
+    conn.execute('INSERT OR REPLACE INTO target_portfolios (id, name, data) VALUES (?, ?, ?)',
+                 (portfolio['id'], portfolio.get('name'), _dumps(portfolio)))
+
+
+# ============================================================================
+# PORTFOLIOS
+# ============================================================================
+
+def get_all_portfolios() -> List[Dict]:
+    """Récupère tous les portefeuilles"""
+    return _fetch_all('SELECT data FROM portfolios ORDER BY id')
+
+
+def get_portfolio_by_id(portfolio_id: int) -> Optional[Dict]:
+    """Récupère un portefeuille par son ID"""
+    return _fetch_one('SELECT data FROM portfolios WHERE id = ?', (portfolio_id,))
+
+
+def get_portfolio_by_name(name: str) -> Optional[Dict]:
+    """Récupère un portefeuille par son nom"""
+    return _fetch_one('SELECT data FROM portfolios WHERE name = ? ORDER BY id LIMIT 1', (name,))
+
+
+def create_portfolio(name: str, description: str = None,
+                     type_compte: str = None, courtier: str = None,
+                     devise: str = 'EUR', date_ouverture: str = None,
+                     couleur: str = None) -> Dict:
+    """Crée un nouveau portefeuille réel (voir file_storage.create_portfolio)"""
+    with _transaction() as conn:
+        if get_portfolio_by_name(name):
+            raise ValueError(f"Un portefeuille avec le nom '{name}' existe déjà")
+
+        new_portfolio = {
+            'id': _next_id(conn, 'portfolios'),
+            'name': name,
+            'description': description,
+            'type_compte': type_compte,
+            'courtier': courtier,
+            'devise': devise or 'EUR',
+            'date_ouverture': date_ouverture,
+            'couleur': couleur,
+            'date_creation': datetime.now().isoformat(),
+            'date_modification': datetime.now().isoformat(),
+        }
+        _save_portfolio(conn, new_portfolio)
+    return new_portfolio
+
+
+def update_portfolio(portfolio_id: int, data: Dict) -> Optional[Dict]:
+    """Met à jour un portefeuille"""
+    with _transaction() as conn:
+        portfolio = get_portfolio_by_id(portfolio_id)
+        if portfolio is None:
+            return None
+        # Vérifier unicité du nom si modifié
+        new_name = data.get('name')
+        if new_name and new_name != portfolio.get('name'):
+            if conn.execute('SELECT 1 FROM portfolios WHERE name = ? AND id != ?',
+                            (new_name, portfolio_id)).fetchone():
+                raise ValueError(f"Un portefeuille avec le nom '{new_name}' existe déjà")
+        portfolio.update(data)
+        portfolio['date_modification'] = datetime.now().isoformat()
+        _save_portfolio(conn, portfolio)
+    return portfolio
+
+
+def delete_portfolio(portfolio_id: int) -> bool:
+    """Supprime un portefeuille et toutes ses transactions et cash associés"""
+    with _transaction() as conn:
+        if conn.execute('DELETE FROM portfolios WHERE id = ?', (portfolio_id,)).rowcount == 0:
+            return False  # Portefeuille non trouvé
+        conn.execute('DELETE FROM transactions WHERE portfolio_id = ?', (portfolio_id,))
+        conn.execute('DELETE FROM cash WHERE portfolio_id = ?', (portfolio_id,))
+    return True
+
+
+def get_or_create_portfolio(name: str, defaults: Dict = None) -> tuple[Dict, bool]:
+    """Récupère ou crée un portefeuille (voir file_storage.get_or_create_portfolio)"""
+    with _transaction():
+        portfolio = get_portfolio_by_name(name)
+        if portfolio:
+            return portfolio, False
+
+        d = defaults or {}
+        new_portfolio = create_portfolio(
+            name=name,
+            description=d.get('description'),
+            type_compte=d.get('type_compte'),
+            courtier=d.get('courtier'),
+            devise=d.get('devise', 'EUR'),
+            date_ouverture=d.get('date_ouverture'),
+            couleur=d.get('couleur'),
+        )
+    return new_portfolio, True
+
+
+def replace_all_portfolios(portfolios: List[Dict]):
+    """Remplace la liste complète des portefeuilles (restauration d'un snapshot, IDs conservés)"""
+    with _transaction() as conn:
+        conn.execute('DELETE FROM portfolios')
+        for portfolio in portfolios:
+            _save_portfolio(conn, portfolio)
+
+
+# ============================================================================
+# TRANSACTIONS
+# ============================================================================
+
+def get_all_transactions() -> List[Dict]:
+    """Récupère toutes les transactions"""
+    return _fetch_all('SELECT data FROM transactions ORDER BY id')
+
+
+def get_transaction_by_id(transaction_id: int) -> Optional[Dict]:
+    """Récupère une transaction par son ID"""
+    return _fetch_one('SELECT data FROM transactions WHERE id = ?', (transaction_id,))
+
+
+def get_transactions_by_portfolio(portfolio_id: int) -> List[Dict]:
+    """Récupère toutes les transactions d'un portefeuille"""
+    return _fetch_all('SELECT data FROM transactions WHERE portfolio_id = ? ORDER BY id', (portfolio_id,))
+
+
+def transaction_exists(portfolio_id: int, signaletique_id: int, date_str: str,
+                       type_operation: str, quantite: str, prix_unitaire: str,
+                       isin: Optional[str] = None) -> bool:
+    """Vérifie si une transaction existe déjà (voir file_storage.transaction_exists)"""
+    candidates = _fetch_all(
+        'SELECT data FROM transactions WHERE portfolio_id = ? AND date = ? AND type_operation = ? '
+        'AND quantite = ? AND prix_unitaire = ? ORDER BY id',
+        (portfolio_id, date_str, type_operation, str(quantite), str(prix_unitaire)))
+
+    for transaction in candidates:
+        # Vérifier l'identité du titre : ISIN en priorité, sinon signaletique_id
+        stored_isin = transaction.get('isin')
+        if isin and stored_isin:
+            if stored_isin.upper() == isin.upper():
+                return True
+        elif transaction.get('signaletique_id') == signaletique_id:
+            return True
+
+    return False
+
+
+def create_transaction(portfolio_id: int, signaletique_id: int, date_obj: date,
+                       type_operation: str, quantite: Decimal, prix_unitaire: Decimal,
+                       devise: str = 'EUR', isin: Optional[str] = None) -> Dict:
+    """Crée une nouvelle transaction"""
+    with _transaction() as conn:
+        new_transaction = _build_transaction(_next_id(conn, 'transactions'), portfolio_id, signaletique_id,
+                                             date_obj, type_operation, quantite, prix_unitaire, devise, isin)
+        _save_transaction(conn, new_transaction)
+    return new_transaction
+
+
+def get_signaletique_for_transaction(transaction: Dict) -> Optional[Dict]:
+    """Résout la signalétique d'une transaction (signaletique_id, puis ISIN en fallback)"""
+    sig = get_signaletique_by_id(transaction.get('signaletique_id'))
+    if sig:
+        return sig
+    isin = transaction.get('isin')
+    if isin:
+        return get_signaletique_by_isin(isin)
+    return None
+
+
+def delete_transaction(transaction_id: int) -> bool:
+    """Supprime une transaction"""
+    with _transaction() as conn:
+        return conn.execute('DELETE FROM transactions WHERE id = ?', (transaction_id,)).rowcount > 0
+
+
+# ============================================================================
+# CASH
+# ============================================================================
+
+def get_all_cash() -> List[Dict]:
+    """Récupère toutes les entrées de cash"""
+    return _fetch_all('SELECT data FROM cash ORDER BY id')
+
+
+def get_cash_by_id(cash_id: int) -> Optional[Dict]:
+    """Récupère une entrée de cash par son ID"""
+    return _fetch_one('SELECT data FROM cash WHERE id = ?', (cash_id,))
+
+
+def get_cash_by_portfolio(portfolio_id: int) -> List[Dict]:
+    """Récupère toutes les entrées de cash d'un portefeuille"""
+    return _fetch_all('SELECT data FROM cash WHERE portfolio_id = ? ORDER BY id', (portfolio_id,))
+
+
+def create_cash(portfolio_id: int, banque: str, montant: Decimal,
+                devise: str, date_obj: date, commentaire: str = None) -> Dict:
+    """Crée une nouvelle entrée de cash"""
+    with _transaction() as conn:
+        new_cash = {
+            'id': _next_id(conn, 'cash'),
+            'portfolio_id': portfolio_id,
+            'banque': banque,
+            'montant': str(montant),
+            'devise': devise,
+            'date': date_obj.isoformat() if hasattr(date_obj, 'isoformat') else date_obj,
+            'commentaire': commentaire,
+            'date_creation': datetime.now().isoformat(),
+            'date_modification': datetime.now().isoformat()
+        }
+        _save_cash(conn, new_cash)
+    return new_cash
+
+
+def update_cash(cash_id: int, data: Dict) -> Optional[Dict]:
+    """Met à jour une entrée de cash"""
+    with _transaction() as conn:
+        cash = get_cash_by_id(cash_id)
+        if cash is None:
+            return None
+        cash.update(data)
+        cash['date_modification'] = datetime.now().isoformat()
+        _save_cash(conn, cash)
+    return cash
+
+
+def delete_cash(cash_id: int) -> bool:
+    """Supprime une entrée de cash"""
+    with _transaction() as conn:
+        return conn.execute('DELETE FROM cash WHERE id = ?', (cash_id,)).rowcount > 0
+
+
+# ============================================================================
+# SIGNALETIQUE
+# ============================================================================
+
+def get_all_signaletiques() -> List[Dict]:
+    return _fetch_all('SELECT data FROM signaletique ORDER BY id')
+
+
+def get_signaletique_by_id(sig_id: int) -> Optional[Dict]:
+    return _fetch_one('SELECT data FROM signaletique WHERE id = ?', (sig_id,))
+
+
+def get_signaletique_by_isin(isin: str) -> Optional[Dict]:
+    return _fetch_one('SELECT data FROM signaletique WHERE isin_key = ? ORDER BY id LIMIT 1',
+                      (isin.strip().upper(),))
+
+
+def get_signaletique_by_code(code: str) -> Optional[Dict]:
+    return _fetch_one('SELECT data FROM signaletique WHERE code_key = ? ORDER BY id LIMIT 1',
+                      (code.strip().upper(),))
+
+
+def search_signaletique_by_titre(titre: str) -> Optional[Dict]:
+    # Comparaison en Python : lower() de SQLite ne gère pas les accents
+    titre_lower = titre.strip().lower()
+    for sig_id, sig_titre in _connection().execute('SELECT id, titre FROM signaletique ORDER BY id'):
+        if titre_lower in (sig_titre or '').lower():
+            return get_signaletique_by_id(sig_id)
+    return None
+
+
+def upsert_signaletique(code: str, isin: Optional[str], titre: str,
+                        description: Optional[str] = None,
+                        categorie_text: Optional[str] = None,
+                        statut: Optional[str] = None,
+                        donnees_supplementaires: Optional[Dict] = None,
+                        prix=None, devise_prix: Optional[str] = None,
+                        source_prix: Optional[str] = None,
+                        date_cours: Optional[str] = None,
+                        frequence_coupon: Optional[str] = None) -> Dict:
+    """Crée ou met à jour une signalétique (clé : ISIN si présent, puis code)"""
+    with _transaction() as conn:
+        existing = get_signaletique_by_isin(isin) if isin else None
+        if existing is None:
+            existing = get_signaletique_by_code(code)
+
+        now = datetime.now().isoformat()
+
+        if existing is not None:
+            sig = existing
+            sig['code'] = code
+            sig['isin'] = isin
+            sig['titre'] = titre
+            sig['description'] = description
+            sig['categorie_text'] = categorie_text
+            sig['statut'] = statut
+            sig['donnees_supplementaires'] = donnees_supplementaires
+            sig['date_modification'] = now
+            if prix is not None:
+                sig['prix'] = prix
+                sig['devise_prix'] = devise_prix
+                sig['source_prix'] = source_prix
+                sig['date_cours'] = date_cours
+            if frequence_coupon is not None:
+                sig['frequence_coupon'] = frequence_coupon
+        else:
+            sig = {
+                'id': _next_id(conn, 'signaletique'),
+                'code': code,
+                'isin': isin,
+                'titre': titre,
+                'description': description,
+                'categorie_text': categorie_text,
+                'statut': statut,
+                'donnees_supplementaires': donnees_supplementaires,
+                'prix': prix,
+                'devise_prix': devise_prix,
+                'source_prix': source_prix,
+                'date_cours': date_cours,
+                'frequence_coupon': frequence_coupon,
+                'date_creation': now,
+                'date_modification': now,
+            }
+        _save_signaletique(conn, sig)
+    return sig
+
+
+def update_signaletique(sig_id: int, data: Dict) -> Optional[Dict]:
+    """Met à jour une signalétique existante."""
+    with _transaction() as conn:
+        sig = get_signaletique_by_id(sig_id)
+        if sig is None:
+            return None
+        for k, v in data.items():
+            # donnees_supplementaires : fusion pour préserver les champs non gérés par le formulaire
+            if k == 'donnees_supplementaires' and v is not None and sig.get('donnees_supplementaires'):
+                sig['donnees_supplementaires'] = {**sig['donnees_supplementaires'], **v}
+            else:
+                sig[k] = v
+        sig['date_modification'] = datetime.now().isoformat()
+        _save_signaletique(conn, sig)
+    return sig
+
+
+# ============================================================================
+# TARGET PORTFOLIOS
+# ============================================================================
+
+def get_all_target_portfolios() -> List[Dict]:
+    """Récupère tous les portefeuilles cibles"""
+    return _fetch_all('SELECT data FROM target_portfolios ORDER BY id')
+
+
+def get_target_portfolio_by_id(portfolio_id: int) -> Optional[Dict]:
+    """Récupère un portefeuille cible par son ID"""
+    return _fetch_one('SELECT data FROM target_portfolios WHERE id = ?', (portfolio_id,))
+
+
+def get_target_portfolio_by_name(name: str) -> Optional[Dict]:
+    """Récupère un portefeuille cible par son nom"""
+    return _fetch_one('SELECT data FROM target_portfolios WHERE name = ? ORDER BY id LIMIT 1', (name,))
+
+
+def _normalize_target_items(items: List[Dict]) -> List[Dict]:
+    return [
+        {'id': idx + 1, 'signaletique': int(item['signaletique']), 'ratio': str(round(float(item['ratio']), 4))}
+        for idx, item in enumerate(items)
+    ]
+
+
+def create_target_portfolio(name: str, items: List[Dict]) -> Dict:
+    """Crée un nouveau portefeuille cible (items : [{signaletique, ratio}])"""
+    with _transaction() as conn:
+        if get_target_portfolio_by_name(name) is not None:
+            raise ValueError(f"Un portefeuille cible nommé '{name}' existe déjà")
+        _validate_target_items(items)
+        new_portfolio = {
+            'id': _next_id(conn, 'target_portfolios'),
+            'name': name,
+            'date_creation': datetime.now().isoformat(),
+            'date_modification': datetime.now().isoformat(),
+            'items': _normalize_target_items(items)
+        }
+        _save_target_portfolio(conn, new_portfolio)
+    return new_portfolio
+
+
+def update_target_portfolio(portfolio_id: int, name: str = None, items: List[Dict] = None) -> Optional[Dict]:
+    """Met à jour un portefeuille cible."""
+    with _transaction() as conn:
+        portfolio = get_target_portfolio_by_id(portfolio_id)
+        if portfolio is None:
+            return None
+        if name is not None and name != portfolio.get('name'):
+            if conn.execute('SELECT 1 FROM target_portfolios WHERE name = ? AND id != ?',
+                            (name, portfolio_id)).fetchone():
+                raise ValueError(f"Un portefeuille cible nommé '{name}' existe déjà")
+        if items is not None:
+            _validate_target_items(items)
+        if name is not None:
+            portfolio['name'] = name
+        if items is not None:
+            portfolio['items'] = _normalize_target_items(items)
+        portfolio['date_modification'] = datetime.now().isoformat()
+        _save_target_portfolio(conn, portfolio)
+    return portfolio
+
+
+def delete_target_portfolio(portfolio_id: int) -> bool:
+    """Supprime un portefeuille cible."""
+    with _transaction() as conn:
+        return conn.execute('DELETE FROM target_portfolios WHERE id = ?', (portfolio_id,)).rowcount > 0
+
+
+# ============================================================================
+# HISTORIQUES DE PRIX
+# ============================================================================
+# Un document JSON par identifiant (prix_sources) ou par ISIN (prix_titres) :
+# les imports ne lisent et ne réécrivent que les identifiants concernés.
+# Les règles de fusion sont celles de file_storage.
+
+def _get_etat(conn, nom: str) -> Dict:
+    found = conn.execute('SELECT data FROM etats WHERE nom = ?', (nom,)).fetchone()
+    return json.loads(found[0]) if found else {}
+
+
+def _set_etat(conn, nom: str, data: Dict):
+    conn.execute('INSERT INTO etats (nom, data) VALUES (?, ?) '
+                 'ON CONFLICT (nom) DO UPDATE SET data = excluded.data', (nom, _dumps(data)))
+
+
+def _get_prix_source(source: str) -> Dict:
+    """Historique brut d'une source : identifiant → points (date_import → {cours, devise})"""
+    return {identifiant: _points_prix(json.loads(data)) for identifiant, data in _connection().execute(
+        'SELECT identifiant, data FROM prix_sources WHERE source = ? ORDER BY rowid', (source,))}
+
+
+def _append_prix_source(source: str, rows: List[Dict], key_field: str) -> Dict:
+    with _transaction() as conn:
+        historique = {}
+        for identifiant in {str(row.get(key_field, '')).strip() for row in rows}:
+            found = conn.execute('SELECT data FROM prix_sources WHERE source = ? AND identifiant = ?',
+                                 (source, identifiant)).fetchone()
+            if found:
+                historique[identifiant] = _points_prix(json.loads(found[0]))
+        touches = {}
+        stats = _append_prix_rows(historique, rows, key_field, touches)
+        for identifiant, entries in historique.items():
+            conn.execute(
+                'INSERT INTO prix_sources (source, identifiant, data) VALUES (?, ?, ?) '
+                'ON CONFLICT (source, identifiant) DO UPDATE SET data = excluded.data',
+                (source, identifiant, _dumps(entries)))
+        if touches:
+            etat = _get_etat(conn, 'prix_consolidation')
+            _fusionner_touches(etat, source, touches)
+            _set_etat(conn, 'prix_consolidation', etat)
+    return stats
+
+
+def get_prix_historique_koala() -> Dict:
+    """Retourne tout l'historique de prix Koala (dict identifiant → [entrées])"""
+    return {identifiant: _liste_prix(points) for identifiant, points in _get_prix_source('koala').items()}
+
+
+def get_prix_historique_bonobo() -> Dict:
+    """Retourne tout l'historique de prix Bonobo (dict identifiant → [entrées])"""
+    return {identifiant: _liste_prix(points) for identifiant, points in _get_prix_source('bonobo').items()}
+
+
+def append_prix_bonobo(rows: List[Dict]) -> Dict:
+    """Ajoute des entrées dans l'historique Bonobo (un prix par isin et date_import)"""
+    return _append_prix_source('bonobo', rows, 'isin')
+
+
+def append_prix_koala(rows: List[Dict]) -> Dict:
+    """Ajoute des entrées dans l'historique Koala (un prix par symbole et date_import)"""
+    return _append_prix_source('koala', rows, 'symbole')
+
+
+def get_prix_historique_titres() -> Dict:
+    """Retourne l'historique consolidé de prix par ISIN"""
+    return {isin: json.loads(data) for isin, data in _connection().execute(
+        'SELECT isin, data FROM prix_titres ORDER BY rowid')}
+
+
+def get_prix_titres_manifest() -> Dict:
+    """Retourne ISIN → en-tête et statistiques de l'historique consolidé"""
+    return {isin: _titre_stats(isin, titre) for isin, titre in get_prix_historique_titres().items()}
+
+
+def get_prix_titre_by_isin(isin: str) -> Optional[Dict]:
+    """Retourne l'historique de prix pour un titre donné par ISIN"""
+    return _fetch_one('SELECT data FROM prix_titres WHERE isin = ?', (isin,))
+
+
+def get_prix_titres_version() -> int:
+    """Version de l'historique consolidé (change à chaque écriture d'un titre)"""
+    return get_data_version('prix_titres')
+
+
+def _save_titre(conn, isin: str, titre: Dict):
+    conn.execute('INSERT INTO prix_titres (isin, data) VALUES (?, ?) '
+                 'ON CONFLICT (isin) DO UPDATE SET data = excluded.data', (isin, _dumps(titre)))
+
+
+def _replace_titres(conn, titres: Dict):
+    conn.execute('DELETE FROM prix_titres')
+    conn.executemany('INSERT INTO prix_titres (isin, data) VALUES (?, ?)',
+                     [(isin, _dumps(titre)) for isin, titre in titres.items()])
+
+
+def upsert_prix_titre_entry(isin: str, entry: Dict, sig: Optional[Dict] = None) -> Dict:
+    """Ajoute ou met à jour une entrée de prix dans l'historique d'un titre ; retourne l'entrée finale"""
+    with _transaction() as conn:
+        titre = get_prix_titre_by_isin(isin) or _nouveau_titre(isin, sig)
+        saved = _upsert_titre_entry(titre, isin, entry)
+        _save_titre(conn, isin, titre)
+    return saved
+
+
+def delete_prix_titre_entry(isin: str, entry_id: str) -> bool:
+    """Supprime une entrée par son id. Retourne True si supprimée, False si introuvable."""
+    with _transaction() as conn:
+        titre = get_prix_titre_by_isin(isin)
+        if titre is None or not _delete_titre_entry(titre, entry_id):
+            return False
+        _save_titre(conn, isin, titre)
+    return True
+
+
+def import_prix_titre_from_rows(isin: str, rows: List[Dict], sig: Optional[Dict] = None) -> Dict:
+    """Importe des lignes dans l'historique d'un titre sans écraser (dédoublonnage date+source)"""
+    with _transaction() as conn:
+        titre = get_prix_titre_by_isin(isin) or _nouveau_titre(isin, sig)
+        stats = _import_titre_rows(titre, isin, rows)
+        _save_titre(conn, isin, titre)
+    return stats
+
+
+def rebuild_prix_historique_titres(incremental: bool = False) -> Dict:
+    """Consolide les historiques Koala (par Symbole) et Bonobo (par ISIN), clé = ISIN.
+    Les entrées manuelles sont conservées ; incremental=True ne fusionne que les points
+    nouveaux depuis la dernière consolidation (voir file_storage)."""
+    with _transaction() as conn:
+        sigs = get_all_signaletiques()
+        koala = _get_prix_source('koala')
+        bonobo = _get_prix_source('bonobo')
+        if incremental:
+            titres, supprimes, etat, stats = _consolider_incremental(
+                sigs, koala, bonobo, _get_etat(conn, 'prix_consolidation'), get_prix_titre_by_isin)
+            for isin, titre in titres.items():
+                _save_titre(conn, isin, titre)
+            for isin in supprimes:
+                conn.execute('DELETE FROM prix_titres WHERE isin = ?', (isin,))
+        else:
+            actuels = {isin: titre for isin, titre in get_prix_historique_titres().items()
+                       if _a_entrees_manuelles(_titre_stats(isin, titre))}
+            titres, etat = _consolider_complet(sigs, koala, bonobo, actuels)
+            _replace_titres(conn, titres)
+            stats = {'titres_reconstruits': len(titres)}
+        _set_etat(conn, 'prix_consolidation', etat)
+        manifest = get_prix_titres_manifest()
+    return {'mode': 'incremental' if incremental else 'complet', **stats, **_stats_consolidation(manifest)}
+
+
+def restore_prix_historique_from_rows(rows: List[Dict]) -> Dict:
+    """Reconstruit l'historique consolidé à partir des lignes du fichier Excel de sauvegarde"""
+    with _transaction() as conn:
+        titres, stats = _titres_from_backup_rows(rows, get_all_signaletiques())
+        _replace_titres(conn, titres)
+    return stats
+
+
+# ============================================================================
+# TAUX DE CHANGE
+# ============================================================================
+# Un document JSON par paire ('BASE/COTATION' → {date: taux}), règles de fusion
+# de file_storage.
+
+def get_taux_change() -> Dict:
+    """Retourne l'historique des taux de change (paire 'BASE/COTATION' → {date: taux})"""
+    return {paire: json.loads(data) for paire, data in _connection().execute(
+        'SELECT paire, data FROM taux_change ORDER BY rowid')}
+
+
+def append_taux_change(rows: List[Dict]) -> Dict:
+    """Ajoute des taux de change (un taux par paire et par date) ; retourne {ajoutes, ignores}"""
+    with _transaction() as conn:
+        historique = {}
+        for paire in {_paire_change(row.get('devise_base'), row.get('devise_cotation')) for row in rows} - {None}:
+            found = conn.execute('SELECT data FROM taux_change WHERE paire = ?', (paire,)).fetchone()
+            if found:
+                historique[paire] = json.loads(found[0])
+        stats = _append_taux_rows(historique, rows)
+        conn.executemany(
+            'INSERT INTO taux_change (paire, data) VALUES (?, ?) '
+            'ON CONFLICT (paire) DO UPDATE SET data = excluded.data',
+            [(paire, _dumps(points)) for paire, points in historique.items()])
+    return stats
+
+
+# ============================================================================
+# UTILITAIRES
+# ============================================================================
+
+def clear_cache():
+    """Sans objet pour SQLite (pas de cache applicatif) ; conservé pour compatibilité"""
+
+
+def get_data_version(nom: str) -> int:
+    """Compteur de version d'une table de données (voir les triggers du schéma)"""
+    if nom not in CORE_TABLES + PRIX_TABLES:
+        raise ValueError(f"Jeu de données inconnu : '{nom}'")
+    row = _connection().execute('SELECT version FROM versions WHERE nom = ?', (nom,)).fetchone()
+    return row[0] if row else 0
+
+
+def get_etat(nom: str) -> Dict:
+    """Retourne un état dérivé persisté (cache de calcul), {} s'il n'existe pas"""
+    return _get_etat(_connection(), nom)
+
+
+def save_etat(nom: str, data: Dict):
+    """Enregistre un état dérivé persisté"""
+    with _transaction() as conn:
+        _set_etat(conn, nom, data)
+
+
+def delete_etat(nom: str):
+    """Supprime un état dérivé persisté (sans effet s'il n'existe pas)"""
+    with _transaction() as conn:
+        conn.execute('DELETE FROM etats WHERE nom = ?', (nom,))
+
+
+def clear_all_data(include_prix: bool = False):
+    """Supprime toutes les données (historiques de prix si include_prix)"""
+    with _transaction() as conn:
+        for table in CORE_TABLES + (PRIX_TABLES if include_prix else []):
+            conn.execute(f'DELETE FROM {table}')
+        conn.execute("DELETE FROM etats WHERE nom != 'prix_consolidation'")
+        if include_prix:
+            conn.execute("DELETE FROM etats WHERE nom = 'prix_consolidation'")
+
+
+def data_exists() -> bool:
+    """Vérifie si la base existe"""
+    return os.path.exists(SQLITE_PATH)
+
+
+def get_data_stats() -> Dict:
+    """Retourne des statistiques sur les données"""
+    if not data_exists():
+        return {
+            'data_dir_exists': False,
+            'portfolios_count': 0,
+            'transactions_count': 0,
+            'cash_count': 0
+        }
+
+    conn = _connection()
+
+    def count(table):
+        return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+    return {
+        'data_dir_exists': True,
+        'portfolios_count': count('portfolios'),
+        'transactions_count': count('transactions'),
+        'cash_count': count('cash'),
+        'target_portfolios_count': count('target_portfolios'),
+        'signaletique_count': count('signaletique'),
+        'moteur': 'sqlite',
+        'base': SQLITE_PATH,
+    }
+
+
+def import_from_json(replace: bool = False) -> Dict:
+    """Copie toutes les données des fichiers JSON (file_storage) dans la base.
+
+    Refuse d'écraser une base non vide sauf si replace=True. Retourne les
+    nombres d'éléments copiés par table.
+    """
+    with _transaction() as conn:
+        existing = sum(conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                       for table in CORE_TABLES + PRIX_TABLES)
+        if existing and not replace:
+            raise ValueError("La base SQLite contient déjà des données (utiliser replace=True)")
+        for table in CORE_TABLES + PRIX_TABLES:
+            conn.execute(f'DELETE FROM {table}')
+
+        copies = {}
+        for table, items, save in [
+            ('portfolios', file_storage.get_all_portfolios(), _save_portfolio),
+            ('transactions', file_storage.get_all_transactions(), _save_transaction),
+            ('cash', file_storage.get_all_cash(), _save_cash),
+            ('signaletique', file_storage.get_all_signaletiques(), _save_signaletique),
+            ('target_portfolios', file_storage.get_all_target_portfolios(), _save_target_portfolio),
+        ]:
+            for item in items:
+                save(conn, item)
+            copies[table] = len(items)
+
+        for source, historique in [
+            ('koala', file_storage._read_prix_source(file_storage.PRIX_HISTORIQUE_KOALA_FILE)),
+            ('bonobo', file_storage._read_prix_source(file_storage.PRIX_HISTORIQUE_BONOBO_FILE)),
+        ]:
+            conn.executemany('INSERT INTO prix_sources (source, identifiant, data) VALUES (?, ?, ?)',
+                             [(source, identifiant, _dumps(entries)) for identifiant, entries in historique.items()])
+            copies[f'prix_{source}'] = len(historique)
+        titres = file_storage.get_prix_historique_titres()
+        _replace_titres(conn, titres)
+        copies['prix_titres'] = len(titres)
+        taux = file_storage.get_taux_change()
+        conn.executemany('INSERT INTO taux_change (paire, data) VALUES (?, ?)',
+                         [(paire, _dumps(points)) for paire, points in taux.items()])
+        copies['taux_change'] = len(taux)
+        _set_etat(conn, 'prix_consolidation', file_storage._read_json_file(file_storage.PRIX_CONSOLIDATION_FILE, {}))
+    return copies
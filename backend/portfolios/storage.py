@@ -0,0 +1,38 @@
+# Sélection du moteur de stockage des données de portefeuille.
+# Le setting PORTFOLIO_STORAGE_ENGINE choisit le module utilisé par les vues :
+#   'json'   – fichiers JSON dans /app/data (file_storage, défaut)
+#   'sqlite' – base SQLite locale (sqlite_storage)
+# Les deux modules exposent les mêmes fonctions publiques.
+
+from importlib import import_module
+
+from django.conf import settings
+
+ENGINES = {
+    'json': 'portfolios.file_storage',
+    'sqlite': 'portfolios.sqlite_storage',
+}
+
+
+def get_engine(name: str = None):
+    """Retourne le module de stockage `name` (par défaut celui configuré)"""
+    name = name or getattr(settings, 'PORTFOLIO_STORAGE_ENGINE', 'json')
+    if name not in ENGINES:
+        raise ValueError(f"Moteur de stockage inconnu : '{name}' (valeurs possibles : {', '.join(ENGINES)})")
+    return import_module(ENGINES[name])
+
+
+def resolve_engine(moteur=None):
+    """Retourne `moteur`, ou à défaut le moteur configuré"""
+    if moteur is None:
+        moteur = globals().get('engine') or __getattr__('engine')
+    return moteur
+
+
+def __getattr__(name):
+    # Moteur configuré, sélectionné au premier accès : le module s'importe sans
+    # settings Django (processus du pool FIFO, scripts)
+    if name == 'engine':
+        globals()['engine'] = get_engine()
+        return globals()['engine']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
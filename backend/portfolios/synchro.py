@@ -0,0 +1,318 @@
+# Double écriture groupée de la signalétique vers PostgreSQL.
+# Le stockage JSON fait foi ; les tables Signaletique, AssetCategory et InstrumentType
+# sont tenues à jour pour les FK résiduelles. Plutôt qu'un get_or_create /
+# update_or_create par ligne (3 à 5 allers-retours en autocommit), les lignes sont
+# accumulées puis écrites par lots de SYNCHRO_TAILLE_LOT, le tout dans une seule
+# transaction :
+#  - catégories et types d'instruments chargés une fois en dictionnaires, les
+#    manquants créés en bulk_create ;
+#  - signalétiques existantes du lot lues en deux requêtes (par ISIN, par code), les
+#    nouvelles créées en bulk_create, les modifiées (au moins une valeur différente)
+#    écrites en bulk_update.
+# Si l'écriture d'un lot échoue sur une donnée (contrainte d'unicité, valeur trop
+# longue…), il est rejoué ligne à ligne dans des points de sauvegarde : l'erreur est
+# attribuée à sa ligne, les autres passent. De même pour les catégories et types
+# créés : un nom refusé (trop long…) met en erreur les lignes qui l'utilisent. Les
+# autres erreurs de base (connexion perdue…) sont propagées.
+
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from django.db import DataError, IntegrityError, transaction
+from django.utils import timezone
+
+from .models import AssetCategory, InstrumentType, Signaletique
+
+# Lignes écrites par lot (bulk_create / bulk_update)
+SYNCHRO_TAILLE_LOT = int(os.environ.get('SYNCHRO_TAILLE_LOT', '500'))
+
+# Champs du modèle renseignables par ligne (hors catégorie, traitée à part)
+CHAMPS = {
+    champ.name: champ for champ in Signaletique._meta.concrete_fields
+    if champ.name not in ('id', 'categorie', 'date_creation', 'date_modification')
+}
+
+
+def cle(valeurs: Dict) -> tuple:
+    """Clé d'une signalétique à écrire : ('isin', …) sinon ('code', …).
+    Lève ValueError si un champ est inconnu ou si ISIN et code manquent."""
+    for nom in valeurs:
+        if nom != 'categorie' and nom not in CHAMPS:
+            raise ValueError(f"Champ de signalétique inconnu : {nom}")
+    if valeurs.get('isin'):
+        return ('isin', str(valeurs['isin']))
+    if valeurs.get('code'):
+        return ('code', str(valeurs['code']))
+    raise ValueError("Signalétique sans ISIN ni code")
+
+
+def normaliser_nom(nom) -> Optional[str]:
+    """Nom de catégorie / type d'instrument tel qu'enregistré par les modèles"""
+    nom = str(nom).strip() if nom is not None else ''
+    return nom.capitalize() if nom else None
+
+
+class _Ligne:
+    __slots__ = ('champs', 'ligne', 'creer', 'mettre_a_jour', 'type_instrument')
+
+    def __init__(self, champs, ligne, creer, mettre_a_jour, type_instrument):
+        self.champs = champs
+        self.ligne = ligne
+        self.creer = creer
+        self.mettre_a_jour = mettre_a_jour
+        self.type_instrument = type_instrument
+
+
+class LotSignaletiques:
+    """Écriture groupée de signalétiques, à utiliser comme contexte :
+
+        with LotSignaletiques(origine="l'import") as lot:
+            lot.ajouter({'isin': ..., 'code': ..., 'titre': ..., 'categorie': 'Actions'}, ligne=2)
+
+    Les lignes sont identifiées par ISIN (sinon par code) ; une même signalétique
+    ajoutée deux fois n'est écrite qu'une fois (dernières valeurs). La transaction est
+    validée à la sortie du bloc (annulée si une exception en sort).
+    origine : complète la description des catégories / types créés automatiquement
+    (« … lors de l'import ») ; None = sans description.
+    Après la sortie : crees, mis_a_jour, inchanges, ignores, erreurs ([{'ligne', 'erreur'}]),
+    refus ({('categorie' | 'type_instrument', nom): erreur} pour les noms refusés par la base).
+    """
+
+    def __init__(self, origine: Optional[str] = None, taille_lot: int = SYNCHRO_TAILLE_LOT):
+        self.origine = origine
+        self.taille_lot = max(taille_lot, 1)
+        self.crees = 0
+        self.mis_a_jour = 0
+        self.inchanges = 0
+        self.ignores = 0
+        self.erreurs: List[Dict] = []
+        self._lignes: 'OrderedDict[tuple, _Ligne]' = OrderedDict()
+        self._categories: Dict[str, AssetCategory] = {}
+        self._types: Dict[str, InstrumentType] = {}
+        self._categories_manquantes = set()
+        self._types_manquants = set()
+        self.refus: Dict[tuple, str] = {}
+        self._lignes_references: Dict[tuple, List[int]] = {}  # référence en attente → lignes
+        self._atomic = None
+
+    def __enter__(self):
+        self._atomic = transaction.atomic()
+        self._atomic.__enter__()
+        self._categories = {c.name: c for c in AssetCategory.objects.all()}
+        self._types = {t.name.lower(): t for t in InstrumentType.objects.all()}
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            try:
+                self.vider()
+            except BaseException as e:
+                self._atomic.__exit__(type(e), e, e.__traceback__)
+                raise
+        return self._atomic.__exit__(exc_type, exc, tb)
+
+    def ajouter(self, valeurs: Dict, ligne: Optional[int] = None, type_instrument: Optional[str] = None,
+                creer: bool = True, mettre_a_jour: bool = True):
+        """Met une signalétique en attente d'écriture.
+
+        valeurs : champs du modèle Signaletique ('isin' ou 'code' obligatoire) ;
+        'categorie' : AssetCategory, nom (créée si absente) ou None, champ inchangé si
+        la clé est absente. type_instrument : type d'instrument créé s'il n'existe pas.
+        creer=False : ne touche pas une signalétique absente de la base ;
+        mettre_a_jour=False : ne modifie pas une signalétique déjà présente.
+        Lève ValueError (champ inconnu, clé manquante) ou ValidationError (valeur invalide).
+        """
+        cle_ligne = cle(valeurs)
+        champs = {}
+        for nom, valeur in valeurs.items():
+            if nom == 'categorie':
+                if valeur is not None and not isinstance(valeur, AssetCategory):
+                    valeur = normaliser_nom(valeur)
+                    self.referencer(categorie=valeur)
+                champs[nom] = valeur
+            else:
+                champs[nom] = CHAMPS[nom].to_python(valeur)
+
+        self.referencer(type_instrument=type_instrument)
+        type_instrument = normaliser_nom(type_instrument)
+
+        attente = self._lignes.get(cle_ligne)
+        if attente is not None:
+            attente.champs.update(champs)
+            attente.ligne, attente.creer, attente.mettre_a_jour = ligne, creer, mettre_a_jour
+            attente.type_instrument = type_instrument or attente.type_instrument
+        else:
+            self._lignes[cle_ligne] = _Ligne(champs, ligne, creer, mettre_a_jour, type_instrument)
+        if len(self._lignes) >= self.taille_lot:
+            self.vider()
+
+    def referencer(self, categorie: Optional[str] = None, type_instrument: Optional[str] = None,
+                   ligne: Optional[int] = None):
+        """Catégorie et / ou type d'instrument à créer s'ils n'existent pas.
+        ligne : mise en erreur si la base refuse l'un de ces noms."""
+        categorie = normaliser_nom(categorie)
+        if categorie and categorie not in self._categories:
+            self._categories_manquantes.add(categorie)
+            if ligne is not None:
+                self._lignes_references.setdefault(('categorie', categorie), []).append(ligne)
+        type_instrument = normaliser_nom(type_instrument)
+        if type_instrument and type_instrument.lower() not in self._types:
+            self._types_manquants.add(type_instrument)
+            if ligne is not None:
+                self._lignes_references.setdefault(('type_instrument', type_instrument), []).append(ligne)
+
+    def vider(self):
+        """Écrit les lignes en attente (appelé à chaque lot complet et en fin de bloc)"""
+        self._creer_references()
+        if not self._lignes:
+            return
+        lignes = []
+        for attente in self._lignes.values():
+            erreur = self._refus_ligne(attente)
+            if erreur is not None:
+                self.erreurs.append({'ligne': attente.ligne, 'erreur': erreur})
+            else:
+                lignes.append(attente)
+        self._lignes = OrderedDict()
+        if not lignes:
+            return
+        try:
+            with transaction.atomic():
+                compteurs = self._ecrire(lignes)
+        except (DataError, IntegrityError):
+            # Rejouer ligne à ligne pour isoler la ou les lignes fautives
+            compteurs = [0, 0, 0, 0]
+            for attente in lignes:
+                try:
+                    with transaction.atomic():
+                        resultat = self._ecrire([attente])
+                except (DataError, IntegrityError) as e:
+                    self.erreurs.append({'ligne': attente.ligne, 'erreur': str(e)})
+                    continue
+                compteurs = [a + b for a, b in zip(compteurs, resultat)]
+        self.crees += compteurs[0]
+        self.mis_a_jour += compteurs[1]
+        self.inchanges += compteurs[2]
+        self.ignores += compteurs[3]
+
+    def _description(self, modele: str) -> Optional[str]:
+        return f"{modele} automatiquement lors de {self.origine}" if self.origine else None
+
+    def _creer_references(self):
+        """Crée en une fois les catégories et types d'instruments manquants"""
+        if self._categories_manquantes:
+            noms = sorted(self._categories_manquantes)
+            self._creer_noms('categorie', AssetCategory, noms, self._description('Catégorie créée'))
+            self._categories.update({c.name: c for c in AssetCategory.objects.filter(name__in=noms)})
+            self._categories_manquantes = set()
+        if self._types_manquants:
+            noms = sorted(self._types_manquants)
+            self._creer_noms('type_instrument', InstrumentType, noms, self._description('Créé'))
+            self._types.update({t.name.lower(): t for t in InstrumentType.objects.filter(name__in=noms)})
+            self._types_manquants = set()
+
+    def _creer_noms(self, nature: str, modele, noms: List[str], description: Optional[str]):
+        """bulk_create des noms ; en cas d'erreur de donnée, rejoué nom par nom et les
+        noms refusés (et les lignes qui les référencent) mis en erreur"""
+        try:
+            with transaction.atomic():
+                modele.objects.bulk_create([modele(name=nom, description=description) for nom in noms],
+                                           ignore_conflicts=True)
+            refuses = {}
+        except (DataError, IntegrityError):
+            refuses = {}
+            for nom in noms:
+                try:
+                    with transaction.atomic():
+                        modele.objects.bulk_create([modele(name=nom, description=description)],
+                                                   ignore_conflicts=True)
+                except (DataError, IntegrityError) as e:
+                    refuses[nom] = str(e)
+        for nom in noms:
+            lignes = self._lignes_references.pop((nature, nom), [])
+            if nom in refuses:
+                self.refus[(nature, nom)] = refuses[nom]
+                self.erreurs.extend({'ligne': ligne, 'erreur': self._message_refus(nature, nom)}
+                                    for ligne in lignes)
+
+    def _message_refus(self, nature: str, nom: str) -> str:
+        libelle = 'Catégorie refusée' if nature == 'categorie' else "Type d'instrument refusé"
+        return f"{libelle} par la base ({nom[:50]}) : {self.refus[(nature, nom)]}"
+
+    def _refus_ligne(self, attente: _Ligne) -> Optional[str]:
+        """Erreur si la ligne utilise une catégorie ou un type refusé par la base"""
+        categorie = attente.champs.get('categorie')
+        if isinstance(categorie, str) and ('categorie', categorie) in self.refus:
+            return self._message_refus('categorie', categorie)
+        if attente.type_instrument and ('type_instrument', attente.type_instrument) in self.refus:
+            return self._message_refus('type_instrument', attente.type_instrument)
+        return None
+
+    def _categorie(self, valeur) -> Optional[AssetCategory]:
+        if valeur is None or isinstance(valeur, AssetCategory):
+            return valeur
+        return self._categories.get(valeur)
+
+    def _ecrire(self, lignes: List[_Ligne]) -> List[int]:
+        """Écrit un lot ; [créées, mises à jour, inchangées, ignorées]"""
+        isins = [l.champs['isin'] for l in lignes if l.champs.get('isin')]
+        codes = [l.champs['code'] for l in lignes if l.champs.get('code')]
+        par_isin = {s.isin: s for s in Signaletique.objects.filter(isin__in=isins)} if isins else {}
+        par_code = {s.code: s for s in Signaletique.objects.filter(code__in=codes)} if codes else {}
+
+        nouvelles = []
+        modifiees: Dict[int, Signaletique] = {}
+        champs_modifies = set()
+        inchangees = ignorees = 0
+        for attente in lignes:
+            champs = attente.champs
+            existante = par_isin.get(champs.get('isin')) if champs.get('isin') else None
+            if existante is None and champs.get('code'):
+                existante = par_code.get(champs['code'])
+                # Même code mais autre ISIN : ce n'est pas la même signalétique
+                if existante is not None and champs.get('isin') and existante.isin not in (None, champs['isin']):
+                    existante = None
+
+            if existante is None:
+                if not attente.creer:
+                    ignorees += 1
+                    continue
+                sig = Signaletique(**{n: v for n, v in champs.items() if n != 'categorie'})
+                if 'categorie' in champs:
+                    sig.categorie = self._categorie(champs['categorie'])
+                nouvelles.append(sig)
+                continue
+
+            if not attente.mettre_a_jour:
+                ignorees += 1
+                continue
+            modifie = False
+            for nom, valeur in champs.items():
+                if nom == 'categorie':
+                    categorie = self._categorie(valeur)
+                    if existante.categorie_id != (categorie.pk if categorie else None):
+                        existante.categorie = categorie
+                        champs_modifies.add('categorie')
+                        modifie = True
+                elif getattr(existante, nom) != valeur:
+                    setattr(existante, nom, valeur)
+                    champs_modifies.add(nom)
+                    modifie = True
+            if modifie:
+                modifiees[existante.pk] = existante
+            else:
+                inchangees += 1
+
+        if nouvelles:
+            Signaletique.objects.bulk_create(nouvelles, batch_size=self.taille_lot)
+        if modifiees:
+            # bulk_update ne renseigne pas les champs auto_now
+            maintenant = timezone.now()
+            for sig in modifiees.values():
+                sig.date_modification = maintenant
+            Signaletique.objects.bulk_update(
+                list(modifiees.values()), sorted(champs_modifies | {'date_modification'}),
+                batch_size=self.taille_lot,
+            )
+        return [len(nouvelles), len(modifiees), inchangees, ignorees]
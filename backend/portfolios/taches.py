@@ -0,0 +1,213 @@
+# Exécution des imports en tâche de fond.
+# Un import lancé avec arriere_plan=1 est confié à un pool de threads borné
+# (IMPORT_TACHES_WORKERS) : la requête HTTP rend aussitôt l'id de son ImportLog, qui
+# sert de table des tâches (statut, compteurs, erreurs partielles, résultat final).
+# L'avancement est écrit dans l'ImportLog au plus une fois par IMPORT_TACHES_INTERVALLE
+# secondes : il survit au rechargement de la page et se lit depuis n'importe quel
+# processus (GET /api/import/jobs/<id>/). Les imports synchrones le renseignent aussi.
+# Threads plutôt que processus : les imports écrivent via le moteur de stockage (verrous
+# propres au processus) et l'ORM. Le fichier reçu est recopié sur disque avant la
+# réponse, le téléversement temporaire de Django étant supprimé en fin de requête.
+# Statuts : en_attente → en_cours → termine / termine_avec_erreurs / erreur ;
+# interrompu si la tâche n'appartient à aucun pool vivant (plus d'écriture depuis
+# IMPORT_TACHES_DELAI_ORPHELIN secondes, ex. redémarrage du serveur).
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+from typing import Callable, Dict, Optional
+
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from .models import ImportLog
+
+# Imports exécutés simultanément (les autres attendent dans la file)
+IMPORT_TACHES_WORKERS = int(os.environ.get('IMPORT_TACHES_WORKERS', '1'))
+# Imports en file (en attente ou en cours) au-delà desquels une soumission est refusée
+IMPORT_TACHES_FILE_MAX = int(os.environ.get('IMPORT_TACHES_FILE_MAX', '16'))
+# Intervalle minimal (secondes) entre deux écritures de l'avancement
+IMPORT_TACHES_INTERVALLE = float(os.environ.get('IMPORT_TACHES_INTERVALLE', '1'))
+IMPORT_TACHES_DELAI_ORPHELIN = int(os.environ.get('IMPORT_TACHES_DELAI_ORPHELIN', '3600'))
+# Erreurs conservées dans l'avancement (la liste complète est écrite en fin d'import)
+IMPORT_TACHES_ERREURS_PARTIELLES = 50
+
+STATUTS_ACTIFS = ('en_attente', 'en_cours')
+
+_executor: Optional[ThreadPoolExecutor] = None
+# id de l'ImportLog → Future des tâches soumises par ce processus
+_taches: Dict[int, Future] = {}
+_taches_lock = threading.Lock()
+
+
+class Progression:
+    """Avancement d'un import, écrit dans son ImportLog (au plus une fois par
+    IMPORT_TACHES_INTERVALLE secondes, sauf force=True)"""
+
+    def __init__(self, import_log: ImportLog):
+        self.import_log = import_log
+        self._derniere_ecriture = 0.0
+
+    def _ecrire(self, **champs):
+        champs['date_maj'] = timezone.now()
+        for nom, valeur in champs.items():
+            setattr(self.import_log, nom, valeur)
+        ImportLog.objects.filter(pk=self.import_log.pk).update(**champs)
+
+    def demarrer(self):
+        self._ecrire(statut='en_cours', date_debut=timezone.now(), lignes_traitees=0)
+        self._derniere_ecriture = time.monotonic()
+
+    def estimer(self, lignes_estimees: Optional[int]):
+        """Nombre de lignes attendu (sert au calcul de l'ETA ; None si inconnu)"""
+        self._ecrire(nombre_lignes=lignes_estimees or 0)
+
+    def avancer(self, lignes_traitees: int, nombre_succes: int, nombre_erreurs: int,
+                erreurs: Optional[list] = None, resultat: Optional[Dict] = None, force: bool = False):
+        instant = time.monotonic()
+        if not force and instant - self._derniere_ecriture < IMPORT_TACHES_INTERVALLE:
+            return
+        self._derniere_ecriture = instant
+        champs = {
+            'lignes_traitees': lignes_traitees,
+            'nombre_succes': nombre_succes,
+            'nombre_erreurs': nombre_erreurs,
+        }
+        if lignes_traitees > self.import_log.nombre_lignes:
+            champs['nombre_lignes'] = lignes_traitees
+        if erreurs is not None:
+            champs['erreurs'] = erreurs[:IMPORT_TACHES_ERREURS_PARTIELLES] or None
+        if resultat is not None:
+            champs['resultat'] = resultat
+        self._ecrire(**champs)
+
+
+def executer(import_log: ImportLog, fonction: Callable, fichier=None) -> Dict:
+    """Exécute fonction(fichier, import_log, progression) dans le thread courant et
+    enregistre son résultat dans l'ImportLog. En cas d'exception, l'ImportLog passe en
+    erreur et l'exception est propagée."""
+    progression = Progression(import_log)
+    progression.demarrer()
+    try:
+        resultat = fonction(fichier, import_log, progression)
+    except Exception as e:
+        import_log.statut = 'erreur'
+        import_log.erreurs = [{'erreur_generale': str(e)}]
+        import_log.date_fin = import_log.date_maj = timezone.now()
+        import_log.save()
+        raise
+    if import_log.statut in STATUTS_ACTIFS:
+        import_log.statut = 'termine'
+    import_log.lignes_traitees = max(import_log.lignes_traitees, import_log.nombre_lignes)
+    import_log.resultat = resultat
+    import_log.date_fin = import_log.date_maj = timezone.now()
+    import_log.save()
+    return resultat
+
+
+def _copier(fichier) -> str:
+    """Copie du fichier téléversé dans un fichier temporaire (chemin)"""
+    suffixe = os.path.splitext(getattr(fichier, 'name', '') or '')[1]
+    descripteur, chemin = tempfile.mkstemp(prefix='import_', suffix=suffixe)
+    with os.fdopen(descripteur, 'wb') as destination:
+        if hasattr(fichier, 'chunks'):
+            for morceau in fichier.chunks():
+                destination.write(morceau)
+        else:
+            fichier.seek(0)
+            shutil.copyfileobj(fichier, destination)
+    return chemin
+
+
+def _executer_tache(pk: int, fonction: Callable, chemin: Optional[str]):
+    close_old_connections()
+    try:
+        executer(ImportLog.objects.get(pk=pk), fonction, chemin)
+    except Exception:
+        pass  # erreur enregistrée dans l'ImportLog par executer
+    finally:
+        if chemin and os.path.exists(chemin):
+            os.remove(chemin)
+        with _taches_lock:
+            _taches.pop(pk, None)
+        connection.close()
+
+
+def soumettre(import_log: ImportLog, fonction: Callable, fichier=None):
+    """Confie l'import au pool de tâches. Lève RuntimeError si la file est pleine
+    (l'ImportLog passe alors en erreur)."""
+    global _executor
+    with _taches_lock:
+        if len(_taches) >= IMPORT_TACHES_FILE_MAX:
+            import_log.statut = 'erreur'
+            import_log.erreurs = [{'erreur_generale': 'File des imports pleine'}]
+            import_log.date_fin = timezone.now()
+            import_log.save()
+            raise RuntimeError(f"File des imports pleine ({IMPORT_TACHES_FILE_MAX} en attente ou en cours), "
+                               f"réessayez plus tard")
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(IMPORT_TACHES_WORKERS, 1),
+                                           thread_name_prefix='import')
+        chemin = _copier(fichier) if fichier is not None else None
+        import_log.statut = 'en_attente'
+        import_log.date_maj = timezone.now()
+        import_log.save()
+        _taches[import_log.pk] = _executor.submit(_executer_tache, import_log.pk, fonction, chemin)
+
+
+def _orpheline(import_log: ImportLog) -> bool:
+    if import_log.statut not in STATUTS_ACTIFS:
+        return False
+    with _taches_lock:
+        if import_log.pk in _taches:
+            return False
+    derniere = import_log.date_maj or import_log.date_import
+    return derniere < timezone.now() - timedelta(seconds=IMPORT_TACHES_DELAI_ORPHELIN)
+
+
+def etat(import_log: ImportLog) -> Dict:
+    """Avancement d'un import : compteurs, vitesse, ETA, erreurs partielles, résultat"""
+    if _orpheline(import_log):
+        import_log.statut = 'interrompu'
+        import_log.date_fin = timezone.now()
+        import_log.save(update_fields=['statut', 'date_fin'])
+
+    actif = import_log.statut in STATUTS_ACTIFS
+    vitesse = eta = avancement = None
+    if import_log.date_debut is not None:
+        ecoule = ((import_log.date_fin or timezone.now()) - import_log.date_debut).total_seconds()
+        if ecoule > 0 and import_log.lignes_traitees:
+            vitesse = import_log.lignes_traitees / ecoule
+    if import_log.nombre_lignes:
+        avancement = min(import_log.lignes_traitees / import_log.nombre_lignes, 1.0) if actif else 1.0
+        if actif and vitesse:
+            eta = max(import_log.nombre_lignes - import_log.lignes_traitees, 0) / vitesse
+
+    def _iso(valeur):
+        return valeur.isoformat() if valeur else None
+
+    return {
+        'job_id': import_log.pk,
+        'type_import': import_log.type_import,
+        'nom_fichier': import_log.nom_fichier,
+        'statut': import_log.statut,
+        'termine': not actif,
+        'lignes_traitees': import_log.lignes_traitees,
+        'lignes_estimees': import_log.nombre_lignes or None,
+        'succes': import_log.nombre_succes,
+        'erreurs': import_log.nombre_erreurs,
+        'avancement': round(avancement, 4) if avancement is not None else None,
+        'lignes_par_seconde': round(vitesse, 1) if vitesse is not None else None,
+        'eta_secondes': round(eta, 1) if eta is not None else None,
+        'date_import': _iso(import_log.date_import),
+        'date_debut': _iso(import_log.date_debut),
+        'date_maj': _iso(import_log.date_maj),
+        'date_fin': _iso(import_log.date_fin),
+        'liste_erreurs': (import_log.erreurs or [])[:10],
+        # Résultat de l'import (partiel en cours de route pour la restauration)
+        'resultat': import_log.resultat,
+    }
@@ -0,0 +1,225 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+
+import numpy as np
+from django.db import DataError, connection
+from django.test import SimpleTestCase, TransactionTestCase
+
+from . import file_storage, outbox, rendements, sqlite_storage
+from .management.commands.storage_parity import scenario
+from .models import AssetCategory, Signaletique
+
+
+class PariteStockageTests(SimpleTestCase):
+    """Le scénario de storage_parity donne les mêmes résultats sur les moteurs JSON et SQLite"""
+
+    def setUp(self):
+        self.ancien_repertoire = file_storage.DATA_DIR
+        self.ancienne_base = sqlite_storage.SQLITE_PATH
+        self.repertoire = tempfile.mkdtemp()
+        file_storage.set_data_dir(os.path.join(self.repertoire, 'json'))
+        sqlite_storage.set_database_path(os.path.join(self.repertoire, 'sqlite', 'portfolio.sqlite3'))
+
+    def tearDown(self):
+        file_storage.set_data_dir(self.ancien_repertoire)
+        sqlite_storage.set_database_path(self.ancienne_base)
+        shutil.rmtree(self.repertoire, ignore_errors=True)
+
+    def test_scenario_identique(self):
+        attendu = scenario(file_storage)
+        obtenu = scenario(sqlite_storage)
+        self.assertEqual([nom for nom, _ in obtenu], [nom for nom, _ in attendu])
+        for (nom, valeur_json), (_, valeur_sqlite) in zip(attendu, obtenu):
+            with self.subTest(operation=nom):
+                self.assertEqual(valeur_sqlite, valeur_json)
+
+
+class VerrousTransactionsTests(SimpleTestCase):
+    """Ordre des verrous du stockage JSON : _journal_lock avant les verrous fcntl"""
+
+    def setUp(self):
+        self.ancien_repertoire = file_storage.DATA_DIR
+        self.repertoire = tempfile.mkdtemp()
+        self.interblocage = False
+        file_storage.set_data_dir(self.repertoire)
+
+    def tearDown(self):
+        if self.interblocage:
+            return  # _journal_lock reste pris par les threads bloqués
+        file_storage.set_data_dir(self.ancien_repertoire)
+        shutil.rmtree(self.repertoire, ignore_errors=True)
+
+    def test_lot_et_creation_concurrents_sans_interblocage(self):
+        iterations = 20
+        erreurs = []
+        acquerir = file_storage._acquire_lock
+
+        def acquerir_lentement(filepath, exclusive):
+            acquerir(filepath, exclusive)
+            if filepath == file_storage.TRANSACTIONS_FILE:
+                time.sleep(0.01)  # élargit la fenêtre entre verrou fcntl et _journal_lock
+
+        def creer(quantite):
+            return file_storage.create_transaction(1, 1, date(2024, 1, 2), 'achat', Decimal(quantite),
+                                                   Decimal('10'), isin='FR0000000001')
+
+        def executer(operation):
+            try:
+                for _ in range(iterations):
+                    operation()
+            except Exception as e:
+                erreurs.append(e)
+
+        def par_lot():
+            with file_storage.batch():
+                creer('1')
+
+        with mock.patch.object(file_storage, '_acquire_lock', acquerir_lentement):
+            threads = [threading.Thread(target=executer, args=(par_lot,), daemon=True),
+                       threading.Thread(target=executer, args=(lambda: creer('2'),), daemon=True)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=10)
+        self.interblocage = any(thread.is_alive() for thread in threads)
+
+        self.assertFalse(self.interblocage, "Interblocage entre un lot et une création de transaction")
+        self.assertEqual(erreurs, [])
+        self.assertEqual(len(file_storage.get_all_transactions()), 2 * iterations)
+
+
+class LotEcrivainConcurrentTests(SimpleTestCase):
+    """Un lot garde ses écritures et celles d'un écrivain concurrent"""
+
+    def setUp(self):
+        self.ancien_repertoire = file_storage.DATA_DIR
+        self.repertoire = tempfile.mkdtemp()
+        file_storage.set_data_dir(self.repertoire)
+
+    def tearDown(self):
+        file_storage.set_data_dir(self.ancien_repertoire)
+        shutil.rmtree(self.repertoire, ignore_errors=True)
+
+    def test_modification_et_creation_pendant_le_lot(self):
+        existante = file_storage.upsert_signaletique('A', 'FR0000000001', 'Titre initial')
+        pendant_le_lot = threading.Event()
+        termine = threading.Event()
+
+        def autre_ecrivain():
+            pendant_le_lot.wait()
+            file_storage.update_signaletique(existante['id'], {'titre': 'Modifié ailleurs'})
+            file_storage.upsert_signaletique('B', 'FR0000000002', 'Créé ailleurs')
+            termine.set()
+
+        thread = threading.Thread(target=autre_ecrivain, daemon=True)
+        thread.start()
+        with file_storage.batch():
+            for k in range(100):
+                file_storage.upsert_signaletique(f'C{k}', f'XS{k:010d}', f'Titre {k}')
+                if k == 50:
+                    pendant_le_lot.set()
+                    self.assertTrue(termine.wait(10))
+        thread.join(10)
+
+        file_storage.clear_cache()
+        sigs = file_storage.get_all_signaletiques()
+        self.assertEqual(len(sigs), 102)
+        self.assertEqual(len({s['id'] for s in sigs}), 102)
+        self.assertEqual(file_storage.get_signaletique_by_id(existante['id'])['titre'], 'Modifié ailleurs')
+        self.assertEqual(file_storage.get_signaletique_by_isin('XS0000000099')['titre'], 'Titre 99')
+
+    def test_element_modifie_des_deux_cotes(self):
+        existante = file_storage.upsert_signaletique('A', 'FR0000000001', 'Titre initial')
+        with file_storage.batch():
+            file_storage.update_signaletique(existante['id'], {'titre': 'Lot'})
+            thread = threading.Thread(
+                target=file_storage.update_signaletique, args=(existante['id'], {'titre': 'Autre'}), daemon=True
+            )
+            thread.start()
+            thread.join(10)
+        self.assertEqual(file_storage.get_signaletique_by_id(existante['id'])['titre'], 'Lot')
+
+
+class FacteursTwrTests(SimpleTestCase):
+    """TWR : achats en début de journée, ventes en fin de journée"""
+
+    def test_sortie_vente_partielle_et_nouvel_achat(self):
+        # Colonnes : sortie complète, vente partielle, achats en cours de période.
+        # Jour 1 : achat de 100 à 1 (sauf 3e colonne) ; jour 2 : clôture à 1,10 ;
+        # jour 3 : vente de tout / de la moitié à 1,09, ou nouvel achat de 100 à 1,10
+        # (clôture à 1,21).
+        valeurs = np.array([
+            [100.0, 100.0, 0.0],
+            [110.0, 110.0, 110.0],
+            [0.0, 54.5, 242.0],
+        ])
+        flux = np.array([
+            [100.0, 100.0, 0.0],
+            [0.0, 0.0, 100.0],
+            [-109.0, -54.5, 110.0],
+        ])
+        facteurs = rendements.facteurs_twr(valeurs, flux)
+        np.testing.assert_allclose(facteurs[-1], [1.09, 1.09, 1.21])
+        np.testing.assert_allclose(facteurs[:, 0], [1.0, 1.1, 1.09])
+
+    def test_sortie_au_dessus_de_la_cloture(self):
+        valeurs = np.array([[100.0], [110.0], [0.0], [0.0]])
+        flux = np.array([[100.0], [0.0], [-115.0], [0.0]])
+        facteurs = rendements.facteurs_twr(valeurs, flux)
+        np.testing.assert_allclose(facteurs[:, 0], [1.0, 1.1, 1.15, 1.15])
+
+
+class OutboxReferenceRefuseeTests(TransactionTestCase):
+    """Un nom de catégorie refusé par la base écarte ses événements sans bloquer la file"""
+
+    def setUp(self):
+        self.ancien_repertoire = file_storage.DATA_DIR
+        self.repertoire = tempfile.mkdtemp()
+        file_storage.set_data_dir(self.repertoire)
+        self.correctifs = [mock.patch.object(outbox, 'OUTBOX_FICHIER', None),
+                           mock.patch.object(outbox, 'demarrer', lambda: None)]
+        if connection.vendor != 'postgresql':
+            # Comme PostgreSQL : DataError si un nom dépasse max_length
+            bulk_create = AssetCategory.objects.bulk_create
+            longueur = AssetCategory._meta.get_field('name').max_length
+
+            def bulk_create_verifie(objets, *args, **kwargs):
+                if any(len(objet.name) > longueur for objet in objets):
+                    raise DataError('value too long for type character varying')
+                return bulk_create(objets, *args, **kwargs)
+            self.correctifs.append(mock.patch.object(AssetCategory.objects, 'bulk_create', bulk_create_verifie))
+        for correctif in self.correctifs:
+            correctif.start()
+
+    def tearDown(self):
+        for correctif in self.correctifs:
+            correctif.stop()
+        file_storage.set_data_dir(self.ancien_repertoire)
+        shutil.rmtree(self.repertoire, ignore_errors=True)
+
+    def test_categorie_trop_longue(self):
+        trop_longue = 'X' * 300
+        outbox.publier([
+            {'op': 'reference', 'origine': None, 'categorie': trop_longue, 'type_instrument': None},
+            {'op': 'signaletique', 'origine': None, 'type_instrument': None, 'creer': True, 'mettre_a_jour': True,
+             'valeurs': {'isin': 'FR0000000001', 'code': 'A', 'titre': 'Refusée', 'categorie': trop_longue}},
+            {'op': 'signaletique', 'origine': None, 'type_instrument': None, 'creer': True, 'mettre_a_jour': True,
+             'valeurs': {'isin': 'FR0000000002', 'code': 'B', 'titre': 'Acceptée', 'categorie': 'Actions'}},
+        ])
+
+        resultat = outbox.drainer()
+
+        self.assertEqual(resultat['appliques'], 3)
+        self.assertEqual(outbox.etat()['evenements_en_attente'], 0)
+        self.assertFalse(Signaletique.objects.filter(isin='FR0000000001').exists())
+        self.assertEqual(Signaletique.objects.get(isin='FR0000000002').categorie.name, 'Actions')
+        with open(outbox._chemin_rejets(), encoding='utf-8') as f:
+            rejets = [json.loads(ligne) for ligne in f]
+        self.assertEqual([r['op'] for r in rejets], ['reference', 'signaletique'])
@@ -19,10 +19,14 @@ urlpatterns = [
     
     # Routes d'administration (réservées aux superusers)
     path('admin/check-superuser/', admin_views.check_superuser, name='check_superuser'),
+    path('admin/synchro/outbox/', admin_views.synchro_outbox, name='synchro_outbox'),
+    path('admin/synchro/outbox/drain/', admin_views.synchro_outbox_drain, name='synchro_outbox_drain'),
+    path('admin/synchro/rapprochement/', admin_views.synchro_rapprochement, name='synchro_rapprochement'),
     path('admin/', include(admin_router.urls)),
     
     # Routes existantes
     path('health/', views.health_check, name='health_check'),
+    path('storage/stats/', views.storage_stats, name='storage_stats'),
     path('categories/', views.list_categories, name='list_categories'),
     path('instrument-types/', views.list_instrument_types, name='list_instrument_types'),
     path('import/signaletique/', views.import_signaletique, name='import_signaletique'),
@@ -31,11 +35,23 @@ urlpatterns = [
     path('signaletique/clear/', views.clear_signaletique, name='clear_signaletique'),
     path('signaletique/<int:pk>/', views.signaletique_detail, name='signaletique_detail'),
     path('import/logs/', views.import_logs, name='import_logs'),
+    path('import/jobs/', views.import_jobs, name='import_jobs'),
+    path('import/jobs/<int:pk>/', views.import_job_detail, name='import_job_detail'),
     path('target-portfolios/', views.list_target_portfolios, name='list_target_portfolios'),
     path('target-portfolios/<int:pk>/', views.target_portfolio_detail, name='target_portfolio_detail'),
+    path('target-portfolios/<int:pk>/exposure/', views.target_portfolio_exposure, name='target_portfolio_exposure'),
+    path('target-portfolios/<int:pk>/risk/', views.target_portfolio_risk, name='target_portfolio_risk'),
     path('real-portfolios/', views.list_real_portfolios, name='list_real_portfolios'),
+    path('real-portfolios/fifo-analysis/', views.portfolios_fifo_analysis, name='portfolios_fifo_analysis'),
+    path('real-portfolios/rebalance/', views.portfolios_rebalance, name='portfolios_rebalance'),
     path('real-portfolios/<int:pk>/', views.real_portfolio_detail, name='real_portfolio_detail'),
     path('real-portfolios/<int:pk>/fifo-analysis/', views.portfolio_fifo_analysis, name='portfolio_fifo_analysis'),
+    path('real-portfolios/<int:pk>/valuation/', views.portfolio_valuation, name='portfolio_valuation'),
+    path('real-portfolios/<int:pk>/exposure/', views.portfolio_exposure, name='portfolio_exposure'),
+    path('real-portfolios/<int:pk>/rebalance/', views.portfolio_rebalance, name='portfolio_rebalance'),
+    path('real-portfolios/<int:pk>/nav/', views.portfolio_nav, name='portfolio_nav'),
+    path('real-portfolios/<int:pk>/returns/', views.portfolio_returns, name='portfolio_returns'),
+    path('real-portfolios/<int:pk>/risk/', views.portfolio_risk, name='portfolio_risk'),
     path('cash/', views.list_cash, name='list_cash'),
     path('cash/<int:pk>/', views.cash_detail, name='cash_detail'),
     path('import/transactions/', views.import_transactions, name='import_transactions'),
@@ -48,6 +64,8 @@ urlpatterns = [
     path('import/bonobo/history/', views.get_bonobo_history, name='get_bonobo_history'),
     path('import/prix-startfiles/', views.import_prix_startfiles, name='import_prix_startfiles'),
     path('prix-historique/consolidate/', views.consolidate_prices, name='consolidate_prices'),
+    path('import/taux-change/', views.import_taux_change, name='import_taux_change'),
+    path('taux-change/', views.list_taux_change, name='list_taux_change'),
     path('prix-historique/', views.list_prix_historique, name='list_prix_historique'),
     path('prix-historique/<str:isin>/', views.titre_price_history, name='titre_price_history'),
     path('prix-historique/<str:isin>/entries/', views.add_prix_entry, name='add_prix_entry'),
@@ -0,0 +1,100 @@
+# Valorisation au prix de marché des positions ouvertes (format positions_actuelles
+# de l'analyse FIFO) : pour chaque position et chaque lot, dernier cours connu à la
+# date de valorisation (price_store.get_cours_a_date), valeur de marché, P&L latent
+# et ancienneté du cours.
+# Les obligations sont cotées en % (100 = 1), comme leurs prix d'achat : le cours
+# est divisé par 100 avant valorisation (fifo_engine.is_obligation).
+# Le cours est pris dans sa devise : si elle diffère de celle de la position,
+# 'devise_cours' le signale (pas de conversion à ce stade).
+
+import os
+from datetime import date
+from typing import Dict, List
+
+from . import price_store
+from .fifo_engine import is_obligation
+
+# Au-delà, le cours utilisé est signalé comme ancien (cours_ancien)
+VALORISATION_ANCIENNETE_MAX_JOURS = int(os.environ.get('VALORISATION_ANCIENNETE_MAX_JOURS', '7'))
+
+
+def _valoriser(position: Dict, cours: Dict, jour: int) -> Dict:
+    diviseur = 100 if is_obligation(position.get('categorie'), position.get('type_instrument')) else 1
+    cours_reel = cours['cours'] / diviseur
+    valeur_marche = position['quantite'] * cours_reel
+    pnl_latent = valeur_marche - position['valeur']
+    anciennete = jour - cours['jour']
+    return {
+        **position,
+        'cours': cours['cours'],
+        'date_cours': cours['date'],
+        'devise_cours': cours['devise'],
+        'anciennete_jours': anciennete,
+        'cours_ancien': anciennete > VALORISATION_ANCIENNETE_MAX_JOURS,
+        'valeur_marche': valeur_marche,
+        'pnl_latent': pnl_latent,
+        'pnl_latent_pct': pnl_latent / position['valeur'] * 100 if position['valeur'] else None,
+        'lots': [
+            {
+                **lot,
+                'valeur_marche': lot['quantite'] * cours_reel,
+                'pnl_latent': lot['quantite'] * (cours_reel - lot['prix_unitaire'] / diviseur),
+            }
+            for lot in position.get('lots', [])
+        ],
+    }
+
+
+def _sans_cours(position: Dict) -> Dict:
+    return {
+        **position,
+        'cours': None,
+        'date_cours': None,
+        'devise_cours': None,
+        'anciennete_jours': None,
+        'cours_ancien': None,
+        'valeur_marche': None,
+        'pnl_latent': None,
+        'pnl_latent_pct': None,
+        'lots': [{**lot, 'valeur_marche': None, 'pnl_latent': None} for lot in position.get('lots', [])],
+    }
+
+
+def valoriser_positions(positions: List[Dict], date_valorisation=None, engine=None) -> Dict:
+    """Valorise les positions au dernier cours connu à date_valorisation (aujourd'hui par défaut).
+
+    Retourne {date_valorisation, positions, totaux} ; totaux par devise de position
+    (valeur_achat, valeur_marche, pnl_latent sur les positions cotées) et liste des
+    ISIN sans cours.
+    """
+    date_valorisation = date_valorisation or date.today()
+    jour = price_store.date_vers_jour(date_valorisation)
+    if jour is None:
+        raise ValueError(f"Date de valorisation invalide : {date_valorisation!r}")
+    cours_par_isin = price_store.get_cours_a_date({p['isin'] for p in positions}, jour, engine)
+
+    valorisees = []
+    totaux: Dict[str, Dict] = {}
+    sans_cours = []
+    for position in positions:
+        cours = cours_par_isin.get(position['isin'])
+        if cours is None:
+            valorisees.append(_sans_cours(position))
+            sans_cours.append(position['isin'])
+            continue
+        valorisee = _valoriser(position, cours, jour)
+        valorisees.append(valorisee)
+        total = totaux.setdefault(position['devise'], {'valeur_achat': 0.0, 'valeur_marche': 0.0, 'pnl_latent': 0.0})
+        total['valeur_achat'] += position['valeur']
+        total['valeur_marche'] += valorisee['valeur_marche']
+        total['pnl_latent'] += valorisee['pnl_latent']
+
+    return {
+        'date_valorisation': price_store.jour_vers_date(jour).isoformat(),
+        'positions': valorisees,
+        'totaux': {
+            'par_devise': totaux,
+            'positions_valorisees': len(positions) - len(sans_cours),
+            'sans_cours': sans_cours,
+        },
+    }
@@ -8,6 +8,7 @@ from django.db import models
 import openpyxl
 import pandas as pd
 import csv
+import json
 import os
 from datetime import date, datetime
 from decimal import Decimal
@@ -21,13 +22,20 @@ from .serializers import (
     TransactionSerializer,
     CashSerializer
 )
-from . import file_storage
+from .storage import engine as file_storage
+from . import classeur, expositions, fifo, fx, nav, outbox, reequilibrage, rendements, risque, taches, valorisation
 
 @api_view(['GET'])
 def health_check(request):
     return Response({'status': 'ok', 'message': 'Portfolio API is running'})
 
 
+@api_view(['GET'])
+def storage_stats(request):
+    """Statistiques du stockage : volumes, cache et journal (JSON) ou base (SQLite)"""
+    return Response(file_storage.get_data_stats())
+
+
 @api_view(['GET'])
 def list_categories(request):
     """Liste toutes les catégories d'actifs disponibles"""
@@ -60,67 +68,60 @@ def list_instrument_types(request):
     ])
 
 
-@api_view(['POST'])
-@parser_classes([MultiPartParser, FormParser])
-def import_signaletique(request):
-    """Import des données de signalétique depuis un fichier Excel"""
-    
-    if 'file' not in request.FILES:
-        return Response(
-            {'error': 'Aucun fichier fourni'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
-    
-    file = request.FILES['file']
-    
-    # Vérifier l'extension
-    if not file.name.endswith(('.xlsx', '.xls')):
-        return Response(
-            {'error': 'Format de fichier non supporté. Utilisez .xlsx ou .xls'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
-    
-    # Créer un log d'import
-    import_log = ImportLog.objects.create(
-        type_import='signaletique',
-        nom_fichier=file.name,
-        statut='en_cours'
-    )
-    
-    try:
-        # Lire le fichier Excel
-        wb = openpyxl.load_workbook(file)
-        ws = wb.active
-        
-        # Récupérer les en-têtes (première ligne)
-        headers = [cell.value for cell in ws[1]]
-        
-        nombre_succes = 0
-        nombre_erreurs = 0
-        nombre_ignores = 0
-        erreurs = []
+def _arriere_plan(request) -> bool:
+    valeur = request.query_params.get('arriere_plan') or request.data.get('arriere_plan')
+    return str(valeur).strip().lower() in ('1', 'true', 'oui')
 
-        rows = list(ws.iter_rows(min_row=2, values_only=True))
 
-        def sanitize_value(value):
-            if isinstance(value, (datetime, date)):
-                return value.isoformat()
-            return value
+def _lancer_import(request, import_log, fonction, fichier=None):
+    """Exécute l'import dans la requête, ou en tâche de fond avec arriere_plan=1 :
+    réponse 202 avec l'id de la tâche, à suivre sur /api/import/jobs/<id>/"""
+    if _arriere_plan(request):
+        try:
+            taches.soumettre(import_log, fonction, fichier)
+        except RuntimeError as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({
+            'job_id': import_log.id,
+            'statut': import_log.statut,
+            'url': f'/api/import/jobs/{import_log.id}/',
+        }, status=status.HTTP_202_ACCEPTED)
+    try:
+        return Response(taches.executer(import_log, fonction, fichier))
+    except Exception as e:
+        return Response(
+            {'error': f'Erreur lors de l\'import: {str(e)}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
 
-        # Ne rien supprimer ni désactiver - l'import crée ou met à jour uniquement
-        # Les signalétiques non présentes dans le fichier restent inchangées
 
-        # Parcourir les lignes (à partir de la ligne 2)
-        for row_idx, row in enumerate(rows, start=2):
+def _importer_signaletique(fichier, import_log, progression):
+    """Import de la signalétique (exécuté par taches.executer)"""
+    def sanitize_value(value):
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        return value
+
+    # Lire le fichier Excel en continu (en-têtes = première ligne)
+    feuille = classeur.Feuille(fichier, entetes_texte=False, convertir=sanitize_value)
+    progression.estimer(feuille.lignes_estimees)
+    headers = feuille.entetes
+
+    nombre_succes = 0
+    nombre_erreurs = 0
+    nombre_ignores = 0
+    erreurs = []
+
+    # Ne rien supprimer ni désactiver - l'import crée ou met à jour uniquement
+    # Les signalétiques non présentes dans le fichier restent inchangées
+
+    # Parcourir les lignes (à partir de la ligne 2)
+    # Double-write vers PostgreSQL (compatibilité FK résiduelle) via la file de synchro,
+    # publiée une fois le lot JSON validé
+    with feuille, outbox.lot_signaletiques(origine="l'import") as lot, file_storage.batch():
+        for row_idx, row_data in feuille:
+            progression.avancer(feuille.lignes_totales, nombre_succes, nombre_erreurs, erreurs)
             try:
-                if not any(cell is not None and str(cell).strip() != '' for cell in row):
-                    continue
-                # Créer un dictionnaire avec les données de la ligne
-                row_data = {
-                    header: sanitize_value(value)
-                    for header, value in zip(headers, row)
-                }
-                
                 # Extraire les champs principaux (mapping adapté à Signalétique.xlsx)
                 # Colonnes principales reconnaissables
                 isin_raw = (
@@ -131,7 +132,7 @@ def import_signaletique(request):
                 isin_value = str(isin_raw).strip().upper() if isin_raw is not None else None
                 if isin_value == "":
                     isin_value = None
-                
+
                 # Validation de l'ISIN (doit avoir 12 caractères)
                 if isin_value and len(isin_value) != 12:
                     erreurs.append({
@@ -140,25 +141,25 @@ def import_signaletique(request):
                     })
                     nombre_erreurs += 1
                     continue
-                
+
                 # Code généré à partir de ISIN ou auto-incrémenté
                 if isin_value:
                     code = f"SIG_{isin_value}"
                 else:
                     code = f"AUTO_{row_idx}"
-                
+
                 titre = row_data.get('Nom') or ""
-                
+
                 description = (
                     row_data.get('Description') or 
                     row_data.get('description') or 
                     ""
                 )
-                
+
                 categorie = row_data.get('Classe d\'actifs') or ""
-                
+
                 statut_data = row_data.get('Type d\'instr') or ""
-                
+
                 # Gérer la catégorie d'actifs (on conserve juste le texte)
                 categorie_text = str(categorie).strip().capitalize() if categorie and str(categorie).strip() else None
 
@@ -173,81 +174,89 @@ def import_signaletique(request):
                     donnees_supplementaires=row_data
                 )
 
-                # Double-write vers PostgreSQL pour compatibilité FK résiduelle
-                categorie_instance = None
-                if categorie_text:
-                    categorie_instance, _ = AssetCategory.objects.get_or_create(
-                        name=categorie_text,
-                        defaults={'description': 'Catégorie créée automatiquement lors de l\'import'}
-                    )
-
-                # Créer automatiquement le type d'instrument si nouveau
-                statut_normalized = str(statut_data).strip().capitalize() if statut_data and str(statut_data).strip() else None
-                if statut_normalized:
-                    InstrumentType.objects.get_or_create(
-                        name__iexact=statut_normalized,
-                        defaults={'name': statut_normalized, 'description': 'Créé automatiquement lors de l\'import'}
-                    )
-
+                # Double-write vers PostgreSQL (catégorie et type d'instrument créés si nouveaux)
                 db_defaults = {
                     'code': str(code),
                     'isin': isin_value,
                     'titre': str(titre)[:500],
                     'description': str(description) if description else None,
-                    'categorie': categorie_instance,
+                    'categorie': categorie_text,
                     'categorie_text': categorie_text,
                     'statut': str(statut_data)[:100] if statut_data else None,
                     'donnees_supplementaires': row_data
                 }
 
                 if not isin_value and not str(titre).strip():
+                    lot.referencer(categorie=categorie_text, type_instrument=statut_data)
                     continue
 
-                if isin_value:
-                    Signaletique.objects.update_or_create(isin=isin_value, defaults=db_defaults)
-                else:
-                    Signaletique.objects.update_or_create(code=str(code), defaults=db_defaults)
-                
+                lot.ajouter(db_defaults, ligne=row_idx, type_instrument=statut_data)
+
                 nombre_succes += 1
-                
+
             except Exception as e:
                 nombre_erreurs += 1
                 erreurs.append({
                     'ligne': row_idx,
                     'erreur': str(e)
                 })
-        
-        # Mettre à jour le log
-        import_log.nombre_lignes = ws.max_row - 1
-        import_log.nombre_succes = nombre_succes
-        import_log.nombre_erreurs = nombre_erreurs
-        import_log.erreurs = erreurs if erreurs else None
-        import_log.statut = 'termine' if nombre_erreurs == 0 else 'termine_avec_erreurs'
-        import_log.save()
-        
-        return Response({
-            'success': True,
-            'message': f'Import terminé avec succès',
-            'details': {
-                'fichier': file.name,
-                'colonnes_detectees': headers,
-                'lignes_totales': ws.max_row - 1,
-                'succes': nombre_succes,
-                'erreurs': nombre_erreurs,
-                'ignores': nombre_ignores,
-                'liste_erreurs': erreurs[:10] if erreurs else []  # Limiter à 10 erreurs
-            }
-        })
-        
-    except Exception as e:
-        import_log.statut = 'erreur'
-        import_log.erreurs = [{'erreur_generale': str(e)}]
-        import_log.save()
-        
+
+    # Lignes refusées par la base lors de l'écriture groupée
+    nombre_succes -= len(lot.erreurs)
+    nombre_erreurs += len(lot.erreurs)
+    erreurs.extend(lot.erreurs)
+
+    # Mettre à jour le log
+    import_log.nombre_lignes = feuille.lignes_totales
+    import_log.nombre_succes = nombre_succes
+    import_log.nombre_erreurs = nombre_erreurs
+    import_log.erreurs = erreurs if erreurs else None
+    import_log.statut = 'termine' if nombre_erreurs == 0 else 'termine_avec_erreurs'
+    import_log.save()
+
+    return {
+        'success': True,
+        'message': f'Import terminé avec succès',
+        'details': {
+            'fichier': import_log.nom_fichier,
+            'colonnes_detectees': headers,
+            'lignes_totales': feuille.lignes_totales,
+            'succes': nombre_succes,
+            'erreurs': nombre_erreurs,
+            'ignores': nombre_ignores,
+            'liste_erreurs': erreurs[:10] if erreurs else []  # Limiter à 10 erreurs
+        }
+    }
+
+
+@api_view(['POST'])
+@parser_classes([MultiPartParser, FormParser])
+def import_signaletique(request):
+    """Import des données de signalétique depuis un fichier Excel"""
+    
+    if 'file' not in request.FILES:
         return Response(
-            {'error': f'Erreur lors de l\'import: {str(e)}'},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            {'error': 'Aucun fichier fourni'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    file = request.FILES['file']
+    
+    # Vérifier l'extension
+    if not file.name.endswith(('.xlsx', '.xls')):
+        return Response(
+            {'error': 'Format de fichier non supporté. Utilisez .xlsx ou .xls'},
+            status=status.HTTP_400_BAD_REQUEST
         )
+    
+    # Créer un log d'import
+    import_log = ImportLog.objects.create(
+        type_import='signaletique',
+        nom_fichier=file.name,
+        statut='en_cours'
+    )
+    
+    return _lancer_import(request, import_log, _importer_signaletique, file)
 
 
 @api_view(['GET', 'POST'])
@@ -285,8 +294,6 @@ def list_signaletique(request):
                 cat_name = cat_name or cat.name
             except (AssetCategory.DoesNotExist, TypeError, ValueError):
                 pass
-        if not cat and cat_name:
-            cat, _ = AssetCategory.objects.get_or_create(name=cat_name)
 
         sig_dict = file_storage.upsert_signaletique(
             code=code, isin=isin, titre=titre,
@@ -298,19 +305,17 @@ def list_signaletique(request):
             source_prix=source_prix, date_cours=date_cours,
             frequence_coupon=frequence_coupon,
         )
-        # Double-write DB
+        # Double-write DB (catégorie créée si nouvelle)
         db_defaults = {'code': code, 'isin': isin, 'titre': titre,
                        'description': request.data.get('description'),
-                       'categorie': cat, 'categorie_text': cat_name,
+                       'categorie': cat or cat_name, 'categorie_text': cat_name,
                        'statut': request.data.get('statut'),
                        'donnees_supplementaires': request.data.get('donnees_supplementaires'),
                        'prix': prix, 'devise_prix': devise_prix,
                        'source_prix': source_prix, 'date_cours': date_cours,
                        'frequence_coupon': frequence_coupon}
-        if isin:
-            Signaletique.objects.update_or_create(isin=isin, defaults=db_defaults)
-        else:
-            Signaletique.objects.update_or_create(code=code, defaults=db_defaults)
+        with outbox.lot_signaletiques() as lot:
+            lot.ajouter(db_defaults)
         # Si un prix + une date sont fournis, créer une entrée dans l'historique
         if prix is not None and date_cours and isin:
             entry = {
@@ -387,15 +392,15 @@ def import_koala(request):
         return Response({'error': 'Format non supporté. Utilisez .xlsx ou .xls'}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        wb = openpyxl.load_workbook(uploaded, data_only=True)
-        # On lit la première feuille (Positions)
-        ws = wb.active
+        # On lit la première feuille (Positions), en continu
+        lignes = classeur.lignes_brutes(uploaded)
+        next(lignes, None)  # en-têtes
 
         date_import = date.today().isoformat()
         rows_to_add = []
         ignores = 0
 
-        for i, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
+        for i, row in enumerate(lignes, start=2):
             # col D = index 3, col H = index 7
             symbole = row[3] if len(row) > 3 else None
             cours = row[7] if len(row) > 7 else None
@@ -541,11 +546,11 @@ def import_prix_startfiles(request):
     if xlsx_files:
         xlsx_path = xlsx_files[-1]  # le plus récent (tri alphabétique)
         try:
-            wb = openpyxl.load_workbook(xlsx_path, data_only=True)
-            ws = wb.active
+            lignes = classeur.lignes_brutes(xlsx_path)
+            next(lignes, None)  # en-têtes
             rows_to_add = []
             ignores_k = 0
-            for row in ws.iter_rows(min_row=2, values_only=True):
+            for row in lignes:
                 symbole = row[3] if len(row) > 3 else None
                 cours   = row[7] if len(row) > 7 else None
                 if symbole is None or cours is None:
@@ -610,9 +615,9 @@ def import_prix_startfiles(request):
     else:
         rapport['bonobo'] = {'info': 'Aucun fichier .csv trouvé dans Start Files'}
 
-    # ── Consolidation ─────────────────────────────────────────────────────────
+    # ── Consolidation (incrémentale : seuls les cours importés sont fusionnés) ──
     try:
-        stats_c = file_storage.rebuild_prix_historique_titres()
+        stats_c = file_storage.rebuild_prix_historique_titres(incremental=True)
         rapport['consolidation'] = stats_c
     except Exception as e:
         rapport['consolidation'] = {'error': str(e)}
@@ -637,11 +642,111 @@ def get_bonobo_history(request):
     return Response(historique)
 
 
+# ---------------------------------------------------------------------------
+# Taux de change – fichier .xlsx ou .csv (;) : Date, Devise base, Devise cotation, Taux
+# ---------------------------------------------------------------------------
+
+TAUX_CHANGE_COLONNES = {
+    'date': ('date',),
+    'devise_base': ('devise base', 'devise_base', 'base'),
+    'devise_cotation': ('devise cotation', 'devise_cotation', 'cotation'),
+    'taux': ('taux', 'cours'),
+}
+
+
+@api_view(['POST'])
+@parser_classes([MultiPartParser, FormParser])
+def import_taux_change(request):
+    """
+    Import de l'historique des taux de change (POST /api/import/taux-change/).
+    Une ligne par (date, paire) : 1 Devise base = Taux Devise cotation.
+    Un taux existant à la même date est remplacé.
+    """
+    if 'file' not in request.FILES:
+        return Response({'error': 'Aucun fichier fourni'}, status=status.HTTP_400_BAD_REQUEST)
+
+    uploaded = request.FILES['file']
+    nom = uploaded.name.lower()
+    if not nom.endswith(('.xlsx', '.xls', '.csv')):
+        return Response({'error': 'Format non supporté. Utilisez .xlsx, .xls ou .csv'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        if nom.endswith('.csv'):
+            import io
+            content = uploaded.read().decode('utf-8-sig', errors='replace')
+            lignes = csv.reader(io.StringIO(content), delimiter=';')
+        else:
+            lignes = classeur.lignes_brutes(uploaded)
+
+        entetes = [str(h or '').strip().lower() for h in next(lignes, [])]
+        positions = {}
+        for champ, noms in TAUX_CHANGE_COLONNES.items():
+            trouvees = [i for i, entete in enumerate(entetes) if entete in noms]
+            if not trouvees:
+                return Response({'error': f"Colonne manquante : {noms[0].capitalize()}"},
+                                status=status.HTTP_400_BAD_REQUEST)
+            positions[champ] = trouvees[0]
+
+        rows_to_add = []
+        for ligne in lignes:
+            row = {champ: (ligne[i] if i < len(ligne) else None) for champ, i in positions.items()}
+            if isinstance(row['date'], (datetime, date)):
+                row['date'] = row['date'].isoformat()
+            if isinstance(row['taux'], str):
+                row['taux'] = row['taux'].strip().replace(',', '.')
+            rows_to_add.append(row)
+
+        stats = file_storage.append_taux_change(rows_to_add)
+        return Response({
+            'success': True,
+            'message': f"Import des taux de change terminé : {stats['ajoutes']} taux importés",
+            'details': {
+                'fichier': uploaded.name,
+                'ajoutes': stats['ajoutes'],
+                'ignores': stats['ignores'],
+            }
+        })
+
+    except Exception as e:
+        return Response({'error': f"Erreur lors de l'import des taux de change : {str(e)}"},
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+def list_taux_change(request):
+    """
+    Paires de devises disponibles (GET /api/taux-change/) : nombre de taux, première et
+    dernière date, dernier taux. ?paire=EUR/USD retourne l'historique complet de la paire.
+    """
+    historique = file_storage.get_taux_change()
+    paire = request.query_params.get('paire')
+    if paire:
+        points = historique.get(paire.upper())
+        if points is None:
+            return Response({'error': f"Aucun taux pour {paire}"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'paire': paire.upper(), 'taux': dict(sorted(points.items()))})
+    resume = []
+    for paire, points in sorted(historique.items()):
+        dates = sorted(points)
+        resume.append({'paire': paire, 'nombre': len(dates), 'premiere_date': dates[0] if dates else None,
+                       'derniere_date': dates[-1] if dates else None,
+                       'dernier_taux': points[dates[-1]] if dates else None})
+    return Response(resume)
+
+
 @api_view(['POST'])
 def consolidate_prices(request):
-    """Consolide Koala + Bonobo → prix_historique_titres.json (POST /api/prix-historique/consolidate/)"""
+    """
+    Consolide Koala + Bonobo → historique par titre (POST /api/prix-historique/consolidate/).
+    Incrémental par défaut ; ?mode=complet reconstruit tout l'historique consolidé.
+    """
+    mode = request.query_params.get('mode') or request.data.get('mode') or 'incremental'
+    if mode not in ('incremental', 'complet'):
+        return Response({'error': "mode doit valoir 'incremental' ou 'complet'"},
+                        status=status.HTTP_400_BAD_REQUEST)
     try:
-        stats = file_storage.rebuild_prix_historique_titres()
+        stats = file_storage.rebuild_prix_historique_titres(incremental=(mode == 'incremental'))
         return Response({
             'success': True,
             'message': (
@@ -670,25 +775,17 @@ def titre_price_history(request, isin):
 @api_view(['GET'])
 def list_prix_historique(request):
     """Liste tous les ISIN ayant un historique de prix (GET /api/prix-historique/)."""
-    titres = file_storage.get_prix_historique_titres()
+    # Le manifeste suffit : les historiques complets ne sont pas chargés
+    manifest = file_storage.get_prix_titres_manifest()
     result = []
-    for isin, data in sorted(titres.items()):
+    for isin, stats in sorted(manifest.items()):
         result.append({
             'isin': isin,
-            'nom': data.get('nom', isin),
-            'devise_ref': data.get('devise_ref', 'EUR'),
-            'nb_entrees': len(data.get('historique') or []),
-            'derniere_date': max(
-                (e.get('date') or '' for e in (data.get('historique') or [])),
-                default=None
-            ),
-            'dernier_cours': next(
-                (e.get('cours') for e in sorted(
-                    data.get('historique') or [],
-                    key=lambda x: x.get('date') or '',
-                    reverse=True
-                )), None
-            ),
+            'nom': stats.get('nom', isin),
+            'devise_ref': stats.get('devise_ref', 'EUR'),
+            'nb_entrees': stats.get('nb_entrees', 0),
+            'derniere_date': stats.get('derniere_date'),
+            'dernier_cours': stats.get('dernier_cours'),
         })
     return Response(result)
 
@@ -781,23 +878,18 @@ def import_prix_titre(request, isin):
     if not f.name.lower().endswith(('.xlsx', '.xls')):
         return Response({'error': 'Format non supporté. Utilisez .xlsx ou .xls'}, status=status.HTTP_400_BAD_REQUEST)
     try:
-        wb = openpyxl.load_workbook(f, data_only=True)
-        ws = wb.active
-        headers = [str(cell.value or '').strip() for cell in ws[1]]
         rows = []
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if not any(c is not None and str(c).strip() != '' for c in row):
-                continue
-            row_dict = {h: v for h, v in zip(headers, row)}
-            # Normaliser la date si c'est un objet datetime/date
-            d = row_dict.get('Date') or row_dict.get('date')
-            if d is not None:
-                from datetime import datetime as _dt, date as _date
-                if isinstance(d, (_dt, _date)):
-                    row_dict['date'] = d.isoformat() if hasattr(d, 'isoformat') else str(d)
-                else:
-                    row_dict['date'] = str(d).strip()
-            rows.append(row_dict)
+        with classeur.Feuille(f) as feuille:
+            for _, row_dict in feuille:
+                # Normaliser la date si c'est un objet datetime/date
+                d = row_dict.get('Date') or row_dict.get('date')
+                if d is not None:
+                    from datetime import datetime as _dt, date as _date
+                    if isinstance(d, (_dt, _date)):
+                        row_dict['date'] = d.isoformat() if hasattr(d, 'isoformat') else str(d)
+                    else:
+                        row_dict['date'] = str(d).strip()
+                rows.append(row_dict)
         sig = file_storage.get_signaletique_by_isin(isin)
         stats = file_storage.import_prix_titre_from_rows(isin, rows, sig=sig)
         return Response({'success': True, 'isin': isin, **stats})
@@ -1029,20 +1121,14 @@ def backup_all_data(request):
     })
 
 
-@api_view(['POST'])
-def restore_all_data(request):
-    """Restaure toutes les données depuis les fichiers les plus récents de /app/sauvegarde/.
-    Ordre : signalétique → transactions → cash → portefeuilles cibles → utilisateurs.
-    Réservé aux superusers.
-    """
-    if not request.user.is_superuser:
-        return Response({'error': 'Réservé aux superusers'}, status=status.HTTP_403_FORBIDDEN)
-
+def _restaurer(fichier, import_log, progression):
+    """Restauration de toutes les données (exécutée par taches.executer)"""
     import glob
     from django.contrib.auth.models import User as DjangoUser
 
     SAUVEGARDE_DIR = '/app/startfiles'
     results = {}
+    progression.estimer(7)  # une « ligne » par section restaurée
 
     def latest_file(prefix):
         files = sorted(glob.glob(os.path.join(SAUVEGARDE_DIR, f'{prefix}_*.xlsx')))
@@ -1065,8 +1151,9 @@ def restore_all_data(request):
         snap_pf_file = os.path.join(SAUVEGARDE_DIR, latest_snap, 'portfolios.json')
         if os.path.exists(snap_pf_file):
             try:
-                pf_data = file_storage._read_json_file(snap_pf_file, [])
-                file_storage._write_json_file(file_storage.PORTFOLIOS_FILE, pf_data)
+                with open(snap_pf_file, 'r', encoding='utf-8') as f:
+                    pf_data = json.load(f)
+                file_storage.replace_all_portfolios(pf_data)
                 results['portefeuilles'] = {
                     'succes': len(pf_data), 'erreurs': 0,
                     'source': f'snapshot JSON ({latest_snap})',
@@ -1084,35 +1171,31 @@ def restore_all_data(request):
         pf_xlsx_path = latest_file('portefeuilles')
         if pf_xlsx_path:
             try:
-                wb = openpyxl.load_workbook(pf_xlsx_path)
-                ws = wb.active
-                headers_pf = [str(c.value or '').strip() for c in ws[1]]
+                feuille = classeur.Feuille(pf_xlsx_path)
                 succes_pf = 0
                 erreurs_pf = []
-                for row_idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-                    if not any(c is not None and str(c).strip() != '' for c in row):
-                        continue
-                    row_data = {h: v for h, v in zip(headers_pf, row)}
-                    nom = str(row_data.get('Nom') or '').strip()
-                    if not nom:
-                        erreurs_pf.append(f"Ligne {row_idx}: nom manquant")
-                        continue
-                    pf_fields = {
-                        'description':    str(row_data.get('Description') or '') or None,
-                        'type_compte':    str(row_data.get('Type') or '') or None,
-                        'courtier':       str(row_data.get('Courtier') or '') or None,
-                        'devise':         str(row_data.get('Devise') or 'EUR'),
-                        'date_ouverture': str(row_data.get('Date ouverture') or '') or None,
-                        'couleur':        str(row_data.get('Couleur') or '') or None,
-                    }
-                    # Mémoriser pour les créations à la volée dans les sections suivantes
-                    portfolio_meta_ref[nom] = pf_fields
-                    existing = file_storage.get_portfolio_by_name(nom)
-                    if existing:
-                        file_storage.update_portfolio(existing['id'], pf_fields)
-                    else:
-                        file_storage.create_portfolio(name=nom, **pf_fields)
-                    succes_pf += 1
+                with file_storage.batch():
+                    for row_idx, row_data in feuille:
+                        nom = str(row_data.get('Nom') or '').strip()
+                        if not nom:
+                            erreurs_pf.append(f"Ligne {row_idx}: nom manquant")
+                            continue
+                        pf_fields = {
+                            'description':    str(row_data.get('Description') or '') or None,
+                            'type_compte':    str(row_data.get('Type') or '') or None,
+                            'courtier':       str(row_data.get('Courtier') or '') or None,
+                            'devise':         str(row_data.get('Devise') or 'EUR'),
+                            'date_ouverture': str(row_data.get('Date ouverture') or '') or None,
+                            'couleur':        str(row_data.get('Couleur') or '') or None,
+                        }
+                        # Mémoriser pour les créations à la volée dans les sections suivantes
+                        portfolio_meta_ref[nom] = pf_fields
+                        existing = file_storage.get_portfolio_by_name(nom)
+                        if existing:
+                            file_storage.update_portfolio(existing['id'], pf_fields)
+                        else:
+                            file_storage.create_portfolio(name=nom, **pf_fields)
+                        succes_pf += 1
                 results['portefeuilles'] = {
                     'succes': succes_pf, 'erreurs': len(erreurs_pf),
                     'source': f'Excel ({os.path.basename(pf_xlsx_path)})',
@@ -1123,13 +1206,13 @@ def restore_all_data(request):
         else:
             results['portefeuilles'] = {'info': 'Aucune source disponible (ni snapshot JSON ni portefeuilles_*.xlsx)'}
 
+    progression.avancer(1, 0, 0, resultat={'details': results}, force=True)
+
     # ── 1. SIGNALÉTIQUE ──────────────────────────────────────────────────────
     sig_path = latest_file('signaletique')
     if sig_path:
         try:
-            wb = openpyxl.load_workbook(sig_path)
-            ws = wb.active
-            headers = [cell.value for cell in ws[1]]
+            feuille = classeur.Feuille(sig_path, entetes_texte=False)
             succes = 0
             erreurs_list = []
 
@@ -1138,117 +1221,107 @@ def restore_all_data(request):
                     return value.isoformat()
                 return value
 
-            for row_idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-                if not any(c is not None and str(c).strip() != '' for c in row):
-                    continue
-                row_data = {h: _sanitize_sig(v) for h, v in zip(headers, row)}
-                isin_raw = row_data.get('Isin') or row_data.get('ISIN') or row_data.get('isin')
-                isin_value = str(isin_raw).strip().upper() if isin_raw else None
-                if not isin_value:
-                    isin_value = None
-                if isin_value and len(isin_value) != 12:
-                    erreurs_list.append(f"Ligne {row_idx}: ISIN invalide ({isin_value})")
-                    continue
-                code = f"SIG_{isin_value}" if isin_value else f"AUTO_{row_idx}"
-                titre = row_data.get('Nom') or ''
-                categorie_text = str(row_data.get("Classe d'actifs") or '').strip().capitalize() or None
-                statut_data = str(row_data.get("Type d'instr") or '')
-                sig_dict = file_storage.upsert_signaletique(
-                    code=str(code), isin=isin_value, titre=str(titre)[:500],
-                    categorie_text=categorie_text,
-                    statut=statut_data[:100] if statut_data else None,
-                    donnees_supplementaires=row_data,
-                )
-                categorie_instance = None
-                if categorie_text:
-                    categorie_instance, _ = AssetCategory.objects.get_or_create(
-                        name=categorie_text,
-                        defaults={'description': 'Catégorie créée automatiquement lors de la restauration'},
-                    )
-                statut_normalized = str(statut_data).strip().capitalize() if statut_data and str(statut_data).strip() else None
-                if statut_normalized:
-                    InstrumentType.objects.get_or_create(
-                        name__iexact=statut_normalized,
-                        defaults={'name': statut_normalized, 'description': 'Créé automatiquement lors de la restauration'}
+            with outbox.lot_signaletiques(origine='la restauration') as lot, file_storage.batch():
+                for row_idx, row in feuille:
+                    row_data = {h: _sanitize_sig(v) for h, v in row.items()}
+                    isin_raw = row_data.get('Isin') or row_data.get('ISIN') or row_data.get('isin')
+                    isin_value = str(isin_raw).strip().upper() if isin_raw else None
+                    if not isin_value:
+                        isin_value = None
+                    if isin_value and len(isin_value) != 12:
+                        erreurs_list.append(f"Ligne {row_idx}: ISIN invalide ({isin_value})")
+                        continue
+                    code = f"SIG_{isin_value}" if isin_value else f"AUTO_{row_idx}"
+                    titre = row_data.get('Nom') or ''
+                    categorie_text = str(row_data.get("Classe d'actifs") or '').strip().capitalize() or None
+                    statut_data = str(row_data.get("Type d'instr") or '')
+                    sig_dict = file_storage.upsert_signaletique(
+                        code=str(code), isin=isin_value, titre=str(titre)[:500],
+                        categorie_text=categorie_text,
+                        statut=statut_data[:100] if statut_data else None,
+                        donnees_supplementaires=row_data,
                     )
-                if not isin_value and not str(titre).strip():
-                    continue
-                db_defaults = {
-                    'code': str(code), 'isin': isin_value, 'titre': str(titre)[:500],
-                    'categorie': categorie_instance, 'categorie_text': categorie_text,
-                    'statut': statut_data[:100] if statut_data else None,
-                    'donnees_supplementaires': row_data,
-                }
-                if isin_value:
-                    Signaletique.objects.update_or_create(isin=isin_value, defaults=db_defaults)
-                else:
-                    Signaletique.objects.update_or_create(code=str(code), defaults=db_defaults)
-                succes += 1
+                    if not isin_value and not str(titre).strip():
+                        lot.referencer(categorie=categorie_text, type_instrument=statut_data)
+                        continue
+                    db_defaults = {
+                        'code': str(code), 'isin': isin_value, 'titre': str(titre)[:500],
+                        'categorie': categorie_text, 'categorie_text': categorie_text,
+                        'statut': statut_data[:100] if statut_data else None,
+                        'donnees_supplementaires': row_data,
+                    }
+                    lot.ajouter(db_defaults, ligne=row_idx, type_instrument=statut_data)
+                    succes += 1
 
+            succes -= len(lot.erreurs)
+            erreurs_list.extend(f"Ligne {e['ligne']}: {e['erreur']}" for e in lot.erreurs)
             results['signaletique'] = {'succes': succes, 'erreurs': len(erreurs_list), 'fichier': os.path.basename(sig_path)}
         except Exception as e:
             results['signaletique'] = {'succes': 0, 'erreurs': 1, 'fichier': os.path.basename(sig_path), 'error': str(e)}
     else:
         results['signaletique'] = {'error': 'Aucun fichier signaletique_*.xlsx trouvé dans Sauvegarde/'}
 
+    progression.avancer(2, 0, 0, resultat={'details': results}, force=True)
+
     # ── 2. TRANSACTIONS ───────────────────────────────────────────────────────
     tx_path = latest_file('transactions')
     if tx_path:
         try:
-            wb = openpyxl.load_workbook(tx_path)
-            ws = wb.active
-            headers = [cell.value for cell in ws[1]]
+            feuille = classeur.Feuille(tx_path, entetes_texte=False)
             succes = 0
             doublons = 0
             erreurs_list = []
 
-            for row_idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-                if not any(c is not None and str(c).strip() != '' for c in row):
-                    continue
-                row_data = {h: sanitize_date(v) for h, v in zip(headers, row)}
-                date_tx = row_data.get('Date')
-                type_op = str(row_data.get('Type') or row_data.get('Sens') or '').strip().upper()
-                isin = row_data.get('Isin') or row_data.get('ISIN') or row_data.get('isin')
-                if isin:
-                    isin = str(isin).strip().upper()
-                quantite = row_data.get('Quantité') or row_data.get('quantite') or row_data.get('Quantite')
-                prix = row_data.get('Prix unitaire') or row_data.get('prix unitaire') or row_data.get('Prix Unitaire')
-                devise = str(row_data.get('Devise') or 'EUR')
-                nom_portfolio = str(row_data.get('Portefeuille') or 'Défaut')
-
-                if not all([type_op, isin, quantite, prix]):
-                    erreurs_list.append(f"Ligne {row_idx}: champs obligatoires manquants")
-                    continue
-                if len(isin) != 12:
-                    erreurs_list.append(f"Ligne {row_idx}: ISIN invalide ({isin})")
-                    continue
-                if type_op not in ['ACHAT', 'VENTE']:
-                    type_op = 'ACHAT' if 'achat' in type_op.lower() else 'VENTE'
-
-                portfolio, _ = file_storage.get_or_create_portfolio(
-                    nom_portfolio,
-                    defaults=portfolio_meta_ref.get(nom_portfolio, {'description': f'Portefeuille {nom_portfolio}'})
-                )
-                sig_dict = file_storage.get_signaletique_by_isin(isin)
-                if not sig_dict:
-                    sig_dict = file_storage.upsert_signaletique(
-                        code=f'TEMP_{isin}', isin=isin, titre=f'[À compléter] {isin}'
-                    )
-                    Signaletique.objects.get_or_create(
-                        isin=isin, defaults={'code': f'TEMP_{isin}', 'titre': f'[À compléter] {isin}'}
-                    )
-
-                q = Decimal(str(quantite))
-                p = Decimal(str(prix))
-                date_str = date_tx.isoformat() if hasattr(date_tx, 'isoformat') else str(date_tx)
-
-                if file_storage.transaction_exists(portfolio['id'], sig_dict['id'], date_str, type_op, q, p, isin=isin):
-                    doublons += 1
-                    continue
-
-                file_storage.create_transaction(portfolio['id'], sig_dict['id'], date_str, type_op, q, p, devise, isin=isin)
-                succes += 1
-
+            with outbox.lot_signaletiques(origine='la restauration') as lot, file_storage.batch():
+                for row_idx, row in feuille:
+                    try:
+                        row_data = {h: sanitize_date(v) for h, v in row.items()}
+                        date_tx = row_data.get('Date')
+                        type_op = str(row_data.get('Type') or row_data.get('Sens') or '').strip().upper()
+                        isin = row_data.get('Isin') or row_data.get('ISIN') or row_data.get('isin')
+                        if isin:
+                            isin = str(isin).strip().upper()
+                        quantite = row_data.get('Quantité') or row_data.get('quantite') or row_data.get('Quantite')
+                        prix = row_data.get('Prix unitaire') or row_data.get('prix unitaire') or row_data.get('Prix Unitaire')
+                        devise = str(row_data.get('Devise') or 'EUR')
+                        nom_portfolio = str(row_data.get('Portefeuille') or 'Défaut')
+
+                        if not all([type_op, isin, quantite, prix]):
+                            erreurs_list.append(f"Ligne {row_idx}: champs obligatoires manquants")
+                            continue
+                        if len(isin) != 12:
+                            erreurs_list.append(f"Ligne {row_idx}: ISIN invalide ({isin})")
+                            continue
+                        if type_op not in ['ACHAT', 'VENTE']:
+                            type_op = 'ACHAT' if 'achat' in type_op.lower() else 'VENTE'
+
+                        portfolio, _ = file_storage.get_or_create_portfolio(
+                            nom_portfolio,
+                            defaults=portfolio_meta_ref.get(nom_portfolio, {'description': f'Portefeuille {nom_portfolio}'})
+                        )
+                        sig_dict = file_storage.get_signaletique_by_isin(isin)
+                        if not sig_dict:
+                            sig_dict = file_storage.upsert_signaletique(
+                                code=f'TEMP_{isin}', isin=isin, titre=f'[À compléter] {isin}'
+                            )
+                            lot.ajouter({'isin': isin, 'code': f'TEMP_{isin}', 'titre': f'[À compléter] {isin}'},
+                                        ligne=row_idx, mettre_a_jour=False)
+
+                        q = Decimal(str(quantite))
+                        p = Decimal(str(prix))
+                        date_str = date_tx.isoformat() if hasattr(date_tx, 'isoformat') else str(date_tx)
+
+                        if file_storage.transaction_exists(portfolio['id'], sig_dict['id'], date_str, type_op, q, p, isin=isin):
+                            doublons += 1
+                            continue
+
+                        file_storage.create_transaction(portfolio['id'], sig_dict['id'], date_str, type_op, q, p, devise, isin=isin)
+                        succes += 1
+                    except Exception as e:
+                        erreurs_list.append(f"Ligne {row_idx}: {str(e)}")
+
+            # Signalétiques provisoires refusées par la base (transactions conservées)
+            erreurs_list.extend(f"Ligne {e['ligne']}: {e['erreur']}" for e in lot.erreurs)
             results['transactions'] = {
                 'succes': succes, 'doublons': doublons,
                 'erreurs': len(erreurs_list), 'fichier': os.path.basename(tx_path),
@@ -1258,45 +1331,46 @@ def restore_all_data(request):
     else:
         results['transactions'] = {'error': 'Aucun fichier transactions_*.xlsx trouvé dans Sauvegarde/'}
 
+    progression.avancer(3, 0, 0, resultat={'details': results}, force=True)
+
     # ── 3. CASH ───────────────────────────────────────────────────────────────
     cash_path = latest_file('lastcash')
     if cash_path:
         try:
-            wb = openpyxl.load_workbook(cash_path)
-            ws = wb.active
-            headers = [str(cell.value or '').strip() for cell in ws[1]]
+            feuille = classeur.Feuille(cash_path)
             succes = 0
             erreurs_list = []
 
-            for row_idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-                if not any(c is not None and str(c).strip() != '' for c in row):
-                    continue
-                row_data = {h: v for h, v in zip(headers, row)}
-                nom_portfolio = str(row_data.get('Portefeuille') or '').strip()
-                banque = str(row_data.get('Banque') or '').strip()
-                montant_raw = row_data.get('Montant')
-                devise = str(row_data.get('Devise') or 'EUR')
-                date_raw = row_data.get('Date')
-                commentaire = str(row_data.get('Commentaire') or '').strip() or None
-
-                if not all([nom_portfolio, banque, montant_raw, date_raw]):
-                    erreurs_list.append(f"Ligne {row_idx}: champs manquants")
-                    continue
-
-                montant = Decimal(str(montant_raw))
-                if isinstance(date_raw, datetime):
-                    date_obj = date_raw.date()
-                elif isinstance(date_raw, date):
-                    date_obj = date_raw
-                else:
-                    date_obj = datetime.fromisoformat(str(date_raw)).date()
-
-                portfolio, _ = file_storage.get_or_create_portfolio(
-                    nom_portfolio,
-                    defaults=portfolio_meta_ref.get(nom_portfolio, {'description': f'Portefeuille {nom_portfolio}'})
-                )
-                file_storage.create_cash(portfolio['id'], banque, montant, devise, date_obj, commentaire)
-                succes += 1
+            with file_storage.batch():
+                for row_idx, row_data in feuille:
+                    try:
+                        nom_portfolio = str(row_data.get('Portefeuille') or '').strip()
+                        banque = str(row_data.get('Banque') or '').strip()
+                        montant_raw = row_data.get('Montant')
+                        devise = str(row_data.get('Devise') or 'EUR')
+                        date_raw = row_data.get('Date')
+                        commentaire = str(row_data.get('Commentaire') or '').strip() or None
+
+                        if not all([nom_portfolio, banque, montant_raw, date_raw]):
+                            erreurs_list.append(f"Ligne {row_idx}: champs manquants")
+                            continue
+
+                        montant = Decimal(str(montant_raw))
+                        if isinstance(date_raw, datetime):
+                            date_obj = date_raw.date()
+                        elif isinstance(date_raw, date):
+                            date_obj = date_raw
+                        else:
+                            date_obj = datetime.fromisoformat(str(date_raw)).date()
+
+                        portfolio, _ = file_storage.get_or_create_portfolio(
+                            nom_portfolio,
+                            defaults=portfolio_meta_ref.get(nom_portfolio, {'description': f'Portefeuille {nom_portfolio}'})
+                        )
+                        file_storage.create_cash(portfolio['id'], banque, montant, devise, date_obj, commentaire)
+                        succes += 1
+                    except Exception as e:
+                        erreurs_list.append(f"Ligne {row_idx}: {str(e)}")
 
             results['cash'] = {'succes': succes, 'erreurs': len(erreurs_list), 'fichier': os.path.basename(cash_path)}
         except Exception as e:
@@ -1304,21 +1378,18 @@ def restore_all_data(request):
     else:
         results['cash'] = {'error': 'Aucun fichier lastcash_*.xlsx trouvé dans Sauvegarde/'}
 
+    progression.avancer(4, 0, 0, resultat={'details': results}, force=True)
+
     # ── 4. PORTEFEUILLES CIBLES ───────────────────────────────────────────────
     tp_path = latest_file('portefeuillecible')
     if tp_path:
         try:
-            wb = openpyxl.load_workbook(tp_path)
-            ws = wb.active
-            headers = [str(cell.value or '').strip() for cell in ws[1]]
+            feuille = classeur.Feuille(tp_path)
             portfolios_data = {}
             succes = 0
             erreurs_list = []
 
-            for row_idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-                if not any(c is not None and str(c).strip() != '' for c in row):
-                    continue
-                row_data = {h: v for h, v in zip(headers, row)}
+            for row_idx, row_data in feuille:
                 nom_p = str(row_data.get('Portefeuille') or '').strip()
                 titre_raw = str(row_data.get('ISIN') or row_data.get('Isin') or row_data.get('Titre') or '').strip()
                 ratio_raw = row_data.get('Ratio')
@@ -1340,13 +1411,14 @@ def restore_all_data(request):
                     portfolios_data[nom_p] = []
                 portfolios_data[nom_p].append({'signaletique': sig['id'], 'ratio': float(str(ratio_raw))})
 
-            for nom, items in portfolios_data.items():
-                existing = file_storage.get_target_portfolio_by_name(nom)
-                if existing:
-                    file_storage.update_target_portfolio(existing['id'], name=nom, items=items)
-                else:
-                    file_storage.create_target_portfolio(nom, items)
-                succes += 1
+            with file_storage.batch():
+                for nom, items in portfolios_data.items():
+                    existing = file_storage.get_target_portfolio_by_name(nom)
+                    if existing:
+                        file_storage.update_target_portfolio(existing['id'], name=nom, items=items)
+                    else:
+                        file_storage.create_target_portfolio(nom, items)
+                    succes += 1
 
             results['portefeuilles_cibles'] = {
                 'succes': succes, 'erreurs': len(erreurs_list), 'fichier': os.path.basename(tp_path),
@@ -1356,19 +1428,18 @@ def restore_all_data(request):
     else:
         results['portefeuilles_cibles'] = {'error': 'Aucun fichier portefeuillecible_*.xlsx trouvé dans Sauvegarde/'}
 
+    progression.avancer(5, 0, 0, resultat={'details': results}, force=True)
+
     # ── 5. UTILISATEURS ───────────────────────────────────────────────────────
     users_path = latest_file('utilisateurs')
     if users_path:
         try:
-            wb = openpyxl.load_workbook(users_path)
-            ws = wb.active
-            headers = [str(c.value or '').strip() for c in ws[1]]
+            feuille = classeur.Feuille(users_path)
             crees = 0
             mis_a_jour = 0
             erreurs_list = []
 
-            for row_idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-                row_data = {h: v for h, v in zip(headers, row)}
+            for row_idx, row_data in feuille:
                 username = str(row_data.get('username') or '').strip()
                 if not username:
                     continue
@@ -1413,18 +1484,14 @@ def restore_all_data(request):
     else:
         results['utilisateurs'] = {'error': 'Aucun fichier utilisateurs_*.xlsx trouvé dans Sauvegarde/'}
 
+    progression.avancer(6, 0, 0, resultat={'details': results}, force=True)
+
     # ── 6. PRIX HISTORIQUES ───────────────────────────────────────────────────
     prix_path = latest_file('prix_historique')
     if prix_path:
         try:
-            wb = openpyxl.load_workbook(prix_path)
-            ws = wb.active
-            headers = [str(cell.value or '').strip() for cell in ws[1]]
-            rows_prix = []
-            for row in ws.iter_rows(min_row=2, values_only=True):
-                if not any(c is not None and str(c).strip() != '' for c in row):
-                    continue
-                rows_prix.append({h: v for h, v in zip(headers, row)})
+            feuille = classeur.Feuille(prix_path)
+            rows_prix = [row_data for _, row_data in feuille]
             stats_p = file_storage.restore_prix_historique_from_rows(rows_prix)
             results['prix_historique'] = {
                 'ajoutes': stats_p['ajoutes'],
@@ -1437,7 +1504,20 @@ def restore_all_data(request):
     else:
         results['prix_historique'] = {'info': 'Aucun fichier prix_historique_*.xlsx trouvé dans Start Files'}
 
-    return Response({'success': True, 'details': results})
+    return {'success': True, 'details': results}
+
+
+@api_view(['POST'])
+def restore_all_data(request):
+    """Restaure toutes les données depuis les fichiers les plus récents de /app/sauvegarde/.
+    Ordre : signalétique → transactions → cash → portefeuilles cibles → utilisateurs.
+    Réservé aux superusers. Avec arriere_plan=1, rend aussitôt l'id de la tâche.
+    """
+    if not request.user.is_superuser:
+        return Response({'error': 'Réservé aux superusers'}, status=status.HTTP_403_FORBIDDEN)
+
+    import_log = ImportLog.objects.create(type_import='restauration', nom_fichier='/app/startfiles', statut='en_cours')
+    return _lancer_import(request, import_log, _restaurer)
 
 
 @api_view(['POST'])
@@ -1451,10 +1531,12 @@ def clear_all_data(request):
 
     import glob
 
-    deleted = []
-    for f in glob.glob('/app/data/*.json'):
+    deleted = [os.path.basename(f) for f in glob.glob('/app/data/*.json') + glob.glob('/app/data/*.jsonl')]
+    # Le stockage supprime ses fichiers et incrémente leurs versions (invalidation des caches),
+    # puis les fichiers qu'il ne gère pas sont supprimés ici
+    file_storage.clear_all_data(include_prix=True)
+    for f in glob.glob('/app/data/*.json') + glob.glob('/app/data/*.jsonl'):
         os.remove(f)
-        deleted.append(os.path.basename(f))
     for f in glob.glob('/app/sauvegarde/*.xlsx'):
         os.remove(f)
         deleted.append(os.path.basename(f))
@@ -1490,8 +1572,6 @@ def signaletique_detail(request, pk):
                 cat_name = cat_name or cat.name
             except (AssetCategory.DoesNotExist, TypeError, ValueError):
                 pass
-        if not cat and cat_name:
-            cat, _ = AssetCategory.objects.get_or_create(name=cat_name)
         if cat_name:
             update_data['categorie_text'] = cat_name
         # Permettre la mise à jour de l'ISIN (utile si null au niveau racine)
@@ -1503,16 +1583,15 @@ def signaletique_detail(request, pk):
             if not sig_dict.get('code'):
                 update_data['code'] = f'SIG_{isin_new}'
         updated = file_storage.update_signaletique(int(pk), update_data)
-        # Sync DB
-        try:
-            db_sig = Signaletique.objects.get(pk=pk)
-            for k, v in update_data.items():
-                setattr(db_sig, k, v)
-            if cat:
-                db_sig.categorie = cat
-            db_sig.save()
-        except Signaletique.DoesNotExist:
-            pass
+        # Sync DB : signalétique retrouvée par ISIN / code (jamais créée ici)
+        db_valeurs = dict(update_data)
+        db_valeurs['code'] = (updated or sig_dict).get('code')
+        if (updated or sig_dict).get('isin'):
+            db_valeurs['isin'] = (updated or sig_dict).get('isin')
+        if cat or cat_name:
+            db_valeurs['categorie'] = cat or cat_name
+        with outbox.lot_signaletiques() as lot:
+            lot.ajouter(db_valeurs, creer=False)
         # Déterminer l'ISIN effectif (après mise à jour éventuelle)
         isin = (updated or sig_dict).get('isin')
         # Fallback : chercher dans donnees_supplementaires si toujours null
@@ -1549,6 +1628,27 @@ def import_logs(request):
     return Response(serializer.data)
 
 
+@api_view(['GET'])
+def import_jobs(request):
+    """Imports récents et leur avancement (GET /api/import/jobs/?actifs=1 : en attente ou en cours)"""
+    logs = ImportLog.objects.all()
+    if request.query_params.get('actifs') in ('1', 'true', 'oui'):
+        logs = logs.filter(statut__in=taches.STATUTS_ACTIFS)
+    return Response([taches.etat(log) for log in logs[:20]])
+
+
+@api_view(['GET'])
+def import_job_detail(request, pk):
+    """
+    Avancement d'un import : compteurs, lignes par seconde, ETA, premières erreurs et,
+    une fois terminé, la réponse de l'import (GET /api/import/jobs/<id>/).
+    """
+    import_log = ImportLog.objects.filter(pk=pk).first()
+    if import_log is None:
+        return Response({'error': 'Import non trouvé'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(taches.etat(import_log))
+
+
 @api_view(['GET', 'POST'])
 def list_target_portfolios(request):
     if request.method == 'GET':
@@ -1592,18 +1692,61 @@ def target_portfolio_detail(request, pk):
         return Response({'error': 'Portefeuille cible non trouvé'}, status=status.HTTP_404_NOT_FOUND)
 
 
-@api_view(['GET', 'POST'])
-def list_real_portfolios(request):
-    """Liste ou crée des portefeuilles réels"""
-    if request.method == 'GET':
-        portfolios = file_storage.get_all_portfolios()
-        return Response(portfolios)
-    
-    elif request.method == 'POST':
-        name = request.data.get('name')
-        if not name:
-            return Response(
-                {'error': 'Le nom du portefeuille est requis'},
+@api_view(['GET'])
+def target_portfolio_exposure(request, pk):
+    """
+    Expositions géographiques et sectorielles d'un portefeuille cible, par transparence
+    sur la signalétique (GET /api/target-portfolios/<pk>/exposure/).
+    """
+    portfolio = file_storage.get_target_portfolio_by_id(int(pk))
+    if not portfolio:
+        return Response({'error': 'Portefeuille cible non trouvé'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({
+        'portfolio': {'id': portfolio['id'], 'name': portfolio['name']},
+        **expositions.exposer_portefeuille_cible(portfolio, file_storage),
+    })
+
+
+def _fenetre_risque(valeur):
+    """Fenêtre (nombre de jours de rendement) passée en paramètre (None : valeur par défaut)"""
+    if valeur in (None, ''):
+        return None
+    fenetre = int(valeur)
+    if fenetre < 2:
+        raise ValueError('fenetre doit être au moins 2')
+    return fenetre
+
+
+@api_view(['GET'])
+def target_portfolio_risk(request, pk):
+    """
+    Volatilité, corrélations, VaR / ES historiques et drawdown d'un portefeuille cible
+    (GET /api/target-portfolios/<pk>/risk/?fenetre=252&fin=AAAA-MM-JJ).
+    """
+    portfolio = file_storage.get_target_portfolio_by_id(int(pk))
+    if not portfolio:
+        return Response({'error': 'Portefeuille cible non trouvé'}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        resultat = risque.analyser_portefeuille_cible(
+            portfolio, _fenetre_risque(request.query_params.get('fenetre')),
+            request.query_params.get('fin'), file_storage)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'portfolio': {'id': portfolio['id'], 'name': portfolio['name']}, **resultat})
+
+
+@api_view(['GET', 'POST'])
+def list_real_portfolios(request):
+    """Liste ou crée des portefeuilles réels"""
+    if request.method == 'GET':
+        portfolios = file_storage.get_all_portfolios()
+        return Response(portfolios)
+    
+    elif request.method == 'POST':
+        name = request.data.get('name')
+        if not name:
+            return Response(
+                {'error': 'Le nom du portefeuille est requis'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         try:
@@ -1675,6 +1818,24 @@ def list_cash(request):
             cash_entries = file_storage.get_cash_by_portfolio(int(portfolio_id))
         else:
             cash_entries = file_storage.get_all_cash()
+        # ?devise=USD (ou 'portefeuille' avec portfolio_id) : montants convertis à ?date=
+        devise = request.query_params.get('devise')
+        if devise:
+            if devise == 'portefeuille':
+                portfolio = file_storage.get_portfolio_by_id(int(portfolio_id)) if portfolio_id else None
+                if not portfolio:
+                    return Response({'error': "devise=portefeuille nécessite un portfolio_id existant"},
+                                    status=status.HTTP_400_BAD_REQUEST)
+                devise = portfolio.get('devise', 'EUR')
+            try:
+                conversion = fx.convertir_cash(cash_entries, devise, request.query_params.get('date'), file_storage)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            montants = {c['id']: c['montant'] for c in conversion.pop('entrees')}
+            return Response({
+                'entrees': [{**entree, 'montant_converti': montants[entree['id']]} for entree in cash_entries],
+                'conversion': conversion,
+            })
         return Response(cash_entries)
     
     elif request.method == 'POST':
@@ -1781,40 +1942,18 @@ def cash_detail(request, pk):
         )
 
 
-@api_view(['POST'])
-@parser_classes([MultiPartParser, FormParser])
-def import_cash(request):
-    """Import des positions cash depuis un fichier Excel.
-    Colonnes attendues: Portefeuille, Banque, Montant, Devise, Date, Commentaire
-    """
-    if 'file' not in request.FILES:
-        return Response({'error': 'Aucun fichier fourni'}, status=status.HTTP_400_BAD_REQUEST)
-
-    file = request.FILES['file']
-    if not file.name.endswith(('.xlsx', '.xls')):
-        return Response({'error': 'Format non supporté. Utilisez .xlsx ou .xls'}, status=status.HTTP_400_BAD_REQUEST)
-
-    import_log = ImportLog.objects.create(
-        type_import='cash',
-        nom_fichier=file.name,
-        statut='en_cours'
-    )
-
-    try:
-        wb = openpyxl.load_workbook(file)
-        ws = wb.active
-        headers = [str(cell.value).strip() if cell.value is not None else '' for cell in ws[1]]
-
-        nombre_succes = 0
-        nombre_erreurs = 0
-        erreurs = []
+def _importer_cash(fichier, import_log, progression):
+    """Import des positions cash (exécuté par taches.executer)"""
+    feuille = classeur.Feuille(fichier)
+    progression.estimer(feuille.lignes_estimees)
 
-        for row_idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-            if not any(cell is not None and str(cell).strip() != '' for cell in row):
-                continue
-
-            row_data = {header: value for header, value in zip(headers, row)}
+    nombre_succes = 0
+    nombre_erreurs = 0
+    erreurs = []
 
+    with feuille, file_storage.batch():
+        for row_idx, row_data in feuille:
+            progression.avancer(feuille.lignes_totales, nombre_succes, nombre_erreurs, erreurs)
             nom_portfolio = (
                 str(row_data.get('Portefeuille') or row_data.get('portefeuille') or '').strip()
             )
@@ -1859,37 +1998,31 @@ def import_cash(request):
             file_storage.create_cash(portfolio['id'], banque, montant_decimal, devise, date_obj, commentaire)
             nombre_succes += 1
 
-        import_log.nombre_lignes = ws.max_row - 1
-        import_log.nombre_succes = nombre_succes
-        import_log.nombre_erreurs = nombre_erreurs
-        import_log.erreurs = erreurs if erreurs else None
-        import_log.statut = 'termine' if nombre_erreurs == 0 else 'termine_avec_erreurs'
-        import_log.save()
-
-        return Response({
-            'success': True,
-            'message': 'Import cash terminé',
-            'details': {
-                'fichier': file.name,
-                'lignes_totales': ws.max_row - 1,
-                'succes': nombre_succes,
-                'erreurs': nombre_erreurs,
-                'liste_erreurs': erreurs[:10] if erreurs else []
-            }
-        })
+    import_log.nombre_lignes = feuille.lignes_totales
+    import_log.nombre_succes = nombre_succes
+    import_log.nombre_erreurs = nombre_erreurs
+    import_log.erreurs = erreurs if erreurs else None
+    import_log.statut = 'termine' if nombre_erreurs == 0 else 'termine_avec_erreurs'
+    import_log.save()
 
-    except Exception as e:
-        import_log.statut = 'erreur'
-        import_log.save()
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return {
+        'success': True,
+        'message': 'Import cash terminé',
+        'details': {
+            'fichier': import_log.nom_fichier,
+            'lignes_totales': feuille.lignes_totales,
+            'succes': nombre_succes,
+            'erreurs': nombre_erreurs,
+            'liste_erreurs': erreurs[:10] if erreurs else []
+        }
+    }
 
 
 @api_view(['POST'])
 @parser_classes([MultiPartParser, FormParser])
-def import_target_portfolio(request):
-    """Import de portefeuilles cibles depuis un fichier Excel.
-    Colonnes attendues: Portefeuille, Titre (nom/ISIN/code du titre), Ratio
-    Plusieurs lignes avec le même nom de portefeuille → un seul portefeuille.
+def import_cash(request):
+    """Import des positions cash depuis un fichier Excel.
+    Colonnes attendues: Portefeuille, Banque, Montant, Devise, Date, Commentaire
     """
     if 'file' not in request.FILES:
         return Response({'error': 'Aucun fichier fourni'}, status=status.HTTP_400_BAD_REQUEST)
@@ -1899,66 +2032,66 @@ def import_target_portfolio(request):
         return Response({'error': 'Format non supporté. Utilisez .xlsx ou .xls'}, status=status.HTTP_400_BAD_REQUEST)
 
     import_log = ImportLog.objects.create(
-        type_import='target_portfolio',
+        type_import='cash',
         nom_fichier=file.name,
         statut='en_cours'
     )
 
-    try:
-        wb = openpyxl.load_workbook(file)
-        ws = wb.active
-        headers = [str(cell.value).strip() if cell.value is not None else '' for cell in ws[1]]
+    return _lancer_import(request, import_log, _importer_cash, file)
 
-        nombre_succes = 0
-        nombre_erreurs = 0
-        erreurs = []
 
-        # Regrouper les lignes par nom de portefeuille
-        portfolios_data = {}  # name → list of items
+def _importer_target_portfolio(fichier, import_log, progression):
+    """Import des portefeuilles cibles (exécuté par taches.executer)"""
+    feuille = classeur.Feuille(fichier)
+    progression.estimer(feuille.lignes_estimees)
 
-        for row_idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-            if not any(cell is not None and str(cell).strip() != '' for cell in row):
-                continue
+    nombre_succes = 0
+    nombre_erreurs = 0
+    erreurs = []
 
-            row_data = {header: value for header, value in zip(headers, row)}
+    # Regrouper les lignes par nom de portefeuille
+    portfolios_data = {}  # name → list of items
 
-            nom_portfolio = str(row_data.get('Portefeuille') or row_data.get('portefeuille') or '').strip()
-            titre_raw = str(row_data.get('Titre') or row_data.get('titre') or row_data.get('ISIN') or row_data.get('isin') or '').strip()
-            ratio_raw = row_data.get('Ratio') or row_data.get('ratio') or row_data.get('%') or row_data.get('Poids')
+    for row_idx, row_data in feuille:
+        progression.avancer(feuille.lignes_totales, nombre_succes, nombre_erreurs, erreurs)
+        nom_portfolio = str(row_data.get('Portefeuille') or row_data.get('portefeuille') or '').strip()
+        titre_raw = str(row_data.get('Titre') or row_data.get('titre') or row_data.get('ISIN') or row_data.get('isin') or '').strip()
+        ratio_raw = row_data.get('Ratio') or row_data.get('ratio') or row_data.get('%') or row_data.get('Poids')
 
-            if not all([nom_portfolio, titre_raw, ratio_raw]):
-                missing = []
-                if not nom_portfolio: missing.append('Portefeuille')
-                if not titre_raw: missing.append('Titre')
-                if not ratio_raw: missing.append('Ratio')
-                erreurs.append({'ligne': row_idx, 'type': 'erreur', 'erreur': f'Champs manquants: {", ".join(missing)}'})
-                nombre_erreurs += 1
-                continue
+        if not all([nom_portfolio, titre_raw, ratio_raw]):
+            missing = []
+            if not nom_portfolio: missing.append('Portefeuille')
+            if not titre_raw: missing.append('Titre')
+            if not ratio_raw: missing.append('Ratio')
+            erreurs.append({'ligne': row_idx, 'type': 'erreur', 'erreur': f'Champs manquants: {", ".join(missing)}'})
+            nombre_erreurs += 1
+            continue
 
-            try:
-                ratio = float(str(ratio_raw))
-            except ValueError:
-                erreurs.append({'ligne': row_idx, 'type': 'erreur', 'erreur': f'Ratio invalide: {ratio_raw}'})
-                nombre_erreurs += 1
-                continue
+        try:
+            ratio = float(str(ratio_raw))
+        except ValueError:
+            erreurs.append({'ligne': row_idx, 'type': 'erreur', 'erreur': f'Ratio invalide: {ratio_raw}'})
+            nombre_erreurs += 1
+            continue
 
-            # Résoudre le titre : chercher par ISIN, puis code, puis titre
-            sig = (
-                file_storage.get_signaletique_by_isin(titre_raw) or
-                file_storage.get_signaletique_by_code(titre_raw) or
-                file_storage.search_signaletique_by_titre(titre_raw)
-            )
+        # Résoudre le titre : chercher par ISIN, puis code, puis titre
+        sig = (
+            file_storage.get_signaletique_by_isin(titre_raw) or
+            file_storage.get_signaletique_by_code(titre_raw) or
+            file_storage.search_signaletique_by_titre(titre_raw)
+        )
 
-            if not sig:
-                erreurs.append({'ligne': row_idx, 'type': 'erreur', 'erreur': f'Titre introuvable: {titre_raw}'})
-                nombre_erreurs += 1
-                continue
+        if not sig:
+            erreurs.append({'ligne': row_idx, 'type': 'erreur', 'erreur': f'Titre introuvable: {titre_raw}'})
+            nombre_erreurs += 1
+            continue
 
-            if nom_portfolio not in portfolios_data:
-                portfolios_data[nom_portfolio] = []
-            portfolios_data[nom_portfolio].append({'signaletique': sig['id'], 'ratio': ratio})
+        if nom_portfolio not in portfolios_data:
+            portfolios_data[nom_portfolio] = []
+        portfolios_data[nom_portfolio].append({'signaletique': sig['id'], 'ratio': ratio})
 
-        # Créer ou mettre à jour les portefeuilles cibles via file_storage
+    # Créer ou mettre à jour les portefeuilles cibles via file_storage
+    with file_storage.batch():
         for nom, items in portfolios_data.items():
             try:
                 existing = file_storage.get_target_portfolio_by_name(nom)
@@ -1971,94 +2104,75 @@ def import_target_portfolio(request):
                 erreurs.append({'ligne': 0, 'type': 'erreur', 'erreur': f'Portefeuille "{nom}": {str(e)}'})
                 nombre_erreurs += 1
 
-        import_log.nombre_lignes = ws.max_row - 1
-        import_log.nombre_succes = nombre_succes
-        import_log.nombre_erreurs = nombre_erreurs
-        import_log.erreurs = erreurs if erreurs else None
-        import_log.statut = 'termine' if nombre_erreurs == 0 else 'termine_avec_erreurs'
-        import_log.save()
-
-        return Response({
-            'success': True,
-            'message': 'Import portefeuilles cibles terminé',
-            'details': {
-                'fichier': file.name,
-                'lignes_totales': ws.max_row - 1,
-                'portefeuilles_crees': nombre_succes,
-                'erreurs': nombre_erreurs,
-                'liste_erreurs': erreurs[:10] if erreurs else []
-            }
-        })
+    import_log.nombre_lignes = feuille.lignes_totales
+    import_log.nombre_succes = nombre_succes
+    import_log.nombre_erreurs = nombre_erreurs
+    import_log.erreurs = erreurs if erreurs else None
+    import_log.statut = 'termine' if nombre_erreurs == 0 else 'termine_avec_erreurs'
+    import_log.save()
 
-    except Exception as e:
-        import_log.statut = 'erreur'
-        import_log.save()
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return {
+        'success': True,
+        'message': 'Import portefeuilles cibles terminé',
+        'details': {
+            'fichier': import_log.nom_fichier,
+            'lignes_totales': feuille.lignes_totales,
+            'portefeuilles_crees': nombre_succes,
+            'erreurs': nombre_erreurs,
+            'liste_erreurs': erreurs[:10] if erreurs else []
+        }
+    }
 
 
 @api_view(['POST'])
 @parser_classes([MultiPartParser, FormParser])
-def import_transactions(request):
-    """Import des transactions d'achat/vente depuis un fichier Excel"""
-    
+def import_target_portfolio(request):
+    """Import de portefeuilles cibles depuis un fichier Excel.
+    Colonnes attendues: Portefeuille, Titre (nom/ISIN/code du titre), Ratio
+    Plusieurs lignes avec le même nom de portefeuille → un seul portefeuille.
+    """
     if 'file' not in request.FILES:
-        return Response(
-            {'error': 'Aucun fichier fourni'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
-    
+        return Response({'error': 'Aucun fichier fourni'}, status=status.HTTP_400_BAD_REQUEST)
+
     file = request.FILES['file']
-    
-    # Vérifier l'extension
     if not file.name.endswith(('.xlsx', '.xls')):
-        return Response(
-            {'error': 'Format de fichier non supporté. Utilisez .xlsx ou .xls'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
-    
-    # Créer un log d'import
+        return Response({'error': 'Format non supporté. Utilisez .xlsx ou .xls'}, status=status.HTTP_400_BAD_REQUEST)
+
     import_log = ImportLog.objects.create(
-        type_import='transactions',
+        type_import='target_portfolio',
         nom_fichier=file.name,
         statut='en_cours'
     )
-    
-    try:
-        # Lire le fichier Excel
-        wb = openpyxl.load_workbook(file)
-        ws = wb.active
-        
-        # Récupérer les en-têtes (première ligne)
-        headers = [cell.value for cell in ws[1]]
-        
-        nombre_succes = 0
-        nombre_erreurs = 0
-        nombre_doublons = 0
-        erreurs = []
-        isins_inconnus = set()
-        
-        rows = list(ws.iter_rows(min_row=2, values_only=True))
-        
-        def sanitize_value(value):
-            if isinstance(value, (datetime, date)):
-                return value.date() if isinstance(value, datetime) else value
-            return value
-        
-        # Parcourir les lignes
-        for row_idx, row in enumerate(rows, start=2):
+
+    return _lancer_import(request, import_log, _importer_target_portfolio, file)
+
+
+def _importer_transactions(fichier, import_log, progression):
+    """Import des transactions (exécuté par taches.executer)"""
+    def sanitize_value(value):
+        if isinstance(value, (datetime, date)):
+            return value.date() if isinstance(value, datetime) else value
+        return value
+
+    # Lire le fichier Excel en continu (en-têtes = première ligne)
+    feuille = classeur.Feuille(fichier, entetes_texte=False, convertir=sanitize_value)
+    progression.estimer(feuille.lignes_estimees)
+    headers = feuille.entetes
+
+    nombre_succes = 0
+    nombre_erreurs = 0
+    nombre_doublons = 0
+    erreurs = []
+    isins_inconnus = set()
+
+    # Parcourir les lignes
+    with feuille, file_storage.batch():
+        for row_idx, row_data in feuille:
+            progression.avancer(feuille.lignes_totales, nombre_succes, nombre_erreurs, erreurs)
             try:
-                if not any(cell is not None and str(cell).strip() != '' for cell in row):
-                    continue
-                
-                # Créer un dictionnaire avec les données de la ligne
-                row_data = {
-                    header: sanitize_value(value)
-                    for header, value in zip(headers, row)
-                }
-                
                 # Extraire les champs avec plus de flexibilité
                 date_transaction = row_data.get('Date') or row_data.get('date')
-                
+
                 # Type/Sens de l'opération
                 type_operation = (
                     row_data.get('Type') or 
@@ -2068,12 +2182,12 @@ def import_transactions(request):
                     row_data.get('sens') or 
                     ''
                 ).strip().upper()
-                
+
                 # ISIN - normaliser en enlevant les espaces et en majuscules
                 isin = row_data.get('Isin') or row_data.get('ISIN') or row_data.get('isin')
                 if isin:
                     isin = str(isin).strip().upper()
-                
+
                 # Quantité
                 quantite = (
                     row_data.get('quantité') or 
@@ -2081,7 +2195,7 @@ def import_transactions(request):
                     row_data.get('quantite') or
                     row_data.get('Quantite')
                 )
-                
+
                 # Prix unitaire
                 prix_unitaire = (
                     row_data.get('prix unitaire') or 
@@ -2090,10 +2204,10 @@ def import_transactions(request):
                     row_data.get('prix') or
                     row_data.get('Prix')
                 )
-                
+
                 devise = row_data.get('Devise') or row_data.get('devise') or 'EUR'
                 nom_portfolio = row_data.get('Portefeuille') or row_data.get('portefeuille') or 'Défaut'
-                
+
                 # Si date manquante, utiliser la date du jour
                 if not date_transaction:
                     date_transaction = date.today()
@@ -2102,7 +2216,7 @@ def import_transactions(request):
                         'type': 'warning',
                         'erreur': 'Date manquante, date du jour utilisée'
                     })
-                
+
                 # Validation
                 if not all([type_operation, isin, quantite, prix_unitaire]):
                     missing_fields = []
@@ -2110,7 +2224,7 @@ def import_transactions(request):
                     if not isin: missing_fields.append('ISIN')
                     if not quantite: missing_fields.append('quantité')
                     if not prix_unitaire: missing_fields.append('prix')
-                    
+
                     erreurs.append({
                         'ligne': row_idx,
                         'type': 'erreur',
@@ -2118,17 +2232,17 @@ def import_transactions(request):
                     })
                     nombre_erreurs += 1
                     continue
-                
+
                 # Normaliser le type
                 if type_operation not in ['ACHAT', 'VENTE']:
                     type_operation = 'ACHAT' if 'achat' in type_operation.lower() else 'VENTE'
-                
+
                 # Récupérer ou créer le portefeuille
                 portfolio, _ = file_storage.get_or_create_portfolio(
                     nom_portfolio,
                     defaults={'description': f'Portefeuille {nom_portfolio}'}
                 )
-                
+
                 # Validation stricte : l'ISIN doit avoir exactement 12 caractères
                 if len(isin) != 12:
                     erreurs.append({
@@ -2138,7 +2252,7 @@ def import_transactions(request):
                     })
                     nombre_erreurs += 1
                     continue
-                
+
                 # Récupérer la signalétique - Recherche exacte uniquement
                 sig_dict = file_storage.get_signaletique_by_isin(isin)
                 if sig_dict:
@@ -2161,11 +2275,11 @@ def import_transactions(request):
                         'type': 'warning',
                         'erreur': f"L'ISIN {isin} est inconnu du système portfolio"
                     })
-                
+
                 # Vérifier si la transaction existe déjà (doublon)
                 quantite_decimal = Decimal(str(quantite))
                 prix_unitaire_decimal = Decimal(str(prix_unitaire))
-                
+
                 existing_transaction = file_storage.transaction_exists(
                     portfolio['id'],
                     signaletique_id,
@@ -2194,9 +2308,9 @@ def import_transactions(request):
                         devise,
                         isin=isin
                     )
-                    
+
                     nombre_succes += 1
-                
+
             except Exception as e:
                 nombre_erreurs += 1
                 erreurs.append({
@@ -2204,92 +2318,112 @@ def import_transactions(request):
                     'type': 'erreur',
                     'erreur': str(e)
                 })
-        
-        # Générer le fichier CSV pour les ISINs inconnus
-        csv_file_url = None
-        if isins_inconnus:
-            # Créer le dossier media/imports s'il n'existe pas
-            import_dir = os.path.join(settings.MEDIA_ROOT, 'imports')
-            os.makedirs(import_dir, exist_ok=True)
-            
-            # Nom du fichier avec timestamp
-            from datetime import datetime as dt
-            timestamp = dt.now().strftime('%Y%m%d_%H%M%S')
-            csv_filename = f'signaletique_isins_inconnus_{timestamp}.csv'
-            csv_filepath = os.path.join(import_dir, csv_filename)
-            
-            # Créer le fichier CSV avec les en-têtes du template
-            with open(csv_filepath, 'w', newline='', encoding='utf-8-sig') as csvfile:
-                writer = csv.writer(csvfile)
-                
-                # En-têtes basés sur le template
-                headers_csv = [
-                    "Type d'instr", "Isin", "Classe d'actifs", "Nom", "Symbole", 
-                    "Banques Dispo", "Devise", "Taux", "Date de fin", "Qualité credit",
-                    "TER", "Cap/Dis", "ESG", "Replication", "Taille du Fonds", 
-                    "Positions", "Couverture de change", "USA", "Japon", "Grande Bretagne",
-                    "Canada", "Pays Emergeants Hors Chine et Japon", "Australie", "Suède",
-                    "Suisse", "Chine", "Israel", "Allemagne", "Nouvelle Zelande", 
-                    "Pays-Bas", "Irlande", "Espagne", "Italie", "France", "Autre Pays",
-                    "Etats", "Industrie", "Finance", "Consommation Cyclique", "Technologie",
-                    "Santé", "Consommation Defensive", "Communication", "Immobilier",
-                    "Matières Premières", "Energie", "Service Publiques", 
-                    "Services de consommation", "Autre Secteur", "Etats2", 
-                    "Banque Emetteur", "Entreprises", "Autre Emetteur", "CodeBank"
-                ]
-                writer.writerow(headers_csv)
-                
-                # Ajouter une ligne pour chaque ISIN inconnu
-                for isin in sorted(isins_inconnus):
-                    row = [''] * len(headers_csv)
-                    row[1] = isin  # Colonne "Isin"
-                    row[3] = f'À compléter pour {isin}'  # Colonne "Nom"
-                    writer.writerow(row)
-            
-            # URL relative pour le téléchargement
-            csv_file_url = f'/media/imports/{csv_filename}'
-        
-        # Mettre à jour le log
-        import_log.nombre_lignes = ws.max_row - 1
-        import_log.nombre_succes = nombre_succes
-        import_log.nombre_erreurs = nombre_erreurs
-        import_log.erreurs = erreurs if erreurs else None
-        import_log.statut = 'termine' if nombre_erreurs == 0 else 'termine_avec_erreurs'
-        import_log.save()
-        
-        response_data = {
-            'success': True,
-            'message': f'Import terminé avec succès',
-            'details': {
-                'fichier': file.name,
-                'colonnes_detectees': headers,
-                'lignes_totales': ws.max_row - 1,
-                'succes': nombre_succes,
-                'doublons': nombre_doublons,
-                'erreurs': nombre_erreurs,
-                'liste_erreurs': erreurs[:10] if erreurs else []
-            }
+
+    # Générer le fichier CSV pour les ISINs inconnus
+    csv_file_url = None
+    if isins_inconnus:
+        # Créer le dossier media/imports s'il n'existe pas
+        import_dir = os.path.join(settings.MEDIA_ROOT, 'imports')
+        os.makedirs(import_dir, exist_ok=True)
+
+        # Nom du fichier avec timestamp
+        from datetime import datetime as dt
+        timestamp = dt.now().strftime('%Y%m%d_%H%M%S')
+        csv_filename = f'signaletique_isins_inconnus_{timestamp}.csv'
+        csv_filepath = os.path.join(import_dir, csv_filename)
+
+        # Créer le fichier CSV avec les en-têtes du template
+        with open(csv_filepath, 'w', newline='', encoding='utf-8-sig') as csvfile:
+            writer = csv.writer(csvfile)
+
+            # En-têtes basés sur le template
+            headers_csv = [
+                "Type d'instr", "Isin", "Classe d'actifs", "Nom", "Symbole", 
+                "Banques Dispo", "Devise", "Taux", "Date de fin", "Qualité credit",
+                "TER", "Cap/Dis", "ESG", "Replication", "Taille du Fonds", 
+                "Positions", "Couverture de change", "USA", "Japon", "Grande Bretagne",
+                "Canada", "Pays Emergeants Hors Chine et Japon", "Australie", "Suède",
+                "Suisse", "Chine", "Israel", "Allemagne", "Nouvelle Zelande", 
+                "Pays-Bas", "Irlande", "Espagne", "Italie", "France", "Autre Pays",
+                "Etats", "Industrie", "Finance", "Consommation Cyclique", "Technologie",
+                "Santé", "Consommation Defensive", "Communication", "Immobilier",
+                "Matières Premières", "Energie", "Service Publiques", 
+                "Services de consommation", "Autre Secteur", "Etats2", 
+                "Banque Emetteur", "Entreprises", "Autre Emetteur", "CodeBank"
+            ]
+            writer.writerow(headers_csv)
+
+            # Ajouter une ligne pour chaque ISIN inconnu
+            for isin in sorted(isins_inconnus):
+                row = [''] * len(headers_csv)
+                row[1] = isin  # Colonne "Isin"
+                row[3] = f'À compléter pour {isin}'  # Colonne "Nom"
+                writer.writerow(row)
+
+        # URL relative pour le téléchargement
+        csv_file_url = f'/media/imports/{csv_filename}'
+
+    # Mettre à jour le log
+    import_log.nombre_lignes = feuille.lignes_totales
+    import_log.nombre_succes = nombre_succes
+    import_log.nombre_erreurs = nombre_erreurs
+    import_log.erreurs = erreurs if erreurs else None
+    import_log.statut = 'termine' if nombre_erreurs == 0 else 'termine_avec_erreurs'
+    import_log.save()
+
+    response_data = {
+        'success': True,
+        'message': f'Import terminé avec succès',
+        'details': {
+            'fichier': import_log.nom_fichier,
+            'colonnes_detectees': headers,
+            'lignes_totales': feuille.lignes_totales,
+            'succes': nombre_succes,
+            'doublons': nombre_doublons,
+            'erreurs': nombre_erreurs,
+            'liste_erreurs': erreurs[:10] if erreurs else []
         }
-        
-        # Ajouter l'info sur les ISINs inconnus
-        if isins_inconnus:
-            response_data['isins_inconnus'] = {
-                'count': len(isins_inconnus),
-                'liste': sorted(list(isins_inconnus)),
-                'csv_file_url': csv_file_url
-            }
-        
-        return Response(response_data)
-        
-    except Exception as e:
-        import_log.statut = 'erreur'
-        import_log.erreurs = [{'erreur_generale': str(e)}]
-        import_log.save()
-        
+    }
+
+    # Ajouter l'info sur les ISINs inconnus
+    if isins_inconnus:
+        response_data['isins_inconnus'] = {
+            'count': len(isins_inconnus),
+            'liste': sorted(list(isins_inconnus)),
+            'csv_file_url': csv_file_url
+        }
+
+    return response_data
+
+
+@api_view(['POST'])
+@parser_classes([MultiPartParser, FormParser])
+def import_transactions(request):
+    """Import des transactions d'achat/vente depuis un fichier Excel"""
+    
+    if 'file' not in request.FILES:
         return Response(
-            {'error': f'Erreur lors de l\'import: {str(e)}'},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            {'error': 'Aucun fichier fourni'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    file = request.FILES['file']
+    
+    # Vérifier l'extension
+    if not file.name.endswith(('.xlsx', '.xls')):
+        return Response(
+            {'error': 'Format de fichier non supporté. Utilisez .xlsx ou .xls'},
+            status=status.HTTP_400_BAD_REQUEST
         )
+    
+    # Créer un log d'import
+    import_log = ImportLog.objects.create(
+        type_import='transactions',
+        nom_fichier=file.name,
+        statut='en_cours'
+    )
+    
+    return _lancer_import(request, import_log, _importer_transactions, file)
 
 
 @api_view(['GET', 'POST'])
@@ -2395,23 +2529,19 @@ def delete_transaction(request, pk):
     )
 
 
-def is_obligation(categorie, type_instrument=''):
-    """
-    Détermine si un actif est une obligation.
-    Pour les obligations, le prix est en pourcentage (100 = 1).
-    """
-    categorie_lower = (categorie or '').lower()
-    type_lower = (type_instrument or '').lower()
-    return 'obligation' in categorie_lower or 'obligation' in type_lower
-
-
-def get_prix_reel(prix_unitaire, categorie, type_instrument=''):
-    """
-    Retourne le prix réel en tenant compte du fait que les obligations sont en pourcentage.
-    """
-    if is_obligation(categorie, type_instrument):
-        return prix_unitaire / Decimal('100')
-    return prix_unitaire
+def _portfolio_resume(portfolio):
+    """En-tête d'un portefeuille dans les réponses d'analyse"""
+    return {
+        'id': portfolio['id'],
+        'name': portfolio['name'],
+        'description': portfolio.get('description', ''),
+        'type_compte': portfolio.get('type_compte', ''),
+        'courtier': portfolio.get('courtier', ''),
+        'devise': portfolio.get('devise', 'EUR'),
+        'date_ouverture': portfolio.get('date_ouverture', ''),
+        'couleur': portfolio.get('couleur', ''),
+        'date_creation': portfolio.get('date_creation', ''),
+    }
 
 
 @api_view(['GET'])
@@ -2425,260 +2555,203 @@ def portfolio_fifo_analysis(request, pk):
             status=status.HTTP_404_NOT_FOUND
         )
     
-    # Récupérer toutes les transactions triées par date
-    all_transactions = file_storage.get_transactions_by_portfolio(int(pk))
-    
-    # Trier les transactions par date et id
-    transactions_sorted = sorted(all_transactions, key=lambda x: (x['date'], x['id']))
-    
-    # Structure pour stocker les lots d'achat (FIFO)
-    # positions[isin] = [(date, quantite, prix_unitaire), ...]
-    positions = {}
-    
-    # P&L réalisé par titre
-    realized_pnl = {}
+    # Résultat matérialisé, mis à jour incrémentalement (voir portfolios/fifo.py)
+    analyse = fifo.analyse_fifo(int(pk), file_storage)
     
-    # Historique des transactions traitées
-    transaction_details = []
-    
-    for transaction in transactions_sorted:
-        # Récupérer la signalétique
-        sig = file_storage.get_signaletique_for_transaction(transaction)
-        if not sig:
-            continue
+    return Response({
+        'portfolio': _portfolio_resume(portfolio),
+        **analyse,
+        # Montants exprimés dans la devise du portefeuille (ou ?devise=)
+        'conversion': fx.convertir_analyse_fifo(
+            analyse, request.query_params.get('devise') or portfolio.get('devise', 'EUR'), file_storage),
+    })
 
-        isin = sig.get('isin') or sig.get('code')
-        titre = sig.get('titre', '')
-        categorie = sig.get('categorie_text') or 'Non classé'
 
-        # Extraire le type d'instrument depuis donnees_supplementaires
-        type_instrument = ''
-        ds = sig.get('donnees_supplementaires') or {}
-        if "Type d'instr" in ds:
-            type_instrument = ds["Type d'instr"] or ''
-        
-        # Convertir les valeurs string en Decimal
-        quantite = Decimal(str(transaction['quantite']))
-        prix_unitaire = Decimal(str(transaction['prix_unitaire']))
-        
-        if transaction['type_operation'] == 'ACHAT':
-            # Ajouter un lot d'achat
-            if isin not in positions:
-                positions[isin] = {
-                    'titre': titre,
-                    'categorie': categorie,
-                    'type_instrument': type_instrument,
-                    'signaletique_id': sig['id'],
-                    'donnees_supplementaires': ds,
-                    'lots': [],
-                    'quantite_totale': Decimal('0')
-                }
-            
-            positions[isin]['lots'].append({
-                'date': transaction['date'],
-                'quantite': quantite,
-                'prix_unitaire': prix_unitaire,
-                'devise': transaction['devise']
-            })
-            positions[isin]['quantite_totale'] += quantite
-            
-            # Calculer le montant (pour obligations: prix en %, donc diviser par 100)
-            prix_reel = get_prix_reel(prix_unitaire, categorie, type_instrument)
-            montant = quantite * prix_reel
-            
-            transaction_details.append({
-                'id': transaction['id'],
-                'date': transaction['date'],
-                'type': 'ACHAT',
-                'titre': titre,
-                'categorie': categorie,
-                'type_instrument': type_instrument,
-                'quantite': float(quantite),
-                'prix_unitaire': float(prix_unitaire),
-                'montant': float(montant),
-                'devise': transaction['devise']
-            })
-            
-        elif transaction['type_operation'] == 'VENTE':
-            # Consommer les lots d'achat en FIFO
-            if isin not in positions or positions[isin]['quantite_totale'] < quantite:
-                # Vente à découvert ou erreur
-                prix_reel = get_prix_reel(prix_unitaire, categorie, type_instrument)
-                montant = quantite * prix_reel
-                
-                transaction_details.append({
-                    'id': transaction['id'],
-                    'date': transaction['date'],
-                    'type': 'VENTE',
-                    'titre': titre,
-                    'categorie': categorie,
-                    'quantite': float(quantite),
-                    'prix_unitaire': float(prix_unitaire),
-                    'montant': float(montant),
-                    'devise': transaction['devise'],
-                    'erreur': 'Vente sans achat correspondant'
-                })
-                continue
-            
-            quantite_a_vendre = quantite
-            pnl_transaction = Decimal('0')
-            lots_consommes = []
-            
-            while quantite_a_vendre > 0 and positions[isin]['lots']:
-                lot = positions[isin]['lots'][0]
-                
-                if lot['quantite'] <= quantite_a_vendre:
-                    # Consommer tout le lot
-                    quantite_vendue = lot['quantite']
-                    # Pour obligations: prix en %, donc calculer avec prix réels
-                    prix_vente_reel = get_prix_reel(prix_unitaire, categorie, type_instrument)
-                    prix_achat_reel = get_prix_reel(lot['prix_unitaire'], categorie, type_instrument)
-                    pnl_lot = quantite_vendue * (prix_vente_reel - prix_achat_reel)
-                    pnl_transaction += pnl_lot
-                    
-                    lots_consommes.append({
-                        'quantite': float(quantite_vendue),
-                        'prix_achat': float(lot['prix_unitaire']),
-                        'prix_vente': float(prix_unitaire),
-                        'pnl': float(pnl_lot)
-                    })
-                    
-                    quantite_a_vendre -= quantite_vendue
-                    positions[isin]['quantite_totale'] -= quantite_vendue
-                    positions[isin]['lots'].pop(0)
-                    
-                else:
-                    # Consommer partiellement le lot
-                    quantite_vendue = quantite_a_vendre
-                    # Pour obligations: prix en %, donc calculer avec prix réels
-                    prix_vente_reel = get_prix_reel(prix_unitaire, categorie, type_instrument)
-                    prix_achat_reel = get_prix_reel(lot['prix_unitaire'], categorie, type_instrument)
-                    pnl_lot = quantite_vendue * (prix_vente_reel - prix_achat_reel)
-                    pnl_transaction += pnl_lot
-                    
-                    lots_consommes.append({
-                        'quantite': float(quantite_vendue),
-                        'prix_achat': float(lot['prix_unitaire']),
-                        'prix_vente': float(prix_unitaire),
-                        'pnl': float(pnl_lot)
-                    })
-                    
-                    lot['quantite'] -= quantite_vendue
-                    positions[isin]['quantite_totale'] -= quantite_vendue
-                    quantite_a_vendre = Decimal('0')
-            
-            # Enregistrer le P&L réalisé
-            if isin not in realized_pnl:
-                realized_pnl[isin] = {
-                    'titre': titre,
-                    'categorie': categorie,
-                    'type_instrument': type_instrument,
-                    'pnl_total': Decimal('0'),
-                    'ventes': []
-                }
-            
-            realized_pnl[isin]['pnl_total'] += pnl_transaction
-            realized_pnl[isin]['ventes'].append({
-                'date': transaction['date'],
-                'quantite': float(quantite),
-                'prix_vente': float(prix_unitaire),
-                'pnl': float(pnl_transaction),
-                'lots_consommes': lots_consommes
-            })
-            
-            # Calculer le montant (pour obligations: prix en %, donc diviser par 100)
-            prix_reel = get_prix_reel(prix_unitaire, categorie, type_instrument)
-            montant = quantite * prix_reel
-            
-            transaction_details.append({
-                'id': transaction['id'],
-                'date': transaction['date'],
-                'type': 'VENTE',
-                'titre': titre,
-                'categorie': categorie,
-                'type_instrument': type_instrument,
-                'quantite': float(quantite),
-                'prix_unitaire': float(prix_unitaire),
-                'montant': float(montant),
-                'devise': transaction['devise'],
-                'pnl': float(pnl_transaction),
-                'lots_consommes': lots_consommes
-            })
-    
-    # Nettoyer les positions vides
-    positions_actuelles = []
-    for isin, data in positions.items():
-        if data['quantite_totale'] > 0:
-            # Calculer le prix moyen pondéré des lots restants
-            # Pour obligations: utiliser prix réel (prix/100)
-            categorie = data.get('categorie', 'Non classé')
-            type_instrument = data.get('type_instrument', '')
-            
-            valeur_totale = Decimal('0')
-            for lot in data['lots']:
-                prix_reel = get_prix_reel(lot['prix_unitaire'], categorie, type_instrument)
-                valeur_totale += lot['quantite'] * prix_reel
-            
-            prix_moyen = valeur_totale / data['quantite_totale'] if data['quantite_totale'] > 0 else Decimal('0')
-            
-            positions_actuelles.append({
-                'isin': isin,
-                'titre': data['titre'],
-                'categorie': data.get('categorie', 'Non classé'),
-                'type_instrument': data.get('type_instrument', ''),
-                'signaletique_id': data.get('signaletique_id'),
-                'donnees_supplementaires': data.get('donnees_supplementaires', {}),
-                'quantite': float(data['quantite_totale']),
-                'prix_moyen': float(prix_moyen),
-                'valeur': float(valeur_totale),
-                'devise': data['lots'][0]['devise'] if data['lots'] else 'EUR',
-                'lots': [
-                    {
-                        'date': lot['date'],
-                        'quantite': float(lot['quantite']),
-                        'prix_unitaire': float(lot['prix_unitaire'])
-                    }
-                    for lot in data['lots']
-                ]
-            })
-    
-    # Calculer le P&L total réalisé
-    pnl_total_realise = sum(data['pnl_total'] for data in realized_pnl.values())
-    
-    # Formater le P&L réalisé
-    pnl_realise_details = [
-        {
-            'isin': isin,
-            'titre': data['titre'],
-            'categorie': data.get('categorie', 'Non classé'),
-            'type_instrument': data.get('type_instrument', ''),
-            'pnl_total': float(data['pnl_total']),
-            'ventes': data['ventes']
-        }
-        for isin, data in realized_pnl.items()
-    ]
-    
+@api_view(['GET'])
+def portfolio_valuation(request, pk):
+    """
+    Valorisation au prix de marché des positions ouvertes d'un portefeuille
+    (GET /api/real-portfolios/<pk>/valuation/?date=AAAA-MM-JJ, aujourd'hui par défaut).
+    'conversion' exprime les totaux dans la devise du portefeuille (ou ?devise=).
+    """
+    portfolio = file_storage.get_portfolio_by_id(int(pk))
+    if not portfolio:
+        return Response({'error': 'Portefeuille non trouvé'}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        resultat = valorisation.valoriser_positions(
+            fifo.analyse_fifo(int(pk), file_storage)['positions_actuelles'],
+            request.query_params.get('date'), file_storage)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    conversion = fx.convertir_valorisation(
+        resultat, request.query_params.get('devise') or portfolio.get('devise', 'EUR'), file_storage)
+    return Response({'portfolio': _portfolio_resume(portfolio), **resultat, 'conversion': conversion})
+
+
+@api_view(['GET'])
+def portfolio_exposure(request, pk):
+    """
+    Expositions géographiques et sectorielles des positions ouvertes d'un portefeuille,
+    pondérées par leur valeur d'achat dans la devise du portefeuille
+    (GET /api/real-portfolios/<pk>/exposure/?categorie=action).
+    """
+    portfolio = file_storage.get_portfolio_by_id(int(pk))
+    if not portfolio:
+        return Response({'error': 'Portefeuille non trouvé'}, status=status.HTTP_404_NOT_FOUND)
+    analyse = fifo.analyse_fifo(int(pk), file_storage)
+    conversion = fx.convertir_analyse_fifo(analyse, portfolio.get('devise', 'EUR'), file_storage)
+    valeurs = {p['isin']: p['valeur'] for p in conversion['positions'] if p['valeur'] is not None}
     return Response({
-        'portfolio': {
-            'id': portfolio['id'],
-            'name': portfolio['name'],
-            'description': portfolio.get('description', ''),
-            'type_compte': portfolio.get('type_compte', ''),
-            'courtier': portfolio.get('courtier', ''),
-            'devise': portfolio.get('devise', 'EUR'),
-            'date_ouverture': portfolio.get('date_ouverture', ''),
-            'couleur': portfolio.get('couleur', ''),
-            'date_creation': portfolio.get('date_creation', ''),
-        },
-        'positions_actuelles': positions_actuelles,
-        'pnl_realise': {
-            'total': float(pnl_total_realise),
-            'par_titre': pnl_realise_details
-        },
-        'transactions': transaction_details,
-        'statistiques': {
-            'nombre_transactions': len(transaction_details),
-            'nombre_titres_en_portefeuille': len(positions_actuelles),
-            'nombre_titres_vendus': len(pnl_realise_details)
-        }
+        'portfolio': _portfolio_resume(portfolio),
+        'categorie': request.query_params.get('categorie'),
+        **expositions.exposer_positions(analyse['positions_actuelles'], valeurs,
+                                        request.query_params.get('categorie'), file_storage),
+        'taux_manquants': conversion['taux_manquants'],
+    })
+
+
+def _montant_min(valeur):
+    """Montant minimum d'ordre passé en paramètre (None : valeur par défaut)"""
+    if valeur in (None, ''):
+        return None
+    montant = float(valeur)
+    if montant < 0:
+        raise ValueError('montant_min doit être positif')
+    return montant
+
+
+@api_view(['GET'])
+def portfolio_rebalance(request, pk):
+    """
+    Écarts au portefeuille cible et ordres de rééquilibrage (quantités entières)
+    (GET /api/real-portfolios/<pk>/rebalance/?cible=<id>&date=AAAA-MM-JJ&montant_min=100).
+    """
+    portfolio = file_storage.get_portfolio_by_id(int(pk))
+    if not portfolio:
+        return Response({'error': 'Portefeuille non trouvé'}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        cible = int(request.query_params.get('cible', ''))
+    except ValueError:
+        return Response({'error': 'Paramètre cible (id du portefeuille cible) requis'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if not file_storage.get_target_portfolio_by_id(cible):
+        return Response({'error': 'Portefeuille cible non trouvé'}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        resultat = reequilibrage.reequilibrer(int(pk), cible, request.query_params.get('date'),
+                                              _montant_min(request.query_params.get('montant_min')), file_storage)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'portfolio': _portfolio_resume(portfolio), **resultat})
+
+
+@api_view(['POST'])
+def portfolios_rebalance(request):
+    """
+    Rééquilibrage de plusieurs couples (portefeuille réel, portefeuille cible) en une requête
+    (POST /api/real-portfolios/rebalance/).
+    Corps : {"paires": [{"portfolio_id": 1, "target_id": 2}, ...], "date": "AAAA-MM-JJ", "montant_min": 100}
+    """
+    try:
+        paires = [(int(p['portfolio_id']), int(p['target_id'])) for p in request.data.get('paires') or []]
+    except (KeyError, TypeError, ValueError):
+        return Response({'error': 'paires doit être une liste de {portfolio_id, target_id}'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if not paires:
+        return Response({'error': 'Aucune paire fournie'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        resultats = reequilibrage.reequilibrer_lot(paires, request.data.get('date'),
+                                                   _montant_min(request.data.get('montant_min')), file_storage)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'resultats': resultats})
+
+
+@api_view(['GET'])
+def portfolio_nav(request, pk):
+    """
+    Valeur quotidienne d'un portefeuille (titres + cash) par devise
+    (GET /api/real-portfolios/<pk>/nav/?debut=AAAA-MM-JJ&fin=AAAA-MM-JJ).
+    """
+    portfolio = file_storage.get_portfolio_by_id(int(pk))
+    if not portfolio:
+        return Response({'error': 'Portefeuille non trouvé'}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        serie = nav.serie_nav(int(pk), request.query_params.get('debut'), request.query_params.get('fin'),
+                              file_storage)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'portfolio': _portfolio_resume(portfolio), **serie})
+
+
+@api_view(['GET'])
+def portfolio_returns(request, pk):
+    """
+    Rendements TWR / XIRR du portefeuille, par catégorie et par titre sur les fenêtres
+    YTD, 1 an, 3 ans et depuis l'origine (GET /api/real-portfolios/<pk>/returns/?fin=AAAA-MM-JJ).
+    """
+    portfolio = file_storage.get_portfolio_by_id(int(pk))
+    if not portfolio:
+        return Response({'error': 'Portefeuille non trouvé'}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        resultat = rendements.calculer_rendements(int(pk), request.query_params.get('fin'), file_storage)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'portfolio': _portfolio_resume(portfolio), 'rendements': resultat})
+
+
+@api_view(['GET'])
+def portfolio_risk(request, pk):
+    """
+    Volatilité, corrélations, VaR / ES historiques et drawdown des positions ouvertes,
+    pondérées par leur valeur de marché dans la devise du portefeuille
+    (GET /api/real-portfolios/<pk>/risk/?fenetre=252&fin=AAAA-MM-JJ).
+    """
+    portfolio = file_storage.get_portfolio_by_id(int(pk))
+    if not portfolio:
+        return Response({'error': 'Portefeuille non trouvé'}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        analyse = fifo.analyse_fifo(int(pk), file_storage)
+        resultat = risque.analyser_positions(
+            analyse['positions_actuelles'], portfolio.get('devise', 'EUR'),
+            _fenetre_risque(request.query_params.get('fenetre')), request.query_params.get('fin'), file_storage)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'portfolio': _portfolio_resume(portfolio), **resultat})
+
+
+@api_view(['GET'])
+def portfolios_fifo_analysis(request):
+    """
+    Analyse FIFO de plusieurs portefeuilles en une passe (GET /api/real-portfolios/fifo-analysis/).
+    ?ids=1,2,3 (tous par défaut) ; ?workers=N répartit le calcul sur N processus.
+    Retourne l'analyse de chaque portefeuille et la vue consolidée du foyer.
+    """
+    try:
+        ids_param = request.query_params.get('ids')
+        ids = [int(i) for i in ids_param.split(',') if i.strip()] if ids_param else None
+        workers = request.query_params.get('workers')
+        workers = int(workers) if workers is not None else None
+    except ValueError:
+        return Response({'error': 'ids et workers doivent être des entiers'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if workers is not None and not 0 <= workers <= (os.cpu_count() or 1):
+        return Response({'error': f"workers doit être compris entre 0 et {os.cpu_count() or 1}"},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    portfolios = {p['id']: p for p in file_storage.get_all_portfolios()}
+    if ids is None:
+        ids = list(portfolios)
+    manquants = [i for i in ids if i not in portfolios]
+    if manquants:
+        return Response({'error': f"Portefeuille(s) non trouvé(s) : {', '.join(map(str, manquants))}"},
+                        status=status.HTTP_404_NOT_FOUND)
+    ids = list(dict.fromkeys(ids))
+
+    analyses = fifo.analyse_fifo_portefeuilles(ids, file_storage, workers=workers)
+    return Response({
+        'portfolios': [
+            {'portfolio': _portfolio_resume(portfolios[pid]), **analyses[pid]}
+            for pid in ids
+        ],
+        'foyer': fifo.vue_foyer(analyses),
     })
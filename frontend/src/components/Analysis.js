@@ -7,75 +7,22 @@ function Analysis() {
   const { t, language, changeLanguage } = useLanguage();
   const { id } = useParams();
   const [portfolio, setPortfolio] = useState(null);
-  const [signaletiqueMap, setSignaletiqueMap] = useState(new Map());
+  const [exposure, setExposure] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
 
   const API_URL = process.env.REACT_APP_API_URL || window.location.origin;
 
-  const normalizeKey = useCallback((value) => {
-    return String(value)
-      .normalize('NFD')
-      .replace(/[\u0300-\u036f]/g, '')
-      .toLowerCase()
-      .replace(/[^a-z0-9]+/g, ' ')
-      .trim();
-  }, []);
-
-  const parseNumber = useCallback((value) => {
-    if (value === null || value === undefined) return 0;
-    if (typeof value === 'number') return value;
-    const normalized = String(value)
-      .replace('%', '')
-      .replace(',', '.')
-      .trim();
-    const parsed = Number.parseFloat(normalized);
-    return Number.isNaN(parsed) ? 0 : parsed;
-  }, []);
-
-  const getDisplayName = useCallback((ds, fallback) => {
-    if (!ds) return fallback;
-    const normalizeKey = (value) => String(value)
-      .normalize('NFD')
-      .replace(/[\u0300-\u036f]/g, '')
-      .toLowerCase()
-      .replace(/[^a-z0-9]+/g, ' ')
-      .trim();
-    const keyMap = new Map(Object.keys(ds).map((key) => [normalizeKey(key), key]));
-    const nameKey = keyMap.get(normalizeKey('Nom'));
-    return (nameKey && ds[nameKey]) || fallback;
-  }, []);
-
-  const getValue = useCallback((ds, label) => {
-    if (!ds) return 0;
-    const keyMap = new Map(Object.keys(ds).map((key) => [normalizeKey(key), key]));
-    const matchedKey = keyMap.get(normalizeKey(label));
-    return parseNumber(matchedKey ? ds[matchedKey] : 0);
-  }, [normalizeKey, parseNumber]);
-
   const fetchData = useCallback(async () => {
     try {
       setLoading(true);
-      const [portfolioResponse, signaletiqueResponse] = await Promise.all([
-        fetch(`${API_URL}/api/target-portfolios/${id}/`),
-        fetch(`${API_URL}/api/signaletique/`)
-      ]);
-
-      if (!portfolioResponse.ok) throw new Error(t('analysis.error'));
-      if (!signaletiqueResponse.ok) throw new Error(t('analysis.error'));
-
-      const portfolioData = await portfolioResponse.json();
-      const signaletiqueData = await signaletiqueResponse.json();
+      // Expositions calculées côté serveur (matrice signalétique × facteurs)
+      const response = await fetch(`${API_URL}/api/target-portfolios/${id}/exposure/`);
+      if (!response.ok) throw new Error(t('analysis.error'));
 
-      const map = new Map(
-        (Array.isArray(signaletiqueData) ? signaletiqueData : []).map((item) => [
-          String(item.id),
-          item
-        ])
-      );
-
-      setPortfolio(portfolioData);
-      setSignaletiqueMap(map);
+      const data = await response.json();
+      setPortfolio(data.portfolio);
+      setExposure(data);
       setError('');
     } catch (err) {
       setError(err.message || t('analysis.error'));
@@ -89,104 +36,55 @@ function Analysis() {
     fetchData();
   }, [fetchData, id]);
 
-  const geoFields = useMemo(() => ([
-    'USA',
-    'Japon',
-    'Grande Bretagne',
-    'Canada',
-    'Pays Emergeants Hors Chine et Japon',
-    'Australie',
-    'Suede',
-    'Suisse',
-    'Chine',
-    'Israel',
-    'Allemagne',
-    'Nouvelle Zelande',
-    'Pays-Bas',
-    'Irlande',
-    'Espagne',
-    'Italie',
-    'France',
-    'Autre Pays'
-  ]), []);
-
-  const sectorFields = useMemo(() => ([
-    'Etats',
-    'Industrie',
-    'Finance',
-    'Consommation Cyclique',
-    'Technologie',
-    'Sante',
-    'Consommation Defensive',
-    'Communication',
-    'Immobilier',
-    'Matieres Premieres',
-    'Energie',
-    'Service Publiques',
-    'Services de consommation',
-    'Autre Secteur'
-  ]), []);
-
   const rows = useMemo(() => {
-    if (!portfolio || !portfolio.items) return [];
-    return portfolio.items.map((item) => {
-      const signaletique = signaletiqueMap.get(String(item.signaletique));
-      const ds = signaletique?.donnees_supplementaires || {};
-      const ratio = parseNumber(item.ratio);
-      const name = getDisplayName(ds, signaletique?.titre || `#${item.signaletique}`);
-      return {
-        id: item.id || `${item.signaletique}`,
-        name,
-        ratio,
-        ds
-      };
-    });
-  }, [portfolio, signaletiqueMap, parseNumber]);
-
-  const getTotals = useCallback((fields) => {
-    return fields.map((field) => {
-      const total = rows.reduce((sum, row) => {
-        const value = getValue(row.ds, field);
-        return sum + (row.ratio * value);
-      }, 0);
-      return { field, total };
-    }).sort((a, b) => b.total - a.total);
-  }, [rows, getValue]);
+    if (!exposure) return [];
+    return exposure.instruments.map((instrument) => ({
+      id: `${instrument.signaletique_id}`,
+      name: instrument.nom || `#${instrument.signaletique_id}`,
+      ratio: instrument.poids,
+      geographie: instrument.geographie,
+      secteur: instrument.secteur
+    }));
+  }, [exposure]);
+
+  const getTotals = useCallback((group) => {
+    if (!exposure) return [];
+    return exposure.expositions[group].map((item) => ({ field: item.facteur, total: item.exposition }));
+  }, [exposure]);
 
   const getTotalSum = useCallback((items) => {
     return items.reduce((sum, item) => sum + item.total, 0);
   }, []);
 
-  const renderTable = (fields) => (
-    <div className="analysis-frame">
-      <table className="analysis-table">
-        <thead>
-          <tr>
-            <th>{t('analysis.titleLabel')}</th>
-            <th>{t('analysis.ratioLabel')}</th>
-            {fields.map((field) => (
-              <th key={field}>{field}</th>
-            ))}
-          </tr>
-        </thead>
-        <tbody>
-          {rows.map((row) => (
-            <tr key={row.id}>
-              <td>{row.name}</td>
-              <td>{row.ratio.toFixed(2)}%</td>
-              {fields.map((field) => {
-                const value = getValue(row.ds, field);
-                const computed = row.ratio * value;
-                return (
-                  <td key={`${row.id}-${field}`}>{computed.toFixed(2)}%</td>
-                );
-              })}
+  const renderTable = (group) => {
+    const fields = getTotals(group).map((item) => item.field);
+    return (
+      <div className="analysis-frame">
+        <table className="analysis-table">
+          <thead>
+            <tr>
+              <th>{t('analysis.titleLabel')}</th>
+              <th>{t('analysis.ratioLabel')}</th>
+              {fields.map((field) => (
+                <th key={field}>{field}</th>
+              ))}
             </tr>
-          ))}
-        </tbody>
-      </table>
-    </div>
-  );
+          </thead>
+          <tbody>
+            {rows.map((row) => (
+              <tr key={row.id}>
+                <td>{row.name}</td>
+                <td>{row.ratio.toFixed(2)}%</td>
+                {fields.map((field) => (
+                  <td key={`${row.id}-${field}`}>{(row[group][field] || 0).toFixed(2)}%</td>
+                ))}
+              </tr>
+            ))}
+          </tbody>
+        </table>
+      </div>
+    );
+  };
 
   return (
     <div className="App">
@@ -231,7 +129,7 @@ function Analysis() {
                 <div className="analysis-summary">
                   <h3>{t('analysis.geoTitle')}</h3>
                   <div className="analysis-summary-grid">
-                    {getTotals(geoFields).map((item) => (
+                    {getTotals('geographie').map((item) => (
                       <div key={`geo-${item.field}`} className="analysis-summary-item">
                         <span>{item.field}</span>
                         <strong>{item.total.toFixed(2)}%</strong>
@@ -240,11 +138,11 @@ function Analysis() {
                   </div>
                   <div className="analysis-summary-total">
                     <span>Total</span>
-                    <strong>{getTotalSum(getTotals(geoFields)).toFixed(2)}%</strong>
+                    <strong>{getTotalSum(getTotals('geographie')).toFixed(2)}%</strong>
                   </div>
                   <h3>{t('analysis.sectorTitle')}</h3>
                   <div className="analysis-summary-grid">
-                    {getTotals(sectorFields).map((item) => (
+                    {getTotals('secteur').map((item) => (
                       <div key={`sector-${item.field}`} className="analysis-summary-item">
                         <span>{item.field}</span>
                         <strong>{item.total.toFixed(2)}%</strong>
@@ -253,13 +151,13 @@ function Analysis() {
                   </div>
                   <div className="analysis-summary-total">
                     <span>Total</span>
-                    <strong>{getTotalSum(getTotals(sectorFields)).toFixed(2)}%</strong>
+                    <strong>{getTotalSum(getTotals('secteur')).toFixed(2)}%</strong>
                   </div>
                 </div>
                 <h3>{t('analysis.geoTitle')}</h3>
-                {renderTable(geoFields)}
+                {renderTable('geographie')}
                 <h3>{t('analysis.sectorTitle')}</h3>
-                {renderTable(sectorFields)}
+                {renderTable('secteur')}
               </>
             )}
           </div>
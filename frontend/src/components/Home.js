@@ -2,6 +2,7 @@ import React, { useState } from 'react';
 import { Link, useNavigate } from 'react-router-dom';
 import { useLanguage } from '../contexts/LanguageContext';
 import { useAuth } from '../contexts/AuthContext';
+import { lancerImport } from './importJob';
 import '../App.css';
 
 function Home() {
@@ -63,13 +64,18 @@ function Home() {
     setRestoreMessage(null);
     try {
       const apiBase = window.location.origin.replace(':3001', ':8001');
-      const res = await fetch(`${apiBase}/api/restore/`, {
+      const { ok, data } = await lancerImport(apiBase, `${apiBase}/api/restore/`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         credentials: 'include',
-      });
-      const data = await res.json();
-      if (res.ok && data.success) {
+      }, (etat) => setRestoreMessage({
+        type: 'progress',
+        lines: [
+          `${etat.lignes_traitees} / ${etat.lignes_estimees || '?'} section(s) restaurée(s)`,
+          ...Object.keys(etat.resultat?.details || {}).map((section) => `✔ ${section}`),
+        ],
+      }));
+      if (ok && data.success) {
         const d = data.details;
         const lines = [
           d.portefeuilles && !d.portefeuilles.error
@@ -250,16 +256,18 @@ function Home() {
               marginTop: '12px',
               padding: '12px 18px',
               borderRadius: '6px',
-              backgroundColor: restoreMessage.type === 'success' ? '#eaf4fb' : '#fdf2f2',
-              color: restoreMessage.type === 'success' ? '#1a5276' : '#c0392b',
-              border: `1px solid ${restoreMessage.type === 'success' ? '#aed6f1' : '#f5b7b1'}`,
+              backgroundColor: restoreMessage.type !== 'error' ? '#eaf4fb' : '#fdf2f2',
+              color: restoreMessage.type !== 'error' ? '#1a5276' : '#c0392b',
+              border: `1px solid ${restoreMessage.type !== 'error' ? '#aed6f1' : '#f5b7b1'}`,
               maxWidth: '600px',
               margin: '12px auto 0',
               fontSize: '0.9em',
               textAlign: 'left',
             }}>
               <div style={{ fontWeight: 'bold', marginBottom: '6px' }}>
-                {restoreMessage.type === 'success' ? '✅ Restauration terminée' : '❌ Erreur de restauration'}
+                {restoreMessage.type === 'success'
+                  ? '✅ Restauration terminée'
+                  : restoreMessage.type === 'progress' ? '⏳ Restauration en cours…' : '❌ Erreur de restauration'}
               </div>
               <ul style={{ margin: 0, paddingLeft: '20px' }}>
                 {restoreMessage.lines.map((l, i) => <li key={i}>{l}</li>)}
@@ -1,6 +1,7 @@
 import React, { useState } from 'react';
 import { Link } from 'react-router-dom';
 import { useLanguage } from '../contexts/LanguageContext';
+import { lancerImport, formaterAvancement } from './importJob';
 import '../App.css';
 
 function ImportData() {
@@ -29,14 +30,12 @@ function ImportData() {
       formData.append('file', file);
 
       const apiBaseUrl = process.env.REACT_APP_API_URL || window.location.origin;
-      const response = await fetch(`${apiBaseUrl}/api/import/signaletique/`, {
+      const { ok, data } = await lancerImport(apiBaseUrl, `${apiBaseUrl}/api/import/signaletique/`, {
         method: 'POST',
         body: formData,
-      });
+      }, (etat) => setMessage(formaterAvancement(etat)));
 
-      const data = await response.json();
-
-      if (response.ok && data.success) {
+      if (ok && data.success) {
         const successMsg = `✅ ${t('import.messages.success').replace('{fileName}', file.name)}\n📊 ${data.details.succes} ligne(s) importée(s) avec succès`;
         const ignoredMsg = data.details.ignores > 0 ? `\n⏭️ ${data.details.ignores} titre(s) ignoré(s) (déjà existants)` : '';
         const errorMsg = data.details.erreurs > 0 ? `\n⚠️ ${data.details.erreurs} erreur(s)` : '';
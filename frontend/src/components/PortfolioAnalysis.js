@@ -8,6 +8,7 @@ function PortfolioAnalysis() {
   const [portfolios, setPortfolios] = useState([]);
   const [selectedPortfolio, setSelectedPortfolio] = useState(null);
   const [analysis, setAnalysis] = useState(null);
+  const [analysesParPortefeuille, setAnalysesParPortefeuille] = useState({});
   const [activeTab, setActiveTab] = useState('positions');
   const [loadingPortfolios, setLoadingPortfolios] = useState(true);
   const [loadingAnalysis, setLoadingAnalysis] = useState(false);
@@ -20,6 +21,7 @@ function PortfolioAnalysis() {
   const [showSignaletiqueModal, setShowSignaletiqueModal] = useState(false);
   const [selectedSignaletique, setSelectedSignaletique] = useState(null);
   const [loadingSignaletique, setLoadingSignaletique] = useState(false);
+  const [exposition, setExposition] = useState(null);
 
   const apiBaseUrl = process.env.REACT_APP_API_URL || window.location.origin;
 
@@ -35,6 +37,7 @@ function PortfolioAnalysis() {
       if (!response.ok) throw new Error('Erreur lors du chargement des portefeuilles');
       const data = await response.json();
       setPortfolios(data);
+      fetchAllAnalyses();
     } catch (err) {
       setError(err.message);
     } finally {
@@ -42,12 +45,31 @@ function PortfolioAnalysis() {
     }
   };
 
+  const fetchAllAnalyses = async () => {
+    // Toutes les analyses en un appel (une passe sur les transactions côté serveur)
+    try {
+      const response = await fetch(`${apiBaseUrl}/api/real-portfolios/fifo-analysis/`);
+      if (!response.ok) return;
+      const data = await response.json();
+      const parId = {};
+      data.portfolios.forEach((item) => { parId[item.portfolio.id] = item; });
+      setAnalysesParPortefeuille(parId);
+    } catch (err) {
+      // Non bloquant : chaque analyse reste disponible individuellement
+      console.error('Erreur:', err);
+    }
+  };
+
   const analyzePortfolio = async (portfolio) => {
     setSelectedPortfolio(portfolio);
     setAnalysis(null);
     setActiveTab('positions');
-    setLoadingAnalysis(true);
     setError('');
+    if (analysesParPortefeuille[portfolio.id]) {
+      setAnalysis(analysesParPortefeuille[portfolio.id]);
+      return;
+    }
+    setLoadingAnalysis(true);
     try {
       const response = await fetch(`${apiBaseUrl}/api/real-portfolios/${portfolio.id}/fifo-analysis/`);
       if (!response.ok) throw new Error("Erreur lors du chargement de l'analyse");
@@ -268,19 +290,27 @@ function PortfolioAnalysis() {
     return parseNumber(matchedKey ? ds[matchedKey] : 0);
   };
 
-  const calculateRepartition = (positions, fields) => {
-    const totalValeur = positions.reduce((sum, pos) => sum + (pos.valeur || 0), 0);
-    if (totalValeur === 0) return [];
-
-    const result = fields.map((field) => {
-      const total = positions.reduce((sum, pos) => {
-        const poids = (pos.valeur || 0) / totalValeur;
-        const value = getValue(pos.donnees_supplementaires, field);
-        return sum + (poids * value * 100); // Multiplier par 100 car poids est en décimal
-      }, 0);
-      return { field, total };
-    });
+  const openDetail = async (categorie, setShow) => {
+    // Expositions de la catégorie calculées côté serveur (matrice signalétique × facteurs)
+    setExposition(null);
+    setShow(true);
+    try {
+      const response = await fetch(
+        `${apiBaseUrl}/api/real-portfolios/${selectedPortfolio.id}/exposure/?categorie=${encodeURIComponent(categorie)}`
+      );
+      if (response.ok) setExposition(await response.json());
+    } catch (err) {
+      console.error('Erreur:', err);
+    }
+  };
 
+  const calculateRepartition = (positions, fields) => {
+    if (!exposition) return [];
+    const totaux = new Map(
+      [...exposition.expositions.geographie, ...exposition.expositions.secteur]
+        .map((item) => [normalizeKey(item.facteur), item.exposition])
+    );
+    const result = fields.map((field) => ({ field, total: totaux.get(normalizeKey(field)) || 0 }));
     return result.sort((a, b) => b.total - a.total);
   };
 
@@ -425,7 +455,7 @@ function PortfolioAnalysis() {
                                 </span>
                                 {categorie.toLowerCase().includes('action') && (
                                   <button
-                                    onClick={() => setShowActionsDetail(true)}
+                                    onClick={() => openDetail('action', setShowActionsDetail)}
                                     className="btn"
                                     style={{
                                       padding: '4px 12px',
@@ -441,7 +471,7 @@ function PortfolioAnalysis() {
                                 )}
                                 {categorie.toLowerCase().includes('obligation') && (
                                   <button
-                                    onClick={() => setShowObligationsDetail(true)}
+                                    onClick={() => openDetail('obligation', setShowObligationsDetail)}
                                     className="btn"
                                     style={{
                                       padding: '4px 12px',
@@ -457,7 +487,7 @@ function PortfolioAnalysis() {
                                 )}
                                 {categorie.toLowerCase().includes('immobilier') && (
                                   <button
-                                    onClick={() => setShowImmobilierDetail(true)}
+                                    onClick={() => openDetail('immobilier', setShowImmobilierDetail)}
                                     className="btn"
                                     style={{
                                       padding: '4px 12px',
@@ -473,7 +503,7 @@ function PortfolioAnalysis() {
                                 )}
                                 {categorie.toLowerCase().includes('long') && categorie.toLowerCase().includes('short') && (
                                   <button
-                                    onClick={() => setShowLongShortDetail(true)}
+                                    onClick={() => openDetail('long short', setShowLongShortDetail)}
                                     className="btn"
                                     style={{
                                       padding: '4px 12px',
@@ -489,7 +519,7 @@ function PortfolioAnalysis() {
                                 )}
                                 {(categorie.toLowerCase().includes('matière') || categorie.toLowerCase().includes('matiere')) && (
                                   <button
-                                    onClick={() => setShowMatieresDetail(true)}
+                                    onClick={() => openDetail('matiere', setShowMatieresDetail)}
                                     className="btn"
                                     style={{
                                       padding: '4px 12px',
@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { Link } from 'react-router-dom';
 import { useLanguage } from '../contexts/LanguageContext';
+import { lancerImport, formaterAvancement } from './importJob';
 import '../App.css';
 
 function Portfolios() {
@@ -257,14 +258,12 @@ function Portfolios() {
       const formData = new FormData();
       formData.append('file', file);
 
-      const response = await fetch(`${apiBaseUrl}/api/import/transactions/`, {
+      const { ok, data } = await lancerImport(apiBaseUrl, `${apiBaseUrl}/api/import/transactions/`, {
         method: 'POST',
         body: formData,
-      });
-
-      const data = await response.json();
+      }, (etat) => setMessage(formaterAvancement(etat)));
 
-      if (response.ok && data.success) {
+      if (ok && data.success) {
         let message = `✅ Import réussi !\n📊 ${data.details.succes} transaction(s) importée(s)`;
         
         if (data.details.doublons > 0) {
@@ -339,12 +338,11 @@ function Portfolios() {
     try {
       const formData = new FormData();
       formData.append('file', cashImportFile);
-      const response = await fetch(`${apiBaseUrl}/api/import/cash/`, {
+      const { ok, data } = await lancerImport(apiBaseUrl, `${apiBaseUrl}/api/import/cash/`, {
         method: 'POST',
         body: formData,
-      });
-      const data = await response.json();
-      if (response.ok && data.success) {
+      }, (etat) => setCashImportMessage(formaterAvancement(etat)));
+      if (ok && data.success) {
         let msg = `✅ Import terminé ! ${data.details.succes} entrée(s) importée(s)`;
         if (data.details.erreurs > 0) msg += ` — ⚠️ ${data.details.erreurs} erreur(s)`;
         if (data.details.liste_erreurs?.length) {
@@ -1,6 +1,7 @@
 import React, { useCallback, useEffect, useMemo, useState } from 'react';
 import { Link } from 'react-router-dom';
 import { useLanguage } from '../contexts/LanguageContext';
+import { lancerImport, formaterAvancement } from './importJob';
 import '../App.css';
 
 function Simulation() {
@@ -319,12 +320,11 @@ function Simulation() {
     try {
       const formData = new FormData();
       formData.append('file', importFile);
-      const response = await fetch(`${API_URL}/api/import/target-portfolio/`, {
+      const { ok, data } = await lancerImport(API_URL, `${API_URL}/api/import/target-portfolio/`, {
         method: 'POST',
         body: formData,
-      });
-      const data = await response.json();
-      if (response.ok && data.success) {
+      }, (etat) => setImportMessage(formaterAvancement(etat)));
+      if (ok && data.success) {
         let msg = `✅ Import terminé ! ${data.details.portefeuilles_crees} portefeuille(s) créé(s)/mis à jour`;
         if (data.details.erreurs > 0) msg += ` — ⚠️ ${data.details.erreurs} erreur(s)`;
         if (data.details.liste_erreurs?.length) {
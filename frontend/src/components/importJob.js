@@ -0,0 +1,47 @@
+// Imports en tâche de fond : l'import est lancé avec ?arriere_plan=1 (réponse 202 avec
+// l'id de la tâche) puis suivi sur /api/import/jobs/<id>/ jusqu'à la fin.
+// Le résultat final a la même forme que la réponse d'un import synchrone.
+
+const INTERVALLE_SUIVI_MS = 1000;
+
+const attendre = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+const fin = (etat) => {
+  if (etat.statut === 'erreur' || etat.statut === 'interrompu') {
+    const erreur = etat.liste_erreurs?.[0]?.erreur_generale || `Import ${etat.statut}`;
+    return { ok: false, data: { error: erreur } };
+  }
+  return { ok: true, data: etat.resultat || {} };
+};
+
+// Suit une tâche jusqu'à la fin ; onProgress(etat) à chaque relevé
+export async function suivreImport(apiBaseUrl, jobId, onProgress, credentials) {
+  for (;;) {
+    const response = await fetch(`${apiBaseUrl}/api/import/jobs/${jobId}/`, { credentials });
+    const etat = await response.json();
+    if (!response.ok) return { ok: false, data: etat };
+    if (onProgress) onProgress(etat);
+    if (etat.termine) return fin(etat);
+    await attendre(INTERVALLE_SUIVI_MS);
+  }
+}
+
+// Lance l'import (fetch(url, options)) en tâche de fond et attend sa fin
+export async function lancerImport(apiBaseUrl, url, options, onProgress) {
+  const separateur = url.includes('?') ? '&' : '?';
+  const response = await fetch(`${url}${separateur}arriere_plan=1`, options);
+  const data = await response.json();
+  if (response.status !== 202) return { ok: response.ok, data };
+  return suivreImport(apiBaseUrl, data.job_id, onProgress, options.credentials);
+}
+
+export function formaterAvancement(etat) {
+  if (etat.statut === 'en_attente') return '⏳ Import en attente…';
+  let texte = `⏳ ${etat.lignes_traitees} ligne(s) traitée(s)`;
+  if (etat.lignes_estimees) {
+    texte += ` / ${etat.lignes_estimees} (${Math.round((etat.avancement || 0) * 100)} %)`;
+  }
+  if (etat.eta_secondes != null) texte += ` — reste ~${Math.ceil(etat.eta_secondes)} s`;
+  if (etat.erreurs > 0) texte += ` — ⚠️ ${etat.erreurs} erreur(s)`;
+  return texte;
+}